@@ -117,6 +117,12 @@ try:
 except LookupError:
     log.error("No job found with that name")
 
+# Interval and polled interval jobs shorter than TIMER_WHEEL_MAX_INTERVAL
+# seconds can be run on an in process timer wheel instead of the
+# PolledScheduler thread pool.  Their callbacks run on the wheel thread
+# so they need to be short.
+scheduler = DriverScheduler(config, timer_wheel=True)
+
 """
 
 __author__ = 'Bill French'
@@ -124,12 +130,18 @@ __license__ = 'Apache 2.0'
 
 import inspect
 
+from apscheduler.util import timedelta_seconds
+
 from mi.core.log import get_logger; log = get_logger()
 
 from mi.core.common import BaseEnum
 from mi.core.scheduler import PolledScheduler
+from mi.core.timer_wheel import TimerWheel
 from mi.core.exceptions import SchedulerException
 
+# jobs with a shorter interval go on the timer wheel when it is enabled
+TIMER_WHEEL_MAX_INTERVAL = 1
+
 class TriggerType(BaseEnum):
     ABSOLUTE = 'absolute'
     INTERVAL = 'interval'
@@ -176,7 +188,7 @@ class DriverScheduler(object):
     jobs.
     """
 
-    def __init__(self, config = None):
+    def __init__(self, config = None, timer_wheel = False):
         """
         config structure:
         {
@@ -186,8 +198,12 @@ class DriverScheduler(object):
             }
         }
         @param config: job configuration structure.
+        @param timer_wheel: run sub second interval and polled jobs on a timer wheel
         """
         self._scheduler = PolledScheduler()
+        self._timer_wheel = None
+        if(timer_wheel):
+            self._timer_wheel = TimerWheel()
         if(config):
             self.add_config(config)
 
@@ -198,6 +214,8 @@ class DriverScheduler(object):
         @param name: name of the job
         @raise LookupError if we fail to find the job
         """
+        if(self._timer_wheel and self._timer_wheel.get_job(name)):
+            return self._timer_wheel.run_polled_job(name)
         return self._scheduler.run_polled_job(name)
 
     def add_config(self, config):
@@ -229,6 +247,8 @@ class DriverScheduler(object):
 
         if(not self._scheduler.running):
             self._scheduler.start()
+        if(self._timer_wheel and not self._timer_wheel.running):
+            self._timer_wheel.start()
 
     def _add_job(self, name, config):
         """
@@ -290,6 +310,14 @@ class DriverScheduler(object):
 
         return callback
 
+    def _use_timer_wheel(self, interval):
+        """
+        @param interval: job interval as a timedelta
+        @return: True if a job with this interval should go on the timer wheel
+        """
+        return (self._timer_wheel is not None and
+                timedelta_seconds(interval) < TIMER_WHEEL_MAX_INTERVAL)
+
     def _add_job_absolute(self, name, config):
         """
         Add a new job to the scheduler based on the trigger configuration
@@ -360,8 +388,12 @@ class DriverScheduler(object):
         if(not (weeks or days or hours or minutes or seconds)):
             raise SchedulerException("at least interval parameter required!")
 
-        self._scheduler.add_interval_job(callback, weeks=weeks, days=days, hours=hours,
-                                                   minutes=minutes, seconds=seconds)
+        interval = self._scheduler.interval(weeks, days, hours, minutes, seconds)
+        if(self._use_timer_wheel(interval)):
+            self._timer_wheel.add_interval_job(callback, name, timedelta_seconds(interval))
+        else:
+            self._scheduler.add_interval_job(callback, weeks=weeks, days=days, hours=hours,
+                                                       minutes=minutes, seconds=seconds)
 
     def _add_job_polled_interval(self, name, config):
         """
@@ -409,7 +441,19 @@ class DriverScheduler(object):
             if(max_weeks or max_days or max_hours or max_minutes or max_seconds):
                 max_interval_obj = self._scheduler.interval(max_weeks, max_days, max_hours, max_minutes, max_seconds)
 
-        self._scheduler.add_polled_job(callback, name, min_interval_obj, max_interval_obj)
+        # polled job names are unique across both backends
+        if(self._timer_wheel and
+           (self._timer_wheel.get_job(name) or self._scheduler.get_polled_job(name))):
+            raise SchedulerException("polled job named '%s' already exists" % name)
+
+        if(self._use_timer_wheel(min_interval_obj)):
+            max_seconds = None
+            if(max_interval_obj):
+                max_seconds = timedelta_seconds(max_interval_obj)
+            self._timer_wheel.add_polled_job(callback, name,
+                                             timedelta_seconds(min_interval_obj), max_seconds)
+        else:
+            self._scheduler.add_polled_job(callback, name, min_interval_obj, max_interval_obj)
 
 
 
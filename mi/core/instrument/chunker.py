@@ -11,9 +11,381 @@
 __author__ = 'Steve Foley'
 __license__ = 'Apache 2.0'
 
+import re
+from collections import deque
+
 from ooi.logging import log
 
 from mi.core.exceptions import SampleException
+from mi.core.exceptions import NotImplementedException
+
+class ResumableSieve(object):
+    """
+    Interface for a sieve that can pick up where it left off. Instead of
+    being handed the whole unconsumed buffer and rescanning it from the top,
+    the sieve is told which bytes are new since the last call and reports
+    back how much of the data is settled, so the chunker never hands those
+    bytes to it again.
+
+    A ResumableSieve is also callable like a plain sieve_function, in which
+    case it does a full scan of the data it is given.
+    """
+    def scan(self, raw_data, cursor):
+        """
+        Find the data blocks in a piece of the buffer.
+
+        @param raw_data The unsettled part of the buffer. Everything before
+            it has already been classified.
+        @param cursor Index into raw_data of the first byte that arrived
+            since the last call. raw_data[:cursor] was part of the last call.
+        @retval A (data_list, settled_index) tuple. data_list is a list of
+            (start_index, end_index) tuples as returned by a sieve_function.
+            settled_index is the index into raw_data before which no data
+            block can ever start, so bytes there that are not in data_list
+            are non-data for good.
+        """
+        raise NotImplementedException("scan() not implemented")
+
+    def __call__(self, raw_data):
+        """
+        Scan a buffer from the top, sieve_function style.
+        @param raw_data The data to scan
+        @retval list of (start_index, end_index) tuples
+        """
+        (data_list, settled) = self.scan(raw_data, 0)
+        return data_list
+
+    def scan_tagged(self, raw_data, cursor):
+        """
+        Like scan, but each block is a (start_index, end_index, tag) tuple
+        naming the kind of block found. Sieves that can not tell their
+        blocks apart tag them all None.
+        @param raw_data The unsettled part of the buffer
+        @param cursor Index into raw_data of the first new byte
+        @retval A (data_list, settled_index) tuple, see scan
+        """
+        (data_list, settled) = self.scan(raw_data, cursor)
+        return ([(start, end, None) for (start, end) in data_list], settled)
+
+class SieveFunctionAdapter(ResumableSieve):
+    """
+    Wraps a stateless sieve_function so the chunker can talk to it like a
+    resumable sieve. The function rescans everything it is handed, but if
+    the largest block it can find is known the chunker can at least settle
+    the bytes that are too far back to start one.
+    """
+    def __init__(self, sieve_fn, max_size=None):
+        """
+        @param sieve_fn The sieve function to wrap
+        @param max_size Size of the largest block the function can return,
+            None if unbounded
+        """
+        self.sieve_fn = sieve_fn
+        self.max_size = max_size
+
+    def scan(self, raw_data, cursor):
+        settled = 0
+        if self.max_size is not None:
+            settled = max(0, len(raw_data) - self.max_size + 1)
+        return (self.sieve_fn(raw_data), settled)
+
+class SieveMatcher(object):
+    """
+    A regex for one kind of block plus what is known about the blocks it
+    matches. The hints let the sieve skip bytes it has already looked at and
+    tell how far back a block that has not finished yet could have started.
+    Every hint is optional; with none the regex scans all of the data every
+    time.
+    """
+    def __init__(self, regex, name=None, start=None, end=None, max_size=None):
+        """
+        @param regex Compiled regex or pattern string for one kind of block
+        @param name Tag for the blocks this matcher finds
+        @param start Literal string every block begins with
+        @param end Literal string every block ends with and that does not
+            appear anywhere else inside a block
+        @param max_size Size of the largest block the regex can match
+        """
+        if isinstance(regex, basestring):
+            regex = re.compile(regex)
+        self.regex = regex
+        self.name = name
+        self.start = start
+        self.end = end
+        self.max_size = max_size
+
+    def validate(self, block):
+        """
+        Final check on a block the regex matched. Override for checks a regex
+        can not do, like checksums.
+        @param block The matched data
+        @retval True if the block is good
+        """
+        return True
+
+    def bounds(self, raw_data, cursor):
+        """
+        Work out where this matcher needs to look in a piece of the buffer.
+        @param raw_data The unsettled part of the buffer
+        @param cursor Index into raw_data of the first new byte
+        @retval A (run, scan_from, settled_index) tuple. run is False if no
+            block can have finished in the new bytes, scan_from is the first
+            index a block finishing in the new bytes can start at and
+            settled_index is as described in ResumableSieve.scan
+        """
+        length = len(raw_data)
+        scan_from = 0
+        settled = 0
+        run = True
+
+        if self.end is not None:
+            # Nothing new can have finished unless an end arrived, and a
+            # block can not reach back past an end that was already here
+            first_new_end = max(0, cursor - len(self.end) + 1)
+            run = raw_data.find(self.end, first_new_end) != -1
+            scan_from = raw_data.rfind(self.end, 0, cursor) + 1
+            settled = raw_data.rfind(self.end) + 1
+
+        if self.max_size is not None:
+            scan_from = max(scan_from, cursor - self.max_size + 1)
+            settled = max(settled, length - self.max_size + 1)
+
+        if self.start is not None:
+            scan_from = raw_data.find(self.start, scan_from)
+            run = run and scan_from != -1
+
+            first_start = raw_data.find(self.start, settled)
+            if first_start == -1:
+                # keep a partial start at the very end
+                first_start = max(settled, length - len(self.start) + 1)
+                while first_start < length and not self.start.startswith(raw_data[first_start:]):
+                    first_start += 1
+            settled = first_start
+
+        return (run, scan_from, min(settled, length))
+
+    def scan(self, raw_data, cursor):
+        """
+        Find the blocks that ended in the new bytes.
+        @param raw_data The unsettled part of the buffer
+        @param cursor Index into raw_data of the first new byte
+        @retval A (data_list, settled_index) tuple, see ResumableSieve.scan
+        """
+        (run, scan_from, settled) = self.bounds(raw_data, cursor)
+
+        return_list = []
+        if run:
+            for match in self.regex.finditer(raw_data, scan_from):
+                if self.validate(match.group()):
+                    return_list.append((match.start(), match.end()))
+
+        return (return_list, settled)
+
+class SyncMatcher(SieveMatcher):
+    """
+    Matcher for fixed length binary structures that begin with a run of
+    sync bytes and are optionally protected by a checksum.
+    """
+    def __init__(self, sync, length, name=None, checksum=None):
+        """
+        @param sync The sync bytes every structure begins with
+        @param length Total length of the structure including the sync bytes
+        @param name Tag for the structures this matcher finds
+        @param checksum Function taking the whole structure and returning
+            True if its checksum is good, None to skip the check
+        """
+        regex = re.compile(re.escape(sync) + '.{%d}' % (length - len(sync)),
+                           re.DOTALL)
+        SieveMatcher.__init__(self, regex, name=name, start=sync,
+                              max_size=length)
+        self.checksum = checksum
+
+    def validate(self, block):
+        if self.checksum is None:
+            return True
+        return self.checksum(block)
+
+def _uncapture(pattern):
+    """
+    Turn every capturing group in a regex pattern into a non-capturing one
+    so that the pattern can be dropped into an alternation with others
+    without running out of groups or clashing on group names.
+
+    @param pattern A regex pattern string
+    @retval The rewritten pattern, None if it can not be combined because it
+        depends on its own groups or sets global flags inline
+    """
+    out = []
+    index = 0
+    length = len(pattern)
+    in_class = False
+
+    while index < length:
+        char = pattern[index]
+        if char == '\\':
+            if not in_class and pattern[index+1:index+2].isdigit():
+                # back reference
+                return None
+            out.append(pattern[index:index+2])
+            index += 2
+        elif in_class:
+            if char == ']':
+                in_class = False
+            out.append(char)
+            index += 1
+        elif char == '[':
+            in_class = True
+            out.append(char)
+            index += 1
+            # a ] right at the start of a class is a literal
+            if pattern[index:index+1] == '^':
+                out.append('^')
+                index += 1
+            if pattern[index:index+1] == ']':
+                out.append(']')
+                index += 1
+        elif pattern.startswith('(?P<', index):
+            out.append('(?:')
+            index = pattern.index('>', index) + 1
+        elif pattern.startswith('(?P=', index) or pattern.startswith('(?(', index):
+            return None
+        elif pattern.startswith('(?', index):
+            if pattern[index+2:index+3] in 'iLmsux':
+                # inline flags apply to the whole expression
+                return None
+            out.append(char)
+            index += 1
+        elif char == '(':
+            out.append('(?:')
+            index += 1
+        else:
+            out.append(char)
+            index += 1
+
+    return ''.join(out)
+
+class RegexSieve(ResumableSieve):
+    """
+    A resumable sieve built from a list of named regexes. Each regex may be
+    given as a SieveMatcher carrying a name and hints about its blocks; a bare
+    compiled regex or pattern string gets neither.
+
+    The matchers are compiled once into a single alternation per set of
+    regex flags, so the data is scanned once however many kinds of block
+    there are. Blocks come back sorted, without overlap and tagged with
+    the name of the matcher that found them. When two kinds of block start
+    at the same place the first one listed that validates wins. The data is settled up
+    to the point where the least settled matcher could still have a block
+    in progress.
+    """
+    def __init__(self, matchers):
+        """
+        @param matchers List of SieveMatcher objects, compiled regexes or
+            pattern strings
+        """
+        self.matchers = []
+        for matcher in matchers:
+            if not isinstance(matcher, SieveMatcher):
+                matcher = SieveMatcher(matcher)
+            self.matchers.append(matcher)
+
+        # list of (regex, [matcher indexes]). Matchers sharing flags are
+        # joined into one regex with a named group per matcher, the rest
+        # stand alone.
+        self._scanners = []
+        by_flags = {}
+        for (index, matcher) in enumerate(self.matchers):
+            pattern = _uncapture(matcher.regex.pattern)
+            if pattern is None:
+                self._scanners.append((matcher.regex, [index]))
+            else:
+                by_flags.setdefault(matcher.regex.flags, []).append(
+                    ('(?P<_m%d>%s)' % (index, pattern), index))
+
+        for (flags, entries) in sorted(by_flags.items()):
+            if len(entries) == 1:
+                index = entries[0][1]
+                self._scanners.append((self.matchers[index].regex, [index]))
+            else:
+                regex = re.compile('|'.join([p for (p, i) in entries]), flags)
+                self._scanners.append((regex, [i for (p, i) in entries]))
+
+    def scan_tagged(self, raw_data, cursor):
+        """
+        Like scan, but each block is a (start_index, end_index, name) tuple
+        @param raw_data The unsettled part of the buffer
+        @param cursor Index into raw_data of the first new byte
+        @retval A (data_list, settled_index) tuple, see ResumableSieve.scan
+        """
+        found = []
+        settled = len(raw_data)
+
+        for (regex, indexes) in self._scanners:
+            scan_from = None
+            for index in indexes:
+                (run, matcher_from, matcher_settled) = \
+                    self.matchers[index].bounds(raw_data, cursor)
+                settled = min(settled, matcher_settled)
+                if run and (scan_from is None or matcher_from < scan_from):
+                    scan_from = matcher_from
+
+            if scan_from is None:
+                continue
+
+            pos = scan_from
+            match = regex.search(raw_data, pos)
+            while match:
+                block = self._validate(match, indexes, raw_data)
+                if block is not None:
+                    (index, end) = block
+                    found.append((match.start(), index, end, self.matchers[index].name))
+                    pos = end
+                else:
+                    pos = match.start() + 1
+                match = regex.search(raw_data, pos)
+
+        # the scanners are independent so drop blocks they both claim
+        found.sort()
+        return_list = []
+        for (start, index, end, name) in found:
+            if return_list and start < return_list[-1][1]:
+                continue
+            return_list.append((start, end, name))
+
+        return (return_list, settled)
+
+    def _validate(self, match, indexes, raw_data):
+        """
+        Find the block a scanner match stands for. The alternation reports
+        the first matcher that matched, if that block fails validation the
+        matchers after it in the alternation get to try at the same place.
+        @param match The match of the scanner regex
+        @param indexes Matcher indexes in the scanner, in alternation order
+        @param raw_data The data searched
+        @retval (matcher index, end index) of the block, None if no
+            matcher has a good block there
+        """
+        if len(indexes) == 1:
+            index = indexes[0]
+        else:
+            index = int(match.lastgroup[2:])
+
+        matcher = self.matchers[index]
+        if match.end() > match.start() and matcher.validate(match.group()):
+            return (index, match.end())
+
+        for other in indexes[indexes.index(index) + 1:]:
+            matcher = self.matchers[other]
+            other_match = matcher.regex.match(raw_data, match.start())
+            if other_match and other_match.end() > other_match.start() and \
+               matcher.validate(other_match.group()):
+                return (other, other_match.end())
+
+        return None
+
+    def scan(self, raw_data, cursor):
+        (data_list, settled) = self.scan_tagged(raw_data, cursor)
+        return ([(start, end) for (start, end, name) in data_list], settled)
 
 class Chunker(object):
     """
@@ -38,9 +410,22 @@ class Chunker(object):
             buffer[start_index:end_index] to properly describe the data block.
             If no data is present, return and empty list. If multiple data
             blocks are found, the returned list will contain multiple tuples,
-            IN SEQUENTIAL ORDER and WITHOUT OVERLAP.
+            IN SEQUENTIAL ORDER and WITHOUT OVERLAP. A ResumableSieve may be
+            passed instead so only new data gets scanned.
         """
-        self.sieve = data_sieve_fn
+        if isinstance(data_sieve_fn, ResumableSieve):
+            self.sieve = data_sieve_fn
+        else:
+            self.sieve = SieveFunctionAdapter(data_sieve_fn)
+
+        # Buffer index before which the sieve has settled everything
+        self._settled_index = 0
+
+        # Tags of pending data blocks keyed by stream offset, that is the
+        # buffer index plus the number of bytes cleaned off the front of the
+        # buffer so far. Untagged blocks have no entry.
+        self._data_tags = {}
+        self._cleaned = 0
         
         self.raw_chunk_list = []
         self.data_chunk_list = []
@@ -66,6 +451,7 @@ class Chunker(object):
             last_data_index = 0
         else:
             last_data_index = self.data_chunk_list[-1][1] 
+        scan_index = max(last_data_index, self._settled_index)
         end_index = start_index + len(raw_data)
         
         if isinstance(self.buffer, str):
@@ -75,19 +461,27 @@ class Chunker(object):
             
         self.raw_chunk_list.append((start_index, end_index))
 
+        # Everything from scan_index on is about to be re-classified, so drop
+        # the non-data blocks past it, including the start of any fragment
+        # that may now be completed
+        while self.nondata_chunk_list and self.nondata_chunk_list[-1][0] >= scan_index:
+            self.nondata_chunk_list.pop()
+        if self.nondata_chunk_list and self.nondata_chunk_list[-1][1] > scan_index:
+            (s, e) = self.nondata_chunk_list.pop()
+            self.nondata_chunk_list.append((s, scan_index))
+
         # find data
-        result = self._generate_data_lists(start_index=last_data_index)
+        result = self._generate_data_lists(start_index=scan_index,
+                                           cursor=start_index - scan_index)
         assert result != None
+        self._settled_index = result['settled_index']
         
+        self._add_data_tags(result)
+
         # rebase onto existing buffer
         for (s, e) in result['data_chunk_list']:
             self.data_chunk_list.append((s, e))
         
-            # remove first fragment part from non-data array if we completed a fragment
-            for (nds, nde) in self.nondata_chunk_list:
-                if (nds == s):
-                    self.nondata_chunk_list.remove((nds, nde))
-        
         # splice non-data blocks in, combining with
         # other blocks as needed
         if result['non_data_chunk_list'] != []:
@@ -113,28 +507,28 @@ class Chunker(object):
             log.debug("Added chunk, data_chunk_list: %s, nondata_chunk_list: %s",
                       self.data_chunk_list, self.nondata_chunk_list)
          
-    def _generate_data_lists(self, start_index=0):
+    def _generate_data_lists(self, start_index=0, cursor=0):
         """
         From some starting place in the raw data buffer, go through and
         find the blocks of data and non-data in the list.
         
         @param start_index The beginning index to start generating lists from.
             Default is the beginning of the buffer
+        @param cursor Offset from start_index of the first byte the sieve
+            has not seen yet. Default is to treat it all as new.
         @retval A dict with keys "data_chunk_list" and "non_data_chunk_list"
-            that include the full data chunk lists for this block of data.
-            Indices are respect to the buffer, not the chunk
+            that include the full data chunk lists for this block of data,
+            "data_tag_list" with the sieve's tag for each data chunk,
+            and "settled_index", the buffer index before which the sieve has
+            settled everything. Indices are respect to the buffer, not the chunk
         """
         log.debug("Generating data lists with start index %s", start_index)
         return_list = {'data_chunk_list':[], 'non_data_chunk_list':[]}
-        result = self.sieve(self.buffer[start_index:])
-        # assert no overlap!
-        if (self.overlaps(result)):
-            raise SampleException("Overlapping blocks in sieve list: %s" % result)
-        # sort to protect us from some sloppy sieve code
-        result.sort()
+        (result, tags, settled) = self._scan(self.buffer[start_index:], cursor)
 
         # rebase to buffer coordinates
         return_list['data_chunk_list'] = [(s+start_index, e+start_index) for (s, e) in result]
+        return_list['data_tag_list'] = tags
         
         if result == []:
             return_list['non_data_chunk_list'].append((start_index,
@@ -151,9 +545,50 @@ class Chunker(object):
                 return_list['non_data_chunk_list'].append((previous_end, s))
                 previous_end = e
 
+        # bytes the sieve settled past the last block are non-data for good
+        settled += start_index
+        if result != [] and settled > previous_end:
+            return_list['non_data_chunk_list'].append((previous_end, settled))
+        return_list['settled_index'] = settled
+
         log.debug("Generated return list: %s", return_list)
         return return_list    
-    
+
+    def _scan(self, raw_data, cursor):
+        """
+        Run the sieve over part of the buffer and check what it hands back.
+
+        @param raw_data The part of the buffer to sieve
+        @param cursor Index into raw_data of the first new byte
+        @retval A (data_list, tag_list, settled_index) tuple. data_list is
+            sorted (start, end) tuples, tag_list the matching tags.
+        @raises SampleException if the sieve returned overlapping blocks
+        """
+        (tagged, settled) = self.sieve.scan_tagged(raw_data, cursor)
+        tagged.sort()
+        result = [(s, e) for (s, e, tag) in tagged]
+        # assert no overlap!
+        if (self.overlaps(result)):
+            raise SampleException("Overlapping blocks in sieve list: %s" % result)
+        return (result, [tag for (s, e, tag) in tagged], settled)
+
+    def _add_data_tags(self, result):
+        """
+        Remember the tags of newly found data blocks
+        @param result Dict returned by _generate_data_lists
+        """
+        for ((s, e), tag) in zip(result['data_chunk_list'], result['data_tag_list']):
+            if tag is not None:
+                self._data_tags[s + self._cleaned] = tag
+
+    def _pop_data_tag(self, start):
+        """
+        Forget the tag of a data block that is being handed out
+        @param start Stream offset of the block
+        @retval The tag, None if the block was untagged
+        """
+        return self._data_tags.pop(start, None)
+
     @staticmethod
     def overlaps(data_list):
         """
@@ -176,24 +611,31 @@ class Chunker(object):
             
         return False
     
-    def get_next_data(self, clean=True):
+    def get_next_data(self, clean=True, tagged=False):
         """
         Get the next chunk of data from the buffer. By default, it clears all
         that comes before it.
         
         @param clean If set to false, do not clear the buffer when fetching the
             data, but simply return the data block and make no further changes.
-        @return A chunk of data
+        @param tagged If set, return a (tag, chunk) tuple where tag is the
+            name the sieve gave the block, None if it did not name it.
+        @return A chunk of data, or a (tag, chunk) tuple if tagged. None if
+            there is no data.
         """
         if self.data_chunk_list == []:
             return None
 
         if clean:    
             (next_start, next_end) = self.data_chunk_list.pop(0)
+            tag = self._pop_data_tag(next_start + self._cleaned)
         else:
             (next_start, next_end) = self.data_chunk_list[0]
+            tag = self._data_tags.get(next_start + self._cleaned)
         
         next_block = self.buffer[next_start:next_end]
+        if tagged:
+            next_block = (tag, next_block)
 
         if clean:    
             self._clean_buffer(next_end)
@@ -265,6 +707,13 @@ class Chunker(object):
         Clean up the buffer only...usually followed by some list cleaning
         @param end_index the last index used...clean up to here
         """
+        self._settled_index = max(0, self._settled_index - end_index)
+
+        # tags of blocks that got cut into are no use any more
+        self._cleaned += end_index
+        for start in [k for k in self._data_tags if k < self._cleaned]:
+            del self._data_tags[start]
+
         # Clean up buffer
         if isinstance(self.buffer, str):
             self.buffer = self.buffer[end_index:]
@@ -348,4 +797,254 @@ class BinaryChunker(Chunker):
     def __init__(self, data_sieve_fn):
         Chunker.__init__(self, data_sieve_fn)
         self.buffer = []
-    
\ No newline at end of file
+    
+
+class RingBufferChunker(Chunker):
+    """
+    A chunker backed by a bytearray with a moving read head. Consuming a
+    chunk only advances the head; the consumed prefix is dropped from the
+    bytearray in one shot once it grows past the compaction threshold, so
+    the cost of removing data is amortized O(1) per byte instead of
+    copying the whole buffer for every sample.
+
+    The chunk lists are deques of (start, end) tuples expressed in absolute
+    stream offsets (bytes since the chunker was created), so nothing has to
+    be rebased when data is consumed. Subtract self.head to get the offset
+    relative to the unconsumed data.
+    """
+    # Drop the consumed prefix once it is at least this many bytes and at
+    # least half of the backing buffer.
+    DEFAULT_COMPACT_THRESHOLD = 4096
+
+    def __init__(self, data_sieve_fn, compact_threshold=DEFAULT_COMPACT_THRESHOLD):
+        Chunker.__init__(self, data_sieve_fn)
+        self.buffer = bytearray()
+        self.raw_chunk_list = deque()
+        self.data_chunk_list = deque()
+        self.nondata_chunk_list = deque()
+
+        # absolute stream offset of self.buffer[0]
+        self.base = 0
+        # absolute stream offset of the first unconsumed byte
+        self.head = 0
+        self.compact_threshold = compact_threshold
+
+    def _tail(self):
+        """ Absolute stream offset one past the last byte in the buffer """
+        return self.base + len(self.buffer)
+
+    def _block(self, start, end):
+        """
+        Return the block between two absolute stream offsets. Subclasses
+        decide what type the caller gets back.
+        """
+        return self.buffer[start - self.base:end - self.base]
+
+    def add_chunk(self, raw_data):
+        """
+        Adds a chunk of data to the end of the buffer and sieves everything
+        after the last pending data block.
+
+        @param raw_data The raw data string (or bytearray) to append
+        """
+        start_index = self._tail()
+        self.buffer.extend(raw_data)
+        end_index = self._tail()
+        self.raw_chunk_list.append((start_index, end_index))
+
+        if self.data_chunk_list:
+            scan_index = self.data_chunk_list[-1][1]
+        else:
+            scan_index = self.head
+        scan_index = max(scan_index, self._settled_index)
+
+        # Everything from scan_index on is about to be re-classified
+        while self.nondata_chunk_list and self.nondata_chunk_list[-1][0] >= scan_index:
+            self.nondata_chunk_list.pop()
+        if self.nondata_chunk_list and self.nondata_chunk_list[-1][1] > scan_index:
+            (s, e) = self.nondata_chunk_list.pop()
+            self.nondata_chunk_list.append((s, scan_index))
+
+        result = self._generate_data_lists(start_index=scan_index,
+                                           cursor=start_index - scan_index)
+        self._settled_index = result['settled_index']
+
+        self._add_data_tags(result)
+        self.data_chunk_list.extend(result['data_chunk_list'])
+        for (s, e) in result['non_data_chunk_list']:
+            self._append_nondata(s, e)
+
+        log.debug("Added chunk, data_chunk_list: %s, nondata_chunk_list: %s",
+                  self.data_chunk_list, self.nondata_chunk_list)
+
+    def _append_nondata(self, start, end):
+        """
+        Add a non-data block, merging it with the previous block if they touch
+        """
+        if self.nondata_chunk_list and self.nondata_chunk_list[-1][1] == start:
+            (s, e) = self.nondata_chunk_list.pop()
+            self.nondata_chunk_list.append((s, end))
+        else:
+            self.nondata_chunk_list.append((start, end))
+
+    def _generate_data_lists(self, start_index=None, cursor=0):
+        """
+        Sieve the buffer from an absolute stream offset and return data and
+        non-data lists in absolute stream offsets.
+
+        @param start_index Absolute offset to start from, defaults to the head
+        @param cursor Offset from start_index of the first byte the sieve
+            has not seen yet
+        @retval A dict with keys "data_chunk_list", "non_data_chunk_list",
+            "data_tag_list" and "settled_index"
+        """
+        if start_index is None:
+            start_index = self.head
+
+        return_list = {'data_chunk_list':[], 'non_data_chunk_list':[]}
+        end_index = self._tail()
+        (result, tags, settled) = self._scan(
+            memoryview(self.buffer)[start_index - self.base:].tobytes(), cursor)
+        return_list['data_tag_list'] = tags
+
+        previous_end = start_index
+        for (s, e) in result:
+            s += start_index
+            e += start_index
+            if (s > previous_end):
+                return_list['non_data_chunk_list'].append((previous_end, s))
+            return_list['data_chunk_list'].append((s, e))
+            previous_end = e
+
+        # Trailing bytes after the last data block may be the start of the
+        # next block, so they are only called non-data when nothing matched
+        if not result and start_index < end_index:
+            return_list['non_data_chunk_list'].append((start_index, end_index))
+
+        # bytes the sieve settled past the last block are non-data for good
+        settled += start_index
+        if result and settled > previous_end:
+            return_list['non_data_chunk_list'].append((previous_end, settled))
+        return_list['settled_index'] = settled
+
+        return return_list
+
+    @staticmethod
+    def _trim_chunk_list(chunk_list, index):
+        """
+        Drop every block that ends at or before index and cut the first
+        remaining block so that it starts no earlier than index.
+
+        @param chunk_list deque of (start, end) tuples in stream offsets
+        @param index Absolute stream offset that has been consumed
+        """
+        while chunk_list and chunk_list[0][1] <= index:
+            chunk_list.popleft()
+        if chunk_list and chunk_list[0][0] < index:
+            (s, e) = chunk_list.popleft()
+            chunk_list.appendleft((index, e))
+
+    def _consume(self, index):
+        """
+        Move the read head up to an absolute stream offset. A data block that
+        straddles the new head can no longer be returned whole, so its
+        remainder is moved over to the non-data list.
+
+        @param index Absolute stream offset to consume up to
+        """
+        self.head = index
+        self._trim_chunk_list(self.raw_chunk_list, index)
+        self._trim_chunk_list(self.nondata_chunk_list, index)
+
+        while self.data_chunk_list and self.data_chunk_list[0][1] <= index:
+            (s, e) = self.data_chunk_list.popleft()
+            self._data_tags.pop(s, None)
+        if self.data_chunk_list and self.data_chunk_list[0][0] < index:
+            (s, e) = self.data_chunk_list.popleft()
+            self._data_tags.pop(s, None)
+            if self.nondata_chunk_list and self.nondata_chunk_list[0][0] == e:
+                (nds, nde) = self.nondata_chunk_list.popleft()
+                self.nondata_chunk_list.appendleft((index, nde))
+            else:
+                self.nondata_chunk_list.appendleft((index, e))
+
+        self._compact()
+
+    def _compact(self):
+        """
+        Release the consumed prefix of the buffer once it is worth the copy
+        """
+        consumed = self.head - self.base
+        if consumed >= self.compact_threshold and consumed * 2 >= len(self.buffer):
+            del self.buffer[:consumed]
+            self.base = self.head
+
+    def _next_block(self, chunk_list, clean):
+        """
+        Common code for the get_next_* methods.
+        """
+        if not chunk_list:
+            return None
+
+        (next_start, next_end) = chunk_list[0]
+        next_block = self._block(next_start, next_end)
+
+        if clean:
+            self._consume(next_end)
+
+        return next_block
+
+    def get_next_data(self, clean=True, tagged=False):
+        """
+        Get the next chunk of data from the buffer. By default, it clears all
+        that comes before it.
+
+        @param clean If set to false, do not clear the buffer when fetching the
+            data, but simply return the data block and make no further changes.
+        @param tagged If set, return a (tag, chunk) tuple where tag is the
+            name the sieve gave the block, None if it did not name it.
+        @return A chunk of data, or a (tag, chunk) tuple if tagged. None if
+            there is no data.
+        """
+        if not tagged:
+            return self._next_block(self.data_chunk_list, clean)
+
+        if not self.data_chunk_list:
+            return None
+        tag = self._data_tags.get(self.data_chunk_list[0][0])
+        return (tag, self._next_block(self.data_chunk_list, clean))
+
+    def get_next_non_data(self, clean=True):
+        """
+        Get the next chunk of non-data from the buffer, clearing all that comes
+        before it.
+
+        @param clean Remove the buffer contents before and including this data
+        @return A chunk of data, None if no data
+        """
+        return self._next_block(self.nondata_chunk_list, clean)
+
+    def get_next_raw(self, clean=True):
+        """
+        Get the next chunk of raw characters from the buffer, clearing all
+        that comes before it.
+
+        @param clean Remove the buffer contents before and including this data
+        @return A chunk of data, None if empty list
+        """
+        return self._next_block(self.raw_chunk_list, clean)
+
+
+class RingStringChunker(RingBufferChunker):
+    """
+    Drop-in replacement for StringChunker that hands out str blocks.
+    """
+    def _block(self, start, end):
+        return memoryview(self.buffer)[start - self.base:end - self.base].tobytes()
+
+
+class RingBinaryChunker(RingBufferChunker):
+    """
+    Drop-in replacement for BinaryChunker that hands out bytearray blocks.
+    """
+    pass
@@ -11,11 +11,13 @@ the driver and agent. This involves a JSON interchange format
 __author__ = 'Steve Foley'
 __license__ = 'Apache 2.0'
 
+import sys
 import time
-import copy
 import ntplib
 import base64
 import json
+from array import array
+from json.encoder import encode_basestring_ascii
 
 from mi.core.common import BaseEnum
 from mi.core.exceptions import SampleException, ReadOnlyException, NotImplementedException
@@ -28,6 +30,80 @@ class CommonDataParticleType(BaseEnum):
     """
     RAW = "raw"
 
+# Timestamps more than this far ahead of the clock are unreasonable, seconds
+FUTURE_TIMESTAMP_LIMIT = 86400*365
+
+# (system second, NTP limit) of the last future_timestamp_limit() call
+_future_limit = (None, None)
+
+def future_timestamp_limit():
+    """
+    The NTP time a year from now. Computed at most once a second since
+    every timestamp of every particle is checked against it.
+    @retval The limit as an NTP timestamp
+    """
+    global _future_limit
+    now = time.time()
+    (second, limit) = _future_limit
+    if second != int(now):
+        limit = ntplib.system_to_ntp_time(int(now) + 1 + FUTURE_TIMESTAMP_LIMIT)
+        _future_limit = (int(now), limit)
+    return limit
+
+_INFINITY = float('inf')
+
+def _encode_float(value):
+    if value != value:
+        return 'NaN'
+    if value == _INFINITY:
+        return 'Infinity'
+    if value == -_INFINITY:
+        return '-Infinity'
+    return repr(value)
+
+# JSON encoders for the scalar types particles are made of
+_SCALAR_ENCODERS = {
+    str: encode_basestring_ascii,
+    unicode: encode_basestring_ascii,
+    float: _encode_float,
+    int: str,
+    long: str,
+    bool: lambda value: value and 'true' or 'false',
+    type(None): lambda value: 'null'
+}
+
+class _NotEncodable(Exception):
+    pass
+
+def _encode_sorted(obj):
+    encode = _SCALAR_ENCODERS.get(type(obj))
+    if encode is not None:
+        return encode(obj)
+    if type(obj) is dict:
+        items = []
+        for key in sorted(obj):
+            if type(key) not in (str, unicode):
+                raise _NotEncodable()
+            items.append(encode_basestring_ascii(key) + ': ' + _encode_sorted(obj[key]))
+        return '{' + ', '.join(items) + '}'
+    if type(obj) in (list, tuple):
+        return '[' + ', '.join([_encode_sorted(value) for value in obj]) + ']'
+    raise _NotEncodable()
+
+def sorted_json(obj):
+    """
+    The same string as json.dumps(obj, sort_keys=True). The json module
+    falls back to its pure python encoder when sorting keys, this does the
+    same work for the plain dicts, lists and scalars particles are made of
+    in a fraction of the time, and hands anything else to json.dumps.
+    @param obj The structure to encode
+    @retval The JSON string
+    """
+    try:
+        return _encode_sorted(obj)
+    except _NotEncodable:
+        return json.dumps(obj, sort_keys=True)
+
 class DataParticleKey(BaseEnum):
     PKT_FORMAT_ID = "pkt_format_id"
     PKT_VERSION = "pkt_version"
@@ -41,6 +117,8 @@ class DataParticleKey(BaseEnum):
     VALUE_ID = "value_id"
     VALUE = "value"
     BINARY = "binary"
+    SHAPE = "shape"
+    ENCODING = "encoding"
 
 class DataParticleValue(BaseEnum):
     JSON_DATA = "JSON_Data"
@@ -50,7 +128,35 @@ class DataParticleValue(BaseEnum):
     OUT_OF_RANGE = "out_of_range"
     INVALID = "invalid"
     QUESTIONABLE = "questionable"
-    
+    FLOAT32 = "<f4"
+
+def packed_array_value(value_id, values):
+    """
+    A particle value holding an array of floats as the base64 of their
+    little endian float32 bytes rather than a JSON list, with no per
+    element encoding. A 1024 sample wave burst particle comes out at about
+    60% of its JSON list size. The shape and encoding are published with it
+    so the array can be rebuilt.
+    @param value_id The value id
+    @param values numpy array of any shape, or a sequence of floats
+    @retval The value dict
+    """
+    if hasattr(values, 'astype'):
+        shape = list(values.shape)
+        packed = values.astype(DataParticleValue.FLOAT32).tostring()
+    else:
+        shape = [len(values)]
+        floats = array('f', values)
+        if sys.byteorder == 'big':
+            floats.byteswap()
+        packed = floats.tostring()
+
+    return {DataParticleKey.VALUE_ID: value_id,
+            DataParticleKey.VALUE: base64.b64encode(packed),
+            DataParticleKey.BINARY: True,
+            DataParticleKey.SHAPE: shape,
+            DataParticleKey.ENCODING: DataParticleValue.FLOAT32}
+
 class DataParticle(object):
     """
     This class is responsible for storing and ultimately generating data
@@ -87,6 +193,10 @@ class DataParticle(object):
             DataParticleKey.QUALITY_FLAG: quality_flag
         }
         self.raw_data = raw_data
+
+        # generate() results, built on first use
+        self._generated = None
+        self._generated_json = None
     
     def set_value(self, id, value):
         """
@@ -98,6 +208,8 @@ class DataParticle(object):
         """
         if (id == DataParticleKey.INTERNAL_TIMESTAMP) and (self._check_timestamp(value)):
             self.contents[DataParticleKey.INTERNAL_TIMESTAMP] = value
+            self._generated = None
+            self._generated_json = None
         else:
             raise ReadOnlyException("Parameter %s not able to be set to %s after object creation!" %
                                     (id, value))
@@ -135,6 +247,24 @@ class DataParticle(object):
            and driver timestamp
         @throws InstrumentDriverException If there is a problem with the inputs
         """
+        if self._generated_json is None:
+            # JSONify response, sorting is nice for testing
+            self._generated_json = sorted_json(self.generate_dict())
+
+        return self._generated_json
+
+    def generate_dict(self):
+        """
+        Generates the packet structure that generate() JSONifies. The
+        structure is built once and shared between calls, so it should not
+        be modified.
+
+        @return The packet as a dict
+        @throws SampleException If there is a problem with the inputs
+        """
+        if self._generated is not None:
+            return self._generated
+
         for time in [DataParticleKey.INTERNAL_TIMESTAMP,
                      DataParticleKey.DRIVER_TIMESTAMP,
                      DataParticleKey.PORT_TIMESTAMP]:
@@ -149,12 +279,9 @@ class DataParticle(object):
         result = self._build_base_structure()
         result[DataParticleKey.STREAM_NAME] = self.data_particle_type()
         result[DataParticleKey.VALUES] = self._build_parsed_values()
-        
-        # JSONify response, sorting is nice for testing
-        json_result = json.dumps(result, sort_keys=True)
-        
-        # return result
-        return json_result
+
+        self._generated = result
+        return result
         
     def _build_parsed_values(self):
         """
@@ -175,12 +302,8 @@ class DataParticle(object):
         
         @return A fresh copy of a core structure to be exported
         """
-        # set the driver time
-        driver_time = ntplib.system_to_ntp_time(time.time())
-        result = {}
-        result[DataParticleKey.DRIVER_TIMESTAMP] = driver_time
-        
-        result = copy.deepcopy(self.contents)
+        # the header holds only numbers and strings, a shallow copy will do
+        result = dict(self.contents)
         # clean out optional fields that were missing
         if not self.contents[DataParticleKey.PORT_TIMESTAMP]:
             del result[DataParticleKey.PORT_TIMESTAMP]
@@ -201,7 +324,7 @@ class DataParticle(object):
             return False
         
         # is it sufficiently in the future to be unreasonable?
-        if timestamp > ntplib.system_to_ntp_time(time.time()+(86400*365)):
+        if timestamp > future_timestamp_limit():
             return False
         else:
             return True
@@ -19,11 +19,66 @@ import os
 import sys
 import time
 import traceback
+import Queue
+from mi.core.common import BaseEnum
 from mi.core.exceptions import InstrumentException, InstrumentCommandException
+from mi.core.exceptions import InstrumentParameterException
 from mi.core.instrument.instrument_driver import DriverAsyncEvent
+from mi.core.instrument.instrument_driver import DriverConfigKey
+from mi.core.instrument.instrument_driver import EventBatchKey
+from mi.core.instrument import event_codec
 
 from ooi.logging import log
 
+# Queued by stop_messaging to wake the event thread.
+STOP_EVENT_THREAD = object()
+
+class FlushCause(BaseEnum):
+    """
+    Why a batch of events was sent.
+    """
+    SIZE = 'size'
+    LATENCY = 'latency'
+    STOP = 'stop'
+
+class EventBatchMetrics(object):
+    """
+    Counts of the event batches sent by a driver process.
+    """
+    def __init__(self):
+        self.batches = 0
+        self.events = 0
+        self.max_size = 0
+        # batch size -> number of batches that size
+        self.sizes = {}
+        self.flush_causes = dict([(cause, 0) for cause in FlushCause.list()])
+
+    def record(self, size, cause):
+        """
+        Count a batch.
+        @param size Number of events in the batch
+        @param cause The FlushCause
+        """
+        self.batches += 1
+        self.events += size
+        self.max_size = max(self.max_size, size)
+        self.sizes[size] = self.sizes.get(size, 0) + 1
+        self.flush_causes[cause] += 1
+
+    def get_metrics(self):
+        """
+        @retval dict of the counts and the mean batch size
+        """
+        mean_size = 0.0
+        if self.batches:
+            mean_size = float(self.events) / self.batches
+        return {'batches': self.batches,
+                'events': self.events,
+                'mean_size': mean_size,
+                'max_size': self.max_size,
+                'sizes': dict(self.sizes),
+                'flush_causes': dict(self.flush_causes)}
+
 class DriverProcess(object):
     """
     Base class for messaging enabled OS-level driver processes. Provides
@@ -56,8 +111,17 @@ class DriverProcess(object):
         self.driver_class = driver_class
         self.ppid = ppid
         self.driver = None
-        self.events = []
+        self.events = Queue.Queue()
         self.messaging_started = False
+
+        # Name of the codec events are sent with, None until a client asks
+        # for one, meaning plain pickles.
+        self.event_codec = None
+
+        # Events are sent one at a time until batching is configured.
+        self.event_batch_size = 1
+        self.event_batch_latency = 0
+        self.event_batch_metrics = EventBatchMetrics()
         
     def construct_driver(self):
         """
@@ -130,6 +194,11 @@ class DriverProcess(object):
         'stop_driver_process' - signal to close messaging and terminate.
         'test_events' - populate event queue with test data.
         'process_echo' - echos the message back.
+        'set_event_codec' - pick the event codec from the client's list of
+        preferences and reply with its name.
+        'get_event_batch_metrics' - reply with the event batch counts.
+        'set_init_params' is forwarded to the driver after the event batch
+        config, if any, is applied.
         If the command is not found in the driver, an echo message is
         replied to the client.
         @param msg A driver command message.
@@ -145,8 +214,19 @@ class DriverProcess(object):
             return'stop_driver_process'
         elif cmd == 'test_events':
             events = kwargs['events']
-            self.events += events
+            for evt in events:
+                self.events.put(evt)
             reply = 'test_events'
+        elif cmd == 'set_event_codec':
+            try:
+                self.event_codec = event_codec.choose_codec(args[0])
+                reply = self.event_codec
+            except InstrumentException as e:
+                reply = e
+        elif cmd == 'get_event_batch_metrics':
+            reply = self.event_batch_metrics.get_metrics()
+        elif cmd == 'set_init_params' and not self._configure_event_batch(args):
+            reply = InstrumentParameterException('Invalid event batch config.')
         elif cmd == 'process_echo':
             reply = 'ping from resource ppid:%s, resource:%s' % (str(self.ppid), str(self.driver))
             #try:
@@ -185,11 +265,76 @@ class DriverProcess(object):
         
         return reply        
             
+    def _configure_event_batch(self, args):
+        """
+        Apply the event batch config from set_init_params arguments.
+        @param args The set_init_params arguments
+        @retval False if the config is invalid
+        """
+        if not args or not isinstance(args[0], dict):
+            return True
+        config = args[0].get(DriverConfigKey.EVENT_BATCH)
+        if config is None:
+            return True
+
+        try:
+            size = int(config.get(EventBatchKey.MAX_EVENTS, 1))
+            latency = float(config.get(EventBatchKey.MAX_LATENCY, 0))
+        except (AttributeError, TypeError, ValueError):
+            log.error('Invalid event batch config: %s' % str(config))
+            return False
+        if size < 1 or latency < 0:
+            log.error('Invalid event batch config: %s' % str(config))
+            return False
+
+        log.info('Driver process batching up to %d events for %.1f ms.' % (size, latency))
+        self.event_batch_size = size
+        self.event_batch_latency = latency
+        return True
+
+    def get_events(self):
+        """
+        Block until an event is queued, then return it along with any
+        events that follow it within the batch latency, up to the batch
+        size. Without batching a single event is returned.
+        @retval list of events, empty if woken by stop_messaging
+        """
+        evt = self.events.get()
+        if evt is STOP_EVENT_THREAD:
+            return []
+        batch = [evt]
+        if self.event_batch_size <= 1:
+            return batch
+
+        deadline = time.time() + self.event_batch_latency / 1000.0
+        while True:
+            if len(batch) >= self.event_batch_size:
+                cause = FlushCause.SIZE
+                break
+            try:
+                evt = self.events.get_nowait()
+            except Queue.Empty:
+                remaining = deadline - time.time()
+                try:
+                    if remaining <= 0:
+                        raise Queue.Empty()
+                    evt = self.events.get(timeout=remaining)
+                except Queue.Empty:
+                    cause = FlushCause.LATENCY
+                    break
+            if evt is STOP_EVENT_THREAD:
+                cause = FlushCause.STOP
+                break
+            batch.append(evt)
+
+        self.event_batch_metrics.record(len(batch), cause)
+        return batch
+
     def send_event(self, evt):
         """
-        Append an event to the list to be sent by the event threaed.
+        Queue an event to be sent by the event thread.
         """
-        self.events.append(evt)
+        self.events.put(evt)
             
     def run(self):
         """
@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.instrument.event_codec
+@file mi/core/instrument/event_codec.py
+@brief Wire codecs for driver process events.
+
+Sample events carry a value that is already a JSON string, so rather than
+serializing the whole event again the codecs only encode the small dict
+around a string value and send the value itself untouched.
+
+An encoded event starts with a header holding the codec, where the value
+went and the length of the encoded dict:
+
+    [header][encoded dict][value]
+
+A value smaller than ZERO_COPY_THRESHOLD rides in the same frame, a bigger
+one goes in a second frame so it is never copied into the first. A message
+that starts with the pickle protocol marker is a legacy pickled event.
+
+A batch of events is sent as one message whose first frame starts with
+BATCH_MARKER and holds, for each event, the length of its first frame, the
+number of frames that follow it, and the frame itself. Any following frames
+come after the first frame, in order:
+
+    [marker]([length][count][event frame])...  [big value]...
+"""
+
+__license__ = 'Apache 2.0'
+
+import cPickle as pickle
+import json
+import struct
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from mi.core.instrument.instrument_driver import DriverAsyncEvent
+from mi.core.exceptions import InstrumentParameterException
+from mi.core.exceptions import NotImplementedException
+
+# Values at least this big go in a frame of their own.
+ZERO_COPY_THRESHOLD = 65536
+
+# codec code, value placement, length of the encoded dict
+HEADER_FORMAT = '>BBI'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+# Where the string value is
+NO_VALUE = 0
+INLINE_VALUE = 1
+FRAME_VALUE = 2
+
+# First byte of a protocol 2 pickle
+PICKLE_MARKER = '\x80'
+
+# First byte of a batch, no codec has code 0
+BATCH_MARKER = '\x00'
+
+# event frame length, number of frames after it
+BATCH_RECORD_FORMAT = '>IB'
+BATCH_RECORD_SIZE = struct.calcsize(BATCH_RECORD_FORMAT)
+
+class EventCodec(object):
+    """
+    Base class for event codecs. A codec encodes the event dict, minus
+    its value when the value is a string, to a string and back.
+    """
+    name = None
+    code = None
+    # False if the codec takes the whole event, value and all
+    split_value = True
+
+    def encode(self, evt):
+        """
+        @param evt The event dict
+        @retval The encoded string
+        @raises TypeError or ValueError if the codec can not carry the event
+        """
+        raise NotImplementedException('encode() not implemented.')
+
+    def decode(self, data):
+        """
+        @param data A string made by encode
+        @retval The event dict
+        """
+        raise NotImplementedException('decode() not implemented.')
+
+class PickleCodec(EventCodec):
+    """
+    The whole event pickled. Slowest to decode, but carries anything.
+    """
+    name = 'pickle'
+    code = 1
+    split_value = False
+
+    def encode(self, evt):
+        return pickle.dumps(evt, pickle.HIGHEST_PROTOCOL)
+
+    def decode(self, data):
+        return pickle.loads(data)
+
+class JsonCodec(EventCodec):
+    """
+    The event dict as JSON.
+    """
+    name = 'json'
+    code = 2
+
+    def encode(self, evt):
+        return json.dumps(evt)
+
+    def decode(self, data):
+        return json.loads(data)
+
+class MsgpackCodec(EventCodec):
+    """
+    The event dict as msgpack.
+    """
+    name = 'msgpack'
+    code = 3
+
+    def encode(self, evt):
+        return msgpack.packb(evt)
+
+    def decode(self, data):
+        return msgpack.unpackb(data)
+
+class BinaryCodec(EventCodec):
+    """
+    The event time and a code for the event type packed into 9 bytes. Only
+    carries events with a known type, a time, and a string or empty value.
+    """
+    name = 'binary'
+    code = 4
+
+    FORMAT = '>dB'
+    TYPES = sorted(DriverAsyncEvent.list())
+    TYPE_CODES = dict([(t, i) for (i, t) in enumerate(TYPES)])
+
+    def encode(self, evt):
+        if sorted(evt.keys()) not in (['time', 'type'], ['time', 'type', 'value']) \
+           or evt.get('value') is not None:
+            raise TypeError('event does not fit the binary header')
+        return struct.pack(self.FORMAT, evt['time'], self.TYPE_CODES[evt['type']])
+
+    def decode(self, data):
+        (evt_time, type_code) = struct.unpack(self.FORMAT, data)
+        return {'type': self.TYPES[type_code], 'time': evt_time, 'value': None}
+
+CODECS = {}
+CODECS_BY_CODE = {}
+for _codec in (PickleCodec(), JsonCodec(), BinaryCodec()):
+    CODECS[_codec.name] = _codec
+if msgpack is not None:
+    CODECS[MsgpackCodec.name] = MsgpackCodec()
+for _codec in CODECS.values():
+    CODECS_BY_CODE[_codec.code] = _codec
+
+def choose_codec(names):
+    """
+    Pick the first codec in a client's list of preferences that is
+    available here.
+    @param names Codec names in order of preference
+    @retval The codec name
+    @raises InstrumentParameterException if none of them are available
+    """
+    for name in names:
+        if name in CODECS:
+            return name
+    raise InstrumentParameterException('No supported event codec in %s' % str(names))
+
+def encode_event(name, evt):
+    """
+    Encode an event into message frames. Events the named codec can not
+    carry are pickled instead.
+    @param name The codec name, None for a legacy pickled event
+    @param evt The event
+    @retval list of frames
+    """
+    if name is None:
+        return [pickle.dumps(evt, pickle.HIGHEST_PROTOCOL)]
+
+    codec = CODECS[name]
+    value = None
+    try:
+        if not isinstance(evt, dict):
+            raise TypeError('not an event dict')
+        if codec.split_value and isinstance(evt.get('value'), str):
+            meta = dict(evt)
+            value = meta.pop('value')
+            data = codec.encode(meta)
+        else:
+            data = codec.encode(evt)
+    except (TypeError, ValueError, KeyError):
+        codec = CODECS[PickleCodec.name]
+        value = None
+        data = codec.encode(evt)
+
+    if value is None:
+        return [struct.pack(HEADER_FORMAT, codec.code, NO_VALUE, len(data)) + data]
+    if len(value) < ZERO_COPY_THRESHOLD:
+        return [struct.pack(HEADER_FORMAT, codec.code, INLINE_VALUE, len(data)) + data + value]
+    return [struct.pack(HEADER_FORMAT, codec.code, FRAME_VALUE, len(data)) + data, value]
+
+def decode_event(frames):
+    """
+    Decode message frames made by encode_event.
+    @param frames list of frames
+    @retval The event
+    """
+    first = frames[0]
+    if first[:1] == PICKLE_MARKER:
+        return pickle.loads(first)
+
+    (code, placement, length) = struct.unpack_from(HEADER_FORMAT, first)
+    end = HEADER_SIZE + length
+    evt = CODECS_BY_CODE[code].decode(first[HEADER_SIZE:end])
+    if placement == INLINE_VALUE:
+        evt['value'] = first[end:]
+    elif placement == FRAME_VALUE:
+        evt['value'] = frames[1]
+    return evt
+
+def encode_batch(name, evts):
+    """
+    Encode several events into the frames of one message.
+    @param name The codec name, None for legacy pickled events
+    @param evts list of events
+    @retval list of frames
+    """
+    records = [BATCH_MARKER]
+    extra_frames = []
+    for evt in evts:
+        frames = encode_event(name, evt)
+        records.append(struct.pack(BATCH_RECORD_FORMAT, len(frames[0]), len(frames) - 1))
+        records.append(frames[0])
+        extra_frames.extend(frames[1:])
+    return [''.join(records)] + extra_frames
+
+def decode_events(frames):
+    """
+    Decode message frames made by encode_event or encode_batch.
+    @param frames list of frames
+    @retval list of events
+    """
+    first = frames[0]
+    if first[:1] != BATCH_MARKER:
+        return [decode_event(frames)]
+
+    evts = []
+    pos = len(BATCH_MARKER)
+    next_frame = 1
+    while pos < len(first):
+        (length, count) = struct.unpack_from(BATCH_RECORD_FORMAT, first, pos)
+        pos += BATCH_RECORD_SIZE
+        evt_frames = [first[pos:pos + length]] + frames[next_frame:next_frame + count]
+        evts.append(decode_event(evt_frames))
+        pos += length
+        next_frame += count
+    return evts
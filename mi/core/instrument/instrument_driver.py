@@ -30,6 +30,18 @@ class DriverConfigKey(BaseEnum):
     """
     PARAMETERS = 'parameters'
     SCHEDULER = 'scheduler'
+    EVENT_BATCH = 'event_batch'
+    RAW_PUBLISHING = 'raw_publishing'
+
+class EventBatchKey(BaseEnum):
+    """
+    Dictionary keys for the driver process event batching config, found
+    under DriverConfigKey.EVENT_BATCH.
+    """
+    # Most events sent in one message
+    MAX_EVENTS = 'max_events'
+    # Longest time, in ms, the first event of a batch waits for others
+    MAX_LATENCY = 'max_latency'
 
 # This is a copy since we can't import from pyon.
 class ResourceAgentState(BaseEnum):
@@ -155,6 +167,8 @@ class DriverAsyncEvent(BaseEnum):
     RESULT = 'DRIVER_ASYNC_RESULT'
     DIRECT_ACCESS = 'DRIVER_ASYNC_EVENT_DIRECT_ACCESS'
     AGENT_EVENT = 'DRIVER_ASYNC_EVENT_AGENT_EVENT'
+    # port agent connection lost, restored or given up on
+    CONNECTION_STATUS = 'DRIVER_ASYNC_EVENT_CONNECTION_STATUS'
 
 class DriverParameter(BaseEnum):
     """
@@ -346,6 +360,10 @@ class InstrumentDriver(object):
             event['value'] = val
             self._send_event(event)
 
+        elif type == DriverAsyncEvent.CONNECTION_STATUS:
+            event['value'] = val
+            self._send_event(event)
+
 
     ########################################################################
     # Test interface.
@@ -534,6 +552,42 @@ class SingleConnectionInstrumentDriver(InstrumentDriver):
         if self._protocol:
             return self._protocol.get_cached_config()
                 
+    def set_stream_subscriptions(self, subscriptions):
+        """
+        Tell the protocol which streams have subscribers, so it can skip
+        building particles no one wants.
+        @param subscriptions dict of stream name -> True if subscribed
+        """
+        if self._protocol:
+            self._protocol.set_stream_subscriptions(subscriptions)
+
+    def get_raw_publishing_counters(self):
+        """
+        Return the packets and bytes the protocol handled in each raw
+        publishing mode.
+        @retval dict of mode -> counters, None if there is no protocol
+        """
+        if self._protocol:
+            return self._protocol.get_raw_publishing_counters()
+
+    def get_connection_metrics(self):
+        """
+        Return the port agent reconnect counts and downtime.
+        @retval dict of ConnectionMetric -> value, None if there is no port
+        agent connection
+        """
+        if isinstance(self._connection, PortAgentClient):
+            return self._connection.get_connection_metrics()
+
+    def get_buffer_metrics(self):
+        """
+        Return the size of the protocol input buffers and how much data was
+        dropped from them to keep them bounded.
+        @retval dict of BufferMetric -> value, None if there is no protocol
+        """
+        if self._protocol:
+            return self._protocol.get_buffer_metrics()
+
     def restore_direct_access_params(self, config):
         """
         Restore the correct values out of the full config that is given when
@@ -824,7 +878,7 @@ class SingleConnectionInstrumentDriver(InstrumentDriver):
         result = None
         
         self._connection.stop_comms()
-        self._protocol = None
+        self._shutdown_protocol()
         next_state = DriverConnectionState.DISCONNECTED
         
         return (next_state, result)
@@ -840,11 +894,19 @@ class SingleConnectionInstrumentDriver(InstrumentDriver):
         result = None
 
         self._connection.stop_comms()
-        self._protocol = None
+        self._shutdown_protocol()
         next_state = DriverConnectionState.DISCONNECTED
         
         return (next_state, result)
 
+    def _shutdown_protocol(self):
+        """
+        Let the protocol stop what it started, then destroy it.
+        """
+        if self._protocol:
+            self._protocol.shutdown()
+        self._protocol = None
+
     def _handler_connected_protocol_event(self, event, *args, **kwargs):
         """
         Forward a driver command event to the protocol FSM.
@@ -914,13 +976,22 @@ class SingleConnectionInstrumentDriver(InstrumentDriver):
             cmd_port = config.get('cmd_port')
 
             if isinstance(addr, str) and isinstance(port, int) and len(addr)>0:
-                return PortAgentClient(addr, port, cmd_port)
+                return PortAgentClient(addr, port, cmd_port,
+                                       reconnect=config.get('reconnect'),
+                                       status_callback=self._connection_status)
             else:
                 raise InstrumentParameterException('Invalid comms config dict.')
 
         except (TypeError, KeyError):
             raise InstrumentParameterException('Invalid comms config dict.')
 
+    def _connection_status(self, status):
+        """
+        Report a change of the port agent connection to the agent.
+        @param status dict of ConnectionMetric -> value
+        """
+        self._driver_event(DriverAsyncEvent.CONNECTION_STATUS, status)
+
     def _build_protocol(self):
         """
         Construct device specific single connection protocol FSM.
@@ -13,14 +13,18 @@ nitty-gritty interaction with individual instruments in the system.
 __author__ = 'Steve Foley'
 __license__ = 'Apache 2.0'
 
+import re
 import time
-import json
+import threading
+from collections import deque
 
 from mi.core.log import get_logger ; log = get_logger()
 
 from mi.core.common import BaseEnum, InstErrorCode
 from mi.core.instrument.data_particle import DataParticleKey
-from mi.core.instrument.data_particle import RawDataParticle
+from mi.core.instrument.data_particle import CommonDataParticleType
+from mi.core.instrument.raw_publisher import RawDataPublisher
+from mi.core.instrument.port_agent_client import PortAgentClient
 from mi.core.instrument.instrument_driver import DriverConfigKey
 from mi.core.driver_scheduler import DriverScheduler
 from mi.core.driver_scheduler import DriverSchedulerConfigKey
@@ -34,6 +38,25 @@ from mi.core.exceptions import InstrumentProtocolException
 from mi.core.exceptions import InstrumentParameterException
 from mi.core.exceptions import NotImplementedException
 
+# Longest wait between prompt checks while waiting for a prompt. Data added
+# with add_to_buffer wakes waiters at once, this only bounds the wait for
+# subclasses that append to the prompt buffer themselves.
+PROMPT_POLL_INTERVAL = .1
+
+class BufferMetric(BaseEnum):
+    """
+    Keys of the dict returned by get_buffer_metrics.
+    """
+    LINEBUF_SIZE = 'linebuf_size'
+    LINEBUF_LIMIT = 'linebuf_limit'
+    # times data was dropped from the head of a full line buffer
+    LINEBUF_OVERFLOWS = 'linebuf_overflows'
+    LINEBUF_OVERFLOW_BYTES = 'linebuf_overflow_bytes'
+    PROMPTBUF_SIZE = 'promptbuf_size'
+    PROMPTBUF_LIMIT = 'promptbuf_limit'
+    # bytes dropped from the head of the prompt buffer
+    PROMPTBUF_TRIMMED_BYTES = 'promptbuf_trimmed_bytes'
+
 class InterfaceType(BaseEnum):
     """The methods of connecting to a device"""
     ETHERNET = 'ethernet'
@@ -74,6 +97,16 @@ class InstrumentProtocol(object):
         self._scheduler_callback = {}
         self._scheduler_config = {}
 
+        # Particle classes for chunks the chunker has tagged, keyed by tag.
+        self._particle_handlers = {}
+
+        # Streams the agent has told us whether anyone subscribes to.
+        self._stream_subscriptions = {}
+
+        # Turns port agent packets into raw particles.
+        self._raw_publisher = RawDataPublisher(self._publish_raw_particle,
+            lambda: self.stream_subscribed(CommonDataParticleType.RAW))
+
     ########################################################################
     # Helper methods
     ########################################################################
@@ -85,6 +118,13 @@ class InstrumentProtocol(object):
         log.error("base got_data.  Who called me?")
         pass
 
+    def _got_chunk(self, chunk):
+        """
+        Called with each chunk the chunker finds that has no particle handler
+        registered for its tag. Defined in subclasses that use a chunker.
+        """
+        raise NotImplementedException('_got_chunk() not implemented.')
+
     def _extract_sample(self, particle_class, regex, line, publish=True):
         """
         Extract sample from a response line if present and publish
@@ -107,19 +147,100 @@ class InstrumentProtocol(object):
 
         sample = None
         if regex.match(line):
-        
-            particle = particle_class(line,
-                preferred_timestamp=DataParticleKey.DRIVER_TIMESTAMP)
+            sample = self._generate_particle(particle_class, line, publish)
+        return sample
 
-            parsed_sample = particle.generate()
+    def _generate_particle(self, particle_class, chunk, publish=True):
+        """
+        Build a particle from a chunk already known to hold that kind of
+        sample and publish it.
+
+        @param particle_class The class to instantiate for this chunk
+        @param chunk The sample data
+        @param publish boolean to publish the parsed particle (default True)
+        @retval The parsed sample as a dict
+        """
+        particle = particle_class(chunk,
+            preferred_timestamp=DataParticleKey.DRIVER_TIMESTAMP)
+
+        sample = particle.generate_dict()
+
+        if publish and self._driver_event:
+            self._driver_event(DriverAsyncEvent.SAMPLE, particle.generate())
 
-            if publish and self._driver_event:
-                self._driver_event(DriverAsyncEvent.SAMPLE, parsed_sample)
-    
-            sample = json.loads(parsed_sample)
-            return sample
         return sample
 
+    def _add_particle_handler(self, tag, particle_class):
+        """
+        Register the particle class built from chunks the chunker tags with
+        tag. Those chunks go straight to the particle class instead of
+        through _got_chunk.
+
+        @param tag The name the sieve gives the chunks
+        @param particle_class The class to instantiate for those chunks
+        """
+        self._particle_handlers[tag] = particle_class
+
+    def _got_tagged_chunk(self, tag, chunk):
+        """
+        Dispatch a chunk from the chunker. Tagged chunks with a registered
+        particle class build exactly that particle, anything else is handed
+        to _got_chunk.
+
+        @param tag The tag the sieve gave the chunk, None if untagged
+        @param chunk The chunk of data
+        """
+        particle_class = self._particle_handlers.get(tag)
+        if particle_class is None:
+            self._got_chunk(chunk)
+        else:
+            self._generate_particle(particle_class, chunk)
+
+    def set_stream_subscriptions(self, subscriptions):
+        """
+        Record which streams have subscribers. Streams not mentioned keep
+        their previous setting.
+        @param subscriptions dict of stream name -> True if subscribed
+        @raise InstrumentParameterException if subscriptions is not a dict
+        """
+        if not isinstance(subscriptions, dict):
+            raise InstrumentParameterException("Invalid stream subscriptions")
+        self._stream_subscriptions.update(subscriptions)
+
+    def stream_subscribed(self, stream_name):
+        """
+        @param stream_name The stream name
+        @retval False if the agent said no one subscribes to the stream
+        """
+        return self._stream_subscriptions.get(stream_name, True)
+
+    def get_raw_publishing_counters(self):
+        """
+        @retval dict of raw publishing mode -> dict of the packets and
+            bytes handled and particles published in that mode
+        """
+        return self._raw_publisher.get_counters()
+
+    def get_buffer_metrics(self):
+        """
+        @retval dict of BufferMetric -> value for the protocol input
+            buffers, empty if the protocol keeps none
+        """
+        return {}
+
+    def shutdown(self):
+        """
+        Called by the driver when it drops the protocol on disconnect or a
+        lost connection. Publish the raw data held for an aggregate and stop
+        anything the protocol started that would otherwise outlive it.
+        Extended in subclasses that start threads.
+        """
+        self._raw_publisher.shutdown()
+
+    def _publish_raw_particle(self, particle):
+        if self._driver_event:
+            self._driver_event(DriverAsyncEvent.SAMPLE, particle)
+
     def get_current_state(self):
         """
         Return current state of the protocol FSM.
@@ -243,6 +364,7 @@ class InstrumentProtocol(object):
         if not isinstance(config, dict):
             raise InstrumentParameterException("Invalid init config format")
 
+        self._configure_raw_publishing(config)
         self._startup_config = config
 
         param_config = config.get(DriverConfigKey.PARAMETERS)
@@ -250,6 +372,15 @@ class InstrumentProtocol(object):
             for name in param_config.keys():
                 self._param_dict.set_init_value(name, param_config[name])
     
+    def _configure_raw_publishing(self, config):
+        """
+        Apply the raw publishing part of the driver config.
+        @param config The driver config
+        @raise InstrumentParameterException If the raw publishing config is
+            invalid
+        """
+        self._raw_publisher.configure(config.get(DriverConfigKey.RAW_PUBLISHING))
+
     def get_startup_config(self):
         """
         Gets the startup configuration for the instrument. The parameters
@@ -425,6 +556,15 @@ class CommandResponseInstrumentProtocol(InstrumentProtocol):
     """
     Base class for text-based command-response instruments.
     """
+
+    # Max bytes kept in the line buffer. Older data is dropped when more
+    # arrives, as happens while autosampling when nothing clears it.
+    LINE_BUFFER_SIZE = 262144
+
+    # Bytes kept in the prompt buffer on top of the longest prompt, for
+    # trailing whitespace and for subclasses that look for other responses
+    # in it.
+    PROMPT_BUFFER_SLACK = 1024
     
     def __init__(self, prompts, newline, driver_event):
         """
@@ -444,7 +584,7 @@ class CommandResponseInstrumentProtocol(InstrumentProtocol):
         # Class of prompts used by device.
         self._prompts = prompts
     
-        # Line buffer for input from device.
+        # Line buffer for input from device, see _get_linebuf.
         self._linebuf = ''
         
         # Short buffer to look for prompts from device in command-response
@@ -461,7 +601,139 @@ class CommandResponseInstrumentProtocol(InstrumentProtocol):
         self._response_handlers = {}
 
         self._last_data_receive_timestamp = None
-        
+
+        # Notified whenever data is added to the buffers.
+        self._buffer_condition = threading.Condition()
+
+        # Compiled prompt alternations, see _prompt_matcher.
+        self._prompt_matchers = {}
+
+        # Text _wait_for_text is waiting for and whether it has arrived.
+        self._awaited_text = None
+        self._awaited_text_found = False
+
+        # Bounds of the line and prompt buffers, see add_to_buffer.
+        longest_prompt = 0
+        if prompts is not None:
+            longest_prompt = max([len(item) for item in prompts.list()] or [0])
+        self._linebuf_limit = self.LINE_BUFFER_SIZE
+        self._promptbuf_limit = longest_prompt + self.PROMPT_BUFFER_SLACK
+        self._linebuf_overflows = 0
+        self._linebuf_overflow_bytes = 0
+        self._promptbuf_trimmed_bytes = 0
+
+    def _get_linebuf(self):
+        """
+        The line buffer is kept as a queue of the chunks that arrived so
+        adding data and dropping old data don't copy the whole buffer.  The
+        chunks are only joined when the buffer is read.
+        @retval the line buffer string
+        """
+        chunks = self._linebuf_chunks
+        if self._linebuf_head or len(chunks) > 1:
+            chunks[0] = chunks[0][self._linebuf_head:]
+            linebuf = ''.join(chunks)
+            chunks.clear()
+            chunks.append(linebuf)
+            self._linebuf_head = 0
+        if chunks:
+            return chunks[0]
+        return ''
+
+    def _set_linebuf(self, linebuf):
+        self._linebuf_chunks = deque()
+        self._linebuf_head = 0
+        self._linebuf_size = len(linebuf)
+        if linebuf:
+            self._linebuf_chunks.append(linebuf)
+
+    _linebuf = property(_get_linebuf, _set_linebuf)
+
+    def _prompt_list(self, expected_prompt):
+        """
+        @param expected_prompt None for all the prompts of the device, a
+        prompt string, or a list of prompt strings
+        @retval list of prompt strings
+        """
+        if expected_prompt == None:
+            return self._prompts.list()
+        if isinstance(expected_prompt, str):
+            return [expected_prompt]
+        return expected_prompt
+
+    def _prompt_matcher(self, prompt_list, strip_chars):
+        """
+        Compile the prompts into one pattern matching any of them at the end
+        of a prompt buffer stripped of strip_chars. When several match the
+        longest wins, as it is the most specific.
+        @param prompt_list list of prompt strings
+        @param strip_chars trailing characters ignored on both the buffer
+        and the prompts, None for whitespace
+        @retval (compiled pattern, dict of stripped prompt -> prompt, length
+        of the longest stripped prompt)
+        """
+        key = (tuple(prompt_list), strip_chars)
+        matcher = self._prompt_matchers.get(key)
+        if matcher is None:
+            prompts = {}
+            for item in prompt_list:
+                prompts.setdefault(item.rstrip(strip_chars), item)
+            stripped = sorted(prompts.keys(), key=len, reverse=True)
+            # no prompts, nothing to match
+            alternatives = '|'.join([re.escape(item) for item in stripped]) or '(?!)'
+            pattern = re.compile('(?:%s)\\Z' % alternatives)
+            matcher = (pattern, prompts, len(stripped[0]) if stripped else 0)
+            self._prompt_matchers[key] = matcher
+        return matcher
+
+    def _wait_for_prompt(self, prompt_list, timeout, strip_chars=None):
+        """
+        Wait until the prompt buffer ends with one of the prompts. The
+        buffer is checked once whenever data arrives.
+        @param prompt_list list of prompt strings
+        @param timeout The timeout in seconds
+        @param strip_chars trailing characters ignored on both the buffer
+        and the prompts, None for whitespace
+        @retval The prompt found, None on timeout
+        """
+        (pattern, prompts, max_length) = self._prompt_matcher(prompt_list, strip_chars)
+        endtime = time.time() + timeout
+        with self._buffer_condition:
+            while True:
+                promptbuf = self._promptbuf.rstrip(strip_chars)
+                match = pattern.search(promptbuf, max(0, len(promptbuf) - max_length))
+                if match:
+                    return prompts[match.group()]
+
+                remaining = endtime - time.time()
+                if remaining <= 0:
+                    return None
+                self._buffer_condition.wait(min(remaining, PROMPT_POLL_INTERVAL))
+
+    def _wait_for_text(self, text, timeout):
+        """
+        Wait for text to show up anywhere in the prompt buffer. Each chunk
+        of data is checked as it is added, so the text is found even when
+        more data than the prompt buffer holds follows it, as when an
+        instrument starts streaming right after a response.
+        @param text The text to look for
+        @param timeout The timeout in seconds
+        @retval True if the text arrived, False on timeout
+        """
+        endtime = time.time() + timeout
+        with self._buffer_condition:
+            self._awaited_text = text
+            self._awaited_text_found = False
+            try:
+                while not (self._awaited_text_found or text in self._promptbuf):
+                    remaining = endtime - time.time()
+                    if remaining <= 0:
+                        return False
+                    self._buffer_condition.wait(min(remaining, PROMPT_POLL_INTERVAL))
+                return True
+            finally:
+                self._awaited_text = None
+
     def _get_response(self, timeout=10, expected_prompt=None):
         """
         Get a response from the instrument, but be a bit loose with what we
@@ -475,26 +747,10 @@ class CommandResponseInstrumentProtocol(InstrumentProtocol):
         presented by this string
         @throw InstrumentProtocolExecption on timeout
         """
-        # Grab time for timeout and wait for prompt.
-
-        starttime = time.time()
-        if expected_prompt == None:
-            prompt_list = self._prompts.list()
-        else:
-            if isinstance(expected_prompt, str):
-                prompt_list = [expected_prompt]
-            else:
-                prompt_list = expected_prompt
-
-        while True:
-            for item in prompt_list:
-                if self._promptbuf.rstrip().endswith(item.rstrip()):
-                    return (item, self._linebuf)
-                else:
-                    time.sleep(.1)
-
-            if time.time() > starttime + timeout:
-                raise InstrumentTimeoutException("in InstrumentProtocol._get_response()")
+        prompt = self._wait_for_prompt(self._prompt_list(expected_prompt), timeout)
+        if prompt is None:
+            raise InstrumentTimeoutException("in InstrumentProtocol._get_response()")
+        return (prompt, self._linebuf)
 
     def _get_raw_response(self, timeout=10, expected_prompt=None):
         """
@@ -506,27 +762,12 @@ class CommandResponseInstrumentProtocol(InstrumentProtocol):
         presented by this string
         @throw InstrumentProtocolExecption on timeout
         """
-        # Grab time for timeout and wait for prompt.
         strip_chars = "\t "
-
-        starttime = time.time()
-        if expected_prompt == None:
-            prompt_list = self._prompts.list()
-        else:
-            if isinstance(expected_prompt, str):
-                prompt_list = [expected_prompt]
-            else:
-                prompt_list = expected_prompt
-
-        while True:
-            for item in prompt_list:
-                if self._promptbuf.rstrip(strip_chars).endswith(item.rstrip(strip_chars)):
-                    return (item, self._linebuf)
-                else:
-                    time.sleep(.1)
-
-            if time.time() > starttime + timeout:
-                raise InstrumentTimeoutException("in InstrumentProtocol._get_raw_response()")
+        prompt = self._wait_for_prompt(self._prompt_list(expected_prompt),
+                                       timeout, strip_chars)
+        if prompt is None:
+            raise InstrumentTimeoutException("in InstrumentProtocol._get_raw_response()")
+        return (prompt, self._linebuf)
 
     def _do_cmd_resp(self, cmd, *args, **kwargs):
         """
@@ -567,12 +808,8 @@ class CommandResponseInstrumentProtocol(InstrumentProtocol):
         log.debug('_do_cmd_resp: %s, timeout=%s, write_delay=%s, expected_prompt=%s,' %
                         (repr(cmd_line), timeout, write_delay, expected_prompt))
 
-        if (write_delay == 0):
-            self._connection.send(cmd_line)
-        else:
-            for char in cmd_line:
-                self._connection.send(char)
-                time.sleep(write_delay)
+        # the response can not start before the whole command has gone out
+        timeout += self._send_cmd_line(cmd_line, write_delay)
 
         # Wait for the prompt, prepare result and return, timeout exception
         (prompt, result) = self._get_response(timeout,
@@ -617,12 +854,31 @@ class CommandResponseInstrumentProtocol(InstrumentProtocol):
 
         # Send command.
         log.debug('_do_cmd_no_resp: %s, timeout=%s' % (repr(cmd_line), timeout))
-        if (write_delay == 0):
+        self._send_cmd_line(cmd_line, write_delay)
+
+    def _send_cmd_line(self, cmd_line, write_delay=0):
+        """
+        Send a command line to the instrument.
+        @param cmd_line The string to send.
+        @param write_delay Seconds to wait after each character, for
+        instruments that can not take characters any faster.
+        @retval Seconds until the last character is sent. The port agent
+        client sends delayed characters on a schedule of its own, so this
+        returns without waiting for them. Other connections get one
+        character at a time from here.
+        """
+        if write_delay == 0:
             self._connection.send(cmd_line)
-        else:
-            for char in cmd_line:
-                self._connection.send(char)
-                time.sleep(write_delay)
+            return 0
+
+        if isinstance(self._connection, PortAgentClient):
+            self._connection.send(cmd_line, char_delay=write_delay)
+            return len(cmd_line) * write_delay
+
+        for char in cmd_line:
+            self._connection.send(char)
+            time.sleep(write_delay)
+        return 0
     
     def _do_cmd_direct(self, cmd):
         """
@@ -661,33 +917,82 @@ class CommandResponseInstrumentProtocol(InstrumentProtocol):
 
             self._chunker.add_chunk(data)
 
-            chunk = self._chunker.get_next_data()
-            while(chunk):
-                self._got_chunk(chunk)
-                chunk = self._chunker.get_next_data()
+            next_data = self._chunker.get_next_data(tagged=True)
+            while(next_data):
+                (tag, chunk) = next_data
+                self._got_tagged_chunk(tag, chunk)
+                next_data = self._chunker.get_next_data(tagged=True)
 
             self.publish_raw(port_agent_packet)
 
     def publish_raw(self, port_agent_packet):
         """
-        Publish raw data
+        Publish raw data, as the raw publishing config allows
         @param: port_agent_packet port agent packet containing raw
         """
-        particle = RawDataParticle(port_agent_packet.get_as_dict(),
-                       preferred_timestamp=DataParticleKey.DRIVER_TIMESTAMP)
-
-        if self._driver_event:
-            self._driver_event(DriverAsyncEvent.SAMPLE, particle.generate())
+        self._raw_publisher.got_packet(port_agent_packet)
 
     def add_to_buffer(self, data):
         '''
         Add a chunk of data to the internal data buffers
         @param data: bytes to add to the buffer
         '''
-        # Update the line and prompt buffers.
-        self._linebuf += data
-        self._promptbuf += data
-        self._last_data_timestamp = time.time()
+        # Update the line and prompt buffers and wake prompt waiters.
+        with self._buffer_condition:
+            if data:
+                self._linebuf_chunks.append(data)
+                self._linebuf_size += len(data)
+            overflow = self._linebuf_size - self._linebuf_limit
+            if overflow > 0:
+                self._trim_linebuf(overflow)
+                self._linebuf_overflows += 1
+                self._linebuf_overflow_bytes += overflow
+
+            # only the tail can hold a prompt
+            promptbuf = self._promptbuf + data
+            text = self._awaited_text
+            if text is not None and not self._awaited_text_found:
+                self._awaited_text_found = \
+                    text in promptbuf[-(len(data) + len(text) - 1):]
+            overflow = len(promptbuf) - self._promptbuf_limit
+            if overflow > 0:
+                promptbuf = promptbuf[overflow:]
+                self._promptbuf_trimmed_bytes += overflow
+            self._promptbuf = promptbuf
+
+            self._last_data_timestamp = time.time()
+            self._buffer_condition.notify_all()
+
+    def _trim_linebuf(self, count):
+        """
+        Drop the oldest count bytes of the line buffer.  Whole chunks are
+        dropped and the first one left is only marked as partly used.
+        @param count: number of bytes to drop
+        """
+        chunks = self._linebuf_chunks
+        self._linebuf_size -= count
+        while count > 0:
+            left = len(chunks[0]) - self._linebuf_head
+            if count < left:
+                self._linebuf_head += count
+                return
+            chunks.popleft()
+            self._linebuf_head = 0
+            count -= left
+
+    def get_buffer_metrics(self):
+        """
+        @retval dict of BufferMetric -> value for the line and prompt buffers
+        """
+        return {
+            BufferMetric.LINEBUF_SIZE: self._linebuf_size,
+            BufferMetric.LINEBUF_LIMIT: self._linebuf_limit,
+            BufferMetric.LINEBUF_OVERFLOWS: self._linebuf_overflows,
+            BufferMetric.LINEBUF_OVERFLOW_BYTES: self._linebuf_overflow_bytes,
+            BufferMetric.PROMPTBUF_SIZE: len(self._promptbuf),
+            BufferMetric.PROMPTBUF_LIMIT: self._promptbuf_limit,
+            BufferMetric.PROMPTBUF_TRIMMED_BYTES: self._promptbuf_trimmed_bytes
+        }
 
     ########################################################################
     # Wakeup helpers.
@@ -714,16 +1019,13 @@ class CommandResponseInstrumentProtocol(InstrumentProtocol):
         starttime = time.time()
         
         while True:
-            # Send a line return and wait a sec.
+            # Send a line return and wait up to a sec for the prompt.
             log.trace('Sending wakeup.')
             self._send_wakeup()
-            time.sleep(delay)
-
-            for item in self._prompts.list():
-                #log.debug("GOT " + repr(self._promptbuf))
-                if self._promptbuf.endswith(item):
-                    log.trace('wakeup got prompt: %s' % repr(item))
-                    return item
+            item = self._wait_for_prompt(self._prompts.list(), delay, '')
+            if item is not None:
+                log.trace('wakeup got prompt: %s' % repr(item))
+                return item
 
             if time.time() > starttime + timeout:
                 raise InstrumentTimeoutException("in _wakeup()")
@@ -11,26 +11,44 @@ and logging.
 __author__ = 'David Everett'
 __license__ = 'Apache 2.0'
 
+import os
+import errno
+import fcntl
 import socket
+import select
 import threading
 import time
 import datetime
 import struct
 import array
 import binascii
+from collections import deque
 
+from mi.core.common import BaseEnum
 from mi.core.log import get_logger ; log = get_logger()
 from mi.core.exceptions import InstrumentConnectionException
+from mi.core.exceptions import InstrumentParameterException
 
 HEADER_SIZE = 16 # BBBBHHLL = 1 + 1 + 1 + 1 + 2 + 2 + 4 + 4 = 16
+HEADER_FORMAT = '>BBBBHHd'
+SYNC_BYTES = '\xa3\x9d\x7a'
+
+# Initial size of the listener's receive buffer. It grows if a packet
+# bigger than this shows up.
+RECV_BUFFER_SIZE = 65536
+
+# Most bytes of queued sends joined into one write
+MAX_WRITE_SIZE = 65536
 
 
 """
 Packet Types
 """
+DATA_FROM_INSTRUMENT = 1
 DATA_FROM_DRIVER = 2
 
 
+OFFSET_P_LENGTH = 4
 OFFSET_P_CHECKSUM_LOW = 6
 OFFSET_P_CHECKSUM_HIGH = 7
 
@@ -49,6 +67,38 @@ SYSTEM_EPOCH = datetime.date(*time.gmtime(0)[0:3])
 NTP_EPOCH = datetime.date(1900, 1, 1)
 NTP_DELTA = (SYSTEM_EPOCH - NTP_EPOCH).days * 24 * 3600
 
+def packet_checksum(header, data):
+    """
+    Sum the bytes of a packet the way the port agent does, skipping the
+    checksum field in the header. The sum is truncated to the 16 bits the
+    header has room for.
+    @param header The 16 byte header as a string, array or bytearray
+    @param data The packet payload
+    @retval The checksum
+    """
+    header = bytearray(header)
+    return (sum(header[:OFFSET_P_CHECKSUM_LOW]) +
+            sum(header[OFFSET_P_CHECKSUM_HIGH+1:HEADER_SIZE]) +
+            sum(bytearray(data))) & 0xffff
+
+def wait_for(events, timeout=None):
+    """
+    Wait for file descriptors to become ready. Uses poll, so unlike select
+    it works for descriptors above FD_SETSIZE, which a process running many
+    clients soon has.
+    @param events List of (fd or socket, select.POLLIN or select.POLLOUT)
+    @param timeout Seconds to wait, None to wait until one is ready
+    @retval List of the fds or sockets that are ready, in events order
+    """
+    poller = select.poll()
+    for (fd, event) in events:
+        poller.register(fd, event)
+    if timeout is not None:
+        timeout = timeout * 1000
+    ready = dict(poller.poll(timeout))
+    return [fd for (fd, event) in events
+            if ready.get(fd if isinstance(fd, int) else fd.fileno())]
+
 class PortAgentPacket():
     """
     An object that encapsulates the details packets that are sent to and
@@ -73,7 +123,7 @@ class PortAgentPacket():
         # H = unsigned short size 2 bytes
         # L = unsigned long size 4 bytes
         # d = float size8 bytes
-        variable_tuple = struct.unpack_from('>BBBBHHd', header)
+        variable_tuple = struct.unpack_from(HEADER_FORMAT, header)
         # change offset to index.
         self.__type = variable_tuple[TYPE_INDEX]
         self.__length = int(variable_tuple[LENGTH_INDEX]) - HEADER_SIZE
@@ -102,7 +152,7 @@ class PortAgentPacket():
             # H = unsigned short size 2 bytes
             # L = unsigned long size 4 bytes
             # d = float size 8 bytes
-            format = '>BBBBHHd'
+            format = HEADER_FORMAT
             size = struct.calcsize(format)
             self.__header = array.array('B', '\0' * HEADER_SIZE)
             struct.pack_into(format, self.__header, 0, *variable_tuple)
@@ -122,25 +172,11 @@ class PortAgentPacket():
         self.__data = data
 
     def calculate_checksum(self):
-        checksum = 0
-        for i in range(HEADER_SIZE):
-            if i < OFFSET_P_CHECKSUM_LOW or i > OFFSET_P_CHECKSUM_HIGH:
-                checksum += struct.unpack_from('B', str(self.__header[i]))[0]
-                
-        for i in range(self.__length):
-            checksum += struct.unpack_from('B', str(self.__data[i]))[0]
-            
-        return checksum
+        return packet_checksum(self.__header, self.__data)
             
                                 
     def verify_checksum(self):
-        checksum = 0
-        for i in range(HEADER_SIZE):
-            if i < OFFSET_P_CHECKSUM_LOW or i > OFFSET_P_CHECKSUM_HIGH:
-                checksum += struct.unpack_from('B', self.__header[i])[0]
-                
-        for i in range(self.__length):
-            checksum += struct.unpack_from('B', self.__data[i])[0]
+        checksum = packet_checksum(self.__header, self.__data)
             
         if checksum == self.__recv_checksum:
             self.__isValid = True
@@ -188,42 +224,166 @@ class PortAgentPacket():
         return self.__isValid
                     
 
+class ReconnectKey(BaseEnum):
+    """
+    Dictionary keys for the reconnect config, found under 'reconnect' in
+    the comms config.
+    """
+    # False to stop listening when the port agent closes the data connection
+    ENABLED = 'enabled'
+    # seconds before the first attempt to reconnect
+    INITIAL_DELAY = 'initial_delay'
+    # the delay grows by this factor after each failed attempt
+    BACKOFF = 'backoff'
+    # most seconds between attempts
+    MAX_DELAY = 'max_delay'
+    # failed attempts before giving up, 0 to keep trying
+    MAX_ATTEMPTS = 'max_attempts'
+    # most bytes of sends held while reconnecting
+    MAX_BUFFERED = 'max_buffered'
+    # seconds a connection sits idle before TCP keepalive probes start
+    KEEPALIVE_IDLE = 'keepalive_idle'
+
+RECONNECT_DEFAULTS = {
+    ReconnectKey.ENABLED: True,
+    ReconnectKey.INITIAL_DELAY: .1,
+    ReconnectKey.BACKOFF: 2,
+    ReconnectKey.MAX_DELAY: 30,
+    ReconnectKey.MAX_ATTEMPTS: 0,
+    ReconnectKey.MAX_BUFFERED: 65536,
+    ReconnectKey.KEEPALIVE_IDLE: 60,
+}
+
+# seconds to wait for a connection to the port agent
+CONNECT_TIMEOUT = 5
+
+class ConnectionStatus(BaseEnum):
+    """
+    States reported to the status callback.
+    """
+    LOST = 'lost'
+    RESTORED = 'restored'
+    # reconnecting gave up after MAX_ATTEMPTS
+    FAILED = 'failed'
+
+class ConnectionMetric(BaseEnum):
+    """
+    Keys of the dict returned by get_connection_metrics and passed to the
+    status callback.
+    """
+    STATUS = 'status'
+    CONNECTED = 'connected'
+    # times the data connection was restored
+    RECONNECTS = 'reconnects'
+    # connection attempts that failed while reconnecting
+    FAILED_ATTEMPTS = 'failed_attempts'
+    # seconds without a data connection, the current outage included
+    DOWNTIME = 'downtime'
+    # seconds of the current or last outage
+    OUTAGE = 'outage'
+    # bytes sent but not yet written to the socket, held data included
+    QUEUED_BYTES = 'queued_bytes'
+    SENDS = 'sends'
+    # sends the socket could not take in full straight away
+    QUEUED_SENDS = 'queued_sends'
+    # socket writes, fewer than sends when queued sends are joined
+    WRITES = 'writes'
+    # seconds from the last send to finish until it was all written
+    FLUSH_LATENCY = 'flush_latency'
+    MAX_FLUSH_LATENCY = 'max_flush_latency'
+    # times the command connection was opened
+    COMMAND_CONNECTS = 'command_connects'
+
 class PortAgentClient(object):
     """
     A port agent process client class to abstract the TCP interface to the 
     of port agent. From the instrument driver's perspective, data is sent 
     to the port agent with this client's send method, and data is received 
     asynchronously via a callback from this client's listener thread.
+
+    Sends are queued and written by a writer thread as the socket takes
+    them. If the port agent closes the data connection the listener
+    reconnects, waiting longer after each failed attempt, and data sent
+    meanwhile is held and sent once the connection is back. The command connection
+    stays open between commands.
     """
     
-    def __init__(self, host, port, cmd_port, delim=None):
+    def __init__(self, host, port, cmd_port, delim=None, reconnect=None,
+                 status_callback=None):
         """
         Logger client constructor.
+        @param reconnect dict keyed by ReconnectKey, None for the defaults
+        @param status_callback Called with a dict keyed by ConnectionMetric
+            when the data connection is lost, restored or given up on
+        @raise InstrumentParameterException if the reconnect config is invalid
         """
         self.host = host
         self.port = port
         self.cmd_port = cmd_port
         self.sock = None
         self.listener_thread = None
-        self.stop_event = None
+        self.writer_thread = None
+        self.stop_event = threading.Event()
         self.delim = delim
-        
+        self._configure_reconnect(reconnect)
+        self._status_callback = status_callback
+
+        self._lock = threading.Lock()
+
+        self._cmd_lock = threading.Lock()
+        self._cmd_sock = None
+
+        self._lost_time = None
+        self._metrics = {
+            ConnectionMetric.RECONNECTS: 0,
+            ConnectionMetric.FAILED_ATTEMPTS: 0,
+            ConnectionMetric.DOWNTIME: 0,
+            ConnectionMetric.OUTAGE: 0,
+            ConnectionMetric.COMMAND_CONNECTS: 0,
+        }
+
+    def _configure_reconnect(self, config):
+        if config is None:
+            config = {}
+        if not isinstance(config, dict):
+            raise InstrumentParameterException('Invalid reconnect config: %s' % config)
+
+        values = dict(RECONNECT_DEFAULTS)
+        values.update(config)
+        try:
+            self._reconnect_enabled = bool(values[ReconnectKey.ENABLED])
+            self._initial_delay = float(values[ReconnectKey.INITIAL_DELAY])
+            self._backoff = float(values[ReconnectKey.BACKOFF])
+            self._max_delay = float(values[ReconnectKey.MAX_DELAY])
+            self._max_attempts = int(values[ReconnectKey.MAX_ATTEMPTS])
+            self._max_buffered = int(values[ReconnectKey.MAX_BUFFERED])
+            self._keepalive_idle = int(values[ReconnectKey.KEEPALIVE_IDLE])
+        except (TypeError, ValueError):
+            raise InstrumentParameterException('Invalid reconnect config: %s' % config)
+        if self._initial_delay < 0 or self._backoff < 1 or self._max_delay < 0 \
+           or self._max_attempts < 0 or self._max_buffered < 0 \
+           or self._keepalive_idle < 1:
+            raise InstrumentParameterException('Invalid reconnect config: %s' % config)
+
     def init_comms(self, callback=None):
         """
         Initialize client comms with the logger process and start a
         listener thread.
-        DHE: I'm going to need to establish two connections here: one 
-        for the data connection and one for the command connection.
         """
         try:
-            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            # This can be thrown here.
-            # error: [Errno 61] Connection refused
-            self.sock.connect((self.host, self.port))
+            self.stop_event.clear()
+            self.sock = self._connect(self.port)
             self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
             self.sock.setblocking(0)
-            self.user_callback = callback        
-            self.listener_thread = Listener(self.sock, self.delim, self.callback)
+            self.user_callback = callback
+            self.writer_thread = Writer(self.sock, self._max_buffered,
+                                        hold_on_error=self._reconnect_enabled)
+            self.writer_thread.start()
+            reconnect = None
+            if self._reconnect_enabled:
+                reconnect = self._reconnect
+            self.listener_thread = Listener(self.sock, self.delim, self.callback,
+                                            reconnect=reconnect)
             self.listener_thread.start()
             log.info('PortAgentClient.init_comms(): connected to port agent at %s:%i.'
                            % (self.host, self.port))        
@@ -238,11 +398,17 @@ class PortAgentClient(object):
         logger. This is called by the done function.
         """
         log.info('Logger shutting down comms.')
+        self.stop_event.set()
         self.listener_thread.done()
         self.listener_thread.join()
-        #-self.sock.shutdown(socket.SHUT_RDWR)
-        self.sock.close()
-        self.sock = None
+        self.writer_thread.done()
+        self.writer_thread.join()
+        with self._lock:
+            if self.sock:
+                self.sock.close()
+            self.sock = None
+        with self._cmd_lock:
+            self._close_command_socket()
         log.info('Logger client comms stopped.')
 
     def done(self):
@@ -265,65 +431,426 @@ class PortAgentClient(object):
         """
         self._command_port_agent('break')
 
+    def get_connection_metrics(self):
+        """
+        @retval dict keyed by ConnectionMetric, STATUS excluded
+        """
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics[ConnectionMetric.CONNECTED] = self.sock is not None
+            if self._lost_time is not None:
+                outage = time.time() - self._lost_time
+                metrics[ConnectionMetric.OUTAGE] = outage
+                metrics[ConnectionMetric.DOWNTIME] += outage
+        if self.writer_thread:
+            metrics.update(self.writer_thread.get_metrics())
+        return metrics
+
+    def _connect(self, port):
+        """
+        Open a connection to the port agent with TCP keepalive on, so a
+        connection the port agent host dropped is noticed even while idle.
+        @raise socket.error if the connection fails
+        """
+        sock = socket.create_connection((self.host, port), CONNECT_TIMEOUT)
+        sock.settimeout(None)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        if hasattr(socket, 'TCP_KEEPIDLE'):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, self._keepalive_idle)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL,
+                            max(1, self._keepalive_idle / 4))
+        return sock
+
+    def _command_socket(self):
+        """
+        The open command connection, connecting if there is none or the
+        port agent has closed it. Anything the port agent sent on it is
+        discarded.
+        """
+        sock = self._cmd_sock
+        if sock is not None:
+            try:
+                while wait_for([(sock, select.POLLIN)], 0):
+                    data = sock.recv(4096)
+                    if not data:
+                        log.debug('Port agent closed the command connection')
+                        self._close_command_socket()
+                        break
+                    log.debug('Ignoring %r from port agent command port', data)
+            except (socket.error, select.error):
+                self._close_command_socket()
+
+        if self._cmd_sock is None:
+            self._cmd_sock = self._connect(self.cmd_port)
+            self._metrics[ConnectionMetric.COMMAND_CONNECTS] += 1
+            log.info('PortAgentClient: connected to port agent command port at %s:%i.'
+                     % (self.host, self.cmd_port))
+        return self._cmd_sock
+
+    def _close_command_socket(self):
+        if self._cmd_sock is not None:
+            self._cmd_sock.close()
+            self._cmd_sock = None
+
     def _command_port_agent(self, cmd):
         """
-        Command the port agent.  We connect to the command port, send the command
-        and then disconnect.  Connection is not persistent
+        Command the port agent. The command connection is opened on first
+        use and kept open. If sending on it fails it is reopened once.
         @raise InstrumentConnectionException if cmd_port is missing.  We don't
                         currently do this on init  where is should happen because
                         some instruments wont set the  command port quite yet.
         """
+        if(not self.cmd_port):
+            raise InstrumentConnectionException("Missing port agent command port config")
+
+        with self._cmd_lock:
+            for retry in (False, True):
+                try:
+                    self._command_socket().sendall(cmd)
+                    return
+                except socket.error as e:
+                    self._close_command_socket()
+                    if retry:
+                        log.error("_command_port_agent(): Exception occurred.", exc_info=True)
+                        raise InstrumentConnectionException('Failed to connect to port agent command port at %s:%i (%s).'
+                                                            % (self.host, self.cmd_port, e))
+                    log.info('Port agent command connection failed (%s), reconnecting', e)
+
+    def send(self, data, char_delay=0):
+        """
+        Send data to the port agent. The data is queued and this returns
+        without waiting for it to be written. While the data connection is
+        being reestablished the data is held and sent once it is back.
+        @param data The string to send
+        @param char_delay Seconds to wait after each character, for
+        instruments that can not take characters any faster
+        @raise InstrumentConnectionException if more data is held while
+            reconnecting than the reconnect config allows, or the
+            connection was lost for good
+        """
+        if self.writer_thread and not self.stop_event.is_set():
+            self.writer_thread.send(data, char_delay)
+
+    def _reconnect(self):
+        """
+        Called by the listener thread when the port agent closes the data
+        connection. Try to connect again until it works, the attempts run
+        out or comms are stopped, waiting longer after each failed attempt.
+        The writer holds data sent meanwhile and writes it to the new
+        socket before anything sent later.
+        @retval The new socket, None to stop listening
+        """
+        self.writer_thread.set_socket(None)
+        with self._lock:
+            if self.sock:
+                self.sock.close()
+            self.sock = None
+            self._lost_time = time.time()
+        self._report(ConnectionStatus.LOST)
+
+        delay = self._initial_delay
+        attempts = 0
+        while not self.stop_event.wait(delay):
+            try:
+                sock = self._connect(self.port)
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                sock.setblocking(0)
+            except socket.error as e:
+                attempts += 1
+                with self._lock:
+                    self._metrics[ConnectionMetric.FAILED_ATTEMPTS] += 1
+                log.debug('Reconnect to port agent at %s:%i failed: %s', self.host, self.port, e)
+                if self._max_attempts and attempts >= self._max_attempts:
+                    break
+                delay = min(delay * self._backoff, self._max_delay)
+                continue
+
+            with self._lock:
+                if self.stop_event.is_set():
+                    sock.close()
+                    return None
+                self.sock = sock
+                self._end_outage()
+            self.writer_thread.set_socket(sock)
+            log.info('Reconnected to port agent at %s:%i after %.1f s',
+                     self.host, self.port, self._metrics[ConnectionMetric.OUTAGE])
+            self._report(ConnectionStatus.RESTORED)
+            return sock
+
+        with self._lock:
+            self._end_outage()
+        self.writer_thread.close()
+        if not self.stop_event.is_set():
+            log.error('Gave up reconnecting to port agent at %s:%i', self.host, self.port)
+            self._report(ConnectionStatus.FAILED)
+        return None
+
+    def _end_outage(self):
+        outage = time.time() - self._lost_time
+        self._lost_time = None
+        self._metrics[ConnectionMetric.OUTAGE] = outage
+        self._metrics[ConnectionMetric.DOWNTIME] += outage
+        if self.sock:
+            self._metrics[ConnectionMetric.RECONNECTS] += 1
+
+    def _report(self, status):
+        if self._status_callback is None:
+            return
+        metrics = self.get_connection_metrics()
+        metrics[ConnectionMetric.STATUS] = status
         try:
-            if(not self.cmd_port):
-                raise InstrumentConnectionException("Missing port agent command port config")
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.connect((self.host, self.cmd_port))
-            log.info('PortAgentClient.init_comms(): connected to port agent at %s:%i.'
-                     % (self.host, self.cmd_port))
-            self.send(cmd, sock)
-            sock.close()
-        except Exception as e:
-            log.error("send_break(): Exception occurred.", exc_info=True)
-            raise InstrumentConnectionException('Failed to connect to port agent command port at %s:%i (%s).'
-                                                % (self.host, self.cmd_port, e))
+            self._status_callback(metrics)
+        except Exception:
+            log.error('Connection status callback failed', exc_info=True)
+
+                
+class Writer(threading.Thread):
+    """
+    A writer thread that sends the data queued by send to the port agent as
+    the socket can take it, so callers never wait on a full socket buffer.
+    Data queued while the socket is busy goes out in one write, and data
+    sent with a character delay goes out a character at a time on a
+    schedule, all in the order it was sent.
+    """
 
+    def __init__(self, sock, max_held, hold_on_error=True):
+        """
+        Writer thread constructor.
+        @param sock The non-blocking socket to write to.
+        @param max_held Most bytes queued while there is no socket.
+        @param hold_on_error True to hold data for a new socket when writing
+        fails, False to refuse all sends from then on.
+        """
+        threading.Thread.__init__(self)
+        self._sock = sock
+        self._max_held = max_held
+        self._hold_on_error = hold_on_error
+        self._closed = False
+        self._done = False
 
-    def send(self, data, sock=None):
+        self._lock = threading.Lock()
+        # [data, char_delay, time sent] for each send, oldest first
+        self._queue = deque()
+        self._queued_bytes = 0
+        # earliest time the next write may go out after a delayed character
+        self._next_write = 0
+
+        # a byte written here wakes the thread from poll
+        (self._wake_r, self._wake_w) = os.pipe()
+        fcntl.fcntl(self._wake_w, fcntl.F_SETFL, os.O_NONBLOCK)
+
+        self._metrics = {
+            ConnectionMetric.SENDS: 0,
+            ConnectionMetric.QUEUED_SENDS: 0,
+            ConnectionMetric.WRITES: 0,
+            ConnectionMetric.FLUSH_LATENCY: 0,
+            ConnectionMetric.MAX_FLUSH_LATENCY: 0,
+        }
+
+    def send(self, data, char_delay=0):
+        """
+        Queue data for the port agent. With nothing queued ahead of it the
+        data is written straight away, as much as the socket takes.
+        @param data The string to send
+        @param char_delay Seconds to wait after each character, 0 to send
+        the data as fast as the socket takes it
+        @raise InstrumentConnectionException if there is no socket and
+        max_held bytes are already held, or if the writer is closed
+        """
+        if not data:
+            return
+        with self._lock:
+            if self._closed:
+                raise InstrumentConnectionException('Not connected to port agent')
+            if self._sock is None and self._queued_bytes + len(data) > self._max_held:
+                raise InstrumentConnectionException(
+                    'Send buffer full while not connected to port agent (%d bytes held)'
+                    % self._queued_bytes)
+
+            self._metrics[ConnectionMetric.SENDS] += 1
+            idle = not self._queue
+            self._queue.append([data, char_delay, time.time()])
+            self._queued_bytes += len(data)
+            if idle and self._sock is not None and not char_delay \
+               and time.time() >= self._next_write:
+                self._write()
+            if self._queue:
+                self._metrics[ConnectionMetric.QUEUED_SENDS] += 1
+                if idle:
+                    self._wake()
+
+    def set_socket(self, sock):
         """
-        Send data to the port agent.
+        Write to a new socket, queued data first.
+        @param sock The non-blocking socket, None to hold data until a
+        socket is set
         """
-        if(not sock):
-            sock = self.sock
+        with self._lock:
+            self._sock = sock
+            self._wake()
+
+    def close(self):
+        """
+        Drop the queued data and refuse further sends.
+        """
+        with self._lock:
+            self._closed = True
+            self._sock = None
+            self._queue.clear()
+            self._queued_bytes = 0
+
+    def done(self):
+        """
+        Signal to the writer thread to end its processing loop and
+        conclude.
+        """
+        with self._lock:
+            self._done = True
+            self._wake()
+
+    def get_metrics(self):
+        """
+        @retval dict of the ConnectionMetric send and flush values
+        """
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics[ConnectionMetric.QUEUED_BYTES] = self._queued_bytes
+        return metrics
+
+    def run(self):
+        """
+        Writer thread processing loop. Wait in poll until the socket
+        can take data, the next delayed character is due, or a send, a
+        new socket or done needs looking at.
+        """
+        log.info('Port agent writer started.')
+        while not self._done:
+            with self._lock:
+                sock = self._sock
+                events = [(self._wake_r, select.POLLIN)]
+                timeout = None
+                if self._queue and sock is not None:
+                    wait = self._next_write - time.time()
+                    if wait > 0:
+                        timeout = wait
+                    else:
+                        events.append((sock, select.POLLOUT))
+
+            try:
+                ready = wait_for(events, timeout)
+            except (select.error, socket.error):
+                # the socket was closed under us, look again
+                continue
+            if self._wake_r in ready:
+                os.read(self._wake_r, 4096)
+            if sock in ready:
+                with self._lock:
+                    if self._sock is sock:
+                        self._write()
+
+        with self._lock:
+            os.close(self._wake_r)
+            os.close(self._wake_w)
+            self._wake_w = None
+        log.info('Port agent writer done.')
+
+    def _wake(self):
+        """
+        Wake the thread, called with the lock held.
+        """
+        if self._wake_w is None:
+            return
+        try:
+            os.write(self._wake_w, 'x')
+        except OSError:
+            # the pipe is full, the thread is awake already
+            pass
+
+    def _write(self):
+        """
+        Write from the head of the queue, called with the lock held. Sends
+        without a delay are joined into one write, a delayed send gives one
+        character.
+        """
+        (data, char_delay, sent_time) = self._queue[0]
+        if char_delay:
+            data = data[0]
+        elif len(self._queue) > 1:
+            chunks = []
+            size = 0
+            for (chunk, delay, chunk_time) in self._queue:
+                if delay or size >= MAX_WRITE_SIZE:
+                    break
+                chunks.append(chunk)
+                size += len(chunk)
+            data = ''.join(chunks)
+
+        try:
+            sent = self._sock.send(data)
+        except socket.error as e:
+            if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return
+            log.error('Sending to port agent failed: %s', e)
+            if self._hold_on_error:
+                # the listener sees the connection go and sets a new socket
+                self._sock = None
+            else:
+                self._closed = True
+                self._sock = None
+                self._queue.clear()
+                self._queued_bytes = 0
+            return
+
+        self._metrics[ConnectionMetric.WRITES] += 1
+        self._queued_bytes -= sent
+        now = time.time()
+        if char_delay:
+            self._next_write = now + char_delay
+        while sent:
+            item = self._queue[0]
+            if sent < len(item[0]):
+                item[0] = item[0][sent:]
+                break
+            sent -= len(item[0])
+            self._queue.popleft()
+            latency = now - item[2]
+            self._metrics[ConnectionMetric.FLUSH_LATENCY] = latency
+            if latency > self._metrics[ConnectionMetric.MAX_FLUSH_LATENCY]:
+                self._metrics[ConnectionMetric.MAX_FLUSH_LATENCY] = latency
 
-        if sock:
-            while len(data) > 0:
-                try:
-                    sent = sock.send(data)
-                    gone = data[:sent]
-                    data = data[sent:]
-                except socket.error:
-                    time.sleep(.1)
 
-                
 class Listener(threading.Thread):
     """
     A listener thread to monitor the client socket data incoming from
     the port agent process. 
     """
     
-    def __init__(self, sock, delim, callback=None):
+    def __init__(self, sock, delim, callback=None, buffer_size=RECV_BUFFER_SIZE,
+                 reconnect=None):
         """
         Listener thread constructor.
         @param sock The socket to listen on.
         @param delim The line delimiter to split incoming lines on, used in
         debugging when no callback is supplied.
         @param callback The callback on data arrival.
+        @param buffer_size Initial size of the receive buffer
+        @param reconnect Called with no arguments when the connection is
+        lost, returns a new socket to listen on or None to stop. None to
+        stop listening as soon as the connection is lost.
         """
         threading.Thread.__init__(self)
         self.sock = sock
         self._done = False
+        self._reconnect = reconnect
         self.linebuf = ''
         self.delim = delim
+
+        # Receive buffer. Bytes between _start and _end have been received
+        # but not yet handed out as packets.
+        self._buffer = bytearray(buffer_size)
+        self._view = memoryview(self._buffer)
+        self._start = 0
+        self._end = 0
         
         if callback:
             def fn_callback(paPacket):
@@ -341,10 +868,11 @@ class Listener(threading.Thread):
         
     def run(self):
         """
-        Listener thread processing loop. Block on receive from port agent.
-        Receive HEADER_SIZE bytes to receive the entire header.  From that,
-        get the length of the whole packet (including header); compute the
-        length of the remaining data and read that.  
+        Listener thread processing loop. Wait for the socket to become
+        readable, then recv_into the free end of a preallocated buffer and
+        hand every complete packet in it to the callback, so a burst of
+        small packets costs one system call rather than two per packet.
+        Partial packets stay in the buffer until the rest arrives.
         NOTE (DHE): I've noticed in my testing that if my test server
         (simulating the port agent) goes away, the client socket (ours)
         goes into a CLOSE_WAIT condition and stays there for a long time. 
@@ -352,50 +880,108 @@ class Listener(threading.Thread):
         I have not had the patience to wait it out, so I don't know how long
         it will last.  When it happens though, 0 bytes are received, which
         should never happen unless something is wrong.  So if that happens,
-        I'm considering it an error.
+        I'm considering it an error, and the connection is treated as lost.
         """
         log.info('Logger client listener started.')
         while not self._done:
             try:
-                received_header = False
-                bytes_left = HEADER_SIZE
-                while not received_header and not self._done: 
-                    header = self.sock.recv(bytes_left)
-                    bytes_left -= len(header)
-                    if bytes_left == 0:
-                        received_header = True
-                        paPacket = PortAgentPacket()         
-                        paPacket.unpack_header(header)         
-                        data_size = paPacket.get_data_size()
-                        bytes_left = data_size
-                    elif len(header) == 0:
-                        log.error('Zero bytes received from port_agent socket')
-                        self._done = True
-                
-                received_data = False
-                while not received_data and not self._done: 
-                    data = self.sock.recv(bytes_left)
-                    bytes_left -= len(data)
-                    if bytes_left == 0:
-                        received_data = True
-                        paPacket.attach_data(data)
-                    elif len(data) == 0:
-                        log.error('Zero bytes received from port_agent socket')
-                        self._done = True
-
-                if not self._done:
-                    """
-                    Should have complete port agent packet.
-                    """
-                    if self.callback:
-                        self.callback(paPacket)
-                    else:
-                        log.error('No callback registered')
-
-            except socket.error:
-                time.sleep(.1)
+                if self._end == len(self._buffer):
+                    self._make_room()
+                bytes_read = self.sock.recv_into(self._view[self._end:])
+                if bytes_read == 0:
+                    log.error('Zero bytes received from port_agent socket')
+                    self._connection_lost()
+                    continue
+                self._end += bytes_read
+                self.parse_packets()
+
+            except socket.error as e:
+                if e.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                    log.error('Port agent socket error: %s', e)
+                    self._connection_lost()
+                    continue
+                # nothing to read yet, wait for the socket without spinning
+                wait_for([(self.sock, select.POLLIN)], .1)
         log.info('Logger client done listening.')
 
+    def _connection_lost(self):
+        """
+        Listen on a new connection if one can be made, else stop. A partial
+        packet left from the old connection is dropped.
+        """
+        sock = None
+        if self._reconnect and not self._done:
+            sock = self._reconnect()
+        if sock is None:
+            self._done = True
+            return
+        self.sock = sock
+        self._start = self._end = 0
+
+    def _make_room(self):
+        """
+        Free up space at the end of the receive buffer. Move the unparsed
+        bytes to the front and, if the packet they start is bigger than the
+        whole buffer, grow it.
+        """
+        pending = self._end - self._start
+        needed = HEADER_SIZE
+        if pending >= HEADER_SIZE:
+            (length,) = struct.unpack_from('>H', self._buffer, self._start + OFFSET_P_LENGTH)
+            needed = max(needed, length)
+
+        # a bytearray can not be resized while a memoryview holds it
+        self._view = None
+        self._buffer[:pending] = self._buffer[self._start:self._end]
+        if needed > len(self._buffer):
+            self._buffer.extend('\0' * (needed - len(self._buffer)))
+        self._view = memoryview(self._buffer)
+        self._start = 0
+        self._end = pending
+
+    def parse_packets(self):
+        """
+        Hand every complete packet in the receive buffer to the callback.
+        Garbage in front of a packet is skipped up to the next sync bytes.
+        """
+        buffer = self._buffer
+        view = self._view
+        start = self._start
+        end = self._end
+
+        while end - start >= HEADER_SIZE:
+            if buffer[start:start+3] != SYNC_BYTES:
+                sync = buffer.find(SYNC_BYTES, start + 1, end)
+                if sync < 0:
+                    # keep a partial sync at the tail
+                    sync = max(start + 1, end - 2)
+                log.error('Skipping %d bytes of garbage from port agent', sync - start)
+                start = sync
+                continue
+
+            (length,) = struct.unpack_from('>H', buffer, start + OFFSET_P_LENGTH)
+            if length < HEADER_SIZE:
+                log.error('Bad port agent packet length %d', length)
+                start += 1
+                continue
+            if end - start < length:
+                break
+
+            paPacket = PortAgentPacket()
+            paPacket.unpack_header(view[start:start+HEADER_SIZE].tobytes())
+            paPacket.attach_data(view[start+HEADER_SIZE:start+length].tobytes())
+            start += length
+
+            if self.callback:
+                self.callback(paPacket)
+            else:
+                log.error('No callback registered')
+
+        if start == end:
+            start = end = 0
+        self._start = start
+        self._end = end
+
     def parse_packet(self, packet):
         log.debug('Logger client parse_packet')
         
@@ -0,0 +1,585 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.instrument.port_agent_simulator
+@file mi/core/instrument/port_agent_simulator.py
+@brief Simulated instruments behind simulated port agents, for running
+drivers without hardware.
+
+Each InstrumentSimulator listens on a data port and a command port the way
+a port agent does. While streaming it sends its records framed as port
+agent packets at a set rate, or as fast as the driver reads them, and it
+answers the commands it is sent from a script. A SimulatorFarm runs any
+number of simulators on one thread with poll, so hundreds fit in one
+process:
+
+    farm = SimulatorFarm()
+    simulator = InstrumentSimulator(itertools.cycle(samples), rate=1, speed=10,
+                                    exchanges=[Exchange('ds', status + 'S>')],
+                                    prompt='S>')
+    (port, cmd_port) = farm.add(simulator)
+    farm.start()
+    ...
+    farm.stop()
+
+Point a driver's comms config at the two ports to talk to the simulator.
+Packet timestamps are the time each packet was queued, so a client can
+tell how far behind it is.
+"""
+
+__license__ = 'Apache 2.0'
+
+import os
+import re
+import time
+import heapq
+import errno
+import fcntl
+import socket
+import select
+import struct
+import threading
+
+from mi.core.common import BaseEnum
+from mi.core.log import get_logger ; log = get_logger()
+from mi.core.instrument.port_agent_client import HEADER_SIZE
+from mi.core.instrument.port_agent_client import HEADER_FORMAT
+from mi.core.instrument.port_agent_client import OFFSET_P_CHECKSUM_LOW
+from mi.core.instrument.port_agent_client import NTP_DELTA
+from mi.core.instrument.port_agent_client import DATA_FROM_INSTRUMENT
+from mi.core.instrument.port_agent_client import packet_checksum
+
+# speed for sending records as fast as the driver takes them
+AS_FAST_AS_POSSIBLE = None
+
+# Records are queued for a driver reading as fast as possible until this
+# many bytes are waiting
+FAST_BATCH_SIZE = 65536
+
+# A record due while this many bytes still wait for a slow driver is
+# skipped and counted as an overrun
+MAX_QUEUED = 1048576
+
+RECV_SIZE = 4096
+
+# the port agent command to send a break
+BREAK_COMMAND = 'break'
+
+class SimulatorMetric(BaseEnum):
+    """
+    Keys of the dict returned by InstrumentSimulator.get_metrics.
+    """
+    RECORDS = 'records'
+    BYTES = 'bytes'
+    # records skipped because the driver had not read the ones before
+    OVERRUNS = 'overruns'
+    COMMANDS = 'commands'
+    BREAKS = 'breaks'
+    # driver connections accepted on the data port
+    CONNECTIONS = 'connections'
+
+def pack_packet(data, packet_type=DATA_FROM_INSTRUMENT, timestamp=None):
+    """
+    Frame data as a port agent packet.
+    @param data The payload
+    @param packet_type The packet type
+    @param timestamp Seconds since the epoch, None for now
+    @retval The packet as a string
+    """
+    if timestamp is None:
+        timestamp = time.time()
+    header = bytearray(struct.pack(HEADER_FORMAT, 0xa3, 0x9d, 0x7a, packet_type,
+                                   len(data) + HEADER_SIZE, 0, timestamp + NTP_DELTA))
+    struct.pack_into('>H', header, OFFSET_P_CHECKSUM_LOW, packet_checksum(header, data))
+    return str(header) + data
+
+def recorded_records(data, delimiter=None, size=None):
+    """
+    Split recorded instrument output into the records to replay.
+    @param data The recorded output
+    @param delimiter Each record ends with this string, which it keeps
+    @param size Each record is this many bytes, if there is no delimiter
+    @retval list of the records, the last one may be short
+    """
+    if delimiter:
+        records = [record + delimiter for record in data.split(delimiter)]
+        if not data.endswith(delimiter):
+            records[-1] = records[-1][:-len(delimiter)]
+        else:
+            records.pop()
+        return records
+    if not size:
+        return [data]
+    return [data[index:index+size] for index in range(0, len(data), size)]
+
+class Exchange(object):
+    """
+    A scripted answer to a command.
+    """
+    def __init__(self, command, response, start_streaming=False,
+                 stop_streaming=False):
+        """
+        @param command Regex the whole command has to match, without its
+        line ending
+        @param response What the instrument sends back, prompt included
+        @param start_streaming True to start sending records after answering
+        @param stop_streaming True to stop sending records before answering
+        """
+        self.command = re.compile(command + '$')
+        self.response = response
+        self.start_streaming = start_streaming
+        self.stop_streaming = stop_streaming
+
+class InstrumentSimulator(object):
+    """
+    The behaviour of one simulated instrument: the records it streams, how
+    fast, and its answers to commands. Run it in a SimulatorFarm.
+    """
+    def __init__(self, records, rate=1, speed=1, exchanges=None, prompt=None,
+                 unknown=None, break_exchange=None, terminators='\r\n',
+                 streaming=True, echo=False):
+        """
+        @param records Iterable of the records to send while streaming, one
+        port agent packet each. Streaming stops when it runs out.
+        @param rate Records per second the instrument sends
+        @param speed Multiple of rate to send at, AS_FAST_AS_POSSIBLE to
+        send as fast as the driver reads
+        @param exchanges List of Exchange, the first one matching a command
+        answers it
+        @param prompt Answer to an empty line, the wakeup of most instruments
+        @param unknown Answer to a command no exchange matches, None for none
+        @param break_exchange Exchange done when the port agent is told to
+        send a break, its command is not used
+        @param terminators Characters that end a command, None if every
+        buffer received is a command of its own
+        @param streaming True to start sending records when a driver connects
+        @param echo True to send commands back as they are received
+        """
+        self._records = iter(records)
+        self._interval = None
+        if speed is not AS_FAST_AS_POSSIBLE:
+            self._interval = 1.0 / (rate * speed)
+        self._exchanges = exchanges or []
+        self._prompt = prompt
+        self._unknown = unknown
+        self._break_exchange = break_exchange
+        self._terminators = terminators
+        self._echo = echo
+        self.streaming = streaming
+
+        self._partial = ''
+        # last character received was '\r'
+        self._after_cr = False
+        self._metrics = dict([(key, 0) for key in SimulatorMetric.list()])
+
+    def fast(self):
+        """
+        @retval True if records are sent as fast as the driver reads them
+        """
+        return self._interval is None
+
+    def interval(self):
+        """
+        @retval Seconds between records, None if sent as fast as possible
+        """
+        return self._interval
+
+    def next_record(self):
+        """
+        @retval The next record to send, None when there are no more
+        """
+        try:
+            record = next(self._records)
+        except StopIteration:
+            self.streaming = False
+            return None
+        self._metrics[SimulatorMetric.RECORDS] += 1
+        self._metrics[SimulatorMetric.BYTES] += len(record)
+        return record
+
+    def received(self, data):
+        """
+        Handle data the driver sent.
+        @param data What the driver sent
+        @retval list of the strings to send back
+        """
+        responses = []
+        if self._echo:
+            responses.append(data)
+
+        if self._terminators is None:
+            responses.extend(self._answer(data))
+            return responses
+
+        line = self._partial
+        for char in data:
+            if char in self._terminators:
+                if not (char == '\n' and self._after_cr and not line):
+                    responses.extend(self._answer(line))
+                line = ''
+                self._after_cr = (char == '\r')
+            else:
+                line += char
+                self._after_cr = False
+        self._partial = line
+        return responses
+
+    def port_agent_command(self, command):
+        """
+        Handle a command sent to the port agent command port.
+        @retval list of the strings the instrument sends back
+        """
+        if not command.startswith(BREAK_COMMAND):
+            log.debug('Simulator ignoring port agent command %r', command)
+            return []
+        self._metrics[SimulatorMetric.BREAKS] += 1
+        if self._break_exchange is None:
+            return []
+        return self._do(self._break_exchange)
+
+    def overrun(self):
+        self._metrics[SimulatorMetric.OVERRUNS] += 1
+
+    def connected(self):
+        self._metrics[SimulatorMetric.CONNECTIONS] += 1
+
+    def get_metrics(self):
+        """
+        @retval dict of SimulatorMetric -> count
+        """
+        return dict(self._metrics)
+
+    def _answer(self, command):
+        self._metrics[SimulatorMetric.COMMANDS] += 1
+        if command == '' and self._prompt is not None:
+            return [self._prompt]
+        for exchange in self._exchanges:
+            if exchange.command.match(command):
+                return self._do(exchange)
+        if self._unknown is not None:
+            return [self._unknown]
+        return []
+
+    def _do(self, exchange):
+        if exchange.stop_streaming:
+            self.streaming = False
+        if exchange.start_streaming:
+            self.streaming = True
+        return [exchange.response]
+
+class _Endpoint(object):
+    """
+    The sockets and send queue of one simulator in a farm.
+    """
+    def __init__(self, simulator, data_server, cmd_server):
+        self.simulator = simulator
+        self.data_server = data_server
+        self.cmd_server = cmd_server
+        self.conn = None
+        self.cmd_conns = []
+        # packets waiting for the driver
+        self.queue = []
+        self.queued_bytes = 0
+        self.next_due = None
+        # bumped when the driver connection changes, to drop stale timers
+        self.generation = 0
+
+class SimulatorFarm(object):
+    """
+    Runs simulators on one thread. Every simulator gets a data and a
+    command port, and one poll loop accepts connections, answers
+    commands, sends records as they fall due and writes packets as the
+    drivers take them.
+    """
+    def __init__(self, host='localhost'):
+        """
+        @param host The address the simulators listen on
+        """
+        self._host = host
+        self._endpoints = []
+        self._lock = threading.Lock()
+        # endpoints added since the loop last looked
+        self._added = []
+        self._thread = None
+        self._done = False
+
+        self._poller = select.poll()
+        # fd -> (handler, endpoint, socket)
+        self._fds = {}
+        # (due time, sequence, endpoint, generation) for paced simulators
+        self._timers = []
+        self._sequence = 0
+
+        (self._wake_r, self._wake_w) = os.pipe()
+        fcntl.fcntl(self._wake_w, fcntl.F_SETFL, os.O_NONBLOCK)
+        self._poller.register(self._wake_r, select.POLLIN)
+
+    def add(self, simulator, port=0, cmd_port=0):
+        """
+        Listen for drivers of a simulator.
+        @param simulator The InstrumentSimulator
+        @param port The data port, 0 for any free port
+        @param cmd_port The command port, 0 for any free port
+        @retval (port, cmd_port) tuple of the ports listened on
+        """
+        data_server = self._listen(port)
+        cmd_server = self._listen(cmd_port)
+        endpoint = _Endpoint(simulator, data_server, cmd_server)
+        with self._lock:
+            self._endpoints.append(endpoint)
+            self._added.append(endpoint)
+        self._wake()
+        return (data_server.getsockname()[1], cmd_server.getsockname()[1])
+
+    def start(self):
+        """
+        Start the farm thread.
+        """
+        self._done = False
+        self._thread = threading.Thread(target=self._run)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the farm thread and close all the sockets.
+        """
+        self._done = True
+        self._wake()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        for endpoint in self._endpoints:
+            for sock in [endpoint.data_server, endpoint.cmd_server, endpoint.conn] + \
+                        endpoint.cmd_conns:
+                if sock:
+                    sock.close()
+        self._endpoints = []
+        os.close(self._wake_r)
+        os.close(self._wake_w)
+
+    def get_metrics(self):
+        """
+        @retval dict of SimulatorMetric -> count summed over all simulators
+        """
+        totals = dict([(key, 0) for key in SimulatorMetric.list()])
+        for endpoint in list(self._endpoints):
+            for (key, value) in endpoint.simulator.get_metrics().items():
+                totals[key] += value
+        return totals
+
+    def _listen(self, port):
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind((self._host, port))
+        server.listen(5)
+        server.setblocking(0)
+        return server
+
+    def _wake(self):
+        try:
+            os.write(self._wake_w, 'x')
+        except OSError:
+            # the pipe is full, the loop is awake already
+            pass
+
+    def _register(self, sock, handler, endpoint, events=select.POLLIN):
+        self._fds[sock.fileno()] = (handler, endpoint, sock)
+        self._poller.register(sock, events)
+
+    def _unregister(self, sock):
+        del self._fds[sock.fileno()]
+        self._poller.unregister(sock)
+        sock.close()
+
+    def _run(self):
+        log.info('Simulator farm started.')
+        while not self._done:
+            with self._lock:
+                added = self._added
+                self._added = []
+            for endpoint in added:
+                self._register(endpoint.data_server, self._accept_data, endpoint)
+                self._register(endpoint.cmd_server, self._accept_command, endpoint)
+
+            timeout = -1
+            if self._timers:
+                timeout = max(0, 1000 * (self._timers[0][0] - time.time()))
+            try:
+                events = self._poller.poll(timeout)
+            except select.error as e:
+                if e.args[0] != errno.EINTR:
+                    raise
+                continue
+
+            for (fd, event) in events:
+                if fd == self._wake_r:
+                    os.read(self._wake_r, 4096)
+                    continue
+                entry = self._fds.get(fd)
+                if entry is not None:
+                    (handler, endpoint, sock) = entry
+                    handler(endpoint, sock, event)
+
+            self._run_timers()
+        log.info('Simulator farm stopped.')
+
+    def _run_timers(self):
+        now = time.time()
+        while self._timers and self._timers[0][0] <= now:
+            (due, sequence, endpoint, generation) = heapq.heappop(self._timers)
+            if generation != endpoint.generation or endpoint.conn is None:
+                continue
+            simulator = endpoint.simulator
+            if simulator.streaming:
+                if endpoint.queued_bytes > MAX_QUEUED:
+                    simulator.overrun()
+                else:
+                    record = simulator.next_record()
+                    if record is not None:
+                        self._send(endpoint, [record])
+            # records keep their spacing, but one that fell more than a
+            # second behind is not sent in a rush after the others
+            endpoint.next_due = max(due + simulator.interval(), now - 1)
+            self._schedule(endpoint)
+
+    def _schedule(self, endpoint):
+        self._sequence += 1
+        heapq.heappush(self._timers, (endpoint.next_due, self._sequence,
+                                      endpoint, endpoint.generation))
+
+    def _accept_data(self, endpoint, server, event):
+        try:
+            (conn, addr) = server.accept()
+        except socket.error:
+            return
+        conn.setblocking(0)
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if endpoint.conn is not None:
+            # the newest driver takes over
+            self._unregister(endpoint.conn)
+        endpoint.conn = conn
+        endpoint.queue = []
+        endpoint.queued_bytes = 0
+        endpoint.generation += 1
+        endpoint.simulator.connected()
+        self._register(conn, self._data_event, endpoint)
+
+        if not endpoint.simulator.fast():
+            endpoint.next_due = time.time()
+            self._schedule(endpoint)
+        self._flush(endpoint)
+
+    def _accept_command(self, endpoint, server, event):
+        try:
+            (conn, addr) = server.accept()
+        except socket.error:
+            return
+        conn.setblocking(0)
+        endpoint.cmd_conns.append(conn)
+        self._register(conn, self._command_event, endpoint)
+
+    def _data_event(self, endpoint, conn, event):
+        if event & (select.POLLIN | select.POLLHUP | select.POLLERR):
+            data = self._recv(conn)
+            if data == '':
+                self._disconnect(endpoint)
+                return
+            if data is not None:
+                self._send(endpoint, endpoint.simulator.received(data))
+                if endpoint.conn is None:
+                    # the driver went away while we answered it
+                    return
+        if event & select.POLLOUT:
+            self._flush(endpoint)
+
+    def _command_event(self, endpoint, conn, event):
+        data = self._recv(conn)
+        if data is None:
+            return
+        if data == '':
+            endpoint.cmd_conns.remove(conn)
+            self._unregister(conn)
+            return
+        if endpoint.conn is not None:
+            self._send(endpoint, endpoint.simulator.port_agent_command(data))
+
+    def _recv(self, conn):
+        """
+        @retval the data read, None if there was nothing to read after all,
+        '' if the connection is closed
+        """
+        try:
+            return conn.recv(RECV_SIZE)
+        except socket.error as e:
+            if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return None
+            return ''
+
+    def _disconnect(self, endpoint):
+        self._unregister(endpoint.conn)
+        endpoint.conn = None
+        endpoint.queue = []
+        endpoint.queued_bytes = 0
+        endpoint.generation += 1
+
+    def _send(self, endpoint, data_list):
+        """
+        Queue data for the driver, one packet each, and write what the
+        socket takes.
+        """
+        if not data_list or endpoint.conn is None:
+            return
+        now = time.time()
+        for data in data_list:
+            packet = pack_packet(data, timestamp=now)
+            endpoint.queue.append(packet)
+            endpoint.queued_bytes += len(packet)
+        self._flush(endpoint)
+
+    def _flush(self, endpoint):
+        """
+        Write the queued packets, as much as the socket takes, and poll for
+        it to take more if any are left. A simulator sending as fast as
+        possible queues its next batch once its queue is empty.
+        """
+        conn = endpoint.conn
+        if conn is None:
+            return
+        if endpoint.queue:
+            data = ''.join(endpoint.queue)
+            try:
+                sent = conn.send(data)
+            except socket.error as e:
+                if e.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                    self._disconnect(endpoint)
+                    return
+                sent = 0
+            endpoint.queued_bytes -= sent
+            if sent < len(data):
+                endpoint.queue = [data[sent:]]
+            else:
+                endpoint.queue = []
+
+        if not endpoint.queue:
+            self._fill(endpoint)
+
+        events = select.POLLIN
+        if endpoint.queue:
+            events |= select.POLLOUT
+        self._poller.modify(conn, events)
+
+    def _fill(self, endpoint):
+        """
+        Queue a batch of records for a driver reading as fast as possible.
+        """
+        simulator = endpoint.simulator
+        if not simulator.fast():
+            return
+        now = time.time()
+        while simulator.streaming and endpoint.queued_bytes < FAST_BATCH_SIZE:
+            record = simulator.next_record()
+            if record is None:
+                break
+            packet = pack_packet(record, timestamp=now)
+            endpoint.queue.append(packet)
+            endpoint.queued_bytes += len(packet)
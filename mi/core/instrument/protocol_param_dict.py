@@ -11,11 +11,51 @@ __author__ = 'Edward Hunter'
 __license__ = 'Apache 2.0'
 
 import re
+import bisect
+import sre_parse
 import logging
 from mi.core.common import BaseEnum
 
 from mi.core.log import get_logger ; log = get_logger()
 
+# Patterns compiled with other flags are never joined in one alternation
+DEFAULT_FLAGS = re.compile('').flags
+
+# Back references would point at the wrong group in a joined alternation
+BACKREFERENCE_REGEX = re.compile(r'\\\d|\(\?P=|\(\?\(')
+
+# re handles at most 100 groups in one pattern
+MAX_JOINED_GROUPS = 99
+
+def required_literal(pattern, flags=0):
+    """
+    Find the longest run of literal text that every match of a pattern
+    holds, so input without it can be skipped without running the regex.
+    @param pattern The regex pattern.
+    @param flags The flags the pattern is compiled with.
+    @retval The literal string, None if the pattern has none.
+    """
+    parsed = sre_parse.parse(pattern, flags)
+    # flags include any set inline, like (?i)
+    if parsed.pattern.flags & re.IGNORECASE:
+        return None
+
+    longest = ''
+    run = []
+    # Only top level literals are required, anything in a group, branch
+    # or repeat may be skipped by a match.
+    for (op, av) in parsed:
+        if op == sre_parse.LITERAL and av < 128:
+            run.append(chr(av))
+        else:
+            if len(run) > len(longest):
+                longest = ''.join(run)
+            run = []
+    if len(run) > len(longest):
+        longest = ''.join(run)
+
+    return longest or None
+
 class ParameterDictVisibility(BaseEnum):
     READ_ONLY = "READ_ONLY"
     READ_WRITE = "READ_WRITE"
@@ -51,6 +91,7 @@ class ParameterDictVal(object):
         self.name = name
         self.pattern = pattern
         self.regex = re.compile(pattern)
+        self.keyword = required_literal(pattern, self.regex.flags)
         self.f_getval = f_getval
         self.f_format = f_format
         self.value = value
@@ -83,6 +124,108 @@ class ParameterDictVal(object):
             return False
 
 
+class ParameterIndex(object):
+    """
+    Finds the parameters whose regex may match some input without running
+    every regex. A parameter with a keyword (see required_literal) is only
+    tried on input holding its keyword. The others share one alternation
+    of their patterns and are only tried on input it matches, except
+    patterns that can not be joined, which are always tried.
+    """
+    def __init__(self, items):
+        """
+        @param items list of (name, ParameterDictVal) in the order the
+        parameters are tried.
+        """
+        self.size = len(items)
+        self.items = items
+        # keyword -> positions in items of the parameters with that keyword
+        self.keywords = {}
+        # positions of the parameters in the joined alternation
+        self.joined = []
+        self.joined_regex = None
+        # positions of the parameters that are always tried
+        self.always = []
+
+        joined_groups = 0
+        for (position, (name, val)) in enumerate(items):
+            keyword = getattr(val, 'keyword', None)
+            regex = getattr(val, 'regex', None)
+            if keyword:
+                self.keywords.setdefault(keyword, []).append(position)
+            elif regex is not None and regex.flags == DEFAULT_FLAGS and \
+                 not BACKREFERENCE_REGEX.search(regex.pattern) and \
+                 joined_groups + regex.groups <= MAX_JOINED_GROUPS:
+                joined_groups += regex.groups
+                self.joined.append(position)
+            else:
+                self.always.append(position)
+
+        if self.joined:
+            try:
+                self.joined_regex = re.compile('|'.join(
+                    ['(?:%s)' % items[position][1].regex.pattern
+                     for position in self.joined]))
+            except re.error:
+                # e.g. the same group name in two patterns
+                self.always = sorted(self.always + self.joined)
+                self.joined = []
+
+    def candidates(self, input):
+        """
+        @param input The string the parameters are matched against.
+        @retval list of (name, val) that may match the input, in order.
+        """
+        positions = list(self.always)
+        for (keyword, keyword_positions) in self.keywords.iteritems():
+            if keyword in input:
+                positions.extend(keyword_positions)
+        if self.joined and self.joined_regex.search(input):
+            positions.extend(self.joined)
+        positions.sort()
+        return [self.items[position] for position in positions]
+
+    def line_candidates(self, response, newline):
+        """
+        Split a response into lines and find the candidates of each line,
+        looking for every keyword in the whole response at once.
+        @param response The response string.
+        @param newline The line separator.
+        @retval list of (line, candidates) for the lines with candidates.
+        """
+        lines = response.split(newline)
+        starts = []
+        start = 0
+        for line in lines:
+            starts.append(start)
+            start += len(line) + len(newline)
+
+        # line number -> set of positions in items
+        hits = {}
+        for (keyword, keyword_positions) in self.keywords.iteritems():
+            pos = response.find(keyword)
+            while pos >= 0:
+                line_no = bisect.bisect_right(starts, pos) - 1
+                line_end = starts[line_no] + len(lines[line_no])
+                if pos + len(keyword) <= line_end:
+                    hits.setdefault(line_no, set()).update(keyword_positions)
+                    # the next hit worth finding is on the next line
+                    pos = response.find(keyword, line_end)
+                else:
+                    pos = response.find(keyword, pos + 1)
+
+        result = []
+        for (line_no, line) in enumerate(lines):
+            positions = list(self.always)
+            positions.extend(hits.get(line_no, ()))
+            if self.joined and self.joined_regex.search(line):
+                positions.extend(self.joined)
+            if positions:
+                positions.sort()
+                result.append((line, [self.items[position] for position in positions]))
+        return result
+
+
 class ProtocolParameterDict(object):
     """
     Protocol parameter dictionary. Manages, matches and formats device
@@ -93,6 +236,7 @@ class ProtocolParameterDict(object):
         Constructor.        
         """
         self._param_dict = {}
+        self._index = None
         
     def add(self, name, pattern, f_getval, f_format, value=None,
             visibility=ParameterDictVisibility.READ_WRITE,
@@ -133,6 +277,7 @@ class ProtocolParameterDict(object):
                                default_value=default_value,
                                init_value=init_value)
         self._param_dict[name] = val
+        self._index = None
         
     def get(self, name):
         """
@@ -167,6 +312,7 @@ class ProtocolParameterDict(object):
         """
         log.debug("setting " + name + " to " + str(value))
         self._param_dict[name] = value
+        self._index = None
         
     def set_default(self, name):
         """
@@ -226,27 +372,58 @@ class ProtocolParameterDict(object):
         """
         return self._param_dict[name].submenu_write
 
-    # RAU Added
-    def multi_match_update(self, input):
+    def _get_index(self):
         """
-        Update the dictionaray with a line input. Iterate through all objects
-        and attempt to match and update (a) parameter(s).
-        @param input A string to match to a dictionary object.
-        @retval The count of successfully updated parameters, 0 if not updated
+        The ParameterIndex of the dictionary, built again when parameters
+        have been added.
+        """
+        index = getattr(self, '_index', None)
+        if index is None or index.size != len(self._param_dict):
+            index = ParameterIndex(self._param_dict.items())
+            self._index = index
+        return index
+
+    def _first_match(self, input, candidates):
+        """
+        Update the first of the candidates matching the input.
+        @retval list of the name updated, empty if none
         """
-        hit_count = 0
+        for (name, val) in candidates:
+            log.trace("Updating param dict name: %s, value: %s", name, val)
+            if val.update(input):
+                return [name]
+        return []
+
+    def _multi_match(self, input, candidates):
+        """
+        Update the first of the candidates matching the input, or if it is
+        a multi match parameter, all multi match candidates matching it.
+        @retval list of the names updated, empty if none
+        """
+        updated = []
         multi_mode = False
-        for (name, val) in self._param_dict.iteritems():
+        for (name, val) in candidates:
             if multi_mode == True and val.multi_match == False:
                 continue
             if val.update(input):
-                hit_count =hit_count +1
+                updated.append(name)
                 if False == val.multi_match:
-                    return hit_count
+                    return updated
                 else:
                     multi_mode = True
+        return updated
 
-        if False == multi_mode and input <> "":
+    # RAU Added
+    def multi_match_update(self, input):
+        """
+        Update the dictionaray with a line input. Iterate through all objects
+        and attempt to match and update (a) parameter(s).
+        @param input A string to match to a dictionary object.
+        @retval The count of successfully updated parameters, 0 if not updated
+        """
+        hit_count = len(self._multi_match(input, self._get_index().candidates(input)))
+
+        if 0 == hit_count and input <> "":
             log.debug("protocol_param_dict.py UNMATCHCHED ***************************** " + input)
         return hit_count
 
@@ -257,7 +434,7 @@ class ProtocolParameterDict(object):
         @retval A dict with the names and values that were updated
         """
         result = {}
-        for (name, val) in self._param_dict.iteritems():
+        for (name, val) in self._get_index().candidates(input):
             update_result = val.update(input)
             if update_result:
                 result[name] = update_result 
@@ -271,11 +448,30 @@ class ProtocolParameterDict(object):
         @param input A string to match to a dictionary object.
         @retval The name that was successfully updated, None if not updated
         """
-        for (name, val) in self._param_dict.iteritems():
-            log.trace("Updating param dict name: %s, value: %s", name, val)
-            if val.update(input):
-                return name
+        updated = self._first_match(input, self._get_index().candidates(input))
+        if updated:
+            return updated[0]
         return False
+
+    def update_lines(self, response, newline, multi_match=False):
+        """
+        Update the dictionary from every line of a multi-line response, such
+        as a status display, in one pass. Each line updates what update()
+        would update from it, or multi_match_update() if multi_match is set.
+        @param response The response string.
+        @param newline The line separator.
+        @param multi_match True to update like multi_match_update().
+        @retval A dict of the names updated and their new values
+        """
+        result = {}
+        for (line, candidates) in self._get_index().line_candidates(response, newline):
+            if multi_match:
+                updated = self._multi_match(line, candidates)
+            else:
+                updated = self._first_match(line, candidates)
+            for name in updated:
+                result[name] = self._param_dict[name].value
+        return result
     
     def get_config(self):
         """
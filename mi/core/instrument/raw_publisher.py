@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.instrument.raw_publisher
+@file mi/core/instrument/raw_publisher.py
+@brief Decide which port agent packets become raw data particles.
+
+Building a raw particle base64 encodes the packet and JSONifies it, which
+for a chatty instrument costs more than everything else the driver does
+with the data. The publisher can send every packet, one packet per
+interval, every Nth packet, one particle per time window holding all the
+data seen in it, published when the window ends, or nothing, and sends nothing while no one is subscribed
+to the raw stream. Configure it through the driver config:
+
+    {DriverConfigKey.RAW_PUBLISHING: {
+        RawPublishingKey.MODE: RawPublishingMode.DECIMATE,
+        RawPublishingKey.DECIMATION: 10}}
+"""
+
+__license__ = 'Apache 2.0'
+
+import time
+import threading
+
+from mi.core.common import BaseEnum
+from mi.core.exceptions import InstrumentParameterException
+from mi.core.instrument.data_particle import DataParticleKey
+from mi.core.instrument.data_particle import RawDataParticle
+from mi.core.log import get_logger ; log = get_logger()
+
+class RawPublishingMode(BaseEnum):
+    """
+    How port agent packets are published as raw particles.
+    """
+    # every packet
+    ALL = 'all'
+    # the first packet of every interval
+    SAMPLE = 'sample'
+    # every Nth packet
+    DECIMATE = 'decimate'
+    # one particle per window holding the data of all its packets
+    AGGREGATE = 'aggregate'
+    # no packets
+    OFF = 'off'
+
+class RawPublishingKey(BaseEnum):
+    """
+    Dictionary keys for the raw publishing config, found under
+    DriverConfigKey.RAW_PUBLISHING.
+    """
+    MODE = 'mode'
+    # seconds between sampled packets
+    INTERVAL = 'interval'
+    # publish one packet in this many
+    DECIMATION = 'decimation'
+    # seconds of data in one aggregated particle
+    WINDOW = 'window'
+
+class RawDataPublisher(object):
+    """
+    Publishes raw particles for port agent packets according to the
+    configured mode, and counts the packets and bytes handled in each mode.
+    """
+    def __init__(self, publish, subscribed=None):
+        """
+        @param publish Called with the JSON of each raw particle
+        @param subscribed Called with no arguments, returns False while no
+            one is subscribed to the raw stream. None if always subscribed.
+        """
+        self._publish = publish
+        self._subscribed = subscribed
+
+        self._mode = RawPublishingMode.ALL
+        self._interval = 0
+        self._decimation = 1
+        self._window = 0
+
+        self._next_sample_time = 0
+        self._packets_skipped = 0
+        self._aggregate = []
+        self._aggregate_start = None
+        # publishes the aggregate when its window ends if no packet does
+        self._aggregate_timer = None
+        # bumped for each new window, so a late timer leaves the next alone
+        self._aggregate_window = 0
+        # the aggregate and the counters are shared with the timer thread
+        self._lock = threading.Lock()
+
+        self._counters = {}
+        for mode in RawPublishingMode.list():
+            self._counters[mode] = {'packets': 0, 'bytes': 0, 'particles': 0}
+
+    def configure(self, config):
+        """
+        Set the publishing mode. Data held for an aggregate is published
+        first.
+        @param config dict keyed by RawPublishingKey, None for the default
+            of publishing every packet
+        @raise InstrumentParameterException if the config is invalid
+        """
+        if config is None:
+            config = {}
+        if not isinstance(config, dict):
+            raise InstrumentParameterException('Invalid raw publishing config: %s' % config)
+
+        mode = config.get(RawPublishingKey.MODE, RawPublishingMode.ALL)
+        if not RawPublishingMode.has(mode):
+            raise InstrumentParameterException('Invalid raw publishing mode: %s' % mode)
+        try:
+            interval = float(config.get(RawPublishingKey.INTERVAL, 0))
+            decimation = int(config.get(RawPublishingKey.DECIMATION, 1))
+            window = float(config.get(RawPublishingKey.WINDOW, 0))
+        except (TypeError, ValueError):
+            raise InstrumentParameterException('Invalid raw publishing config: %s' % config)
+        if interval < 0 or decimation < 1 or window < 0:
+            raise InstrumentParameterException('Invalid raw publishing config: %s' % config)
+
+        self.flush()
+        log.debug('Raw publishing mode %s' % mode)
+        self._mode = mode
+        self._interval = interval
+        self._decimation = decimation
+        self._window = window
+        self._next_sample_time = 0
+        self._packets_skipped = 0
+
+    def got_packet(self, port_agent_packet):
+        """
+        Handle a port agent packet received from the instrument.
+        @param port_agent_packet The PortAgentPacket
+        """
+        mode = self._mode
+        if mode != RawPublishingMode.OFF and self._subscribed is not None \
+           and not self._subscribed():
+            mode = RawPublishingMode.OFF
+
+        counters = self._counters[mode]
+        counters['packets'] += 1
+        counters['bytes'] += port_agent_packet.get_data_size()
+
+        if mode == RawPublishingMode.ALL:
+            self._publish_particle(mode, port_agent_packet.get_as_dict())
+
+        elif mode == RawPublishingMode.SAMPLE:
+            now = time.time()
+            if now >= self._next_sample_time:
+                self._next_sample_time = now + self._interval
+                self._publish_particle(mode, port_agent_packet.get_as_dict())
+
+        elif mode == RawPublishingMode.DECIMATE:
+            if self._packets_skipped == 0:
+                self._publish_particle(mode, port_agent_packet.get_as_dict())
+            self._packets_skipped = (self._packets_skipped + 1) % self._decimation
+
+        elif mode == RawPublishingMode.AGGREGATE:
+            now = time.time()
+            with self._lock:
+                if self._aggregate_start is None:
+                    self._start_window(now)
+                self._aggregate.append(port_agent_packet)
+                ended = now - self._aggregate_start >= self._window
+            if ended:
+                self.flush()
+
+    def flush(self):
+        """
+        Publish the data held for an aggregate, if any.
+        """
+        self._flush_window(None)
+
+    def shutdown(self):
+        """
+        Publish the data held for an aggregate before the publisher is
+        dropped.
+        """
+        self.flush()
+
+    def _start_window(self, now):
+        """
+        Start an aggregate window and the timer that ends it. Called with
+        the lock held.
+        """
+        self._aggregate_start = now
+        self._aggregate_window += 1
+        if self._window > 0:
+            self._aggregate_timer = threading.Timer(self._window, self._flush_window,
+                                                    [self._aggregate_window])
+            self._aggregate_timer.daemon = True
+            self._aggregate_timer.start()
+
+    def _flush_window(self, window):
+        """
+        Publish the data held for an aggregate.
+        @param window The window the timer was started for, None to publish
+            whichever window is open
+        """
+        with self._lock:
+            if window is not None and window != self._aggregate_window:
+                return
+            if self._aggregate_timer is not None:
+                self._aggregate_timer.cancel()
+                self._aggregate_timer = None
+            if not self._aggregate:
+                return
+
+            packets = self._aggregate
+            self._aggregate = []
+            self._aggregate_start = None
+
+        data = ''.join([packet.get_data() for packet in packets])
+        self._publish_particle(RawPublishingMode.AGGREGATE, {
+            'type': packets[0].get_header_type(),
+            'length': len(data),
+            # no single port agent checksum covers the aggregate
+            'checksum': None,
+            'raw': data
+        })
+
+    def get_counters(self):
+        """
+        @retval dict of mode -> dict of the packets and bytes handled and
+            particles published in that mode
+        """
+        return dict([(mode, dict(counters)) for (mode, counters) in self._counters.items()])
+
+    def _publish_particle(self, mode, packet_dict):
+        particle = RawDataParticle(packet_dict,
+                       preferred_timestamp=DataParticleKey.DRIVER_TIMESTAMP)
+        with self._lock:
+            self._counters[mode]['particles'] += 1
+        self._publish(particle.generate())
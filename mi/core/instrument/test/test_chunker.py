@@ -10,6 +10,8 @@
 __author__ = 'Steve Foley'
 __license__ = 'Apache 2.0'
 
+import time
+import random
 import unittest
 from mi.core.unit_test import MiUnitTest, MiUnitTestCase
 import re
@@ -19,6 +21,13 @@ from ooi.logging import log
 
 from mi.core.exceptions import SampleException
 from mi.core.instrument.chunker import StringChunker
+from mi.core.instrument.chunker import RingStringChunker
+from mi.core.instrument.chunker import RingBinaryChunker
+from mi.core.instrument.chunker import RegexSieve
+from mi.core.instrument.chunker import SieveMatcher
+from mi.core.instrument.chunker import SieveFunctionAdapter
+from mi.core.instrument.chunker import SyncMatcher
+from mi.core.instrument.chunker import _uncapture
 
 @attr('UNIT', group='mi')
 class UnitTestStringChunker(MiUnitTestCase):
@@ -37,6 +46,8 @@ class UnitTestStringChunker(MiUnitTestCase):
     
     MULTI_SAMPLE_1 = "%s\r\n%s" % (SAMPLE_1,
                                    SAMPLE_2)
+
+    CHUNKER_CLASS = StringChunker
     
     @staticmethod
     def sieve_function(raw_data):
@@ -56,7 +67,7 @@ class UnitTestStringChunker(MiUnitTestCase):
     
     def setUp(self):
         """ Setup a chunker for use in tests """
-        self._chunker = StringChunker(UnitTestStringChunker.sieve_function)
+        self._chunker = self.CHUNKER_CLASS(UnitTestStringChunker.sieve_function)
         
     def _display_chunk_list(self, data, chunk_list):
         """ Display the data as viewed through the chunk list """
@@ -238,7 +249,7 @@ class UnitTestStringChunker(MiUnitTestCase):
         def funky_sieve(data):
             return [(3,6),(0,3)]
 
-        self._chunker = StringChunker(funky_sieve)
+        self._chunker = self.CHUNKER_CLASS(funky_sieve)
         self._chunker.add_chunk("BarFoo")
         result = self._chunker.get_next_data()
         self.assertEquals(result, "Bar")
@@ -256,9 +267,312 @@ class UnitTestStringChunker(MiUnitTestCase):
         def overlap_sieve(data):
             return [(0,3),(2,6)]
 
-        self._chunker = StringChunker(overlap_sieve)
+        self._chunker = self.CHUNKER_CLASS(overlap_sieve)
         self.assertRaises(SampleException, self._chunker.add_chunk, "foobar")
                 
+@attr('UNIT', group='mi')
+class UnitTestRingStringChunker(UnitTestStringChunker):
+    """
+    Run the string chunker tests against the ring buffer chunker and check
+    the behavior that is specific to it.
+    """
+    CHUNKER_CLASS = RingStringChunker
+
+    def test_block_type(self):
+        """
+        String chunker hands out str, binary chunker hands out bytearray
+        """
+        self._chunker.add_chunk(self.SAMPLE_1)
+        self.assertTrue(isinstance(self._chunker.get_next_data(), str))
+
+        chunker = RingBinaryChunker(UnitTestStringChunker.sieve_function)
+        chunker.add_chunk(self.SAMPLE_1)
+        result = chunker.get_next_data()
+        self.assertTrue(isinstance(result, bytearray))
+        self.assertEquals(result, bytearray(self.SAMPLE_1))
+
+    def test_compaction(self):
+        """
+        Consumed data is only dropped from the buffer once it passes the
+        compaction threshold, and offsets keep counting from the stream start
+        """
+        self._chunker = RingStringChunker(UnitTestStringChunker.sieve_function,
+                                          compact_threshold=64)
+        self._chunker.add_chunk(self.SAMPLE_1)
+        self.assertEquals(self._chunker.get_next_data(), self.SAMPLE_1)
+        self.assertEquals(self._chunker.head, 31)
+        self.assertEquals(self._chunker.base, 0)
+        self.assertEquals(len(self._chunker.buffer), 31)
+
+        self._chunker.add_chunk(self.SAMPLE_2 + self.SAMPLE_3)
+        self.assertEquals(list(self._chunker.data_chunk_list),
+                          [(31, 62), (62, 93)])
+        self.assertEquals(self._chunker.get_next_data(), self.SAMPLE_2)
+        self.assertEquals(self._chunker.base, 0)
+
+        self.assertEquals(self._chunker.get_next_data(), self.SAMPLE_3)
+        self.assertEquals(self._chunker.head, 93)
+        self.assertEquals(self._chunker.base, 93)
+        self.assertEquals(len(self._chunker.buffer), 0)
+
+        self._chunker.add_chunk(self.FRAGMENT_1)
+        self._chunker.add_chunk(self.FRAGMENT_2)
+        self.assertEquals(self._chunker.get_next_data(), self.FRAGMENT_SAMPLE)
+
+    def test_raw_splits_data(self):
+        """
+        Consuming raw data from the middle of a data block turns the rest of
+        that block into non-data
+        """
+        self._chunker.add_chunk(self.FRAGMENT_1)
+        self._chunker.add_chunk(self.FRAGMENT_2 + "Foo")
+        self.assertEquals(len(self._chunker.data_chunk_list), 1)
+
+        self.assertEquals(self._chunker.get_next_raw(), self.FRAGMENT_1)
+        self.assertEquals(self._chunker.get_next_data(), None)
+        self.assertEquals(self._chunker.get_next_non_data(clean=False),
+                          self.FRAGMENT_2)
+
+@attr('UNIT', group='mi')
+class UnitTestResumableSieve(MiUnitTestCase):
+    """
+    Test the resumable sieve classes and how the chunkers use them
+    """
+    SAMPLE_REGEX = re.compile(r'SATPAR(?P<sernum>\d{4}),(?P<timer>\d{1,7}.\d\d),(?P<counts>\d{10}),(?P<checksum>\d{1,3})\r\n')
+    BLOCK_REGEX = re.compile(r'BEGIN.*?END\r\n', re.DOTALL)
+
+    SAMPLE_1 = "SATPAR0229,10.01,2206748111,111\r\n"
+    BLOCK = "BEGIN\r\n1\r\n2\r\n3\r\nEND\r\n"
+
+    class CountingRegex(object):
+        """ Wrap a regex to count how many characters get scanned """
+        def __init__(self, regex):
+            self.regex = regex
+            self.pattern = regex.pattern
+            self.flags = regex.flags
+            self.scanned = 0
+
+        def search(self, raw_data, pos=0):
+            self.scanned += len(raw_data) - pos
+            return self.regex.search(raw_data, pos)
+
+    def test_callable(self):
+        """
+        A resumable sieve still works as a plain sieve function
+        """
+        sieve = RegexSieve([self.SAMPLE_REGEX,
+                            SieveMatcher(self.BLOCK_REGEX, start='BEGIN', end='END\r\n')])
+        data = "foo" + self.SAMPLE_1 + self.BLOCK + "bar"
+        self.assertEquals(sorted(sieve(data)), [(3, 36), (36, 57)])
+
+    def test_end_hint(self):
+        """
+        A matcher with an end only runs when an end arrives and only looks
+        back as far as the previous end
+        """
+        matcher = SieveMatcher(self.SAMPLE_REGEX, end='\r\n')
+        data = "noise\r\n" + self.SAMPLE_1[:10]
+        self.assertEquals(matcher.scan(data, 0), ([], 6))
+
+        data += self.SAMPLE_1[10:]
+        self.assertEquals(matcher.scan(data, 17), ([(7, 40)], 39))
+
+    def test_start_hint(self):
+        """
+        A matcher with a start keeps the data settled up to the first start
+        """
+        matcher = SieveMatcher(self.BLOCK_REGEX, start='BEGIN', end='END\r\n')
+        self.assertEquals(matcher.scan("noise", 0), ([], 5))
+        self.assertEquals(matcher.scan("noiseBEG", 5), ([], 5))
+        self.assertEquals(matcher.scan("noise" + self.BLOCK[:10], 8), ([], 5))
+
+        data = "noise" + self.BLOCK
+        self.assertEquals(matcher.scan(data, 15), ([(5, 26)], 26))
+
+    def test_max_size_hint(self):
+        """
+        Bytes further back than the largest block are settled
+        """
+        matcher = SieveMatcher(self.SAMPLE_REGEX, max_size=33)
+        data = "x" * 100
+        self.assertEquals(matcher.scan(data, 90), ([], 68))
+
+        adapter = SieveFunctionAdapter(UnitTestStringChunker.sieve_function, max_size=33)
+        self.assertEquals(adapter.scan(data, 90), ([], 68))
+        self.assertEquals(SieveFunctionAdapter(UnitTestStringChunker.sieve_function).scan(data, 90),
+                          ([], 0))
+
+    def test_block_scanned_once(self):
+        """
+        A long block arriving a byte at a time is only scanned once its end
+        arrives, and bytes before it are not rescanned
+        """
+        for chunker_class in (StringChunker, RingStringChunker):
+            regex = self.CountingRegex(self.BLOCK_REGEX)
+            sieve = RegexSieve([SieveMatcher(regex, start='BEGIN', end='END\r\n')])
+            chunker = chunker_class(sieve)
+
+            body = "".join(["%d\r\n" % i for i in range(1000)])
+            data = "noise\r\n" + "BEGIN\r\n" + body + "END\r\n"
+            for char in data:
+                chunker.add_chunk(char)
+
+            self.assertEquals(chunker.get_next_data(), data[7:])
+            self.assertEquals(regex.scanned, len(data) - 7)
+
+    def test_settled_non_data(self):
+        """
+        Settled bytes are reported as non-data even after a data block
+        """
+        sieve = RegexSieve([SieveMatcher(self.SAMPLE_REGEX, start='SATPAR', end='\r\n')])
+        for chunker_class in (StringChunker, RingStringChunker):
+            chunker = chunker_class(sieve)
+            chunker.add_chunk("Foo" + self.SAMPLE_1 + "Bar\r\nSAT")
+            self.assertEquals(chunker.get_next_data(), self.SAMPLE_1)
+            self.assertEquals(chunker.get_next_non_data(), "Bar\r\n")
+            self.assertEquals(chunker.get_next_non_data(), None)
+
+            chunker.add_chunk(self.SAMPLE_1[3:])
+            self.assertEquals(chunker.get_next_data(), self.SAMPLE_1)
+
+    def test_fragment_non_data(self):
+        """
+        The unsettled start of a fragment is taken back off the non-data
+        once the rest of the block arrives
+        """
+        for chunker_class in (StringChunker, RingStringChunker):
+            sieve = RegexSieve([SieveMatcher(r'START.*?END', start='START', end='END')])
+            chunker = chunker_class(sieve)
+            chunker.add_chunk("garbage...")
+            chunker.add_chunk("xxSTAR")
+            chunker.add_chunk("T data END")
+
+            self.assertEquals(list(chunker.nondata_chunk_list), [(0, 12)])
+            self.assertEquals(list(chunker.data_chunk_list), [(12, 26)])
+            self.assertEquals(chunker.get_next_non_data(clean=False), "garbage...xx")
+            self.assertEquals(chunker.get_next_data(), "START data END")
+            self.assertEquals(chunker.get_next_non_data(), None)
+
+    def test_tagged_data(self):
+        """
+        get_next_data can hand back the name the sieve gave each block
+        """
+        sieve = RegexSieve([SieveMatcher(self.SAMPLE_REGEX, name='sample'),
+                            SieveMatcher(self.BLOCK_REGEX, name='block')])
+        for chunker_class in (StringChunker, RingStringChunker):
+            chunker = chunker_class(sieve)
+            chunker.add_chunk("foo" + self.SAMPLE_1 + self.BLOCK + self.SAMPLE_1)
+
+            self.assertEquals(chunker.get_next_data(clean=False, tagged=True),
+                              ('sample', self.SAMPLE_1))
+            self.assertEquals(chunker.get_next_data(tagged=True), ('sample', self.SAMPLE_1))
+            self.assertEquals(chunker.get_next_data(tagged=True), ('block', self.BLOCK))
+            self.assertEquals(chunker.get_next_data(), self.SAMPLE_1)
+            self.assertEquals(chunker.get_next_data(tagged=True), None)
+
+            # a plain sieve function leaves its blocks untagged
+            chunker = chunker_class(UnitTestStringChunker.sieve_function)
+            chunker.add_chunk(UnitTestStringChunker.SAMPLE_1)
+            self.assertEquals(chunker.get_next_data(tagged=True),
+                              (None, UnitTestStringChunker.SAMPLE_1))
+
+    def test_tags_follow_buffer(self):
+        """
+        Tags stay with their blocks as the buffer is consumed around them
+        """
+        sieve = RegexSieve([SieveMatcher(self.SAMPLE_REGEX, name='sample'),
+                            SieveMatcher(self.BLOCK_REGEX, name='block')])
+        for chunker_class in (StringChunker, RingStringChunker):
+            chunker = chunker_class(sieve)
+            chunker.add_chunk("foo" + self.SAMPLE_1)
+            chunker.add_chunk("bar" + self.BLOCK)
+            self.assertEquals(chunker.get_next_non_data(), "foo")
+            self.assertEquals(chunker.get_next_data(tagged=True), ('sample', self.SAMPLE_1))
+            self.assertEquals(chunker.get_next_non_data(), "bar")
+            self.assertEquals(chunker.get_next_data(tagged=True), ('block', self.BLOCK))
+            self.assertEquals(chunker._data_tags, {})
+
+    def test_uncapture(self):
+        """
+        Groups are made non-capturing, patterns that need their groups are not
+        """
+        self.assertEquals(_uncapture(r'(a)(?P<b>b)(?:c)[(]\(d'), r'(?:a)(?:b)(?:c)[(]\(d')
+        self.assertEquals(_uncapture(r'[]()](x)'), r'[]()](?:x)')
+        self.assertEquals(_uncapture(r'(?=a)(?!b)'), r'(?=a)(?!b)')
+        self.assertEquals(_uncapture(r'(a)\1'), None)
+        self.assertEquals(_uncapture(r'(?P<a>a)(?P=a)'), None)
+        self.assertEquals(_uncapture(r'(?i)a'), None)
+
+    def test_tagged(self):
+        """
+        Blocks come back sorted and tagged with the name of their matcher
+        """
+        sieve = RegexSieve([SieveMatcher(self.BLOCK_REGEX, name='block'),
+                            SieveMatcher(self.SAMPLE_REGEX, name='sample')])
+        self.assertEquals(len(sieve._scanners), 2)
+
+        data = self.SAMPLE_1 + "noise" + self.BLOCK + self.SAMPLE_1
+        self.assertEquals(sieve.scan_tagged(data, 0)[0],
+                          [(0, 33, 'sample'), (38, 59, 'block'), (59, 92, 'sample')])
+
+    def test_first_matcher_wins(self):
+        """
+        When two matchers find a block at the same place the first listed wins
+        """
+        data = "ABCD"
+        sieve = RegexSieve([SieveMatcher(r'AB', name='short'),
+                            SieveMatcher(r'ABCD', name='long')])
+        self.assertEquals(sieve.scan_tagged(data, 0)[0], [(0, 2, 'short')])
+
+        sieve = RegexSieve([SieveMatcher(r'ABCD', name='long'),
+                            SieveMatcher(r'AB', name='short')])
+        self.assertEquals(sieve.scan_tagged(data, 0)[0], [(0, 4, 'long')])
+
+    def test_sync_matcher(self):
+        """
+        A structure with a bad checksum is skipped and the scan resumes one
+        byte past its sync
+        """
+        good = lambda block: block[-1] == 'G'
+        sieve = RegexSieve([SyncMatcher('\xa5\x01', 6, name='sync', checksum=good)])
+
+        data = "\xa5\x01\xa5\x01abcG" + "xx" + "\xa5\x01defG"
+        self.assertEquals(sieve.scan_tagged(data, 0)[0], [(2, 8, 'sync'), (10, 16, 'sync')])
+
+        data = "\xa5\x01abcBxx\xa5\x01a"
+        self.assertEquals(sieve.scan(data, 0), ([], 8))
+
+    def test_shared_sync(self):
+        """
+        Structures sharing sync bytes are each found when the one listed
+        first fails its checksum at the same place
+        """
+        short_good = lambda block: block[-1] == 'S'
+        long_good = lambda block: block[-1] == 'L'
+        sieve = RegexSieve([SyncMatcher('\xa5\x01', 6, name='short', checksum=short_good),
+                            SyncMatcher('\xa5\x01', 10, name='long', checksum=long_good)])
+        self.assertEquals(len(sieve._scanners), 1)
+
+        data = "\xa5\x01abcdefgL" + "\xa5\x01abcS" + "x" + "\xa5\x01abcdefgB"
+        self.assertEquals(sieve.scan_tagged(data, 0)[0],
+                          [(0, 10, 'long'), (10, 16, 'short')])
+
+        # a long structure whose first six bytes would pass as a short one
+        data = "\xa5\x01abcSefgL"
+        self.assertEquals(sieve.scan_tagged(data, 0)[0], [(0, 6, 'short')])
+
+    def test_many_groups(self):
+        """
+        Matchers with more groups between them than one regex may hold are
+        still combined into a single scanner
+        """
+        matchers = [SieveMatcher("m%d:%s" % (i, r'(\d)' * 10), name=i) for i in range(20)]
+        sieve = RegexSieve(matchers)
+        self.assertEquals(len(sieve._scanners), 1)
+
+        data = "xm19:0123456789ym3:0123456789"
+        self.assertEquals(sieve.scan_tagged(data, 0)[0], [(1, 15, 19), (16, 29, 3)])
+
 @unittest.skip("Write this when a binary chunker is needed")
 @attr('UNIT', group='mi')
 class UnitTestBinaryChunker(MiUnitTestCase):
@@ -308,3 +622,58 @@ class UnitTestBinaryChunker(MiUnitTestCase):
         """
         pass
     
+
+
+@attr('BENCHMARK', group='mi')
+class BenchmarkChunker(MiUnitTest):
+    """
+    Compare chunker throughput on 1 MB of samples mixed with noise. Run with
+    -a BENCHMARK, the rates are logged at info level.
+    """
+    DATA_SIZE = 1024 * 1024
+    READ_SIZE = 4096
+
+    def _build_data(self):
+        """
+        Build a reproducible stream of PAR samples and noise
+        """
+        rand = random.Random(42)
+        samples = [UnitTestStringChunker.SAMPLE_1,
+                   UnitTestStringChunker.SAMPLE_2,
+                   UnitTestStringChunker.SAMPLE_3]
+        parts = []
+        size = 0
+        while size < self.DATA_SIZE:
+            if rand.random() < 0.8:
+                part = rand.choice(samples) + "\r\n"
+            else:
+                part = "noise %d\r\n" % rand.randint(0, 1000000)
+            parts.append(part)
+            size += len(part)
+        return "".join(parts)
+
+    def _run(self, chunker, data):
+        """
+        Feed the data in READ_SIZE pieces draining as we go
+        @retval (number of samples, elapsed seconds)
+        """
+        count = 0
+        start = time.time()
+        for i in range(0, len(data), self.READ_SIZE):
+            chunker.add_chunk(data[i:i+self.READ_SIZE])
+            while chunker.get_next_data() is not None:
+                count += 1
+        return (count, time.time() - start)
+
+    def test_throughput(self):
+        data = self._build_data()
+        sieve = UnitTestStringChunker.sieve_function
+
+        (old_count, old_time) = self._run(StringChunker(sieve), data)
+        (new_count, new_time) = self._run(RingStringChunker(sieve), data)
+
+        self.assertEquals(old_count, new_count)
+        log.info("StringChunker: %d samples in %.3fs (%.1f MB/s)",
+                 old_count, old_time, len(data) / old_time / 1e6)
+        log.info("RingStringChunker: %d samples in %.3fs (%.1f MB/s)",
+                 new_count, new_time, len(data) / new_time / 1e6)
@@ -12,7 +12,10 @@ __license__ = 'Apache 2.0'
 
 
 import json
+import time
+import copy
 import base64
+import ntplib
 from nose.plugins.attrib import attr
 from mi.core.unit_test import MiUnitTestCase
 
@@ -20,6 +23,8 @@ from mi.core.log import get_logger ; log = get_logger()
 from mi.core.exceptions import SampleException, ReadOnlyException, NotImplementedException
 from mi.core.instrument.data_particle import DataParticle, DataParticleKey, DataParticleValue
 from mi.core.instrument.data_particle import RawDataParticle, CommonDataParticleType
+from mi.core.instrument.data_particle import future_timestamp_limit
+from mi.core.instrument.data_particle import sorted_json
 from mi.core.instrument.port_agent_client import PortAgentPacket
 
 TEST_PARTICLE_VERSION = 1
@@ -210,3 +215,117 @@ class TestUnitDataParticle(MiUnitTestCase):
 
         with self.assertRaises(NotImplementedException):
             particle.data_particle_type()
+
+    def test_generate_cached(self):
+        """
+        Test generate builds the particle once, and that the dict form
+        matches the JSON
+        """
+        parsed_result = self.parsed_test_particle.generate()
+        self.assertTrue(self.parsed_test_particle.generate() is parsed_result)
+
+        parsed_dict = self.parsed_test_particle.generate_dict()
+        self.assertTrue(self.parsed_test_particle.generate_dict() is parsed_dict)
+        self.assertEqual(parsed_dict, json.loads(parsed_result))
+
+        # setting a value rebuilds it
+        test_particle = self.TestDataParticle(self.sample_raw_data,
+            preferred_timestamp=DataParticleKey.INTERNAL_TIMESTAMP,
+            internal_timestamp=self.sample_internal_timestamp)
+        test_particle.generate()
+        test_particle.set_value(DataParticleKey.INTERNAL_TIMESTAMP,
+                                self.sample_internal_timestamp + 200)
+        self.assertEqual(test_particle.generate_dict()[DataParticleKey.INTERNAL_TIMESTAMP],
+                         self.sample_internal_timestamp + 200)
+
+    def test_future_timestamp_limit(self):
+        """
+        Test the limit is a year ahead, give or take the second it is
+        cached for
+        """
+        year_ahead = ntplib.system_to_ntp_time(time.time() + 86400*365)
+        self.assertTrue(year_ahead <= future_timestamp_limit() <= year_ahead + 2)
+
+        test_particle = self.TestDataParticle(self.sample_raw_data,
+            preferred_timestamp=DataParticleKey.DRIVER_TIMESTAMP,
+            internal_timestamp=year_ahead + 86400)
+        self.assertRaises(SampleException, test_particle.generate)
+
+    def test_sorted_json(self):
+        """
+        Test sorted_json matches json.dumps with sorted keys
+        """
+        class Other(object):
+            pass
+        for obj in [self.sample_parsed_particle, self.sample_raw_particle,
+                    {'a': [1, 2L, True, None, float('nan'), float('-inf'),
+                           u'\u1234 "quoted"\n', -0.0, 1e300, (3, 4)],
+                     u'b': {'z': {}, 'y': []}},
+                    {1: 'number key'}]:
+            self.assertEqual(sorted_json(obj), json.dumps(obj, sort_keys=True))
+        self.assertRaises(TypeError, sorted_json, {'a': Other()})
+
+class LegacyGenerate(object):
+    """
+    DataParticle.generate as it was before the header was built shallow and
+    the timestamp limit cached, for comparison.
+    """
+    def generate(self):
+        for key in [DataParticleKey.INTERNAL_TIMESTAMP,
+                    DataParticleKey.DRIVER_TIMESTAMP,
+                    DataParticleKey.PORT_TIMESTAMP]:
+            timestamp = self.contents[key]
+            if timestamp is not None and \
+               timestamp > ntplib.system_to_ntp_time(time.time()+(86400*365)):
+                raise SampleException("Invalid port agent timestamp in raw packet")
+        self._check_preferred_timestamps()
+
+        result = copy.deepcopy(self.contents)
+        if not self.contents[DataParticleKey.PORT_TIMESTAMP]:
+            del result[DataParticleKey.PORT_TIMESTAMP]
+        if not self.contents[DataParticleKey.INTERNAL_TIMESTAMP]:
+            del result[DataParticleKey.INTERNAL_TIMESTAMP]
+        result[DataParticleKey.STREAM_NAME] = self.data_particle_type()
+        result[DataParticleKey.VALUES] = self._build_parsed_values()
+        return json.dumps(result, sort_keys=True)
+
+@attr('BENCHMARK', group='mi')
+class BenchmarkDataParticle(MiUnitTestCase):
+    """
+    SBE37 particles generated and published per second the way
+    InstrumentProtocol._generate_particle does it, with and without the fast
+    path.
+    """
+    PARTICLE_COUNT = 100000
+    SAMPLE = '#55.9044,41.40609, 572.170,   34.2583, 1505.948, 05 Feb 2013, 19:16:59'
+
+    def test_generate_rate(self):
+        from mi.instrument.seabird.sbe37smb.ooicore.driver import SBE37DataParticle
+
+        class LegacySBE37DataParticle(LegacyGenerate, SBE37DataParticle):
+            pass
+
+        published = []
+        def legacy():
+            particle = LegacySBE37DataParticle(self.SAMPLE,
+                preferred_timestamp=DataParticleKey.DRIVER_TIMESTAMP)
+            parsed_sample = particle.generate()
+            published.append(parsed_sample)
+            return json.loads(parsed_sample)
+
+        def fast():
+            particle = SBE37DataParticle(self.SAMPLE,
+                preferred_timestamp=DataParticleKey.DRIVER_TIMESTAMP)
+            sample = particle.generate_dict()
+            published.append(particle.generate())
+            return sample
+
+        self.assertEqual(legacy()[DataParticleKey.VALUES], fast()[DataParticleKey.VALUES])
+
+        for (name, build) in [('legacy', legacy), ('fast', fast)]:
+            del published[:]
+            start_time = time.time()
+            for i in range(self.PARTICLE_COUNT):
+                build()
+            rate = self.PARTICLE_COUNT / (time.time() - start_time)
+            log.info("SBE37 particles, %s path: %d particles/s", name, rate)
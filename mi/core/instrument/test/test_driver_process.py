@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.instrument.test.test_driver_process
+@file mi/core/instrument/test/test_driver_process.py
+@brief Test cases for the driver process event queue
+"""
+
+__license__ = 'Apache 2.0'
+
+import time
+
+from nose.plugins.attrib import attr
+
+from mi.core.unit_test import MiUnitTest
+from mi.core.exceptions import InstrumentParameterException
+from mi.core.instrument.instrument_driver import DriverConfigKey
+from mi.core.instrument.instrument_driver import EventBatchKey
+from mi.core.instrument.driver_process import DriverProcess
+from mi.core.instrument.driver_process import FlushCause
+from mi.core.instrument.driver_process import STOP_EVENT_THREAD
+
+@attr('UNIT', group='mi')
+class TestEventBatch(MiUnitTest):
+    """
+    Batching of queued events
+    """
+    def setUp(self):
+        self.process = DriverProcess('module', 'class', None)
+
+    def _configure(self, config):
+        return self.process.cmd_driver({'cmd': 'set_init_params',
+                                        'args': ({DriverConfigKey.EVENT_BATCH: config},),
+                                        'kwargs': {}})
+
+    def test_unbatched(self):
+        """
+        Without batching events come one at a time
+        """
+        for i in range(3):
+            self.process.send_event(i)
+        self.assertEqual(self.process.get_events(), [0])
+        self.assertEqual(self.process.get_events(), [1])
+        self.assertEqual(self.process.get_events(), [2])
+        self.assertEqual(self.process.event_batch_metrics.batches, 0)
+
+    def test_flush_causes(self):
+        """
+        A batch is sent when full, when its latency runs out, or on stop
+        """
+        self._configure({EventBatchKey.MAX_EVENTS: 3, EventBatchKey.MAX_LATENCY: 20})
+        self.assertEqual(self.process.event_batch_size, 3)
+
+        for i in range(5):
+            self.process.send_event(i)
+        self.assertEqual(self.process.get_events(), [0, 1, 2])
+        start_time = time.time()
+        self.assertEqual(self.process.get_events(), [3, 4])
+        self.assertTrue(time.time() - start_time >= .02)
+
+        self.process.send_event(5)
+        self.process.events.put(STOP_EVENT_THREAD)
+        self.assertEqual(self.process.get_events(), [5])
+        self.process.events.put(STOP_EVENT_THREAD)
+        self.assertEqual(self.process.get_events(), [])
+
+        metrics = self.process.cmd_driver({'cmd': 'get_event_batch_metrics',
+                                           'args': (), 'kwargs': {}})
+        self.assertEqual(metrics['batches'], 3)
+        self.assertEqual(metrics['events'], 6)
+        self.assertEqual(metrics['max_size'], 3)
+        self.assertEqual(metrics['sizes'], {1: 1, 2: 1, 3: 1})
+        self.assertEqual(metrics['flush_causes'], {FlushCause.SIZE: 1,
+                                                   FlushCause.LATENCY: 1,
+                                                   FlushCause.STOP: 1})
+
+    def test_invalid_config(self):
+        """
+        Bad batch config is refused and batching is left alone
+        """
+        reply = self._configure({EventBatchKey.MAX_EVENTS: 0})
+        self.assertIsInstance(reply, InstrumentParameterException)
+        reply = self._configure({EventBatchKey.MAX_LATENCY: 'soon'})
+        self.assertIsInstance(reply, InstrumentParameterException)
+        reply = self._configure('batch')
+        self.assertIsInstance(reply, InstrumentParameterException)
+        self.assertEqual(self.process.event_batch_size, 1)
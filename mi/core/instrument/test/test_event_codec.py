@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.instrument.test.test_event_codec
+@file mi/core/instrument/test/test_event_codec.py
+@brief Test cases for the driver process event codecs
+"""
+
+__license__ = 'Apache 2.0'
+
+import json
+import time
+import threading
+
+import zmq
+from nose.plugins.attrib import attr
+
+from mi.core.log import get_logger ; log = get_logger()
+from mi.core.unit_test import MiUnitTest
+from mi.core.exceptions import InstrumentParameterException
+from mi.core.instrument.instrument_driver import DriverAsyncEvent
+from mi.core.instrument.driver_process import DriverProcess
+from mi.core.instrument.zmq_driver_process import ZmqDriverProcess
+from mi.core.instrument.event_codec import CODECS
+from mi.core.instrument.event_codec import ZERO_COPY_THRESHOLD
+from mi.core.instrument.event_codec import choose_codec
+from mi.core.instrument.event_codec import encode_event
+from mi.core.instrument.event_codec import decode_event
+from mi.core.instrument.event_codec import encode_batch
+from mi.core.instrument.event_codec import decode_events
+
+SAMPLE_VALUE = json.dumps({
+    'stream_name': 'parsed',
+    'pkt_format_id': 'JSON_Data',
+    'pkt_version': 1,
+    'port_timestamp': 3564425404.85,
+    'driver_timestamp': 3564425404.86,
+    'preferred_timestamp': 'driver_timestamp',
+    'quality_flag': 'ok',
+    'values': [{'value_id': 'temp', 'value': 10.5},
+               {'value_id': 'conductivity', 'value': 4.2},
+               {'value_id': 'pressure', 'value': 1023.4}]
+})
+
+def sample_event():
+    return {'type': DriverAsyncEvent.SAMPLE, 'value': SAMPLE_VALUE,
+            'time': time.time()}
+
+@attr('UNIT', group='mi')
+class TestEventCodec(MiUnitTest):
+    """
+    Round trip events through each codec
+    """
+    def test_sample_round_trip(self):
+        """
+        A sample survives every codec and its value rides in the same frame
+        """
+        evt = sample_event()
+        for name in CODECS.keys():
+            frames = encode_event(name, evt)
+            self.assertEqual(len(frames), 1)
+            if name != 'pickle':
+                self.assertTrue(frames[0].endswith(SAMPLE_VALUE))
+            self.assertEqual(decode_event(frames), evt)
+
+    def test_large_value(self):
+        """
+        A big value is sent as a frame of its own
+        """
+        evt = {'type': DriverAsyncEvent.DIRECT_ACCESS,
+               'value': 'x' * ZERO_COPY_THRESHOLD, 'time': time.time()}
+        frames = encode_event('binary', evt)
+        self.assertEqual(len(frames), 2)
+        self.assertTrue(frames[1] is evt['value'])
+        self.assertEqual(decode_event(frames), evt)
+
+    def test_structured_value(self):
+        """
+        A value that is not a string is encoded with the rest of the event,
+        or pickled if the codec can not carry it
+        """
+        evt = {'type': DriverAsyncEvent.CONFIG_CHANGE,
+               'value': {'PARAM': 1.5}, 'time': time.time()}
+        self.assertEqual(encode_event('json', evt)[0][0], chr(CODECS['json'].code))
+        self.assertEqual(decode_event(encode_event('json', evt)), evt)
+        self.assertEqual(encode_event('binary', evt)[0][0], chr(CODECS['pickle'].code))
+        self.assertEqual(decode_event(encode_event('binary', evt)), evt)
+
+        evt = {'type': DriverAsyncEvent.RESULT, 'value': Exception('bad'),
+               'time': time.time()}
+        self.assertEqual(encode_event('json', evt)[0][0], chr(CODECS['pickle'].code))
+
+    def test_legacy(self):
+        """
+        Without a codec events are a single pickled frame, and so is anything
+        that is not an event dict
+        """
+        self.assertEqual(len(encode_event(None, sample_event())), 1)
+        self.assertEqual(decode_event(encode_event(None, 'event')), 'event')
+        self.assertEqual(decode_event(encode_event('binary', 'event')), 'event')
+
+    def test_batch(self):
+        """
+        A batch comes back as the same events in order, with big values in
+        frames of their own
+        """
+        big = {'type': DriverAsyncEvent.DIRECT_ACCESS,
+               'value': 'x' * ZERO_COPY_THRESHOLD, 'time': time.time()}
+        evts = [sample_event(), big, 'event', sample_event(), big]
+        for name in [None] + CODECS.keys():
+            frames = encode_batch(name, evts)
+            if name in (None, 'pickle'):
+                self.assertEqual(len(frames), 1)
+            else:
+                self.assertEqual(len(frames), 3)
+            self.assertEqual(decode_events(frames), evts)
+
+        self.assertEqual(decode_events(encode_event('json', big)), [big])
+        self.assertEqual(decode_events(encode_event(None, 'event')), ['event'])
+
+    def test_negotiation(self):
+        """
+        The driver process picks the first codec it knows
+        """
+        self.assertEqual(choose_codec(['nonsense', 'json', 'pickle']), 'json')
+        self.assertRaises(InstrumentParameterException, choose_codec, ['nonsense'])
+
+        process = DriverProcess('module', 'class', None)
+        reply = process.cmd_driver({'cmd': 'set_event_codec',
+                                    'args': (['binary', 'json'],), 'kwargs': {}})
+        self.assertEqual(reply, 'binary')
+        self.assertEqual(process.event_codec, 'binary')
+
+        reply = process.cmd_driver({'cmd': 'set_event_codec',
+                                    'args': (['nonsense'],), 'kwargs': {}})
+        self.assertIsInstance(reply, InstrumentParameterException)
+        self.assertEqual(process.event_codec, 'binary')
+
+@attr('BENCHMARK', group='mi')
+class BenchmarkEventCodec(MiUnitTest):
+    """
+    Sample events per second from the driver process event socket to a
+    client for each codec, encode and decode included.
+    """
+    EVENT_COUNT = 20000
+
+    def _rate(self, name):
+        context = zmq.Context()
+        pub = context.socket(zmq.PUB)
+        pub.setsockopt(zmq.SNDHWM, 0)
+        port = pub.bind_to_random_port('tcp://127.0.0.1')
+        sub = context.socket(zmq.SUB)
+        sub.setsockopt(zmq.RCVHWM, 0)
+        sub.connect('tcp://127.0.0.1:%i' % port)
+        sub.setsockopt(zmq.SUBSCRIBE, '')
+
+        # wait out the subscription handshake
+        while True:
+            ZmqDriverProcess.send_frames(pub, ['sync'])
+            if sub.poll(100):
+                sub.recv_multipart()
+                break
+
+        received = []
+        def receive():
+            while len(received) < self.EVENT_COUNT:
+                frames = sub.recv_multipart()
+                if frames != ['sync']:
+                    received.append(decode_event(frames))
+        receiver = threading.Thread(target=receive)
+        receiver.start()
+
+        events = [sample_event() for i in range(self.EVENT_COUNT)]
+        start_time = time.time()
+        for evt in events:
+            ZmqDriverProcess.send_frames(pub, encode_event(name, evt))
+        receiver.join()
+        elapsed = time.time() - start_time
+
+        pub.close()
+        sub.close()
+        context.term()
+        self.assertEqual(received[-1], events[-1])
+        return self.EVENT_COUNT / elapsed
+
+    def test_codec_rate(self):
+        rates = [('legacy', self._rate(None))]
+        for name in sorted(CODECS.keys()):
+            rates.append((name, self._rate(name)))
+        for (name, rate) in rates:
+            log.info("Event codec %s: %d events/s", name, rate)
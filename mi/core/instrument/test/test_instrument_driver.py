@@ -187,6 +187,21 @@ class TestUnitInstrumentDriver(MiUnitTestCase):
         self.assertTrue(self.driver._protocol._param_dict.get("baz"), 2000)
         self.assertTrue(self.driver._protocol._param_dict.get("bat"), 40)
 
+    def test_shutdown_protocol(self):
+        """
+        The protocol is shut down when the driver disconnects or loses the
+        connection, so it can stop threads that would outlive it.
+        """
+        for handler in (self.driver._handler_connected_disconnect,
+                        self.driver._handler_connected_connection_lost):
+            protocol = Mock(name='protocol')
+            self.driver._protocol = protocol
+            self.driver._connection = Mock(name='connection')
+            handler()
+            protocol.shutdown.assert_called_once_with()
+            self.driver._connection.stop_comms.assert_called_once_with()
+            self.assertIsNone(self.driver._protocol)
+
     ##### Integration tests for startup config in the SBE37 integration suite
 
 
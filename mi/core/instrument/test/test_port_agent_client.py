@@ -19,7 +19,15 @@ import datetime
 import array
 from nose.plugins.attrib import attr
 from mock import Mock
+import socket
+import struct
+import threading
 from mi.core.instrument.port_agent_client import PortAgentClient, PortAgentPacket
+from mi.core.instrument.port_agent_client import Listener, HEADER_SIZE, packet_checksum
+from mi.core.instrument.port_agent_client import Writer
+from mi.core.instrument.port_agent_client import ReconnectKey, ConnectionStatus, ConnectionMetric
+from mi.core.exceptions import InstrumentConnectionException
+from mi.core.exceptions import InstrumentParameterException
 
 # MI logger
 from mi.core.log import get_logger ; log = get_logger()
@@ -118,3 +126,553 @@ class TestPortAgentPacket(MiUnitTest):
         result = self.pap.get_timestamp()
         self.assertEqual(self.ntp_time, result)
         pass
+
+
+def build_packet(data):
+    """
+    Build a port agent packet the way the port agent would send it
+    @param data The payload
+    @retval The packet as a string
+    """
+    pap = PortAgentPacket()
+    pap.attach_data(data)
+    pap.pack_header()
+    return pap.get_header().tostring() + data
+
+@attr('UNIT', group='mi')
+class TestListener(MiUnitTest):
+    """
+    Run the listener over a socketpair standing in for the port agent
+    """
+    def setUp(self):
+        (self.sock, self.port_agent) = socket.socketpair()
+        self.sock.setblocking(0)
+        self.packets = []
+        self.listener = None
+
+    def tearDown(self):
+        if self.listener:
+            self.listener.done()
+            self.listener.join()
+        self.sock.close()
+        self.port_agent.close()
+
+    def got_packet(self, paPacket):
+        paPacket.verify_checksum()
+        self.packets.append(paPacket)
+
+    def start_listener(self, **kwargs):
+        self.listener = Listener(self.sock, None, self.got_packet, **kwargs)
+        self.listener.start()
+
+    def assert_packets(self, expected, timeout=5):
+        end_time = time.time() + timeout
+        while len(self.packets) < len(expected) and time.time() < end_time:
+            time.sleep(.01)
+        self.assertEqual([p.get_data() for p in self.packets], expected)
+        for paPacket in self.packets:
+            self.assertTrue(paPacket.is_valid())
+
+    def test_fragments(self):
+        """
+        Packets split at any byte and packets arriving together all come out
+        """
+        samples = ["sample %d\r\n" % i for i in range(50)]
+        stream = "".join([build_packet(sample) for sample in samples])
+        self.start_listener()
+
+        for index in range(0, len(stream), 7):
+            self.port_agent.sendall(stream[index:index+7])
+        self.assert_packets(samples)
+
+    def test_resync(self):
+        """
+        Garbage between packets is skipped
+        """
+        self.start_listener()
+        self.port_agent.sendall(build_packet("one") + "garbage\xa3" + build_packet("two"))
+        self.assert_packets(["one", "two"])
+
+    def test_large_packet(self):
+        """
+        The receive buffer grows to hold a packet bigger than it is
+        """
+        sample = "x" * 1000
+        self.start_listener(buffer_size=64)
+        self.port_agent.sendall(build_packet("small") + build_packet(sample))
+        self.assert_packets(["small", sample])
+
+    def test_checksum(self):
+        """
+        A corrupted payload fails its checksum
+        """
+        packet = build_packet("sample")
+        self.start_listener()
+        self.port_agent.sendall(packet[:-1] + "X")
+        end_time = time.time() + 5
+        while not self.packets and time.time() < end_time:
+            time.sleep(.01)
+        self.assertFalse(self.packets[0].is_valid())
+
+
+class FakePortAgent(object):
+    """
+    Listening data and command ports on localhost
+    """
+    def __init__(self):
+        self.data_server = self._listen(0)
+        self.port = self.data_server.getsockname()[1]
+        self.cmd_server = self._listen(0)
+        self.cmd_port = self.cmd_server.getsockname()[1]
+
+    def _listen(self, port):
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind(('localhost', port))
+        server.listen(5)
+        server.settimeout(5)
+        return server
+
+    def accept(self):
+        (sock, addr) = self.data_server.accept()
+        sock.settimeout(5)
+        return sock
+
+    def accept_command(self):
+        (sock, addr) = self.cmd_server.accept()
+        sock.settimeout(5)
+        return sock
+
+    def stop_listening(self):
+        self.data_server.close()
+        self.data_server = None
+
+    def start_listening(self):
+        self.data_server = self._listen(self.port)
+
+    def close(self):
+        for server in (self.data_server, self.cmd_server):
+            if server:
+                server.close()
+
+def recv_exactly(sock, size):
+    data = ''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+@attr('UNIT', group='mi')
+class TestReconnect(MiUnitTest):
+    """
+    The client against a port agent that goes away and comes back
+    """
+    RECONNECT = {ReconnectKey.INITIAL_DELAY: .01, ReconnectKey.MAX_DELAY: .05,
+                 ReconnectKey.MAX_BUFFERED: 100}
+
+    def setUp(self):
+        self.port_agent = FakePortAgent()
+        self.addCleanup(self.port_agent.close)
+        self.packets = []
+        self.events = []
+        self.client = None
+
+    def tearDown(self):
+        if self.client and self.client.listener_thread:
+            self.client.stop_comms()
+
+    def start_client(self, **reconnect):
+        config = dict(self.RECONNECT)
+        config.update(reconnect)
+        self.client = PortAgentClient('localhost', self.port_agent.port,
+                                      self.port_agent.cmd_port,
+                                      reconnect=config,
+                                      status_callback=self.events.append)
+        self.client.init_comms(self.packets.append)
+        conn = self.port_agent.accept()
+        self.addCleanup(conn.close)
+        return conn
+
+    def wait_for(self, condition, timeout=5):
+        end_time = time.time() + timeout
+        while not condition() and time.time() < end_time:
+            time.sleep(.01)
+        self.assertTrue(condition())
+
+    def statuses(self):
+        return [event[ConnectionMetric.STATUS] for event in self.events]
+
+    def test_reconnect(self):
+        """
+        The data connection comes back after the port agent closes it, data
+        sent meanwhile is delivered first, and the outage is reported
+        """
+        conn = self.start_client()
+        conn.sendall(build_packet("before"))
+        self.wait_for(lambda: len(self.packets) == 1)
+
+        self.port_agent.stop_listening()
+        conn.close()
+        self.wait_for(lambda: self.statuses() == [ConnectionStatus.LOST])
+        self.client.send("held 1 ")
+        self.client.send("held 2")
+        self.assertEqual(self.client.get_connection_metrics()[ConnectionMetric.QUEUED_BYTES], 13)
+        self.assertFalse(self.client.get_connection_metrics()[ConnectionMetric.CONNECTED])
+        self.wait_for(lambda: self.client.get_connection_metrics()[ConnectionMetric.FAILED_ATTEMPTS] >= 2)
+
+        self.port_agent.start_listening()
+        conn = self.port_agent.accept()
+        self.addCleanup(conn.close)
+        self.assertEqual(recv_exactly(conn, 13), "held 1 held 2")
+        self.wait_for(lambda: len(self.events) == 2)
+        self.client.send("after")
+        self.assertEqual(recv_exactly(conn, 5), "after")
+        conn.sendall(build_packet("after"))
+        self.wait_for(lambda: len(self.packets) == 2)
+        self.assertEqual([p.get_data() for p in self.packets], ["before", "after"])
+
+        restored = self.events[1]
+        self.assertEqual(restored[ConnectionMetric.STATUS], ConnectionStatus.RESTORED)
+        self.assertEqual(restored[ConnectionMetric.RECONNECTS], 1)
+        self.assertTrue(restored[ConnectionMetric.FAILED_ATTEMPTS] >= 2)
+        self.assertTrue(restored[ConnectionMetric.OUTAGE] > 0)
+        self.assertEqual(restored[ConnectionMetric.DOWNTIME], restored[ConnectionMetric.OUTAGE])
+        metrics = self.client.get_connection_metrics()
+        self.assertTrue(metrics[ConnectionMetric.CONNECTED])
+        self.assertEqual(metrics[ConnectionMetric.QUEUED_BYTES], 0)
+
+    def test_buffer_full(self):
+        """
+        Sends beyond MAX_BUFFERED fail while reconnecting
+        """
+        conn = self.start_client()
+        self.port_agent.stop_listening()
+        conn.close()
+        self.wait_for(lambda: self.statuses() == [ConnectionStatus.LOST])
+        self.client.send("x" * 100)
+        self.assertRaises(InstrumentConnectionException, self.client.send, "x")
+
+    def test_give_up(self):
+        """
+        The listener stops after MAX_ATTEMPTS failed attempts
+        """
+        conn = self.start_client(**{ReconnectKey.MAX_ATTEMPTS: 3})
+        self.port_agent.stop_listening()
+        conn.close()
+        self.client.listener_thread.join(5)
+        self.assertFalse(self.client.listener_thread.is_alive())
+        self.assertEqual(self.statuses(), [ConnectionStatus.LOST, ConnectionStatus.FAILED])
+        self.assertEqual(self.events[1][ConnectionMetric.FAILED_ATTEMPTS], 3)
+        self.assertEqual(self.events[1][ConnectionMetric.RECONNECTS], 0)
+
+    def test_disabled(self):
+        """
+        Without reconnecting the listener stops when the connection is lost
+        """
+        conn = self.start_client(**{ReconnectKey.ENABLED: False})
+        conn.close()
+        self.client.listener_thread.join(5)
+        self.assertFalse(self.client.listener_thread.is_alive())
+        self.assertEqual(self.events, [])
+
+    def test_stop_while_reconnecting(self):
+        """
+        stop_comms ends the reconnect wait
+        """
+        conn = self.start_client(**{ReconnectKey.INITIAL_DELAY: 60})
+        conn.close()
+        self.wait_for(lambda: self.statuses() == [ConnectionStatus.LOST])
+        start_time = time.time()
+        self.client.stop_comms()
+        self.assertTrue(time.time() - start_time < 5)
+        self.assertFalse(self.client.listener_thread.is_alive())
+
+    def test_command_channel(self):
+        """
+        Commands share one connection, which is reopened after the port
+        agent closes it
+        """
+        self.start_client()
+        self.client.send_break()
+        self.client.send_break()
+        cmd_conn = self.port_agent.accept_command()
+        self.assertEqual(recv_exactly(cmd_conn, 10), "breakbreak")
+        self.assertEqual(self.client.get_connection_metrics()[ConnectionMetric.COMMAND_CONNECTS], 1)
+
+        cmd_conn.close()
+        self.client.send_break()
+        cmd_conn = self.port_agent.accept_command()
+        self.addCleanup(cmd_conn.close)
+        self.assertEqual(recv_exactly(cmd_conn, 5), "break")
+        self.assertEqual(self.client.get_connection_metrics()[ConnectionMetric.COMMAND_CONNECTS], 2)
+
+    def test_config(self):
+        """
+        Bad reconnect configs are refused
+        """
+        for config in ('fast', {ReconnectKey.BACKOFF: .5},
+                       {ReconnectKey.MAX_ATTEMPTS: 'never'}):
+            self.assertRaises(InstrumentParameterException, PortAgentClient,
+                              'localhost', 1, 2, reconnect=config)
+
+
+@attr('UNIT', group='mi')
+class TestWriter(MiUnitTest):
+    """
+    Run the writer over a socketpair standing in for the port agent
+    """
+    def setUp(self):
+        (self.sock, self.port_agent) = socket.socketpair()
+        self.sock.setblocking(0)
+        self.port_agent.settimeout(5)
+        self.writer = Writer(self.sock, 100)
+        self.writer.start()
+
+    def tearDown(self):
+        self.writer.done()
+        self.writer.join()
+        self.sock.close()
+        self.port_agent.close()
+
+    def fill_socket(self):
+        """
+        Fill the socket buffers so sends queue
+        @retval The number of bytes written
+        """
+        filled = 0
+        try:
+            while True:
+                filled += self.sock.send('f' * 65536)
+        except socket.error:
+            pass
+        return filled
+
+    def wait_for_flush(self, timeout=5):
+        end_time = time.time() + timeout
+        while self.writer.get_metrics()[ConnectionMetric.QUEUED_BYTES] and time.time() < end_time:
+            time.sleep(.01)
+        self.assertEqual(self.writer.get_metrics()[ConnectionMetric.QUEUED_BYTES], 0)
+
+    def test_send(self):
+        """
+        With nothing queued a send is written straight away
+        """
+        self.writer.send("sample\r\n")
+        self.assertEqual(self.port_agent.recv(100), "sample\r\n")
+        metrics = self.writer.get_metrics()
+        self.assertEqual(metrics[ConnectionMetric.SENDS], 1)
+        self.assertEqual(metrics[ConnectionMetric.QUEUED_SENDS], 0)
+        self.assertEqual(metrics[ConnectionMetric.WRITES], 1)
+
+    def test_coalesce(self):
+        """
+        Sends to a full socket return at once, and are joined into fewer
+        writes once the port agent reads again
+        """
+        filled = self.fill_socket()
+        commands = ["command %d\r\n" % i for i in range(100)]
+        start_time = time.time()
+        for command in commands:
+            self.writer.send(command)
+        self.assertTrue(time.time() - start_time < .1)
+        self.assertEqual(self.writer.get_metrics()[ConnectionMetric.QUEUED_BYTES],
+                         len("".join(commands)))
+
+        self.assertEqual(recv_exactly(self.port_agent, filled), 'f' * filled)
+        expected = "".join(commands)
+        self.assertEqual(recv_exactly(self.port_agent, len(expected)), expected)
+        self.wait_for_flush()
+        metrics = self.writer.get_metrics()
+        self.assertEqual(metrics[ConnectionMetric.SENDS], 100)
+        self.assertEqual(metrics[ConnectionMetric.QUEUED_SENDS], 100)
+        self.assertTrue(metrics[ConnectionMetric.WRITES] < 100)
+        self.assertTrue(metrics[ConnectionMetric.MAX_FLUSH_LATENCY] > 0)
+
+    def test_char_delay(self):
+        """
+        Characters sent with a delay go out on schedule, ahead of later sends
+        """
+        start_time = time.time()
+        self.writer.send("abc", char_delay=.05)
+        self.writer.send("de")
+        self.assertTrue(time.time() - start_time < .05)
+
+        self.assertEqual(recv_exactly(self.port_agent, 5), "abcde")
+        self.assertTrue(time.time() - start_time >= .15)
+        self.wait_for_flush()
+        self.assertEqual(self.writer.get_metrics()[ConnectionMetric.WRITES], 4)
+
+    def test_hold(self):
+        """
+        Without a socket data is held up to the limit, then written to the
+        next socket
+        """
+        self.writer.set_socket(None)
+        self.writer.send("x" * 60)
+        self.writer.send("y" * 40)
+        self.assertRaises(InstrumentConnectionException, self.writer.send, "z")
+        self.writer.set_socket(self.sock)
+        self.assertEqual(recv_exactly(self.port_agent, 100), "x" * 60 + "y" * 40)
+
+        self.writer.close()
+        self.assertRaises(InstrumentConnectionException, self.writer.send, "z")
+
+
+class LegacyListener(Listener):
+    """
+    The listener as it was before it read into a buffer, one recv for each
+    header and each body, kept to benchmark against.
+    """
+    def run(self):
+        while not self._done:
+            try:
+                received_header = False
+                bytes_left = HEADER_SIZE
+                while not received_header and not self._done:
+                    header = self.sock.recv(bytes_left)
+                    bytes_left -= len(header)
+                    if bytes_left == 0:
+                        received_header = True
+                        paPacket = PortAgentPacket()
+                        paPacket.unpack_header(header)
+                        bytes_left = paPacket.get_data_size()
+                    elif len(header) == 0:
+                        self._done = True
+
+                received_data = False
+                while not received_data and not self._done:
+                    data = self.sock.recv(bytes_left)
+                    bytes_left -= len(data)
+                    if bytes_left == 0:
+                        received_data = True
+                        paPacket.attach_data(data)
+                    elif len(data) == 0:
+                        self._done = True
+
+                if not self._done:
+                    self.callback(paPacket)
+            except socket.error:
+                time.sleep(.1)
+
+def legacy_checksum(header, data):
+    """ Byte at a time checksum the packet class used to compute """
+    checksum = 0
+    for i in range(HEADER_SIZE):
+        if i < 6 or i > 7:
+            checksum += struct.unpack_from('B', header[i])[0]
+    for i in range(len(data)):
+        checksum += struct.unpack_from('B', data[i])[0]
+    return checksum
+
+@attr('BENCHMARK', group='mi')
+class BenchmarkListener(MiUnitTest):
+    """
+    Packets per second through the listener from a socketpair, including
+    the checksum the client runs on every packet.
+    """
+    PACKET_COUNT = 20000
+
+    def _rate(self, listener_class, checksum):
+        (sock, port_agent) = socket.socketpair()
+        sock.setblocking(0)
+        stream = build_packet("SATPAR0229,10.01,2206748111,111\r\n") * self.PACKET_COUNT
+        received = []
+
+        def got_packet(paPacket):
+            checksum(paPacket.get_header(), paPacket.get_data())
+            received.append(paPacket)
+
+        listener = listener_class(sock, None, got_packet)
+        listener.start()
+
+        start_time = time.time()
+        port_agent.sendall(stream)
+        while len(received) < self.PACKET_COUNT and time.time() - start_time < 120:
+            time.sleep(.001)
+        elapsed = time.time() - start_time
+
+        listener.done()
+        listener.join()
+        sock.close()
+        port_agent.close()
+
+        self.assertEqual(len(received), self.PACKET_COUNT)
+        return self.PACKET_COUNT / elapsed
+
+    def test_listener_rate(self):
+        legacy = self._rate(LegacyListener, legacy_checksum)
+        current = self._rate(Listener, packet_checksum)
+        log.info("Listener: legacy %d packets/s, recv_into %d packets/s (%.1fx)",
+                 legacy, current, current / legacy)
+
+@attr('BENCHMARK', group='mi')
+class BenchmarkWriter(MiUnitTest):
+    """
+    Time the sending thread spends in send while the port agent reads
+    slowly, with the old send that slept while the socket was full and with
+    the writer.
+    """
+    SEND_COUNT = 2000
+    SEND_SIZE = 1000
+
+    def legacy_send(self, sock, data):
+        while len(data) > 0:
+            try:
+                sent = sock.send(data)
+                data = data[sent:]
+            except socket.error:
+                time.sleep(.1)
+
+    def _run(self, send):
+        (sock, port_agent) = socket.socketpair()
+        sock.setblocking(0)
+        total = self.SEND_COUNT * self.SEND_SIZE
+        received = []
+        def read_slowly():
+            size = 0
+            while size < total:
+                data = port_agent.recv(8192)
+                size += len(data)
+                time.sleep(.001)
+            received.append(size)
+        reader = threading.Thread(target=read_slowly)
+        reader.start()
+
+        data = 'x' * self.SEND_SIZE
+        blocked = 0
+        longest = 0
+        for i in range(self.SEND_COUNT):
+            start_time = time.time()
+            send(sock, data)
+            elapsed = time.time() - start_time
+            blocked += elapsed
+            longest = max(longest, elapsed)
+        reader.join()
+        sock.close()
+        port_agent.close()
+        self.assertEqual(received, [total])
+        return (blocked, longest)
+
+    def test_send_blocking(self):
+        (legacy_blocked, legacy_longest) = self._run(self.legacy_send)
+
+        writers = []
+        def writer_send(sock, data):
+            if not writers:
+                writers.append(Writer(sock, 0))
+                writers[0].start()
+            writers[0].send(data)
+        (blocked, longest) = self._run(writer_send)
+        metrics = writers[0].get_metrics()
+        writers[0].done()
+        writers[0].join()
+
+        log.info("Sleeping send: %.3f s blocked, longest send %.1f ms",
+                 legacy_blocked, 1000 * legacy_longest)
+        log.info("Writer: %.3f s blocked, longest send %.1f ms",
+                 blocked, 1000 * longest)
+        log.info("Writer: %d sends in %d writes, max flush latency %.1f ms",
+                 metrics[ConnectionMetric.SENDS], metrics[ConnectionMetric.WRITES],
+                 1000 * metrics[ConnectionMetric.MAX_FLUSH_LATENCY])
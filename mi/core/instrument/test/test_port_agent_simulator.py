@@ -0,0 +1,334 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.instrument.test.test_port_agent_simulator
+@file mi/core/instrument/test/test_port_agent_simulator.py
+@brief Test cases for the simulated port agents
+"""
+
+__license__ = 'Apache 2.0'
+
+import time
+import errno
+import select
+import socket
+import itertools
+
+from nose.plugins.attrib import attr
+
+from mi.core.log import get_logger ; log = get_logger()
+from mi.core.unit_test import MiUnitTest
+from mi.core.instrument.port_agent_client import PortAgentClient
+from mi.core.instrument.port_agent_client import PortAgentPacket
+from mi.core.instrument.port_agent_client import HEADER_SIZE
+from mi.core.instrument.port_agent_client import DATA_FROM_INSTRUMENT
+from mi.core.instrument.port_agent_client import NTP_DELTA
+from mi.core.instrument.port_agent_simulator import AS_FAST_AS_POSSIBLE
+from mi.core.instrument.port_agent_simulator import SimulatorMetric
+from mi.core.instrument.port_agent_simulator import SimulatorFarm
+from mi.core.instrument.port_agent_simulator import InstrumentSimulator
+from mi.core.instrument.port_agent_simulator import Exchange
+from mi.core.instrument.port_agent_simulator import pack_packet
+from mi.core.instrument.port_agent_simulator import recorded_records
+
+SAMPLE = '#55.9044,41.40609, 572.170, 34.2583, 1505.948, 05 Feb 2013, 19:16:59\r\n'
+STATUS = 'SBE37-SMP V 2.6  SERIAL NO. 2165\r\nvbatt = 9.3\r\nS>'
+
+def sbe37(**kwargs):
+    return InstrumentSimulator(itertools.repeat(SAMPLE), prompt='S>',
+                               unknown='?cmd S>',
+                               exchanges=[Exchange('ds', STATUS),
+                                          Exchange('stop', 'S>', stop_streaming=True),
+                                          Exchange('startnow', 'S>', start_streaming=True)],
+                               **kwargs)
+
+@attr('UNIT', group='mi')
+class TestInstrumentSimulator(MiUnitTest):
+    """
+    Packets, records and command answers without sockets
+    """
+    def test_pack_packet(self):
+        """
+        Packets unpack and pass their checksum
+        """
+        packet = pack_packet(SAMPLE, timestamp=1000)
+        paPacket = PortAgentPacket()
+        paPacket.unpack_header(packet[:HEADER_SIZE])
+        paPacket.attach_data(packet[HEADER_SIZE:])
+        paPacket.verify_checksum()
+        self.assertTrue(paPacket.is_valid())
+        self.assertEqual(paPacket.get_header_type(), DATA_FROM_INSTRUMENT)
+        self.assertEqual(paPacket.get_data(), SAMPLE)
+        self.assertEqual(paPacket.get_timestamp(), 1000 + NTP_DELTA)
+
+    def test_recorded_records(self):
+        self.assertEqual(recorded_records('a\r\nbb\r\nc', '\r\n'), ['a\r\n', 'bb\r\n', 'c'])
+        self.assertEqual(recorded_records('a\r\nbb\r\n', '\r\n'), ['a\r\n', 'bb\r\n'])
+        self.assertEqual(recorded_records('abcdefg', size=3), ['abc', 'def', 'g'])
+
+    def test_exchanges(self):
+        """
+        Commands split anywhere are answered once whole, a wakeup gets the
+        prompt, and \\r\\n is one line ending
+        """
+        simulator = sbe37()
+        self.assertEqual(simulator.received('\r\n'), ['S>'])
+        self.assertEqual(simulator.received('d'), [])
+        self.assertEqual(simulator.received('s\r'), [STATUS])
+        self.assertEqual(simulator.received('\nbogus\r\n'), ['?cmd S>'])
+        self.assertEqual(simulator.received('\r'), ['S>'])
+
+        self.assertTrue(simulator.streaming)
+        self.assertEqual(simulator.received('stop\r\n'), ['S>'])
+        self.assertFalse(simulator.streaming)
+        self.assertEqual(simulator.received('startnow\r\n'), ['S>'])
+        self.assertTrue(simulator.streaming)
+        self.assertEqual(simulator.get_metrics()[SimulatorMetric.COMMANDS], 6)
+
+    def test_binary_commands(self):
+        simulator = InstrumentSimulator([], terminators=None, echo=True,
+                                        exchanges=[Exchange('MC', '\x06\x06')])
+        self.assertEqual(simulator.received('MC'), ['MC', '\x06\x06'])
+        self.assertEqual(simulator.received('M'), ['M'])
+
+    def test_records(self):
+        """
+        Streaming stops when the records run out
+        """
+        simulator = InstrumentSimulator(['one', 'two'])
+        self.assertEqual(simulator.next_record(), 'one')
+        self.assertEqual(simulator.next_record(), 'two')
+        self.assertEqual(simulator.next_record(), None)
+        self.assertFalse(simulator.streaming)
+        self.assertEqual(simulator.get_metrics()[SimulatorMetric.RECORDS], 2)
+        self.assertEqual(simulator.get_metrics()[SimulatorMetric.BYTES], 6)
+
+class FakeConnection(object):
+    """
+    A driver connection that reads canned data, an exception in the data
+    is raised instead, and fails every send
+    """
+    def __init__(self, received):
+        (self._sock, self._peer) = socket.socketpair()
+        self._received = list(received)
+        self.closed = False
+
+    def fileno(self):
+        return self._sock.fileno()
+
+    def recv(self, size):
+        data = self._received.pop(0)
+        if isinstance(data, Exception):
+            raise data
+        return data
+
+    def send(self, data):
+        raise socket.error(errno.ECONNRESET, 'Connection reset by peer')
+
+    def close(self):
+        self.closed = True
+        self._sock.close()
+        self._peer.close()
+
+@attr('UNIT', group='mi')
+class TestFarmEvents(MiUnitTest):
+    """
+    Socket events handled by the farm loop, without the loop
+    """
+    def setUp(self):
+        self.farm = SimulatorFarm()
+        self.addCleanup(self.farm.stop)
+
+    def connect(self, simulator, received):
+        self.farm.add(simulator)
+        endpoint = self.farm._endpoints[-1]
+        conn = FakeConnection(received)
+        endpoint.conn = conn
+        self.farm._register(conn, self.farm._data_event, endpoint)
+        return (endpoint, conn)
+
+    def test_send_fails(self):
+        """
+        A driver that sends and drops is disconnected once, also when the
+        socket was writable too
+        """
+        for speed in (1, AS_FAST_AS_POSSIBLE):
+            (endpoint, conn) = self.connect(sbe37(speed=speed), ['ds\r\n'])
+            self.farm._data_event(endpoint, conn, select.POLLIN | select.POLLOUT)
+            self.assertIsNone(endpoint.conn)
+            self.assertEqual(endpoint.queue, [])
+            self.assertEqual(endpoint.queued_bytes, 0)
+            self.assertTrue(conn.closed)
+
+    def test_nothing_to_read(self):
+        """
+        A wakeup with nothing to read keeps the driver, end of file drops it
+        """
+        (endpoint, conn) = self.connect(sbe37(streaming=False),
+                                        [socket.error(errno.EAGAIN, 'again'),
+                                         socket.error(errno.EINTR, 'interrupted'), ''])
+        self.farm._data_event(endpoint, conn, select.POLLIN)
+        self.farm._data_event(endpoint, conn, select.POLLIN)
+        self.assertIs(endpoint.conn, conn)
+        self.farm._data_event(endpoint, conn, select.POLLIN)
+        self.assertIsNone(endpoint.conn)
+
+    def test_command_nothing_to_read(self):
+        (endpoint, conn) = self.connect(sbe37(streaming=False), [])
+        command = FakeConnection([socket.error(errno.EAGAIN, 'again'), ''])
+        endpoint.cmd_conns.append(command)
+        self.farm._register(command, self.farm._command_event, endpoint)
+        self.farm._command_event(endpoint, command, select.POLLIN)
+        self.assertEqual(endpoint.cmd_conns, [command])
+        self.farm._command_event(endpoint, command, select.POLLIN)
+        self.assertEqual(endpoint.cmd_conns, [])
+
+class FarmFixture(MiUnitTest):
+    """
+    A farm and the port agent clients connected to its simulators
+    """
+    def setUp(self):
+        self.farm = SimulatorFarm()
+        self.clients = []
+        self.addCleanup(self._stop)
+
+    def _stop(self):
+        for client in self.clients:
+            client.stop_comms()
+        self.farm.stop()
+
+    def connect(self, simulator=None, ports=None):
+        """
+        @param simulator Simulator to add to the farm and connect to
+        @param ports (port, cmd_port) of a simulator already in the farm
+        @retval (client, packets) the connected PortAgentClient and the list
+        it appends packets to
+        """
+        (port, cmd_port) = ports or self.farm.add(simulator)
+        packets = []
+        client = PortAgentClient('localhost', port, cmd_port)
+        client.init_comms(packets.append)
+        self.clients.append(client)
+        return (client, packets)
+
+    def wait_for(self, condition, timeout=5):
+        end_time = time.time() + timeout
+        while not condition() and time.time() < end_time:
+            time.sleep(.01)
+        self.assertTrue(condition())
+
+@attr('UNIT', group='mi')
+class TestSimulatorFarm(FarmFixture):
+    """
+    Simulators serving port agent clients
+    """
+    def test_rate(self):
+        """
+        Records come at the simulator rate times its speed
+        """
+        self.farm.start()
+        (client, slow) = self.connect(sbe37(rate=10))
+        (client, fast) = self.connect(sbe37(rate=10, speed=4))
+        time.sleep(1)
+        self.assertTrue(8 <= len(slow) <= 12, len(slow))
+        self.assertTrue(36 <= len(fast) <= 44, len(fast))
+        for paPacket in slow + fast:
+            self.assertTrue(paPacket.is_valid())
+            self.assertEqual(paPacket.get_data(), SAMPLE)
+
+    def test_as_fast_as_possible(self):
+        simulator = sbe37(speed=AS_FAST_AS_POSSIBLE)
+        self.farm.start()
+        (client, packets) = self.connect(simulator)
+        self.wait_for(lambda: len(packets) >= 10000)
+
+    def test_commands(self):
+        """
+        Commands on the data port and breaks on the command port are
+        answered in the stream
+        """
+        simulator = sbe37(streaming=False,
+                          break_exchange=Exchange('', 'break\r\nS>'))
+        self.farm.start()
+        (client, packets) = self.connect(simulator)
+        client.send('\r\n')
+        self.wait_for(lambda: len(packets) == 1)
+        client.send('ds\r\n')
+        self.wait_for(lambda: len(packets) == 2)
+        client.send_break()
+        self.wait_for(lambda: len(packets) == 3)
+        self.assertEqual([p.get_data() for p in packets], ['S>', STATUS, 'break\r\nS>'])
+
+        client.send('startnow\r\n')
+        self.wait_for(lambda: len(packets) > 5)
+        self.assertEqual(packets[4].get_data(), SAMPLE)
+        metrics = simulator.get_metrics()
+        self.assertEqual(metrics[SimulatorMetric.BREAKS], 1)
+        self.assertEqual(metrics[SimulatorMetric.COMMANDS], 3)
+        self.assertEqual(metrics[SimulatorMetric.CONNECTIONS], 1)
+
+    def test_reconnect(self):
+        """
+        A simulator serves the next driver after one disconnects
+        """
+        simulator = sbe37(rate=20)
+        self.farm.start()
+        (client, packets) = self.connect(simulator)
+        self.wait_for(lambda: len(packets) > 0)
+        client.stop_comms()
+        self.clients.remove(client)
+        (client, packets) = self.connect(simulator)
+        self.wait_for(lambda: len(packets) > 0)
+        self.assertEqual(simulator.get_metrics()[SimulatorMetric.CONNECTIONS], 2)
+
+    def test_many(self):
+        """
+        One farm serves a hundred simulators
+        """
+        ports = [self.farm.add(sbe37(rate=10)) for i in range(100)]
+        self.farm.start()
+        received = [self.connect(ports=ports[i])[1] for i in range(0, 100, 10)]
+        self.wait_for(lambda: min([len(packets) for packets in received]) >= 5)
+        self.assertEqual(self.farm.get_metrics()[SimulatorMetric.CONNECTIONS], 10)
+
+@attr('BENCHMARK', group='mi')
+class BenchmarkSimulatorFarm(FarmFixture):
+    """
+    Packets per second and packet latency from a farm to port agent clients
+    in the same process, with records paced and sent as fast as possible.
+    """
+    DURATION = 3
+
+    def _run(self, count, speed):
+        received = []
+        latencies = []
+        def got_packet(paPacket):
+            received.append(len(received))
+            if len(received) % 10 == 0:
+                latencies.append(time.time() + NTP_DELTA - paPacket.get_timestamp())
+
+        for i in range(count):
+            (port, cmd_port) = self.farm.add(sbe37(speed=speed))
+            client = PortAgentClient('localhost', port, cmd_port)
+            self.clients.append(client)
+        self.farm.start()
+        for client in self.clients:
+            client.init_comms(got_packet)
+        start_time = time.time()
+        time.sleep(self.DURATION)
+        elapsed = time.time() - start_time
+        count = len(received)
+
+        latencies.sort()
+        self.assertTrue(latencies)
+        return (count / elapsed, latencies[len(latencies) / 2], latencies[-1])
+
+    def test_paced(self):
+        (rate, median, worst) = self._run(200, 40)
+        log.info("200 simulators at 40 Hz: %d packets/s, latency median %.1f ms, max %.1f ms",
+                 rate, 1000 * median, 1000 * worst)
+
+    def test_as_fast_as_possible(self):
+        (rate, median, worst) = self._run(20, AS_FAST_AS_POSSIBLE)
+        log.info("20 simulators as fast as possible: %d packets/s, latency median %.1f ms, max %.1f ms",
+                 rate, 1000 * median, 1000 * worst)
@@ -15,6 +15,18 @@ from nose.plugins.attrib import attr
 from mi.core.unit_test import MiUnitTestCase
 from mi.core.instrument.protocol_param_dict import ProtocolParameterDict
 from mi.core.instrument.protocol_param_dict import ParameterDictVisibility
+from mi.core.instrument.protocol_param_dict import required_literal
+
+STATUS_LINES = [
+    "SBE 16plus V 2.2  SERIAL NO. 6841    28 Feb 2013 16:10:30",
+    "vbatt = 13.0, vlith =  8.5, ioper =  61.2 ma, ipump =  0.0 ma,",
+    "status = not logging",
+    "samples = 0, free = 4386542",
+    "sample interval = 10 seconds, number of measurements per sample = 4",
+    "output salinity = no, output sound velocity = no",
+    "",
+    "S>"
+]
 
 @attr('UNIT', group='mi')
 class TestUnitProtocolParameterDict(MiUnitTestCase):
@@ -119,4 +131,81 @@ bar=200, baz=300
         lst = self.param_dict.get_visibility_list(ParameterDictVisibility.DIRECT_ACCESS)
         self.assertEquals(lst, ["baz"])
         lst = self.param_dict.get_visibility_list(ParameterDictVisibility.READ_ONLY)
-        self.assertEquals(lst, ["bat", "qux"])
\ No newline at end of file
+        self.assertEquals(lst, ["bat", "qux"])
+
+    def test_required_literal(self):
+        """
+        Only literal text every match holds is a keyword
+        """
+        self.assertEquals(required_literal(r'.*foo=(\d*).*'), 'foo=')
+        self.assertEquals(required_literal(r'samples = (\d+), free = \d+'), 'samples = ')
+        self.assertEquals(required_literal(r' +average salinity = ([\d.]+)'), 'average salinity = ')
+        self.assertEquals(required_literal(r'(external|internal) temperature sensor'),
+                          ' temperature sensor')
+        self.assertEquals(required_literal(r'status = (not )?logging'), 'status = ')
+        self.assertEquals(required_literal(r'foo|bar'), None)
+        self.assertEquals(required_literal(r'(\d+)'), None)
+        self.assertEquals(required_literal(r'(?i)status = (\w+)'), None)
+
+    def test_update_order(self):
+        """
+        The first parameter matching a line is updated, whether or not it
+        has a keyword, and parameters added later are matched too
+        """
+        param_dict = ProtocolParameterDict()
+        param_dict.add("number", r'(\d+)', lambda match : int(match.group(1)), str)
+        param_dict.add("named", r'n=(\d+)', lambda match : int(match.group(1)), str)
+        first = param_dict._param_dict.keys()[0]
+        self.assertEquals(param_dict.update("n=5"), first)
+        self.assertEquals(param_dict.update("nothing"), False)
+
+        param_dict.add("word", r'(?P<word>[a-z]+)!', lambda match : match.group('word'), str)
+        self.assertEquals(param_dict.update("hello!"), "word")
+        self.assertEquals(param_dict.get("word"), "hello")
+
+    def _status_dict(self):
+        param_dict = ProtocolParameterDict()
+        param_dict.add("version", r'SBE 16plus V ([\w.]+) +SERIAL NO. (\d+)',
+                       lambda match : match.group(1), str, multi_match=True)
+        param_dict.add("serial", r'SBE 16plus V ([\w.]+) +SERIAL NO. (\d+)',
+                       lambda match : int(match.group(2)), str, multi_match=True)
+        param_dict.add("vbatt", r'vbatt = (\d+\.\d)', lambda match : float(match.group(1)), str)
+        param_dict.add("ioper", r'ioper = +([\d.]+) ma', lambda match : float(match.group(1)), str)
+        param_dict.add("logging", r'status = (not )?logging',
+                       lambda match : match.group(1) is None, str)
+        param_dict.add("interval", r'sample interval = (\d+) seconds',
+                       lambda match : int(match.group(1)), str)
+        param_dict.add("salinity", r'(?:output salinity|OUTPUTSAL) = (no)?',
+                       lambda match : match.group(1) is None, str)
+        param_dict.add("samples", r'samples = (\d+), free', lambda match : int(match.group(1)), str)
+        param_dict.add("prompt", r'^(S)>$', lambda match : match.group(1), str)
+        return param_dict
+
+    def test_update_lines(self):
+        """
+        Parsing a whole response updates what parsing it a line at a time
+        does, one parameter per line or all multi match ones
+        """
+        for multi_match in (False, True):
+            expected = self._status_dict()
+            for line in STATUS_LINES:
+                if multi_match:
+                    expected.multi_match_update(line)
+                else:
+                    expected.update(line)
+
+            param_dict = self._status_dict()
+            result = param_dict.update_lines("\r\n".join(STATUS_LINES), "\r\n",
+                                             multi_match=multi_match)
+            self.assertEquals(param_dict.get_config(), expected.get_config())
+            self.assertEquals(result, dict([(name, value) for (name, value) in
+                                            expected.get_config().items()
+                                            if value is not None]))
+
+        self.assertEquals(result["version"], "2.2")
+        self.assertEquals(result["serial"], 6841)
+        self.assertEquals(result["logging"], False)
+        self.assertEquals(result["salinity"], False)
+        self.assertEquals(result["prompt"], "S")
+        # the lines are split before matching
+        self.assertEquals(param_dict.update_lines("sample interval\r\n= 5 seconds", "\r\n"), {})
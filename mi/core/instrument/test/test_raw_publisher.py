@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.instrument.test.test_raw_publisher
+@file mi/core/instrument/test/test_raw_publisher.py
+@brief Test cases for the raw particle publishing modes
+"""
+
+__license__ = 'Apache 2.0'
+
+import json
+import base64
+import time
+
+from mock import patch
+from nose.plugins.attrib import attr
+
+from mi.core.log import get_logger ; log = get_logger()
+from mi.core.unit_test import MiUnitTest
+from mi.core.exceptions import InstrumentParameterException
+from mi.core.instrument.data_particle import DataParticleKey
+from mi.core.instrument.data_particle import RawDataParticleKey
+from mi.core.instrument.port_agent_client import PortAgentPacket
+from mi.core.instrument.raw_publisher import RawDataPublisher
+from mi.core.instrument.raw_publisher import RawPublishingKey
+from mi.core.instrument.raw_publisher import RawPublishingMode
+
+def make_packet(data):
+    packet = PortAgentPacket()
+    packet.attach_data(data)
+    packet.pack_header()
+    return packet
+
+def raw_payload(particle):
+    for value in json.loads(particle)[DataParticleKey.VALUES]:
+        if value[DataParticleKey.VALUE_ID] == RawDataParticleKey.PAYLOAD:
+            return base64.b64decode(value[DataParticleKey.VALUE])
+
+@attr('UNIT', group='mi')
+class TestRawDataPublisher(MiUnitTest):
+    """
+    Which packets each mode publishes
+    """
+    def setUp(self):
+        self.particles = []
+        self.subscribed = True
+        self.publisher = RawDataPublisher(self.particles.append,
+                                          lambda: self.subscribed)
+        self.addCleanup(self.publisher.shutdown)
+        self.packets = [make_packet('packet %d' % i) for i in range(10)]
+
+    def _send(self, packets):
+        for packet in packets:
+            self.publisher.got_packet(packet)
+        return [raw_payload(particle) for particle in self.particles]
+
+    def test_all(self):
+        """
+        By default every packet is published
+        """
+        self.assertEqual(self._send(self.packets[:3]),
+                         ['packet 0', 'packet 1', 'packet 2'])
+        counters = self.publisher.get_counters()[RawPublishingMode.ALL]
+        self.assertEqual(counters, {'packets': 3, 'bytes': 24, 'particles': 3})
+
+    def test_decimate(self):
+        """
+        Every Nth packet is published
+        """
+        self.publisher.configure({RawPublishingKey.MODE: RawPublishingMode.DECIMATE,
+                                  RawPublishingKey.DECIMATION: 4})
+        self.assertEqual(self._send(self.packets),
+                         ['packet 0', 'packet 4', 'packet 8'])
+        counters = self.publisher.get_counters()[RawPublishingMode.DECIMATE]
+        self.assertEqual(counters, {'packets': 10, 'bytes': 80, 'particles': 3})
+
+    @patch('mi.core.instrument.raw_publisher.time')
+    def test_sample(self, mock_time):
+        """
+        The first packet of each interval is published
+        """
+        self.publisher.configure({RawPublishingKey.MODE: RawPublishingMode.SAMPLE,
+                                  RawPublishingKey.INTERVAL: 1})
+        for (i, packet) in enumerate(self.packets):
+            mock_time.time.return_value = 1000 + i * .4
+            self.publisher.got_packet(packet)
+        payloads = [raw_payload(particle) for particle in self.particles]
+        self.assertEqual(payloads, ['packet 0', 'packet 3', 'packet 6', 'packet 9'])
+
+    @patch('mi.core.instrument.raw_publisher.time')
+    def test_aggregate(self, mock_time):
+        """
+        Each window's packets are published as one particle
+        """
+        self.publisher.configure({RawPublishingKey.MODE: RawPublishingMode.AGGREGATE,
+                                  RawPublishingKey.WINDOW: 1})
+        for (i, packet) in enumerate(self.packets[:8]):
+            mock_time.time.return_value = 1000 + i * .3
+            self.publisher.got_packet(packet)
+        self.assertEqual(len(self.particles), 1)
+        self.assertEqual(raw_payload(self.particles[0]),
+                         ''.join(['packet %d' % i for i in range(5)]))
+
+        # changing the mode publishes what is held
+        self.publisher.configure({RawPublishingKey.MODE: RawPublishingMode.OFF})
+        self.assertEqual(len(self.particles), 2)
+        self.assertEqual(raw_payload(self.particles[1]), 'packet 5packet 6packet 7')
+        counters = self.publisher.get_counters()[RawPublishingMode.AGGREGATE]
+        self.assertEqual(counters, {'packets': 8, 'bytes': 64, 'particles': 2})
+
+    def test_aggregate_window_ends(self):
+        """
+        A window is published when it ends even if no packet follows it
+        """
+        self.publisher.configure({RawPublishingKey.MODE: RawPublishingMode.AGGREGATE,
+                                  RawPublishingKey.WINDOW: .1})
+        self._send(self.packets[:2])
+        self.assertEqual(self.particles, [])
+        end_time = time.time() + 5
+        while not self.particles and time.time() < end_time:
+            time.sleep(.01)
+        self.assertEqual(self._send([]), ['packet 0packet 1'])
+
+        # the next window gets its own timer
+        self._send(self.packets[2:3])
+        time.sleep(.3)
+        self.assertEqual(self._send([]), ['packet 0packet 1', 'packet 2'])
+
+    def test_shutdown(self):
+        """
+        Data held for an aggregate is published when the publisher is dropped
+        """
+        self.publisher.configure({RawPublishingKey.MODE: RawPublishingMode.AGGREGATE,
+                                  RawPublishingKey.WINDOW: 60})
+        self._send(self.packets[:2])
+        self.assertEqual(self.particles, [])
+        self.publisher.shutdown()
+        self.assertEqual(self._send([]), ['packet 0packet 1'])
+        self.assertIsNone(self.publisher._aggregate_timer)
+
+    def test_off(self):
+        """
+        Nothing is published when off or when no one subscribes
+        """
+        self.publisher.configure({RawPublishingKey.MODE: RawPublishingMode.OFF})
+        self.assertEqual(self._send(self.packets[:2]), [])
+
+        self.publisher.configure(None)
+        self.subscribed = False
+        self.assertEqual(self._send(self.packets[:2]), [])
+        self.subscribed = True
+        self.assertEqual(self._send(self.packets[:1]), ['packet 0'])
+
+        counters = self.publisher.get_counters()
+        self.assertEqual(counters[RawPublishingMode.OFF]['packets'], 4)
+        self.assertEqual(counters[RawPublishingMode.OFF]['particles'], 0)
+        self.assertEqual(counters[RawPublishingMode.ALL]['packets'], 1)
+
+    def test_invalid_config(self):
+        """
+        Bad config is refused
+        """
+        for config in ['all', {RawPublishingKey.MODE: 'some'},
+                       {RawPublishingKey.MODE: RawPublishingMode.DECIMATE,
+                        RawPublishingKey.DECIMATION: 0},
+                       {RawPublishingKey.WINDOW: 'long'}]:
+            self.assertRaises(InstrumentParameterException,
+                              self.publisher.configure, config)
+
+@attr('BENCHMARK', group='mi')
+class BenchmarkRawDataPublisher(MiUnitTest):
+    """
+    Port agent packets handled per second in each mode.
+    """
+    PACKET_COUNT = 20000
+
+    def test_mode_rate(self):
+        packet = make_packet('x' * 256)
+        for (mode, config) in [(RawPublishingMode.ALL, {}),
+                               (RawPublishingMode.DECIMATE, {RawPublishingKey.DECIMATION: 10}),
+                               (RawPublishingMode.AGGREGATE, {RawPublishingKey.WINDOW: .1}),
+                               (RawPublishingMode.OFF, {})]:
+            publisher = RawDataPublisher(lambda particle: None)
+            config[RawPublishingKey.MODE] = mode
+            publisher.configure(config)
+            start_time = time.time()
+            for i in range(self.PACKET_COUNT):
+                publisher.got_packet(packet)
+            rate = self.PACKET_COUNT / (time.time() - start_time)
+            publisher.shutdown()
+            log.info("Raw publishing %s: %d packets/s", mode, rate)
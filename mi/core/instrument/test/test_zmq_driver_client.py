@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.instrument.test.test_zmq_driver_client
+@file mi/core/instrument/test/test_zmq_driver_client.py
+@brief Test cases for ZmqDriverClient talking to an in process
+ZmqDriverProcess.
+"""
+
+__license__ = 'Apache 2.0'
+
+import os
+import time
+import tempfile
+
+from nose.plugins.attrib import attr
+
+from mi.core.log import get_logger ; log = get_logger()
+from mi.core.unit_test import MiUnitTest
+from mi.core.instrument.zmq_driver_client import ZmqDriverClient
+from mi.core.instrument.zmq_driver_process import ZmqDriverProcess
+from mi.core.instrument.instrument_driver import DriverConfigKey
+from mi.core.instrument.instrument_driver import EventBatchKey
+from mi.core.instrument.driver_process import FlushCause
+
+DRIVER_MODULE = 'mi.core.instrument.instrument_driver'
+DRIVER_CLASS = 'SingleConnectionInstrumentDriver'
+
+class DriverProcessFixture(MiUnitTest):
+    """
+    Runs the driver process messaging threads in this process with a driver
+    that has no protocol and connects a client to them.
+    """
+    def setUp(self):
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(os.rmdir, workdir)
+        cmd_fname = os.path.join(workdir, 'cmd_port')
+        evt_fname = os.path.join(workdir, 'evt_port')
+
+        self.process = ZmqDriverProcess(DRIVER_MODULE, DRIVER_CLASS,
+                                        cmd_fname, evt_fname, None)
+        self.assertTrue(self.process.construct_driver())
+        self.process.start_messaging()
+        self.addCleanup(self._stop_process)
+
+        for fname in (cmd_fname, evt_fname):
+            while not os.path.exists(fname):
+                time.sleep(.01)
+            self.addCleanup(os.remove, fname)
+        while self.process.cmd_port is None or self.process.evt_port is None:
+            time.sleep(.01)
+
+        self.events = []
+        self.client = ZmqDriverClient('localhost', self.process.cmd_port,
+                                      self.process.evt_port)
+        self.client.start_messaging(self.events.append)
+
+    def _subscribe(self):
+        """
+        Events published before the subscription settles are dropped, so
+        send test events until one arrives.
+        """
+        timeout = time.time() + 5
+        while 'subscribed' not in self.events and time.time() < timeout:
+            self.client.cmd_dvr('test_events', events=['subscribed'])
+            time.sleep(.05)
+        self.assertTrue('subscribed' in self.events)
+        time.sleep(.1)
+        del self.events[:]
+
+    def _wait_for_events(self, count, timeout=10):
+        timeout = time.time() + timeout
+        while len(self.events) < count and time.time() < timeout:
+            time.sleep(.01)
+        self.assertEqual(len(self.events), count)
+
+    def _stop_process(self):
+        if self.client.zmq_cmd_socket:
+            self.client.done()
+        self.process.stop_messaging()
+        self.process.cmd_thread.join()
+        self.process.evt_thread.join()
+
+@attr('UNIT', group='mi')
+class TestZmqDriverClient(DriverProcessFixture):
+    """
+    Command and event round trips
+    """
+    def test_ping(self):
+        """
+        Commands reach the driver and replies come back
+        """
+        self.assertEqual(self.client.cmd_dvr('driver_ping', 'foo'), 'driver_ping: foo')
+        self.assertEqual(self.client.cmd_dvr('driver_ping', 'bar'), 'driver_ping: bar')
+
+    def test_events(self):
+        """
+        Events queued in the driver process reach the client callback
+        """
+        self._subscribe()
+        self.client.cmd_dvr('test_events', events=['event 1', 'event 2'])
+        self._wait_for_events(2)
+        self.assertEqual(self.events, ['event 1', 'event 2'])
+
+    def test_event_batch(self):
+        """
+        Batched events are unpacked into one callback each, in order
+        """
+        self._subscribe()
+        self.client.cmd_dvr('set_init_params', {DriverConfigKey.EVENT_BATCH: {
+            EventBatchKey.MAX_EVENTS: 10, EventBatchKey.MAX_LATENCY: 50}})
+        evts = ['event %d' % i for i in range(25)]
+        self.client.cmd_dvr('test_events', events=evts)
+        self._wait_for_events(25)
+        self.assertEqual(self.events, evts)
+
+        metrics = self.client.cmd_dvr('get_event_batch_metrics')
+        self.assertEqual(metrics['events'], 25)
+        self.assertEqual(metrics['flush_causes'][FlushCause.SIZE], 2)
+        self.assertEqual(metrics['flush_causes'][FlushCause.LATENCY], 1)
+
+    def test_stop(self):
+        """
+        Stopping the driver process ends its messaging threads
+        """
+        self.client.done()
+        self.process.cmd_thread.join(5)
+        self.process.evt_thread.join(5)
+        self.assertFalse(self.process.cmd_thread.is_alive())
+        self.assertFalse(self.process.evt_thread.is_alive())
+
+@attr('BENCHMARK', group='mi')
+class BenchmarkDriverPing(DriverProcessFixture):
+    """
+    driver_ping round trip latency from client to driver process and back.
+    """
+    PING_COUNT = 200
+
+    def test_ping_latency(self):
+        latencies = []
+        for i in range(self.PING_COUNT):
+            start_time = time.time()
+            reply = self.client.cmd_dvr('driver_ping', 'ping')
+            latencies.append(time.time() - start_time)
+            self.assertEqual(reply, 'driver_ping: ping')
+
+        latencies.sort()
+        log.info("driver_ping round trip: mean %.3f ms, median %.3f ms, max %.3f ms",
+                 1000 * sum(latencies) / len(latencies),
+                 1000 * latencies[len(latencies) / 2],
+                 1000 * latencies[-1])
+
+@attr('BENCHMARK', group='mi')
+class BenchmarkEventBatch(DriverProcessFixture):
+    """
+    Sample events per second from the driver to the client callback, with
+    and without batching.
+    """
+    EVENT_COUNT = 20000
+
+    def _rate(self, config):
+        if config:
+            self.client.cmd_dvr('set_init_params', {DriverConfigKey.EVENT_BATCH: config})
+        del self.events[:]
+        evt = {'type': 'DRIVER_ASYNC_EVENT_SAMPLE', 'value': 'x' * 400, 'time': time.time()}
+
+        start_time = time.time()
+        for i in range(self.EVENT_COUNT):
+            self.process.send_event(evt)
+        self._wait_for_events(self.EVENT_COUNT, 60)
+        return self.EVENT_COUNT / (time.time() - start_time)
+
+    def test_batch_rate(self):
+        self._subscribe()
+        rates = [('unbatched', self._rate(None))]
+        for size in (10, 100):
+            config = {EventBatchKey.MAX_EVENTS: size, EventBatchKey.MAX_LATENCY: 10}
+            rates.append(('batches of %d' % size, self._rate(config)))
+        for (name, rate) in rates:
+            log.info("Events %s: %d events/s", name, rate)
+        log.info("Batch metrics: %s", self.client.cmd_dvr('get_event_batch_metrics'))
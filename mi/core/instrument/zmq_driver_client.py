@@ -27,6 +27,10 @@ import time
 import zmq
 
 from mi.core.instrument.driver_client import DriverClient
+from mi.core.instrument.event_codec import decode_events
+from mi.core.instrument.zmq_driver_process import wait_readable
+from mi.core.instrument.zmq_driver_process import POLL_TIMEOUT
+from mi.core.exceptions import InstrumentException
 from mi.core.log import get_logger ; log = get_logger()
 
  
@@ -36,12 +40,14 @@ class ZmqDriverClient(DriverClient):
     thread for catching asynchronous driver events.
     """
     
-    def __init__(self, host, cmd_port, event_port):
+    def __init__(self, host, cmd_port, event_port, event_codecs=None):
         """
         Initialize members.
         @param host Host string address of the driver process.
         @param cmd_port Port number for the driver process command port.
         @param event_port Port number for the driver process event port.
+        @param event_codecs Event codec names in order of preference, see
+        mi.core.instrument.event_codec. None to keep pickled events.
         """
         DriverClient.__init__(self)
         self.host = host
@@ -53,6 +59,8 @@ class ZmqDriverClient(DriverClient):
         self.zmq_cmd_socket = None
         self.event_thread = None
         self.stop_event_thread = True
+        self.event_codecs = event_codecs
+        self.event_codec = None
         
     def start_messaging(self, evt_callback=None):
         """
@@ -84,13 +92,17 @@ class ZmqDriverClient(DriverClient):
             driver_client.stop_event_thread = False
             #last_time = time.time()
             while not driver_client.stop_event_thread:
+                if not wait_readable(sock, POLL_TIMEOUT):
+                    continue
                 try:
-                    evt = sock.recv_pyobj(flags=zmq.NOBLOCK)
-                    log.debug('got event: %s' % str(evt))
-                    if driver_client.evt_callback:
-                        driver_client.evt_callback(evt)
+                    while True:
+                        frames = sock.recv_multipart(flags=zmq.NOBLOCK)
+                        for evt in decode_events(frames):
+                            log.debug('got event: %s' % str(evt))
+                            if driver_client.evt_callback:
+                                driver_client.evt_callback(evt)
                 except zmq.ZMQError:
-                    time.sleep(.5)
+                    pass
                 #cur_time = time.time()
                 #if cur_time - last_time > 5:
                 #    log.info('event thread listening')
@@ -100,6 +112,21 @@ class ZmqDriverClient(DriverClient):
             log.info('Client event socket closed.')
         self.event_thread = thread.start_new_thread(recv_evt_messages, (self,))
         log.info('Driver client messaging started.')
+
+        if self.event_codecs:
+            self._negotiate_event_codec()
+
+    def _negotiate_event_codec(self):
+        """
+        Ask the driver process to send events with the first codec in our
+        list that it supports. Driver processes that predate codecs keep
+        sending pickles.
+        """
+        try:
+            self.event_codec = self.cmd_dvr('set_event_codec', self.event_codecs)
+            log.info('Driver client using %s event codec.' % self.event_codec)
+        except InstrumentException as e:
+            log.warn('Event codec not negotiated, using pickle: %s' % str(e))
         
     def stop_messaging(self):
         """
@@ -133,31 +160,12 @@ class ZmqDriverClient(DriverClient):
         msg = {'cmd':cmd,'args':args,'kwargs':kwargs}
         
         log.debug('Sending command %s.' % str(msg))
-        while True:
-            try:
-                # Attempt command send. Retry if necessary.
-                self.zmq_cmd_socket.send_pyobj(msg)
-                if msg == 'stop_driver_process':
-                    return 'driver stopping'
-
-                # Command sent, break out and wait for reply.
-                break    
+        self.zmq_cmd_socket.send_pyobj(msg)
 
-            except zmq.ZMQError:
-                # Socket not ready to accept send. Sleep and retry later.
-                time.sleep(.5)
-            
         log.debug('Awaiting reply.')
-        while True:
-            try:
-                # Attempt reply recv. Retry if necessary.
-                reply = self.zmq_cmd_socket.recv_pyobj(flags=zmq.NOBLOCK)
-                # Reply recieved, break and return.
-                break
-
-            except zmq.ZMQError:
-                # Socket not ready with the reply. Sleep and retry later.
-                time.sleep(.5)
+        while not wait_readable(self.zmq_cmd_socket, POLL_TIMEOUT):
+            pass
+        reply = self.zmq_cmd_socket.recv_pyobj(flags=zmq.NOBLOCK)
                 
         log.debug('Reply: %s.' % str(reply))
         
@@ -24,14 +24,36 @@ import time
 import logging
 import sys
 import uuid
+import select
 
 import zmq
 
 import mi.core.instrument.driver_process as driver_process
+from mi.core.instrument.event_codec import encode_event
+from mi.core.instrument.event_codec import encode_batch
+from mi.core.instrument.event_codec import ZERO_COPY_THRESHOLD
 from mi.core.instrument.instrument_driver import DriverAsyncEvent
 from mi.core.log import get_logger
 log = get_logger()
 
+# How long messaging loops wait on a socket before checking their stop flags, s.
+POLL_TIMEOUT = .1
+
+def wait_readable(sock, timeout):
+    """
+    Wait for a message on a zmq socket. Waits with select on the socket's
+    file descriptor, which gevent patches, so other greenlets keep running
+    while a patched thread waits here.
+    @param sock The zmq socket
+    @param timeout Seconds to wait at most
+    @retval True if a message can be received
+    """
+    # The descriptor only signals changes, so check before waiting.
+    if sock.getsockopt(zmq.EVENTS) & zmq.POLLIN:
+        return True
+    select.select([sock.getsockopt(zmq.FD)], [], [], timeout)
+    return bool(sock.getsockopt(zmq.EVENTS) & zmq.POLLIN)
+
 class ZmqDriverProcess(driver_process.DriverProcess):
     """
     A OS-level driver process that communicates with ZMQ sockets.
@@ -116,9 +138,9 @@ class ZmqDriverProcess(driver_process.DriverProcess):
         """
         Initialize and start messaging resources for the driver, blocking
         until messaging terminates. This ZMQ implementation starts and
-        joins command and event threads, managing nonblocking send/recv calls
-        on REP and PUB sockets, respectively. Terminate loops and close
-        sockets when stop flag is set in driver process.
+        joins command and event threads, which block on the REP socket and
+        on the event queue respectively. Terminate loops and
+        close sockets when stop flag is set in driver process.
         """
         def recv_cmd_msg(zmq_driver_process):
             """
@@ -134,21 +156,13 @@ class ZmqDriverProcess(driver_process.DriverProcess):
 
             zmq_driver_process.stop_cmd_thread = False
             while not zmq_driver_process.stop_cmd_thread:
-                try:
-                    msg = sock.recv_pyobj(flags=zmq.NOBLOCK)
-                    log.debug('Processing message %s' % str(msg))
-                    reply = zmq_driver_process.cmd_driver(msg)
-                    while True:
-                        try:
-                            sock.send_pyobj(reply, flags=zmq.NOBLOCK)
-                            break
-                        except zmq.ZMQError:
-                            time.sleep(.1)
-                            if zmq_driver_process.stop_cmd_thread:
-                                break
-                except zmq.ZMQError:
-                    time.sleep(.1)
-                
+                if not wait_readable(sock, POLL_TIMEOUT):
+                    continue
+                msg = sock.recv_pyobj()
+                log.debug('Processing message %s' % str(msg))
+                reply = zmq_driver_process.cmd_driver(msg)
+                sock.send_pyobj(reply)
+
             sock.close()
             context.term()
             log.info('Driver process cmd socket closed.')
@@ -167,20 +181,19 @@ class ZmqDriverProcess(driver_process.DriverProcess):
 
             zmq_driver_process.stop_evt_thread = False
             while not zmq_driver_process.stop_evt_thread:
+                evts = zmq_driver_process.get_events()
+                if not evts:
+                    continue
+                log.debug('Event thread sending events %s' % str(evts))
+                if len(evts) == 1:
+                    frames = encode_event(zmq_driver_process.event_codec, evts[0])
+                else:
+                    frames = encode_batch(zmq_driver_process.event_codec, evts)
                 try:
-                    evt = zmq_driver_process.events.pop(0)
-                    log.debug('Event thread sending event %s' % str(evt))
-                    while evt:
-                        try:
-                            sock.send_pyobj(evt, flags=zmq.NOBLOCK)
-                            evt = None
-                            log.debug('Event sent!')
-                        except zmq.ZMQError:
-                            time.sleep(.1)
-                            if zmq_driver_process.stop_evt_thread:
-                                break
-                except IndexError:
-                    time.sleep(.1)
+                    zmq_driver_process.send_frames(sock, frames)
+                    log.debug('Event sent!')
+                except zmq.ZMQError as e:
+                    log.error('Driver process could not send event: %s' % str(e))
 
             sock.close()
             context.term()
@@ -192,6 +205,21 @@ class ZmqDriverProcess(driver_process.DriverProcess):
         self.evt_thread.start()
         self.messaging_started = True
     
+    @staticmethod
+    def send_frames(sock, frames, flags=0):
+        """
+        Send a multipart message. Big frames are sent without a copy.
+        @param sock The zmq socket
+        @param frames list of string frames
+        @param flags zmq send flags
+        """
+        last = len(frames) - 1
+        for (index, frame) in enumerate(frames):
+            frame_flags = flags
+            if index < last:
+                frame_flags |= zmq.SNDMORE
+            sock.send(frame, frame_flags, copy=len(frame) < ZERO_COPY_THRESHOLD)
+
     def stop_messaging(self):
         """
         Close messaging resource for the driver. Set flags to cause
@@ -199,6 +227,7 @@ class ZmqDriverProcess(driver_process.DriverProcess):
         """
         self.stop_cmd_thread = True
         self.stop_evt_thread = True
+        self.events.put(driver_process.STOP_EVENT_THREAD)
         self.messaging_started = False
     
     def shutdown(self):
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.line_assembler
+@file mi/core/line_assembler.py
+@brief Assembles lines out of the buffers received from an instrument.
+"""
+
+__license__ = 'Apache 2.0'
+
+from collections import deque
+
+
+class LineAssembler(object):
+    """
+    Splits received buffers into lines, keeping the last completed line, the
+    line being received and a bounded history of completed lines.
+
+    Each buffer is split in one go, so callers can act once per completed
+    line (see add) instead of once per received character.
+    """
+
+    def __init__(self, max_lines, newline='\n'):
+        """
+        @param max_lines Max number of completed lines kept in lines.
+        @param newline The line terminator. It is not included in the lines.
+        """
+        self._newline = newline
+        self.lines = deque(maxlen=max_lines)
+        self.reset()
+
+    def reset(self):
+        """
+        Forgets all received lines.
+        """
+        self.last_line = ''
+        self.new_line = ''
+        self.lines.clear()
+
+    def add(self, buffer):
+        """
+        Adds a received buffer.
+        @param buffer The received string
+        @retval list of the lines completed by this buffer, in order
+        """
+        if buffer.find(self._newline) < 0:
+            self.new_line += buffer
+            return []
+
+        completed = buffer.split(self._newline)
+        completed[0] = self.new_line + completed[0]
+        self.new_line = completed.pop()
+        self.last_line = completed[-1]
+        self.lines.extend(completed)
+        return completed
@@ -56,6 +56,7 @@ __license__ = 'Apache 2.0'
 from datetime import timedelta
 from datetime import datetime
 from math import ceil
+from threading import Lock
 
 from apscheduler.scheduler import Scheduler
 from apscheduler.scheduler import JobStoreEvent
@@ -76,6 +77,9 @@ class PolledScheduler(Scheduler):
         ensure we are running in daemon mode, so we won't wait for 
         unfinished threads on shutdown
         """
+        # polled job name -> (job, alias, jobstore).  Set before the base
+        # constructor because it adds the default job store.
+        self._polled_jobs = {}
         Scheduler.__init__(self, {'demonic': True})
 
     @staticmethod
@@ -127,35 +131,34 @@ class PolledScheduler(Scheduler):
 
     def run_polled_job(self, name):
         """
-        Find a job in the job store and pull the trigger on the job.  If it is read to run, run it
+        Find a job by name and pull the trigger on the job.  If it is read to run, run it
         and return true, otherwise do nothing and return false.
         @param name: name of the job we are looking for
         @return: True if the job is run, false otherwise
         @raise LookupError if the job name isn't found in the job store or the found job isn't a
                            polled job.
         """
-        self._jobstores_lock.acquire()
-        log.debug("jobstores lock acquired")
-        try:
-            now = datetime.now()
-            (job, alias, jobstore) = self.get_polled_job_tuple(name)
+        (job, alias, jobstore) = self.get_polled_job_tuple(name)
 
-            if(not job):
-                raise LookupError("no PolledIntervalJob found named '%s'" % name )
+        if(not job):
+            raise LookupError("no PolledIntervalJob found named '%s'" % name )
 
-            if(job.ready_to_run()):
-                log.debug("Job '%s' is ready to run" % job.name)
-                self._threadpool.submit(self._run_job, job, [datetime.now()])
-                job.compute_next_run_time(now)
-                jobstore.update_job(job)
-                return True
-            else:
-                log.debug("Job '%s' is *NOT* ready to run" % job.name)
-                return False
+        # Jobs that are not ready return here without taking the jobstores
+        # lock, this is the common case when polled on every sample.
+        if(not job.ready_to_run()):
+            return False
 
+        now = datetime.now()
+        self._threadpool.submit(self._run_job, job, [now])
+
+        self._jobstores_lock.acquire()
+        try:
+            job.compute_next_run_time(now)
+            jobstore.update_job(job)
         finally:
             self._jobstores_lock.release()
-            log.debug("jobstores lock released")
+
+        return True
 
     def get_polled_job_tuple(self, name):
         """
@@ -164,12 +167,7 @@ class PolledScheduler(Scheduler):
         @param name: name of the job we are looking for
         @return: Tuple containing (job, alias, jobstore)
         """
-        for (alias, jobstore) in self._jobstores.items():
-            for job in tuple(jobstore.jobs):
-                if(isinstance(job, PolledIntervalJob) and name == job.name):
-                    return (job, alias, jobstore)
-
-        return (None, None, None)
+        return self._polled_jobs.get(name, (None, None, None))
 
     def get_polled_job(self, name):
         """
@@ -178,46 +176,58 @@ class PolledScheduler(Scheduler):
         @param name: name of the job we are looking for
         @return: PolledIntervalJob with the matching name or None if not found.
         """
-        for (alias, jobstore) in self._jobstores.items():
-            for job in tuple(jobstore.jobs):
-                if(isinstance(job, PolledIntervalJob) and name == job.name):
-                    return job
+        return self.get_polled_job_tuple(name)[0]
 
-        return None
+    def add_jobstore(self, jobstore, alias, quiet=False):
+        """
+        Add a job store and index the polled jobs it loaded
+        """
+        Scheduler.add_jobstore(self, jobstore, alias, quiet)
+
+        self._jobstores_lock.acquire()
+        try:
+            for job in jobstore.jobs:
+                if(isinstance(job, PolledIntervalJob)):
+                    self._polled_jobs[job.name] = (job, alias, jobstore)
+        finally:
+            self._jobstores_lock.release()
+
+    def remove_jobstore(self, alias, close=True):
+        """
+        Remove a job store and drop its polled jobs from the index
+        """
+        Scheduler.remove_jobstore(self, alias, close)
+
+        self._jobstores_lock.acquire()
+        try:
+            for (name, (job, job_alias, jobstore)) in self._polled_jobs.items():
+                if(job_alias == alias):
+                    del self._polled_jobs[name]
+        finally:
+            self._jobstores_lock.release()
 
     def _process_jobs(self, now, polled=False):
         """
         Iterates through jobs in every jobstore, starts pending jobs
         and figures out the next wakeup time.
         """
-        log.debug("_process_jobs started")
         next_wakeup_time = None
-        next_polled_wakeup_time = None
         self._jobstores_lock.acquire()
         try:
-            log.debug("_process_jobs lock acquired")
             for (alias, jobstore) in self._jobstores.items():
                 for job in tuple(jobstore.jobs):
-                    log.debug("_process_jobs process job %s" % job)
                     if(isinstance(job, PolledIntervalJob)):
-                        next_polled_wakeup_time = self._process_polled_job(job, now, alias, jobstore)
+                        job_wakeup_time = self._process_polled_job(job, now, alias, jobstore)
                     else:
-                        next_wakeup_time = self._process_original_job(job, now, alias, jobstore)
+                        job_wakeup_time = self._process_original_job(job, now, alias, jobstore)
 
-            log.debug("_process_jobs loop complete")
-            log.debug("_process_jobs next polled wakeup %s" % next_polled_wakeup_time)
-            log.debug("_process_jobs next wakeup %s" % next_wakeup_time)
+                    if(job_wakeup_time and
+                       (next_wakeup_time is None or job_wakeup_time < next_wakeup_time)):
+                        next_wakeup_time = job_wakeup_time
 
-            if(next_polled_wakeup_time and next_wakeup_time):
-                return min(next_polled_wakeup_time, next_wakeup_time)
-            elif(next_wakeup_time == None):
-                return next_polled_wakeup_time
-            else:
-                return next_wakeup_time
+            return next_wakeup_time
         finally:
             self._jobstores_lock.release()
-            log.debug("_process_jobs lock released")
-
 
     def _process_original_job(self, job, now, alias, jobstore):
         """
@@ -255,19 +265,16 @@ class PolledScheduler(Scheduler):
         """
         next_wakeup_time=job.trigger.get_next_fire_time()
 
-        if not next_wakeup_time == None and next_wakeup_time <= now:
-            log.debug("submit job to pool: %s" % job)
+        # pull_trigger keeps a job polled at the same time from running twice
+        if(not next_wakeup_time == None and next_wakeup_time <= now and
+           job.trigger.pull_trigger(now)):
             if(not self._threadpool._shutdown):
                 self._threadpool.submit(self._run_job, job, [next_wakeup_time])
 
-            # Increase the job's run count
-            if job.coalesce:
-                job.runs += 1
-            else:
-                job.runs += len(run_times)
+            # A polled job only ever runs once per wakeup
+            job.runs += 1
 
             # Update the job.  We don't remove any polled jobs automatically
-            job.trigger.pull_trigger()
             job.compute_next_run_time(now + timedelta(microseconds=1))
             jobstore.update_job(job)
 
@@ -289,18 +296,21 @@ class PolledScheduler(Scheduler):
         if not isinstance(job, PolledIntervalJob) and not job.next_run_time:
             raise ValueError('Not adding job since it would never be run')
 
-        # We DO want to raise an exception if we already have a polled interval job
-        # with the same name as the one we are trying to add.
-        if isinstance(job, PolledIntervalJob) and self.get_polled_job(job.name):
-            raise ValueError("Not adding job since a job named '%s' already exists" % job.name)
-
         self._jobstores_lock.acquire()
         try:
+            # We DO want to raise an exception if we already have a polled interval job
+            # with the same name as the one we are trying to add.
+            if isinstance(job, PolledIntervalJob) and self.get_polled_job(job.name):
+                raise ValueError("Not adding job since a job named '%s' already exists" % job.name)
+
             try:
                 store = self._jobstores[jobstore]
             except KeyError:
                 raise KeyError('No such job store: %s' % jobstore)
             store.add_job(job)
+
+            if isinstance(job, PolledIntervalJob):
+                self._polled_jobs[job.name] = (job, jobstore, store)
         finally:
             self._jobstores_lock.release()
 
@@ -314,6 +324,17 @@ class PolledScheduler(Scheduler):
         if wakeup:
             self._wakeup.set()
 
+    def _remove_job(self, job, alias, jobstore):
+        """
+        Remove a job from its job store and, for polled jobs, from the
+        name index.  Called with the jobstores lock held.
+        """
+        if(isinstance(job, PolledIntervalJob) and
+           self._polled_jobs.get(job.name, (None,))[0] is job):
+            del self._polled_jobs[job.name]
+
+        Scheduler._remove_job(self, job, alias, jobstore)
+
 class PolledIntervalJob(Job):
     """
     Specialized Job that has additional functionality for polled jobs.
@@ -375,6 +396,9 @@ class PolledIntervalTrigger(object):
            self.min_interval_length > self.max_interval_length):
             raise ValueError("min_interval < max_interval")
 
+        # Only taken when the trigger fires, see pull_trigger
+        self._lock = Lock()
+
         self.next_max_date = None
         if start_date is None:
             self.next_min_date = datetime.now()
@@ -394,24 +418,41 @@ class PolledIntervalTrigger(object):
         """
         return self.next_max_date
 
-    def pull_trigger(self):
+    def pull_trigger(self, now=None):
         """
         Method used by new scheduler mechanism for checking if a job should run when polled.
+        The minimum date is checked without locking so polling a job that isn't ready is
+        cheap, the trigger lock makes sure only one caller fires it.
+        @param now: time to check against, defaults to now
         @return: true if the trigger is fired.
         """
-        now = datetime.now()
+        if(now is None):
+            now = datetime.now()
+
+        if(now < self.next_min_date):
+            return False
+
+        self._lock.acquire()
+        try:
+            if(now < self.next_min_date):
+                return False
 
-        if(self.next_min_date <= now):
             if(self.max_interval):
                 self.next_max_date = now + self.max_interval
             self.next_min_date = now + self.min_interval
 
-            log.debug("Next min date: %s" % self.next_min_date)
-            log.debug("Next max date: %s" % self.next_max_date)
-
             return True
+        finally:
+            self._lock.release()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_lock', None)
+        return state
 
-        return False
+    def __setstate__(self, state):
+        self.__dict__ = state
+        self._lock = Lock()
 
     def __str__(self):
         return "min_interval[%s] max_interval[%s]" % (str(self.min_interval), str(self.max_interval))
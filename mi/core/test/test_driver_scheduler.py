@@ -157,6 +157,60 @@ class TestDriverScheduler(MiUnitTest):
         # Check the automatic trigger again
         self.assert_event_triggered()
 
+    def test_timer_wheel_jobs(self):
+        """
+        With the timer wheel enabled sub second interval and polled jobs
+        run on the wheel and longer ones on the polled scheduler.
+        """
+        test_name = 'polled_job'
+        self._scheduler = DriverScheduler(timer_wheel=True)
+        config = {
+            'interval_job': {
+                DriverSchedulerConfigKey.TRIGGER: {
+                    DriverSchedulerConfigKey.TRIGGER_TYPE: TriggerType.INTERVAL,
+                    DriverSchedulerConfigKey.SECONDS: 0.2
+                },
+                DriverSchedulerConfigKey.CALLBACK: self._callback
+            },
+            test_name: {
+                DriverSchedulerConfigKey.TRIGGER: {
+                    DriverSchedulerConfigKey.TRIGGER_TYPE: TriggerType.POLLED_INTERVAL,
+                    DriverSchedulerConfigKey.MINIMAL_INTERVAL: {DriverSchedulerConfigKey.SECONDS: 0.5},
+                },
+                DriverSchedulerConfigKey.CALLBACK: self._callback
+            },
+            'slow_polled_job': {
+                DriverSchedulerConfigKey.TRIGGER: {
+                    DriverSchedulerConfigKey.TRIGGER_TYPE: TriggerType.POLLED_INTERVAL,
+                    DriverSchedulerConfigKey.MINIMAL_INTERVAL: {DriverSchedulerConfigKey.SECONDS: 1},
+                },
+                DriverSchedulerConfigKey.CALLBACK: self._callback
+            }
+        }
+        self._scheduler.add_config(config)
+
+        wheel = self._scheduler._timer_wheel
+        self.assertIsNotNone(wheel.get_job('interval_job'))
+        self.assertIsNotNone(wheel.get_job(test_name))
+        self.assertIsNone(wheel.get_job('slow_polled_job'))
+        self.assertIsNotNone(self._scheduler._scheduler.get_polled_job('slow_polled_job'))
+
+        self.assert_event_triggered(poll_time=0.1, timeout=1)
+
+        self.assertTrue(self._scheduler.run_job(test_name))
+        self.assertFalse(self._scheduler.run_job(test_name))
+        time.sleep(0.6)
+        self.assertTrue(self._scheduler.run_job(test_name))
+
+        self.assertTrue(self._scheduler.run_job('slow_polled_job'))
+        self.assertFalse(self._scheduler.run_job('slow_polled_job'))
+
+        # polled job names are unique across the wheel and the scheduler
+        with self.assertRaises(SchedulerException):
+            self._scheduler.add_config({'slow_polled_job': config[test_name]})
+        with self.assertRaises(SchedulerException):
+            self._scheduler.add_config({test_name: config['slow_polled_job']})
+
     ###
     #   Negative Testing For All Job Types
     ###
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.test.test_line_assembler
+@file mi/core/test/test_line_assembler.py
+@brief Test cases for the LineAssembler
+"""
+
+__license__ = 'Apache 2.0'
+
+import time
+
+from nose.plugins.attrib import attr
+
+from mi.core.log import get_logger ; log = get_logger()
+from mi.core.unit_test import MiUnitTest
+from mi.core.line_assembler import LineAssembler
+
+
+def _directory_listing(no_files=500):
+    """
+    A response to the Workhorse RR? command (recorder directory), about as
+    long as those seen from the instrument.
+    """
+    lines = ['', 'Recorder Directory:']
+    for i in range(no_files):
+        lines.append('RDI%03d.%03d  %7d  12/05/%02d  %02d:%02d:%02d' %
+                     (i / 1000, i % 1000, 50000 + 37 * i, 1 + i % 28,
+                      i % 24, i % 60, (7 * i) % 60))
+    lines.append('%d files, 3998.5 MB free' % no_files)
+    return '\r\n'.join(lines) + '\r\n>'
+
+
+def _chunks(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@attr('UNIT', group='mi')
+class TestLineAssembler(MiUnitTest):
+
+    def test_add(self):
+        assembler = LineAssembler(10)
+        self.assertEqual(assembler.add('abc'), [])
+        self.assertEqual(assembler.new_line, 'abc')
+        self.assertEqual(assembler.last_line, '')
+
+        self.assertEqual(assembler.add('d\nef\n\ngh'), ['abcd', 'ef', ''])
+        self.assertEqual(assembler.last_line, '')
+        self.assertEqual(assembler.new_line, 'gh')
+        self.assertEqual(list(assembler.lines), ['abcd', 'ef', ''])
+
+        self.assertEqual(assembler.add('\n'), ['gh'])
+        self.assertEqual(assembler.last_line, 'gh')
+        self.assertEqual(assembler.new_line, '')
+
+        assembler.reset()
+        self.assertEqual(list(assembler.lines), [])
+        self.assertEqual(assembler.last_line, '')
+
+    def test_chunking(self):
+        """
+        The lines do not depend on how the data is split into buffers
+        """
+        data = _directory_listing()
+        expected = data.split('\n')
+        for size in (1, 3, 64, 4096):
+            assembler = LineAssembler(1024)
+            completed = []
+            for chunk in _chunks(data, size):
+                completed.extend(assembler.add(chunk))
+            self.assertEqual(completed, expected[:-1])
+            self.assertEqual(assembler.new_line, '>')
+
+    def test_max_lines(self):
+        assembler = LineAssembler(3, newline='\r\n')
+        assembler.add('1\r\n2\r\n3\r\n4\r\n5')
+        self.assertEqual(list(assembler.lines), ['2', '3', '4'])
+        self.assertEqual(assembler.last_line, '4')
+
+
+class _PerCharacter(object):
+    """
+    How the ADCP and TRHPH receivers used to keep their lines, as the
+    benchmark baseline.
+    """
+    MAX_NUM_LINES = 1024
+
+    def __init__(self):
+        self._last_line = ''
+        self._new_line = ''
+        self._lines = []
+
+    def add(self, buffer):
+        numl = 0
+        for c in buffer:
+            if c == '\n':
+                numl += 1
+                self._last_line = self._new_line
+                self._new_line = ''
+                self._lines.append(self._last_line)
+                if len(self._lines) > self.MAX_NUM_LINES:
+                    self._lines = self._lines[1 - self.MAX_NUM_LINES:]
+            else:
+                self._new_line += c
+        return numl
+
+
+@attr('BENCHMARK', group='mi')
+class BenchmarkLineAssembler(MiUnitTest):
+    """
+    Time to take a 500 line RR? directory listing apart, received in socket
+    sized buffers.
+    """
+    REPEAT = 100
+
+    def _time(self, assembler):
+        chunks = _chunks(_directory_listing(), 4096)
+        start_time = time.time()
+        for i in range(self.REPEAT):
+            for chunk in chunks:
+                assembler.add(chunk)
+        return (time.time() - start_time) / self.REPEAT
+
+    def test_listing(self):
+        per_character = self._time(_PerCharacter())
+        assembler = self._time(LineAssembler(1024))
+        log.info("RR? listing: per character %.3f ms, LineAssembler %.3f ms",
+                 1000 * per_character, 1000 * assembler)
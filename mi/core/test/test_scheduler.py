@@ -13,6 +13,7 @@ __license__ = 'Apache 2.0'
 import unittest
 import datetime
 import time
+import pickle
 
 from mi.core.log import get_logger ; log = get_logger()
 
@@ -189,6 +190,35 @@ class TestScheduler(MiUnitTest):
         time.sleep(2)
         self.assertTrue(self._scheduler.run_polled_job(test_name))
 
+    def test_polled_job_index(self):
+        """
+        Polled jobs are found by name until they are unscheduled, after which
+        the name can be used again.
+        """
+        test_name = 'test_job'
+        min_interval = PolledScheduler.interval(seconds=1)
+
+        job = self._scheduler.add_polled_job(self._callback, test_name, min_interval)
+        self.assertIs(self._scheduler.get_polled_job(test_name), job)
+        self.assertEqual(self._scheduler.get_polled_job_tuple(test_name)[1], 'default')
+
+        # interval jobs aren't polled jobs
+        self._scheduler.add_interval_job(self._callback, seconds=60)
+        self.assertIsNone(self._scheduler.get_polled_job('foo'))
+
+        self._scheduler.unschedule_job(job)
+        self.assertIsNone(self._scheduler.get_polled_job(test_name))
+        with self.assertRaises(LookupError):
+            self._scheduler.run_polled_job(test_name)
+
+        job = self._scheduler.add_polled_job(self._callback, test_name, min_interval)
+        self.assertTrue(self._scheduler.run_polled_job(test_name))
+        self.assertFalse(self._scheduler.run_polled_job(test_name))
+
+        self._scheduler.unschedule_func(self._callback)
+        self.assertIsNone(self._scheduler.get_polled_job(test_name))
+        self.assertEqual(len(self._scheduler.get_jobs()), 0)
+
 
 ####################################################################################################
 #  Test our new polled trigger
@@ -313,6 +343,17 @@ class TestScheduler(MiUnitTest):
         trigger = PolledIntervalTrigger(PolledScheduler.interval(seconds=1), None, now)
         self.assertEqual(str(trigger), "min_interval[0:00:01] max_interval[None]")
         self.assertEqual(repr(trigger), "<PolledIntervalTrigger (min_interval=datetime.timedelta(0, 1), max_interval=None)>")
+    def test_trigger_pickle(self):
+        """
+        Triggers can be stored in persistent job stores, the lock isn't pickled
+        """
+        trigger = PolledIntervalTrigger(PolledScheduler.interval(seconds=1),
+                                        PolledScheduler.interval(seconds=3))
+        trigger = pickle.loads(pickle.dumps(trigger))
+        self.assertEqual(trigger.max_interval_length, 3)
+        self.assertTrue(trigger.pull_trigger())
+        self.assertFalse(trigger.pull_trigger())
+
 
 ####################################################################################################
 #  Test our new polled job
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.test.test_timer_wheel Timer wheel tests
+@file mi/core/test/test_timer_wheel.py
+@brief Unit tests for the timer wheel and benchmarks for polling jobs
+"""
+
+__license__ = 'Apache 2.0'
+
+import time
+
+from nose.plugins.attrib import attr
+
+from mi.core.log import get_logger ; log = get_logger()
+from mi.core.unit_test import MiUnitTest
+from mi.core.scheduler import PolledScheduler
+from mi.core.timer_wheel import TimerWheel
+
+@attr('UNIT', group='mi')
+class TestTimerWheel(MiUnitTest):
+    def setUp(self):
+        self._wheel = TimerWheel()
+        self._wheel.start()
+        self._triggered = []
+
+    def tearDown(self):
+        self._wheel.shutdown()
+
+    def _callback(self):
+        self._triggered.append(time.time())
+
+    def wait_for(self, count, timeout=5):
+        endtime = time.time() + timeout
+        while len(self._triggered) < count and time.time() < endtime:
+            time.sleep(0.01)
+        self.assertGreaterEqual(len(self._triggered), count)
+
+    def test_interval_job(self):
+        start = time.time()
+        self._wheel.add_interval_job(self._callback, 'test_job', 0.1)
+        self.wait_for(5)
+        # no drift from the 0.1 second schedule, within a few ticks
+        self.assertAlmostEqual(self._triggered[4] - start, 0.5, delta=0.05)
+
+    def test_polled_job(self):
+        test_name = 'test_job'
+        self._wheel.add_polled_job(self._callback, test_name, 0.2)
+
+        self.assertTrue(self._wheel.run_polled_job(test_name))
+        self.assertFalse(self._wheel.run_polled_job(test_name))
+        self.wait_for(1)
+
+        time.sleep(0.25)
+        self.assertTrue(self._wheel.run_polled_job(test_name))
+        self.wait_for(2)
+
+        with self.assertRaises(LookupError):
+            self._wheel.run_polled_job('foo')
+
+    def test_polled_max_interval(self):
+        """
+        A polled job runs on its own at the maximum interval, and polling it
+        pushes the maximum out
+        """
+        test_name = 'test_job'
+        start = time.time()
+        self._wheel.add_polled_job(self._callback, test_name, 0.1, 0.3)
+        self.wait_for(1)
+        self.assertAlmostEqual(self._triggered[0] - start, 0.3, delta=0.05)
+
+        time.sleep(0.15)
+        polled = time.time()
+        self.assertTrue(self._wheel.run_polled_job(test_name))
+        self.wait_for(3)
+        self.assertAlmostEqual(self._triggered[2] - polled, 0.3, delta=0.05)
+
+    def test_long_interval(self):
+        """
+        Intervals longer than a revolution of the wheel wait their turn
+        """
+        wheel = TimerWheel(tick=0.01, slots=8)
+        wheel.start()
+        try:
+            start = time.time()
+            wheel.add_interval_job(self._callback, 'test_job', 0.25)
+            self.wait_for(1)
+            self.assertAlmostEqual(self._triggered[0] - start, 0.25, delta=0.05)
+        finally:
+            wheel.shutdown()
+
+    def test_unschedule(self):
+        self._wheel.add_interval_job(self._callback, 'test_job', 0.05)
+        self._wheel.unschedule_job('test_job')
+        self.assertIsNone(self._wheel.get_job('test_job'))
+        time.sleep(0.2)
+        self.assertEqual(self._triggered, [])
+
+        with self.assertRaises(LookupError):
+            self._wheel.unschedule_job('test_job')
+
+    def test_bad_jobs(self):
+        self._wheel.add_interval_job(self._callback, 'test_job', 1)
+        with self.assertRaises(ValueError):
+            self._wheel.add_polled_job(self._callback, 'test_job', 1)
+        with self.assertRaises(ValueError):
+            self._wheel.add_interval_job(self._callback, 'other_job', 0)
+        with self.assertRaises(ValueError):
+            self._wheel.add_polled_job(self._callback, 'other_job', 2, 1)
+
+        # interval jobs can't be polled
+        with self.assertRaises(LookupError):
+            self._wheel.run_polled_job('test_job')
+
+    def test_callback_exception(self):
+        """
+        A callback that raises doesn't stop the wheel
+        """
+        def boom():
+            raise Exception('boom')
+        self._wheel.add_interval_job(boom, 'boom', 0.05)
+        self._wheel.add_interval_job(self._callback, 'test_job', 0.05)
+        self.wait_for(3)
+        self.assertTrue(self._wheel.running)
+
+@attr('BENCHMARK', group='mi')
+class BenchmarkPolledJobs(MiUnitTest):
+    """
+    Poll 1000 polled jobs that aren't ready, the way a driver polls on each
+    sample, and time interval jobs firing on the timer wheel.
+    """
+    JOBS = 1000
+    POLLS = 100000
+
+    def _callback(self):
+        self._runs += 1
+
+    def _poll(self, run_job):
+        names = ['job_%d' % i for i in range(self.JOBS)]
+        start_time = time.time()
+        for i in xrange(self.POLLS):
+            run_job(names[i % self.JOBS])
+        return self.POLLS / (time.time() - start_time)
+
+    def test_polled_scheduler(self):
+        self._runs = 0
+        scheduler = PolledScheduler()
+        scheduler.start()
+        try:
+            for i in range(self.JOBS):
+                scheduler.add_polled_job(self._callback, 'job_%d' % i,
+                                         PolledScheduler.interval(seconds=3600))
+                scheduler.run_polled_job('job_%d' % i)
+            rate = self._poll(scheduler.run_polled_job)
+        finally:
+            scheduler.shutdown(wait=False)
+
+        log.info("PolledScheduler: %d polls/s with %d jobs", rate, self.JOBS)
+        self.assertEqual(len(scheduler.get_jobs()), self.JOBS)
+
+    def test_timer_wheel(self):
+        self._runs = 0
+        wheel = TimerWheel()
+        wheel.start()
+        try:
+            for i in range(self.JOBS):
+                wheel.add_polled_job(self._callback, 'job_%d' % i, 3600)
+                wheel.run_polled_job('job_%d' % i)
+            rate = self._poll(wheel.run_polled_job)
+        finally:
+            wheel.shutdown()
+
+        log.info("TimerWheel: %d polls/s with %d jobs", rate, self.JOBS)
+        self.assertEqual(self._runs, self.JOBS)
+
+    def test_timer_wheel_intervals(self):
+        """
+        1000 jobs every 0.1 seconds, 10000 runs a second
+        """
+        self._runs = 0
+        wheel = TimerWheel()
+        wheel.start()
+        try:
+            for i in range(self.JOBS):
+                wheel.add_interval_job(self._callback, 'job_%d' % i, 0.1)
+            start_time = time.time()
+            time.sleep(2)
+            rate = self._runs / (time.time() - start_time)
+        finally:
+            wheel.shutdown()
+
+        log.info("TimerWheel: %d interval runs/s with %d jobs every 0.1s, %d expected",
+                 rate, self.JOBS, self.JOBS * 10)
+        self.assertGreater(self._runs, 0)
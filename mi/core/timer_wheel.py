@@ -0,0 +1,345 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.timer_wheel In process timer wheel for short interval jobs
+@file mi/core/timer_wheel.py
+@brief Hashed timer wheel that runs interval and polled jobs on its own thread
+Jobs are kept in a ring of slots, one slot per tick.  Adding, rescheduling
+and removing a job are constant time and each tick only looks at the jobs
+hashed to its slot.  Callbacks are run on the wheel thread rather than
+handed to a thread pool, so they should be short; anything that takes
+longer than a tick delays every other job on the wheel.
+
+Polled jobs work the same as PolledScheduler polled jobs: run_polled_job
+runs the job if the minimum interval has passed since its last run, and
+a job that hasn't run within its maximum interval runs on its own.
+
+Usage:
+
+wheel = TimerWheel()
+wheel.start()
+
+wheel.add_interval_job(some_callback, 'fast_job', 0.25)
+wheel.add_polled_job(other_callback, 'polled_job', 0.5, 2)
+
+wheel.run_polled_job('polled_job')
+"""
+# Needed so we import the time module and not mi.core.time
+from __future__ import absolute_import
+
+__license__ = 'Apache 2.0'
+
+import time
+from threading import Thread, Event, Lock
+from collections import deque
+
+from mi.core.log import get_logger; log = get_logger()
+
+DEFAULT_TICK = 0.01
+DEFAULT_SLOTS = 512
+
+class TimerWheelJob(object):
+    """
+    A job on the timer wheel.  Interval jobs have an interval, polled jobs
+    have a minimum and optionally a maximum interval.  All intervals are in
+    seconds.
+    """
+    def __init__(self, callback, name, interval=None, min_interval=None, max_interval=None):
+        self.callback = callback
+        self.name = name
+        self.interval = interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.runs = 0
+
+        # time of the next timed run and the earliest time a poll can run the job
+        self.deadline = None
+        self.next_min_time = time.time()
+
+        # bumped on reschedule so older slot entries for the job are ignored
+        self.generation = 0
+
+        # only taken when a polled job fires
+        self._lock = Lock()
+
+    def is_polled(self):
+        return self.min_interval is not None
+
+    def __repr__(self):
+        return '<%s (name=%s, interval=%s, min_interval=%s, max_interval=%s)>' % (
+            self.__class__.__name__, self.name, self.interval,
+            self.min_interval, self.max_interval)
+
+class TimerWheel(object):
+    """
+    Hashed timer wheel.  A job due at tick t goes in slot t % slots, ticks
+    further out than one revolution wait in their slot until the wheel
+    gets round to their tick.
+    """
+    def __init__(self, tick=DEFAULT_TICK, slots=DEFAULT_SLOTS):
+        """
+        @param tick: seconds per tick, the resolution of the wheel
+        @param slots: number of slots in the wheel
+        """
+        if(tick <= 0):
+            raise ValueError("tick must be positive")
+        if(slots < 1):
+            raise ValueError("need at least one slot")
+
+        self._tick = float(tick)
+        self._slots = [[] for i in range(slots)]
+        self._jobs = {}
+        self._due = deque()
+        self._timed = 0
+
+        self._lock = Lock()
+        self._wakeup = Event()
+        self._thread = None
+        self._stopped = True
+
+        self._epoch = time.time()
+        self._last_tick = 0
+
+    @property
+    def running(self):
+        return not self._stopped and self._thread is not None and self._thread.isAlive()
+
+    def start(self):
+        """
+        Start the wheel thread
+        """
+        if(self.running):
+            raise RuntimeError("timer wheel already running")
+
+        self._stopped = False
+        self._thread = Thread(target=self._main_loop, name='TimerWheel')
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def shutdown(self, wait=True):
+        """
+        Stop the wheel thread.  Jobs stay on the wheel.
+        @param wait: wait for the wheel thread to finish
+        """
+        if(self._stopped):
+            return
+
+        self._stopped = True
+        self._wakeup.set()
+        if(wait and self._thread):
+            self._thread.join()
+
+    def add_interval_job(self, callback, name, interval):
+        """
+        Run a job every interval seconds
+        @param callback: callable to run
+        @param name: name of the job, unique on the wheel
+        @param interval: seconds between runs
+        @retval the TimerWheelJob
+        @raise ValueError if the interval isn't positive or the name is taken
+        """
+        if(not interval > 0):
+            raise ValueError("interval must be positive")
+
+        job = TimerWheelJob(callback, name, interval=interval)
+        self._add_job(job, time.time() + interval)
+        return job
+
+    def add_polled_job(self, callback, name, min_interval, max_interval=None):
+        """
+        Add a job that runs when polled, at most once per min_interval, and
+        on its own if it hasn't run for max_interval
+        @param callback: callable to run
+        @param name: name of the job, unique on the wheel
+        @param min_interval: minimum seconds between runs
+        @param max_interval: maximum seconds between runs, or None to only run when polled
+        @retval the TimerWheelJob
+        @raise ValueError if the intervals are bad or the name is taken
+        """
+        if(not min_interval > 0):
+            raise ValueError("min_interval must be positive")
+        if(max_interval is not None and min_interval > max_interval):
+            raise ValueError("min_interval < max_interval")
+
+        job = TimerWheelJob(callback, name, min_interval=min_interval, max_interval=max_interval)
+        deadline = None
+        if(max_interval is not None):
+            deadline = time.time() + max_interval
+        self._add_job(job, deadline)
+        return job
+
+    def get_job(self, name):
+        """
+        @param name: name of the job we are looking for
+        @retval the TimerWheelJob with that name or None
+        """
+        return self._jobs.get(name)
+
+    def unschedule_job(self, name):
+        """
+        Take a job off the wheel
+        @param name: name of the job
+        @raise LookupError if there is no job with that name
+        """
+        self._lock.acquire()
+        try:
+            job = self._jobs.pop(name, None)
+            if(job is None):
+                raise LookupError("no job found named '%s'" % name)
+            if(job.deadline is not None):
+                self._timed -= 1
+            job.generation += 1
+            job.deadline = None
+        finally:
+            self._lock.release()
+
+    def run_polled_job(self, name):
+        """
+        Run a polled job on the wheel thread if its minimum interval has
+        passed.  The readiness check doesn't lock, only a job that fires
+        takes a lock.
+        @param name: name of the job
+        @retval True if the job is going to run, False otherwise
+        @raise LookupError if there is no polled job with that name
+        """
+        job = self._jobs.get(name)
+        if(job is None or not job.is_polled()):
+            raise LookupError("no polled job found named '%s'" % name)
+
+        now = time.time()
+        if(now < job.next_min_time):
+            return False
+
+        job._lock.acquire()
+        try:
+            if(now < job.next_min_time):
+                return False
+            self._fired(job, now)
+        finally:
+            job._lock.release()
+
+        self._due.append(job)
+        self._wakeup.set()
+        return True
+
+    def _add_job(self, job, deadline):
+        """
+        Index a job by name and put it on the wheel if it has a deadline
+        """
+        self._lock.acquire()
+        try:
+            if(job.name in self._jobs):
+                raise ValueError("Not adding job since a job named '%s' already exists" % job.name)
+            self._jobs[job.name] = job
+            if(deadline is not None):
+                self._timed += 1
+                self._schedule(job, deadline)
+        finally:
+            self._lock.release()
+
+        self._wakeup.set()
+
+    def _schedule(self, job, deadline):
+        """
+        Put a job in the slot for its deadline.  Called with the wheel lock
+        held.  Never goes in a tick that has already been processed.
+        """
+        job.generation += 1
+        job.deadline = deadline
+        tick = max(int((deadline - self._epoch) / self._tick) + 1, self._last_tick + 1)
+        self._slots[tick % len(self._slots)].append((tick, job, job.generation))
+
+    def _fired(self, job, now):
+        """
+        Record that a polled job fired, pushing out its minimum and maximum
+        times.  Called with the job lock held.
+        """
+        job.next_min_time = now + job.min_interval
+        if(job.max_interval is not None):
+            self._lock.acquire()
+            try:
+                if(self._jobs.get(job.name) is job):
+                    self._schedule(job, now + job.max_interval)
+            finally:
+                self._lock.release()
+
+    def _main_loop(self):
+        while not self._stopped:
+            self._wakeup.clear()
+
+            while self._due:
+                self._run_job(self._due.popleft())
+
+            self._advance(time.time())
+
+            if(self._timed):
+                self._wakeup.wait(self._tick)
+            else:
+                self._wakeup.wait()
+
+    def _advance(self, now):
+        """
+        Process every tick up to now.  After a stall of more than a
+        revolution each slot is still only visited once.
+        """
+        now_tick = int((now - self._epoch) / self._tick)
+        first = max(self._last_tick + 1, now_tick - len(self._slots) + 1)
+
+        for tick in xrange(first, now_tick + 1):
+            slot = self._slots[tick % len(self._slots)]
+            expired = []
+            pending = []
+
+            # _schedule reads _last_tick, so move it on under the lock even
+            # when the slot is empty
+            self._lock.acquire()
+            try:
+                for entry in slot:
+                    (entry_tick, job, generation) = entry
+                    if(generation != job.generation):
+                        continue
+                    if(entry_tick <= now_tick):
+                        expired.append(job)
+                    else:
+                        pending.append(entry)
+                slot[:] = pending
+                self._last_tick = tick
+            finally:
+                self._lock.release()
+
+            for job in expired:
+                self._expired(job, now)
+
+    def _expired(self, job, now):
+        """
+        Handle a job whose deadline has passed
+        """
+        if(job.is_polled()):
+            job._lock.acquire()
+            try:
+                # a poll may have run the job since the slot was read
+                if(now < job.next_min_time):
+                    return
+                self._fired(job, now)
+            finally:
+                job._lock.release()
+        else:
+            # keep to the original schedule unless we have fallen behind it
+            deadline = job.deadline + job.interval
+            if(deadline <= now):
+                deadline = now + job.interval
+            self._lock.acquire()
+            try:
+                if(self._jobs.get(job.name) is job):
+                    self._schedule(job, deadline)
+            finally:
+                self._lock.release()
+
+        self._run_job(job)
+
+    def _run_job(self, job):
+        job.runs += 1
+        try:
+            job.callback()
+        except Exception:
+            log.exception('Job "%s" raised an exception', job.name)
@@ -0,0 +1,64 @@
+"""
+@file mi/idk/scripts/simulator_farm.py
+@brief Run a farm of simulated instruments for driver load testing
+
+    python -m mi.idk.scripts.simulator_farm sbe37=100 nortek=20 --speed 10
+"""
+
+import time
+import argparse
+
+from mi.core.instrument.port_agent_simulator import AS_FAST_AS_POSSIBLE
+from mi.idk.simulator_farm import FORMATS
+from mi.idk.simulator_farm import start_farm
+
+def run():
+    opts = parseArgs()
+    (farm, ports) = start_farm(opts.counts, opts.speed, opts.host, opts.port)
+    for (name, port, cmd_port) in ports:
+        print "%s %s:%d command port %d" % (name, opts.host, port, cmd_port)
+
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        farm.stop()
+
+def _count(value):
+    (name, sep, count) = value.partition('=')
+    if name not in FORMATS:
+        raise argparse.ArgumentTypeError("unknown instrument %s, not one of %s"
+                                         % (name, ', '.join(sorted(FORMATS.keys()))))
+    try:
+        return (name, int(count or 1))
+    except ValueError:
+        raise argparse.ArgumentTypeError("count of %s is not a number" % name)
+
+def _speed(value):
+    if value == 'max':
+        return AS_FAST_AS_POSSIBLE
+    return float(value)
+
+def parseArgs():
+    parser = argparse.ArgumentParser(description="Simulated instruments behind port agent ports")
+    parser.add_argument("instruments", nargs='+', type=_count, metavar="INSTRUMENT=COUNT",
+                        help="simulators to run, instrument one of %s"
+                             % ', '.join(sorted(FORMATS.keys())))
+    parser.add_argument("-s", "--speed", dest='speed', type=_speed, default=1,
+                        help="multiple of the instrument sample rates, or max to send as fast as the drivers read")
+    parser.add_argument("--host", dest='host', default='localhost',
+                        help="address to listen on")
+    parser.add_argument("-p", "--port", dest='port', type=int, default=0,
+                        help="first data port, default any free ports")
+    opts = parser.parse_args()
+
+    opts.counts = {}
+    for (name, count) in opts.instruments:
+        opts.counts[name] = opts.counts.get(name, 0) + count
+    return opts
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+
+"""
+@package mi.idk.simulator_farm
+@file mi/idk/simulator_farm.py
+@brief Simulated SBE37, SBE16, SBE26, Nortek Vector, PAR and ADCP PD0
+instruments for load testing drivers without hardware.
+
+Each format knows the records its instrument streams, how often it sends
+them, its prompt and the commands that start and stop streaming. Records
+are synthesized, except for PD0 where the ensembles recorded in the
+workhorse driver resources are replayed. start_farm runs any mix of them
+in one SimulatorFarm:
+
+    (farm, ports) = start_farm({'sbe37': 100, 'nortek': 20}, speed=10)
+"""
+
+__license__ = 'Apache 2.0'
+
+import os
+import time
+import random
+import struct
+import itertools
+
+from mi.core.log import get_logger ; log = get_logger()
+from mi.core.instrument.port_agent_simulator import SimulatorFarm
+from mi.core.instrument.port_agent_simulator import InstrumentSimulator
+from mi.core.instrument.port_agent_simulator import Exchange
+from mi.core.instrument.port_agent_simulator import recorded_records
+from mi.instrument.nortek.framing import calculate_checksum
+import mi.instrument.teledyne.workhorse_adcp_5_beam_600khz.ooicore.pd0 as pd0
+
+NEWLINE = '\r\n'
+
+# distinct records synthesized per simulator, sent over and over
+RECORD_POOL_SIZE = 100
+
+PD0_SAMPLE = os.path.join(os.path.dirname(pd0.__file__), 'resource', 'pd0_sample.bin')
+
+def _seabird_time(rand, separator=' '):
+    return time.strftime('%d %b %Y' + separator + '%H:%M:%S',
+                         time.gmtime(rand.randint(1300000000, 1400000000)))
+
+def sbe37_record(rand):
+    return '#%8.4f,%9.5f,%9.3f,%9.4f,%9.3f, %s' % (
+        rand.uniform(-2, 35), rand.uniform(0, 7), rand.uniform(0, 600),
+        rand.uniform(30, 38), rand.uniform(1400, 1550),
+        _seabird_time(rand, ', ')) + NEWLINE
+
+def sbe16_record(rand):
+    return '#%8.4f,%9.5f,%9.3f,%9.4f, %s' % (
+        rand.uniform(-2, 35), rand.uniform(0, 7), rand.uniform(0, 600),
+        rand.uniform(30, 38), _seabird_time(rand, ', ')) + NEWLINE
+
+def sbe26_record(rand):
+    return 'tide: start time = %s, p = %8.4f, pt = %7.3f, t = %8.4f' % (
+        _seabird_time(rand), rand.uniform(10, 20), rand.uniform(20, 30),
+        rand.uniform(-2, 35)) + NEWLINE
+
+def par_record(rand):
+    line = 'SATPAR%04d,%.2f,%010d' % (rand.randint(0, 9999),
+                                     rand.uniform(0, 9999999), rand.randint(0, 4000000000))
+    checksum = sum([ord(char) for char in line]) & 0xff
+    return '%s,%d%s' % (line, checksum, NEWLINE)
+
+def _nortek_structure(header, length, rand):
+    body = header + ''.join([chr(rand.randint(0, 255))
+                             for i in range(length - len(header) - 2)])
+    return body + struct.pack('<H', calculate_checksum(body, length))
+
+def nortek_vector_record(rand):
+    """
+    A second of Vector output at 16 Hz: a system data structure and the
+    velocity data structures sampled with it
+    """
+    records = [_nortek_structure('\xa5\x11\x0e\x00', 28, rand)]
+    for count in range(16):
+        records.append(_nortek_structure('\xa5\x10', 24, rand))
+    return ''.join(records)
+
+def pd0_ensembles(filename=PD0_SAMPLE):
+    """
+    @retval list of the whole ensembles in a PD0 recording
+    """
+    data = open(filename, 'rb').read()
+    # bytes 2 and 3 of an ensemble give its length without the checksum
+    (length,) = struct.unpack_from('<H', data, 2)
+    return [record for record in recorded_records(data, size=length + 2)
+            if len(record) == length + 2]
+
+class SimulatedFormat(object):
+    """
+    How one kind of instrument is simulated.
+    """
+    def __init__(self, record, rate, prompt=None, unknown=None, start=None,
+                 stop=None, break_stops=False, terminators=NEWLINE, records=None):
+        """
+        @param record Called with a random.Random, returns a synthesized
+        record
+        @param rate Records per second the instrument sends
+        @param prompt Answer to a wakeup
+        @param unknown Answer to a command the simulator does not know
+        @param start Regex of the command that starts streaming
+        @param stop Regex of the command that stops streaming
+        @param break_stops True if a break stops streaming and gets the
+        prompt
+        @param terminators Characters that end a command, None for binary
+        commands
+        @param records Called with no arguments, returns the recorded
+        records to replay instead of synthesizing them
+        """
+        self.record = record
+        self.rate = rate
+        self.prompt = prompt
+        self.unknown = unknown
+        self.start = start
+        self.stop = stop
+        self.break_stops = break_stops
+        self.terminators = terminators
+        self.records = records
+
+    def build(self, speed=1, exchanges=None, streaming=True, seed=None):
+        """
+        @param speed Multiple of the instrument rate to send records at,
+        AS_FAST_AS_POSSIBLE to send as fast as the driver reads
+        @param exchanges List of Exchange tried before the start and stop
+        commands
+        @param streaming True to stream as soon as a driver connects
+        @param seed Seed of the synthesized records
+        @retval An InstrumentSimulator
+        """
+        if self.records:
+            records = self.records()
+        else:
+            rand = random.Random(seed)
+            records = [self.record(rand) for i in range(RECORD_POOL_SIZE)]
+
+        exchanges = list(exchanges or [])
+        if self.start:
+            exchanges.append(Exchange(self.start, self.prompt or '', start_streaming=True))
+        if self.stop:
+            exchanges.append(Exchange(self.stop, self.prompt or '', stop_streaming=True))
+        break_exchange = None
+        if self.break_stops:
+            break_exchange = Exchange('', self.prompt or '', stop_streaming=True)
+
+        return InstrumentSimulator(itertools.cycle(records), rate=self.rate,
+                                   speed=speed, exchanges=exchanges,
+                                   prompt=self.prompt, unknown=self.unknown,
+                                   break_exchange=break_exchange,
+                                   terminators=self.terminators,
+                                   streaming=streaming)
+
+FORMATS = {
+    'sbe37': SimulatedFormat(sbe37_record, 1, prompt='S>', unknown='?cmd S>',
+                             start='startnow', stop='stop'),
+    'sbe16': SimulatedFormat(sbe16_record, .1, prompt='S>', unknown='?cmd S>',
+                             start='startnow', stop='stop'),
+    'sbe26': SimulatedFormat(sbe26_record, 1 / 60.0, prompt='S>', unknown='? cmd S>',
+                             start='start', stop='stop'),
+    # control characters switch between polled and streaming
+    'par': SimulatedFormat(par_record, 4, prompt='$', terminators=None,
+                           start='\x01', stop='\x13'),
+    # the break is sent as a command in the data
+    'nortek': SimulatedFormat(nortek_vector_record, 1, prompt='\x06\x06', terminators=None,
+                              start='S[RT]', stop='(.*K1W%!Q)|MC'),
+    'pd0': SimulatedFormat(None, 1, prompt='>', start='CS', break_stops=True,
+                           records=pd0_ensembles),
+}
+
+def start_farm(counts, speed=1, host='localhost', port=0):
+    """
+    Start a farm of simulated instruments.
+    @param counts dict of FORMATS name -> number of simulators
+    @param speed Multiple of the instrument rates to send records at,
+    AS_FAST_AS_POSSIBLE to send as fast as the drivers read
+    @param host The address the simulators listen on
+    @param port Data port of the first simulator, its command port is the
+    next one up and so on for the others. 0 for any free ports.
+    @retval (farm, ports) tuple of the started SimulatorFarm and a list of
+    (name, port, cmd_port) tuples, one per simulator
+    """
+    farm = SimulatorFarm(host)
+    ports = []
+    for name in sorted(counts.keys()):
+        simulated_format = FORMATS[name]
+        for index in range(counts[name]):
+            simulator = simulated_format.build(speed, seed=len(ports))
+            if port:
+                data_port = port + 2 * len(ports)
+                (data_port, cmd_port) = farm.add(simulator, data_port, data_port + 1)
+            else:
+                (data_port, cmd_port) = farm.add(simulator)
+            ports.append((name, data_port, cmd_port))
+    farm.start()
+    log.info('Started %d simulated instruments', len(ports))
+    return (farm, ports)
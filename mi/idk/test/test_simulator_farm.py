@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+
+"""
+@package mi.idk.test.test_simulator_farm
+@file mi/idk/test/test_simulator_farm.py
+@brief Check the simulated instruments against the drivers that read them
+"""
+
+__license__ = 'Apache 2.0'
+
+import time
+import random
+
+from nose.plugins.attrib import attr
+
+from mi.core.log import get_logger ; log = get_logger()
+from mi.core.unit_test import MiUnitTest
+from mi.core.instrument.port_agent_client import PortAgentClient
+from mi.idk.simulator_farm import FORMATS
+from mi.idk.simulator_farm import start_farm
+from mi.idk.simulator_farm import pd0_ensembles
+from mi.idk.simulator_farm import sbe37_record
+from mi.idk.simulator_farm import sbe16_record
+from mi.idk.simulator_farm import sbe26_record
+from mi.idk.simulator_farm import par_record
+from mi.idk.simulator_farm import nortek_vector_record
+
+from mi.instrument.seabird.sbe37smb.ooicore.driver import SBE37Protocol
+from mi.instrument.seabird.sbe16plus_v2.ooicore.driver import SBE16Protocol
+from mi.instrument.seabird.sbe26plus.driver import Protocol as SBE26Protocol
+from mi.instrument.satlantic.par_ser_600m.driver import SatlanticPARInstrumentProtocol
+from mi.instrument.satlantic.par_ser_600m.driver import SatlanticChecksumDecorator
+from mi.instrument.nortek.vector.ooicore.driver import Protocol as VectorProtocol
+from mi.instrument.teledyne.workhorse_adcp_5_beam_600khz.ooicore.pd0 import PD0DataStructure
+
+def assert_sieved(test, sieve_function, record, count=1):
+    """
+    Check a record is count blocks back to back, followed by nothing but
+    the line ending the sieve leaves out
+    """
+    blocks = sieve_function(record)
+    test.assertEqual(len(blocks), count)
+    end = 0
+    for (start, block_end) in blocks:
+        test.assertEqual(start, end)
+        end = block_end
+    test.assertEqual(record[end:].strip(), '')
+
+@attr('UNIT', group='mi')
+class TestSimulatedFormats(MiUnitTest):
+    """
+    Synthesized records are whole samples to the driver sieves
+    """
+    def test_seabird(self):
+        rand = random.Random(1)
+        for i in range(20):
+            assert_sieved(self, SBE37Protocol.sieve_function, sbe37_record(rand))
+            assert_sieved(self, SBE16Protocol.sieve_function, sbe16_record(rand))
+            assert_sieved(self, SBE26Protocol.sieve_function, sbe26_record(rand))
+
+    def test_par(self):
+        rand = random.Random(1)
+        checksum = SatlanticChecksumDecorator()
+        for i in range(20):
+            record = par_record(rand)
+            assert_sieved(self, SatlanticPARInstrumentProtocol.sieve_function, record)
+            self.assertTrue(checksum._checksum_ok(record))
+
+    def test_nortek(self):
+        """
+        A system structure and 16 velocity structures, all checksummed
+        """
+        rand = random.Random(1)
+        for i in range(20):
+            assert_sieved(self, VectorProtocol.sieve_function, nortek_vector_record(rand), 17)
+
+    def test_pd0(self):
+        ensembles = pd0_ensembles()
+        self.assertTrue(ensembles)
+        for ensemble in ensembles:
+            PD0DataStructure(ensemble)
+
+    def test_build(self):
+        """
+        Each format streams its records and answers its prompt
+        """
+        for (name, simulated_format) in FORMATS.items():
+            simulator = simulated_format.build(seed=1)
+            self.assertTrue(simulator.next_record(), name)
+
+@attr('UNIT', group='mi')
+class TestStartFarm(MiUnitTest):
+    def test_start_farm(self):
+        (farm, ports) = start_farm({'sbe37': 3, 'par': 2}, speed=10)
+        self.addCleanup(farm.stop)
+        self.assertEqual([name for (name, port, cmd_port) in ports],
+                         ['par', 'par', 'sbe37', 'sbe37', 'sbe37'])
+
+        (name, port, cmd_port) = ports[-1]
+        packets = []
+        client = PortAgentClient('localhost', port, cmd_port)
+        client.init_comms(packets.append)
+        self.addCleanup(client.stop_comms)
+        end_time = time.time() + 5
+        while len(packets) < 3 and time.time() < end_time:
+            time.sleep(.01)
+        self.assert_(len(packets) >= 3)
+        for paPacket in packets:
+            assert_sieved(self, SBE37Protocol.sieve_function, paPacket.get_data())
@@ -27,6 +27,7 @@ from mi.core.instrument.instrument_driver import DriverEvent
 from mi.core.instrument.instrument_driver import DriverAsyncEvent
 from mi.core.instrument.instrument_driver import DriverProtocolState
 from mi.core.instrument.instrument_driver import DriverParameter
+from mi.core.instrument.instrument_driver import DriverConfigKey
 from mi.core.instrument.instrument_driver import ResourceAgentState
 from mi.core.exceptions import InstrumentTimeoutException, \
                                InstrumentParameterException, \
@@ -38,6 +39,9 @@ from mi.core.instrument.protocol_param_dict import ParameterDictVisibility
 from mi.core.instrument.protocol_param_dict import ParameterDictVal
 from mi.core.instrument.protocol_param_dict import ProtocolParameterDict
 from mi.core.instrument.chunker import StringChunker
+from mi.instrument.nortek.framing import StructureSieve
+from mi.instrument.nortek.framing import StructureType
+from mi.instrument.nortek.framing import calculate_checksum
 from mi.core.instrument.data_particle import DataParticle, DataParticleKey, DataParticleValue, CommonDataParticleType
 
 
@@ -65,12 +69,13 @@ DIAGNOSTIC_DATA_HEADER_LEN = 36
 DIAGNOSTIC_DATA_HEADER_SYNC_BYTES = '\xa5\x06\x12\x00'
 DIAGNOSTIC_DATA_LEN = 42
 DIAGNOSTIC_DATA_SYNC_BYTES = '\xa5\x80\x15\x00'
-CHECK_SUM_SEED = 0xb58c
 FAT_LENGTH = 512
 
-sample_structures = [[VELOCITY_DATA_SYNC_BYTES, VELOCITY_DATA_LEN],
-                     [DIAGNOSTIC_DATA_SYNC_BYTES, VELOCITY_DATA_LEN],
-                     [DIAGNOSTIC_DATA_HEADER_SYNC_BYTES, DIAGNOSTIC_DATA_HEADER_LEN]]
+# chunk tags for the sample structures
+class StructureTag(BaseEnum):
+    VELOCITY = 'velocity'
+    DIAGNOSTIC = 'diagnostic'
+    DIAGNOSTIC_HEADER = 'diagnostic_header'
 
 VELOCITY_DATA_PATTERN = r'^%s(.{6})(.{2})(.{2})(.{2})(.{2})(.{2})(.{2})(.{2})(.{1})(.{1})(.{2})(.{2})(.{2})(.{2})(.{2})(.{1})(.{1})(.{1})(.{3})' % VELOCITY_DATA_SYNC_BYTES
 VELOCITY_DATA_REGEX = re.compile(VELOCITY_DATA_PATTERN, re.DOTALL)
@@ -505,13 +510,7 @@ class BinaryProtocolParameterDict(ProtocolParameterDict):
     
     @staticmethod
     def calculate_checksum(input, length):
-        #log.debug("calculate_checksum: input=%s, length=%d", input.encode('hex'), length)
-        calculated_checksum = CHECK_SUM_SEED
-        for word_index in range(0, length-2, 2):
-            word_value = BinaryProtocolParameterDict.convert_word_to_int(input[word_index:word_index+2])
-            calculated_checksum = (calculated_checksum + word_value) % 0x10000
-            #log.debug('w_i=%d, c_c=%d' %(word_index, calculated_checksum))
-        return calculated_checksum
+        return calculate_checksum(input, length)
 
     @staticmethod
     def convert_time(response):
@@ -989,26 +988,24 @@ class Protocol(CommandResponseInstrumentProtocol):
         self._build_param_dict()
 
         # create chunker for processing instrument samples.
-        self._chunker = StringChunker(Protocol.chunker_sieve_function)
+        self._chunker = StringChunker(Protocol.sieve_function)
+        self._add_particle_handler(StructureTag.VELOCITY, AquadoppDwVelocityDataParticle)
+        self._add_particle_handler(StructureTag.DIAGNOSTIC, AquadoppDwDiagnosticDataParticle)
+        self._add_particle_handler(StructureTag.DIAGNOSTIC_HEADER, AquadoppDwDiagnosticHeaderDataParticle)
+
+    sieve_function = StructureSieve([
+        StructureType(VELOCITY_DATA_SYNC_BYTES[1], VELOCITY_DATA_LEN,
+                      name=StructureTag.VELOCITY),
+        StructureType(DIAGNOSTIC_DATA_SYNC_BYTES[1], DIAGNOSTIC_DATA_LEN,
+                      name=StructureTag.DIAGNOSTIC),
+        StructureType(DIAGNOSTIC_DATA_HEADER_SYNC_BYTES[1], DIAGNOSTIC_DATA_HEADER_LEN,
+                      name=StructureTag.DIAGNOSTIC_HEADER)])
 
     @staticmethod
     def chunker_sieve_function(raw_data):
         """ The method that detects data sample structures from instrument
         """
-        return_list = []
-        
-        for structure_sync, structure_len in sample_structures:
-            start = raw_data.find(structure_sync)
-            if start != -1:    # found a sync pattern
-                if start+structure_len <= len(raw_data):    # only check the CRC if all of the structure has arrived
-                    calculated_checksum = BinaryProtocolParameterDict.calculate_checksum(raw_data[start:start+structure_len], structure_len)
-                    #log.debug('chunker_sieve_function: calculated checksum = %s' % calculated_checksum)
-                    sent_checksum = BinaryProtocolParameterDict.convert_word_to_int(raw_data[start+structure_len-2:start+structure_len])
-                    if sent_checksum == calculated_checksum:
-                        return_list.append((start, start+structure_len))        
-                        #log.debug("chunker_sieve_function: found %s", raw_data[start:start+structure_len].encode('hex'))
-                
-        return return_list
+        return Protocol.sieve_function(raw_data)
     
     def _filter_capabilities(self, events):
         """
@@ -1032,6 +1029,8 @@ class Protocol(CommandResponseInstrumentProtocol):
         log.debug("set_init_params: config=%s" %config)
         if not isinstance(config, dict):
             raise InstrumentParameterException("Invalid init config format")
+
+        self._configure_raw_publishing(config)
                 
         if DriverParameter.ALL in config:
             binary_config = base64.b64decode(config[DriverParameter.ALL])
@@ -1048,6 +1047,8 @@ class Protocol(CommandResponseInstrumentProtocol):
                 raise InstrumentParameterException("configuration not the correct length")
         else:
             for name in config.keys():
+                if name == DriverConfigKey.RAW_PUBLISHING:
+                    continue
                 self._param_dict.set_init_value(name, config[name])
     
     def _got_chunk(self, structure):
@@ -1926,11 +1927,8 @@ class Protocol(CommandResponseInstrumentProtocol):
             log.debug('_create_set_output: adding %s to list' %name)
             output += parameters.format_parameter(name)
         
-        checksum = CHECK_SUM_SEED
-        for word_index in range(0, len(output), 2):
-            word_value = BinaryProtocolParameterDict.convert_word_to_int(output[word_index:word_index+2])
-            checksum = (checksum + word_value) % 0x10000
-            #log.debug('w_i=%d, c_c=%d' %(word_index, calculated_checksum))
+        # the checksum word is not there yet
+        checksum = calculate_checksum(output, len(output) + 2)
         log.debug('_create_set_output: user checksum = %s' % checksum)
 
         output += BinaryProtocolParameterDict.word_to_string(checksum)
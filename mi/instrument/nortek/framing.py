@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+
+"""
+@package mi.instrument.nortek.framing
+@file mi/instrument/nortek/framing.py
+@brief Checksums and chunker framing for Nortek binary structures.
+
+Every Nortek structure starts with the sync byte 0xA5 and an id byte, and
+most follow them with their size in 16 bit words. The last word is a
+checksum: the sum of all the words before it plus CHECK_SUM_SEED, modulo
+0x10000. All words are little endian.
+"""
+
+__license__ = 'Apache 2.0'
+
+import sys
+from array import array
+
+from mi.core.instrument.chunker import ResumableSieve
+
+SYNC_BYTE = '\xa5'
+CHECK_SUM_SEED = 0xb58c
+
+# sync, id and size
+HEADER_LEN = 4
+
+def calculate_checksum(data, length=None):
+    """
+    Calculate the checksum of a structure.
+    @param data The structure, starting with its sync byte
+    @param length Length of the structure including its checksum word,
+        None for all of data
+    @retval The checksum of the words before the checksum word
+    """
+    if length is None:
+        length = len(data)
+    words = array('H', data[:length-2])
+    if sys.byteorder == 'big':
+        words.byteswap()
+    return (CHECK_SUM_SEED + sum(words)) % 0x10000
+
+def checksum_ok(structure):
+    """
+    Check the checksum carried in the last word of a structure
+    @param structure The whole structure including its sync byte
+    @retval True if the checksum matches the structure
+    """
+    length = len(structure)
+    sent_checksum = ord(structure[length-2]) + 0x100 * ord(structure[length-1])
+    return sent_checksum == calculate_checksum(structure, length)
+
+class StructureType(object):
+    """
+    What the sieve knows about one kind of structure.
+    """
+    def __init__(self, structure_id, length, name=None, sized=True):
+        """
+        @param structure_id The id byte following the sync byte
+        @param length Length of the structure in bytes, checksum included
+        @param name Tag for the structures of this type
+        @param sized False if the structure has no size word after its id,
+            like Vector velocity data
+        """
+        self.structure_id = structure_id
+        self.length = length
+        self.name = name
+        self.sized = sized
+
+class StructureSieve(ResumableSieve):
+    """
+    Frames Nortek structures in one walk over the buffer. At each sync byte
+    the id picks the structure type, the size word has to agree with it,
+    and a structure that has arrived in full is kept if its checksum is
+    good. Otherwise the walk moves on to the next sync byte. All the good
+    structures are returned, however many of a type are in the buffer.
+    """
+    def __init__(self, structure_types):
+        """
+        @param structure_types List of StructureType
+        """
+        self._types = {}
+        self._sizes = {}
+        for structure_type in structure_types:
+            self._types[structure_type.structure_id] = structure_type
+            if structure_type.sized:
+                words = structure_type.length / 2
+                self._sizes[structure_type.structure_id] = \
+                    chr(words & 0xff) + chr(words >> 8)
+        self._max_length = max([t.length for t in structure_types])
+
+    def scan_tagged(self, raw_data, cursor):
+        """
+        Like scan, but each block is a (start_index, end_index, name) tuple
+        @param raw_data The unsettled part of the buffer
+        @param cursor Index into raw_data of the first new byte
+        @retval A (data_list, settled_index) tuple, see ResumableSieve.scan
+        """
+        data_len = len(raw_data)
+        return_list = []
+        # the first structure that may still be arriving
+        settled = data_len
+
+        # a structure finishing in the new bytes starts this far back at most
+        pos = raw_data.find(SYNC_BYTE, max(0, cursor - self._max_length + 1))
+        while pos != -1:
+            if pos + 2 > data_len:
+                # the id has not arrived
+                settled = min(settled, pos)
+                break
+
+            structure_type = self._types.get(raw_data[pos+1])
+            if structure_type is not None:
+                end = pos + structure_type.length
+                size = self._sizes.get(structure_type.structure_id)
+                if size is not None and not size.startswith(raw_data[pos+2:pos+HEADER_LEN]):
+                    # not a structure of this type
+                    pass
+                elif end > data_len:
+                    # the rest of the structure has not arrived
+                    settled = min(settled, pos)
+                elif checksum_ok(raw_data[pos:end]):
+                    return_list.append((pos, end, structure_type.name))
+                    pos = raw_data.find(SYNC_BYTE, end)
+                    continue
+
+            pos = raw_data.find(SYNC_BYTE, pos + 1)
+
+        return (return_list, settled)
+
+    def scan(self, raw_data, cursor):
+        (data_list, settled) = self.scan_tagged(raw_data, cursor)
+        return ([(start, end) for (start, end, name) in data_list], settled)
@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+
+"""
+@package mi.instrument.nortek.test.test_framing
+@file mi/instrument/nortek/test/test_framing.py
+@brief Test cases for the shared Nortek checksum and structure framing
+"""
+
+__license__ = 'Apache 2.0'
+
+import time
+import random
+import struct
+
+from nose.plugins.attrib import attr
+
+from mi.core.log import get_logger ; log = get_logger()
+from mi.core.unit_test import MiUnitTest
+from mi.core.instrument.chunker import StringChunker
+from mi.core.instrument.chunker import RegexSieve
+from mi.core.instrument.chunker import SyncMatcher
+from mi.instrument.nortek.framing import CHECK_SUM_SEED
+from mi.instrument.nortek.framing import calculate_checksum
+from mi.instrument.nortek.framing import checksum_ok
+from mi.instrument.nortek.vector.ooicore.driver import Protocol
+from mi.instrument.nortek.vector.ooicore.driver import StructureTag
+from mi.instrument.nortek.vector.ooicore.driver import VELOCITY_DATA_SYNC_BYTES
+from mi.instrument.nortek.vector.ooicore.driver import VELOCITY_DATA_LEN
+from mi.instrument.nortek.vector.ooicore.driver import SYSTEM_DATA_SYNC_BYTES
+from mi.instrument.nortek.vector.ooicore.driver import SYSTEM_DATA_LEN
+from mi.instrument.nortek.vector.ooicore.driver import VELOCITY_HEADER_DATA_SYNC_BYTES
+from mi.instrument.nortek.vector.ooicore.driver import VELOCITY_HEADER_DATA_LEN
+
+def word_checksum(data):
+    """
+    The checksum the way the drivers used to add it up, a word at a time
+    """
+    checksum = CHECK_SUM_SEED
+    for index in range(0, len(data) - 2, 2):
+        checksum = (checksum + ord(data[index]) + 0x100 * ord(data[index+1])) % 0x10000
+    return checksum
+
+def make_structure(sync, length, rand):
+    """
+    Build a structure with random contents and a good checksum
+    @param sync The sync bytes the structure starts with
+    @param length Length of the structure, checksum included
+    @param rand The random.Random to fill it from
+    """
+    body = sync + ''.join([chr(rand.randint(0, 255)) for i in range(length - len(sync) - 2)])
+    return body + struct.pack('<H', calculate_checksum(body, length))
+
+def velocity(rand):
+    return make_structure(VELOCITY_DATA_SYNC_BYTES, VELOCITY_DATA_LEN, rand)
+
+def system(rand):
+    return make_structure(SYSTEM_DATA_SYNC_BYTES, SYSTEM_DATA_LEN, rand)
+
+def velocity_header(rand):
+    return make_structure(VELOCITY_HEADER_DATA_SYNC_BYTES, VELOCITY_HEADER_DATA_LEN, rand)
+
+def drain(chunker):
+    """
+    @retval list of (tag, structure) the chunker has ready
+    """
+    found = []
+    while True:
+        block = chunker.get_next_data(tagged=True)
+        if block is None:
+            return found
+        found.append(block)
+
+@attr('UNIT', group='mi')
+class TestFraming(MiUnitTest):
+    def setUp(self):
+        self.rand = random.Random(17)
+
+    def test_checksum(self):
+        """
+        The checksum matches adding the words up one at a time
+        """
+        for length in (2, 4, 24, 42, 512):
+            data = ''.join([chr(self.rand.randint(0, 255)) for i in range(length)])
+            self.assertEqual(calculate_checksum(data), word_checksum(data))
+            self.assertEqual(calculate_checksum(data + 'xx', length), word_checksum(data))
+
+        structure = velocity_header(self.rand)
+        self.assertTrue(checksum_ok(structure))
+        self.assertFalse(checksum_ok(structure[:-1] + chr(ord(structure[-1]) ^ 1)))
+
+    def test_same_type(self):
+        """
+        Every structure in a buffer is found, several of a type included,
+        and tagged with its type
+        """
+        structures = [velocity_header(self.rand), velocity(self.rand), velocity(self.rand),
+                      system(self.rand), velocity(self.rand), velocity(self.rand)]
+        data = 'noise\xa5' + ''.join(structures) + '\xa5\x10'
+        (found, settled) = Protocol.sieve_function.scan_tagged(data, 0)
+
+        self.assertEqual([data[start:end] for (start, end, name) in found], structures)
+        self.assertEqual([name for (start, end, name) in found],
+                         [StructureTag.VELOCITY_HEADER, StructureTag.VELOCITY,
+                          StructureTag.VELOCITY, StructureTag.SYSTEM,
+                          StructureTag.VELOCITY, StructureTag.VELOCITY])
+        # the velocity data that has only started is not settled
+        self.assertEqual(settled, len(data) - 2)
+        self.assertEqual(Protocol.chunker_sieve_function(data),
+                         [(start, end) for (start, end, name) in found])
+
+    def test_bad_structures(self):
+        """
+        Structures with a bad checksum or size are skipped, as are sync
+        bytes that do not start a structure
+        """
+        good = system(self.rand)
+        bad_checksum = system(self.rand)[:-1] + '\x00'
+        if checksum_ok(bad_checksum):
+            bad_checksum = bad_checksum[:-1] + '\x01'
+        bad_size = SYSTEM_DATA_SYNC_BYTES[:2] + '\x0f' + good[3:]
+        data = bad_checksum + bad_size + '\xa5\xa5\xff' + good
+        (found, settled) = Protocol.sieve_function.scan(data, 0)
+        self.assertEqual(found, [(len(data) - len(good), len(data))])
+        self.assertEqual(settled, len(data))
+
+    def test_fragments(self):
+        """
+        Structures arriving in pieces through the chunker come out whole
+        and in order
+        """
+        structures = []
+        for i in range(20):
+            structures.append(velocity(self.rand))
+            if i % 8 == 0:
+                structures.append(system(self.rand))
+        data = velocity_header(self.rand) + ''.join(structures)
+
+        chunker = StringChunker(Protocol.sieve_function)
+        found = []
+        pos = 0
+        while pos < len(data):
+            size = self.rand.randint(1, 30)
+            chunker.add_chunk(data[pos:pos+size])
+            found.extend(drain(chunker))
+            pos += size
+
+        self.assertEqual(''.join([structure for (tag, structure) in found]), data)
+        self.assertEqual(found[0][0], StructureTag.VELOCITY_HEADER)
+        self.assertEqual(len(found), len(structures) + 1)
+
+@attr('BENCHMARK', group='mi')
+class BenchmarkFraming(MiUnitTest):
+    """
+    Structures framed per second from a synthetic Vector burst at 64 Hz,
+    one structure per port agent packet, by the regex sieve that looked
+    for each sync pattern with a checksum added up a word at a time, and
+    by the structure sieve.
+    """
+    SAMPLE_RATE = 64
+    BURST_SECONDS = 60
+
+    def _burst(self):
+        rand = random.Random(64)
+        structures = [velocity_header(rand)]
+        for second in range(self.BURST_SECONDS):
+            structures.append(system(rand))
+            for sample in range(self.SAMPLE_RATE):
+                structures.append(velocity(rand))
+        return structures
+
+    def _rate(self, sieve, structures):
+        chunker = StringChunker(sieve)
+        count = 0
+        start_time = time.time()
+        for structure in structures:
+            chunker.add_chunk(structure)
+            while chunker.get_next_data() is not None:
+                count += 1
+        rate = count / (time.time() - start_time)
+        self.assertEqual(count, len(structures))
+        return rate
+
+    def test_burst_rate(self):
+        structures = self._burst()
+        word_checksum_ok = lambda structure: \
+            word_checksum(structure) == struct.unpack('<H', structure[-2:])[0]
+        regex_sieve = RegexSieve([
+            SyncMatcher(VELOCITY_DATA_SYNC_BYTES, VELOCITY_DATA_LEN, checksum=word_checksum_ok),
+            SyncMatcher(SYSTEM_DATA_SYNC_BYTES, SYSTEM_DATA_LEN, checksum=word_checksum_ok),
+            SyncMatcher(VELOCITY_HEADER_DATA_SYNC_BYTES, VELOCITY_HEADER_DATA_LEN,
+                        checksum=word_checksum_ok)])
+
+        rates = [('regex sieve', self._rate(regex_sieve, structures)),
+                 ('structure sieve', self._rate(Protocol.sieve_function, structures))]
+        for (name, rate) in rates:
+            log.info("64 Hz burst, %s: %d structures/s", name, rate)
+
+        data = ''.join(structures)
+        start_time = time.time()
+        found = Protocol.chunker_sieve_function(data)
+        log.info("64 Hz burst in one buffer: %d structures/s",
+                 len(found) / (time.time() - start_time))
+        self.assertEqual(len(found), len(structures))
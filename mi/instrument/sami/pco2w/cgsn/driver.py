@@ -16,7 +16,11 @@ __author__ = 'Chris Center'
 __license__ = 'Apache 2.0'
 
 import re
+import sys
 import string
+import struct
+import binascii
+from array import array
 
 from mi.core.log import get_logger ; log = get_logger()
 
@@ -33,6 +37,9 @@ from mi.core.instrument.data_particle import DataParticle
 from mi.core.instrument.data_particle import DataParticleKey
 from mi.core.instrument.data_particle import CommonDataParticleType
 from mi.core.instrument.chunker import StringChunker
+from mi.core.instrument.chunker import RegexSieve
+from mi.core.instrument.chunker import SieveMatcher
+from mi.core.exceptions import SampleException
 
 # newline.
 NEWLINE = '\r\n'
@@ -64,6 +71,20 @@ RECORD_CTRL_START  = 0x81  # Start - The measurement sequence has started.
 RECORD_CTRL_SHUTDOWN = 0x83 # Good Shutdown.
 RECORD_CTRL_RTS_ENABLE = 0x85  # RTS Handshake is on.
 
+RECORD_DATA_TYPES = (RECORD_DATA_PH, RECORD_DATA_SAMI_CO2, RECORD_DATA_BLANK)
+
+# A record is hex for its unique id, length, type and time, followed for data
+# records by the light measurements, battery voltage and thermistor, and last
+# a checksum. The length counts the bytes from itself to the checksum.
+RECORD_HEADER = struct.Struct('>BBBI')
+RECORD_DATA_TRAILER = struct.Struct('>HHB')
+
+# A record on a line of its own, as in a dump of stored records
+RECORD_LINE_REGEX = re.compile(r'^\*[0-9A-Fa-f]+\r?$', re.MULTILINE)
+
+# Seconds from the SAMI epoch, 1904-01-01, to the NTP one, 1900-01-01
+SAMI_TO_NTP = 1460 * 24 * 60 * 60
+
 ###
 #    Driver Constant Definitions
 ###
@@ -165,17 +186,30 @@ class Prompt(BaseEnum):
     CONFIG_COMMAND = 'L'
     CONFIRMATION_PROMPT = 'proceed Y/N ?'
 
-# Common utilities.    
-def calc_crc(s, num_points):
-    cs = 0
-    k = 0
-    for i in range(num_points):
-#        print("I= " + str(i) + " " + s[k:k+2] )
-        value = int(s[k:k+2],16)  # 2-chars per data point
-        cs = cs + value
-        k = k + 2
-    cs = cs & 0xFF        
-    return(cs)
+# Common utilities.
+def calc_crc(data):
+    """
+    Checksum of the bytes of a record
+    @param data The binary bytes the checksum covers
+    @retval The low byte of their sum
+    """
+    return sum(bytearray(data)) & 0xFF
+
+def unhexlify_record(raw_data, prefix=''):
+    """
+    Turn the hex of a record into its binary bytes in one go
+    @param raw_data The record as it arrived, line ending and all
+    @param prefix Character marking the record that is not part of its hex
+    @retval The binary bytes of the record
+    @throws SampleException if the record is not hex
+    """
+    hex_data = raw_data.strip()
+    if not hex_data.startswith(prefix):
+        raise SampleException("Record does not start with %s: [%s]" % (prefix, raw_data))
+    try:
+        return binascii.unhexlify(hex_data[len(prefix):])
+    except TypeError:
+        raise SampleException("Record is not hex: [%s]" % raw_data)
 
 ###############################################################################
 # Data Particles
@@ -190,6 +224,89 @@ class SamiRecordDataParticleKey(BaseEnum):
     THERMISTER_RAW = 'thermister_raw'
     CHECKSUM = 'checksum'
 
+# Order of the record particle values
+RECORD_VALUE_KEYS = [SamiRecordDataParticleKey.UNIQUE_ID,
+                     SamiRecordDataParticleKey.RECORD_LENGTH,
+                     SamiRecordDataParticleKey.RECORD_TYPE,
+                     SamiRecordDataParticleKey.RECORD_TIME,
+                     SamiRecordDataParticleKey.VOLTAGE_BATTERY,
+                     SamiRecordDataParticleKey.THERMISTER_RAW,
+                     SamiRecordDataParticleKey.CHECKSUM,
+                     SamiRecordDataParticleKey.LIGHT_MEASUREMENT]
+
+def decode_record(raw_data):
+    """
+    Decode a record with one unhexlify and the record structs.
+    @param raw_data The record, starting with its '*'
+    @retval A dict of the record values keyed by SamiRecordDataParticleKey.
+        Control records have no light measurements, battery voltage or
+        thermistor.
+    @throws SampleException if the record is malformed or its checksum is bad
+    """
+    data = unhexlify_record(raw_data, '*')
+    if len(data) < RECORD_HEADER.size + 1:
+        raise SampleException("Record too short: [%s]" % raw_data)
+
+    (unique_id, record_length, record_type, record_time) = RECORD_HEADER.unpack_from(data)
+    if len(data) != record_length + 1:
+        raise SampleException("Record length %d does not match its %d bytes: [%s]" %
+                              (record_length, len(data) - 1, raw_data))
+    checksum = ord(data[-1])
+    if calc_crc(data[1:-1]) != checksum:
+        raise SampleException("Checksum failed for record: [%s]" % raw_data)
+
+    light_measurements = []
+    voltage_battery = None
+    thermister_raw = None
+    if record_type in RECORD_DATA_TYPES:
+        trailer = len(data) - RECORD_DATA_TRAILER.size
+        if trailer < RECORD_HEADER.size or (trailer - RECORD_HEADER.size) % 2:
+            raise SampleException("Bad data record length: [%s]" % raw_data)
+        measurements = array('H', data[RECORD_HEADER.size:trailer])
+        if sys.byteorder == 'little':
+            measurements.byteswap()
+        light_measurements = measurements.tolist()
+        (voltage_battery, thermister_raw, checksum) = RECORD_DATA_TRAILER.unpack_from(data, trailer)
+
+    return {SamiRecordDataParticleKey.UNIQUE_ID: unique_id,
+            SamiRecordDataParticleKey.RECORD_LENGTH: record_length,
+            SamiRecordDataParticleKey.RECORD_TYPE: record_type,
+            SamiRecordDataParticleKey.RECORD_TIME: record_time,
+            SamiRecordDataParticleKey.LIGHT_MEASUREMENT: light_measurements,
+            SamiRecordDataParticleKey.VOLTAGE_BATTERY: voltage_battery,
+            SamiRecordDataParticleKey.THERMISTER_RAW: thermister_raw,
+            SamiRecordDataParticleKey.CHECKSUM: checksum}
+
+def decode_record_dump(dump):
+    """
+    Turn a dump of stored records, such as the records read off a SAMI after
+    recovery, into particles in one pass. Every record is decoded once, as
+    its particle is generated, and records that do not decode are skipped.
+    The particles prefer the record time as their timestamp, since the port
+    timestamps of a dump say nothing about when the records were taken.
+    @param dump Records one per line, other lines are ignored
+    @retval A list of SamiRecordDataParticle, already generated
+    """
+    particles = []
+    skipped = 0
+    for match in RECORD_LINE_REGEX.finditer(dump):
+        record = match.group()
+        try:
+            header = unhexlify_record(record[:1 + 2 * RECORD_HEADER.size], '*')
+            record_time = RECORD_HEADER.unpack(header)[3]
+            particle = SamiRecordDataParticle(record,
+                                              internal_timestamp=float(record_time + SAMI_TO_NTP),
+                                              preferred_timestamp=DataParticleKey.INTERNAL_TIMESTAMP)
+            particle.generate_dict()
+        except (SampleException, struct.error):
+            skipped += 1
+            continue
+        particles.append(particle)
+
+    if skipped:
+        log.warn("Skipped %d bad records in a dump of %d", skipped, skipped + len(particles))
+    return particles
+
 class SamiRecordDataParticle(DataParticle):
     """
     Routines for parsing raw data into a data particle structure. Override
@@ -198,94 +315,10 @@ class SamiRecordDataParticle(DataParticle):
     _data_particle_type = DataParticleType.RECORD_PARSED
 
     def _build_parsed_values(self):
-        # Restore the first character we removed for recognition.
-        regex1 = RECORD_TYPE4_REGEX_MATCHER
-        
-        match = regex1.match(self.raw_data)
-        if not match:
-            raise SampleException("No regex match of parsed Record Type4 data: [%s]" % self.raw_data)
-
-        unique_id = None
-        record_length = None        
-        record_time = None
-        record_type = None
-        pt_light_measurements = []
-        voltage_battery = None
-        thermister_raw = None
-        checksum = None
-
-        # Decode Time Stamp since Launch       
-        txt = match.group(1)
-        unique_id = int(txt,16)
-        
-        txt = match.group(2)
-        record_length = int(txt,16)
-
-        txt = match.group(3)    
-        record_type = int(txt, 16)
-
-        txt = match.group(4)    
-        record_time = int(txt, 16)
-
-        # Record Type #4,#5 have a length of 39 bytes, time & trailing checksum.
-        if( (record_type == RECORD_DATA_PH) | \
-            (record_type == RECORD_DATA_SAMI_CO2) | \
-            (record_type == RECORD_DATA_BLANK) ):
-            
-            # Compute now many 8-bit data bytes we have.
-            data_length = record_length
-            data_length = data_length - 6  # Adjust for type, 4-bytes of time.
-            data_length = data_length - 5  # Adjust for battery, thermister, cs
-            num_measurements = data_length / 2  # 2-bytes per record.
-        
-            # Start extracting measurements from this string position
-            idx = 15
-            for i in range(num_measurements):
-                txt = self.raw_data[idx:idx+4]
-                val = int(txt, 16)
-                pt_light_measurements.append(val)
-                idx = idx + 4;            
-                
-            txt = self.raw_data[idx:idx+3]
-            voltage_battery = int(txt, 16)
-            idx = idx + 4
-            
-            txt = self.raw_data[idx:idx+3]
-            thermister_raw = int(txt, 16) 
-            idx = idx + 4
-    
-            txt = self.raw_data[idx:idx+2]
-            checksum = int(txt, 16)
-    
-            # Compute the checksum now that we have the record length.
-            # Skip over the ID character and the 1st byte (+3)
-            cs = 0
-            cs_num_bytes = record_length - 1
-            k = 3
-            for i in range(cs_num_bytes):
-                j = int(self.raw_data[k:k+2],16)
-                cs = (cs + j)
-                k = k + 2
-            cs = cs & 0xFF        
-            
-        result = [{DataParticleKey.VALUE_ID: SamiRecordDataParticleKey.UNIQUE_ID,
-                   DataParticleKey.VALUE: unique_id},
-                  {DataParticleKey.VALUE_ID: SamiRecordDataParticleKey.RECORD_LENGTH,
-                   DataParticleKey.VALUE: record_length},                  
-                  {DataParticleKey.VALUE_ID: SamiRecordDataParticleKey.RECORD_TYPE,
-                   DataParticleKey.VALUE: record_type},
-                  {DataParticleKey.VALUE_ID: SamiRecordDataParticleKey.RECORD_TIME,
-                   DataParticleKey.VALUE: record_time},
-                  {DataParticleKey.VALUE_ID: SamiRecordDataParticleKey.VOLTAGE_BATTERY,
-                   DataParticleKey.VALUE: voltage_battery},
-                  {DataParticleKey.VALUE_ID: SamiRecordDataParticleKey.THERMISTER_RAW,
-                   DataParticleKey.VALUE: thermister_raw},
-                  {DataParticleKey.VALUE_ID: SamiRecordDataParticleKey.CHECKSUM,
-                   DataParticleKey.VALUE: checksum},
-                  {DataParticleKey.VALUE_ID: SamiRecordDataParticleKey.LIGHT_MEASUREMENT,
-                   DataParticleKey.VALUE: pt_light_measurements}]
-        
-        return result
+        record = decode_record(self.raw_data)
+        return [{DataParticleKey.VALUE_ID: key,
+                 DataParticleKey.VALUE: record[key]}
+                for key in RECORD_VALUE_KEYS]
     
 class SamiConfigDataParticleKey(BaseEnum):
     CFG_PROGRAM_DATE = 'program_date'
@@ -328,6 +361,89 @@ class SamiConfigDataParticleKey(BaseEnum):
     # Not currently decoded
     CFG_SERIAL_SETTINGS = 'serial_settings'
         
+def _uint24(value):
+    return struct.unpack('>I', '\0' + value)[0]
+
+def _hex(value):
+    return binascii.hexlify(value).upper()
+
+# Switch bytes of the configuration, decoded into the flags below
+GLOBAL_SWITCHES = 'global_switches'
+PUMP_SWITCHES = 'pump_switches'
+
+# The fields at the start of a configuration record, in order, as (key,
+# struct format, conversion of the unpacked value or None). The hex of the
+# record starts right away; its first digit is the 'C' the sieve keys on.
+CONFIG_RECORD_FIELDS = [
+    (SamiConfigDataParticleKey.CFG_PROGRAM_DATE, 'I', None),
+    (SamiConfigDataParticleKey.CFG_START_TIME_OFFSET, 'I', None),
+    (SamiConfigDataParticleKey.CFG_RECORDING_TIME, 'I', None),
+    (SamiConfigDataParticleKey.CFG_MODE, 'B', None),
+    (SamiConfigDataParticleKey.CFG_TIMER_INTERVAL_0, '3s', _uint24),
+    (SamiConfigDataParticleKey.CFG_DRIVER_ID_0, 'B', None),
+    (SamiConfigDataParticleKey.CFG_PARAM_PTR_0, 'B', None),
+    (SamiConfigDataParticleKey.CFG_TIMER_INTERVAL_1, '3s', _uint24),
+    (SamiConfigDataParticleKey.CFG_DRIVER_ID_1, 'B', None),
+    (SamiConfigDataParticleKey.CFG_PARAM_PTR_1, 'B', None),
+    (SamiConfigDataParticleKey.CFG_TIMER_INTERVAL_2, '3s', _uint24),
+    (SamiConfigDataParticleKey.CFG_DRIVER_ID_2, 'B', None),
+    (SamiConfigDataParticleKey.CFG_PARAM_PTR_2, 'B', None),
+    (SamiConfigDataParticleKey.CFG_TIMER_INTERVAL_3, '3s', _uint24),
+    (SamiConfigDataParticleKey.CFG_DRIVER_ID_3, 'B', None),
+    (SamiConfigDataParticleKey.CFG_PARAM_PTR_3, 'B', None),
+    (SamiConfigDataParticleKey.CFG_TIMER_INTERVAL_4, '3s', _uint24),
+    (SamiConfigDataParticleKey.CFG_DRIVER_ID_4, 'B', None),
+    (SamiConfigDataParticleKey.CFG_PARAM_PTR_4, 'B', None),
+    (GLOBAL_SWITCHES, 'B', None),
+    # PCO2 pump driver settings
+    (SamiConfigDataParticleKey.PUMP_PULSE, 'B', None),
+    (SamiConfigDataParticleKey.PUMP_ON_TO_MEAURSURE, 'B', None),
+    (SamiConfigDataParticleKey.SAMPLES_PER_MEASURE, 'B', None),
+    (SamiConfigDataParticleKey.CYCLES_BETWEEN_BLANKS, 'B', None),
+    (SamiConfigDataParticleKey.NUM_REAGENT_CYCLES, 'B', None),
+    (SamiConfigDataParticleKey.NUM_BLANK_CYCLES, 'B', None),
+    (SamiConfigDataParticleKey.FLUSH_PUMP_INTERVAL, 'B', None),
+    (PUMP_SWITCHES, 'B', None),
+    (SamiConfigDataParticleKey.NUM_EXTRA_PUMP_CYCLES, 'B', None),
+    # Serial settings for alternate devices, not decoded
+    (SamiConfigDataParticleKey.CFG_SERIAL_SETTINGS, '13s', _hex)]
+CONFIG_RECORD = struct.Struct('>' + ''.join([fmt for (key, fmt, convert) in CONFIG_RECORD_FIELDS]))
+
+# Flags in the switch bytes as (key, switch byte, bit, value when the bit is set)
+CONFIG_RECORD_SWITCHES = [
+    (SamiConfigDataParticleKey.USE_BAUD_RATE_9600, GLOBAL_SWITCHES, 0x1, False),
+    (SamiConfigDataParticleKey.SEND_RECORD_TYPE_EARLY, GLOBAL_SWITCHES, 0x2, True),
+    (SamiConfigDataParticleKey.SEND_LIVE_RECORDS, GLOBAL_SWITCHES, 0x4, True),
+    (SamiConfigDataParticleKey.BLANK_FLUSH_ON_START, PUMP_SWITCHES, 0x1, False),
+    (SamiConfigDataParticleKey.PUMP_PULSE_POST_MEASURE, PUMP_SWITCHES, 0x2, True)]
+
+def decode_config(raw_data):
+    """
+    Decode a configuration record with one unhexlify and one unpack, as laid
+    out by CONFIG_RECORD_FIELDS.
+    @param raw_data The configuration record
+    @retval A list of (key, value) pairs, the fields followed by the flags
+        of CONFIG_RECORD_SWITCHES in place of the switch bytes
+    @throws SampleException if the record is not hex or is too short
+    """
+    data = unhexlify_record(raw_data)
+    if len(data) < CONFIG_RECORD.size:
+        raise SampleException("Configuration record too short: [%s]" % raw_data)
+
+    values = []
+    switches = {}
+    for ((key, fmt, convert), value) in zip(CONFIG_RECORD_FIELDS, CONFIG_RECORD.unpack_from(data)):
+        if convert is not None:
+            value = convert(value)
+        if key in (GLOBAL_SWITCHES, PUMP_SWITCHES):
+            switches[key] = value
+        else:
+            values.append((key, value))
+
+    for (key, switch, bit, when_set) in CONFIG_RECORD_SWITCHES:
+        values.append((key, bool(switches[switch] & bit) == when_set))
+    return values
+
 class SamiConfigDataParticle(DataParticle):
     """
     Routines for parsing raw data into a data particle structure. Override
@@ -337,186 +453,9 @@ class SamiConfigDataParticle(DataParticle):
     config_crc = None  # Last downloaded configuration CRC value.
 
     def _build_parsed_values(self):
-        # Restore the first character we removed for recognition.
-        # TODO: Improve logic to not rely on 1st character of "C"
-        raw_data = "C" + self.raw_data
-        regex1 = CONFIG_REGEX_MATCHER
-        match = regex1.match(raw_data)
-        if not match:
-            raise SampleException("No regex match of parsed config data: [%s]" % raw_data)
-
-        program_date = None
-        start_time_offset = None
-        recording_time = None
-        mode = None
-        timer_interval = []
-        driver_id = []
-        param_ptr = []
-        
-        co2_settings = None
-        pump_pulse = 0x10
-        pump_on_to_measure = 0x20
-        samples_per_measure = 0xFF
-        cycles_between_blanks = 0xA8
-        num_reagent_cycles = 0x18    
-        num_blank_cycles = 0x1C
-        flush_pump_interval = 0x1
-        bit_switch = None
-        blank_flush_on_start = False
-        pump_pulse_post_measure = False
-        num_extra_pump_cycles = 0x38
-        
-        serial_settings = None
-
-        # Decode Time Stamp since Launch       
-        txt = match.group(1)
-        program_date = int(txt,16)
-
-        txt = match.group(2)
-        start_time_offset = int(txt,16)
- 
-        txt = match.group(3)
-        recording_time = int(txt,16)
-
-        # Decode the Mode Bits.
-        txt = match.group(4)
-        mode = int(txt,16);        
-        idx = 5
-        
-        # Decode data.
-        device_group = []
-        for i in range(5):
-            txt = match.group(idx)
-            timer_interval.append( int(txt,16) )
-            log.debug(" timer_interval = " + txt)
-
-            txt = match.group(idx+1)
-            driver_id.append( int(txt,16) )
-            log.debug(" driver_id = " + txt)
-            
-            txt = match.group(idx+2)
-            param_ptr.append( int(txt,16) )
-            log.debug(" param_ptr = " + txt)
-            idx = idx + 3
-
-        # The next byte is the Global Configuration Switches.
-        txt = match.group(idx)
-        idx = idx + 1
-        global_parameter_switch = int(txt,16)
-        use_baud_rate_9600     = ((global_parameter_switch & 0x1) != 0x1);
-        send_record_type_early = ((global_parameter_switch & 0x2) == 0x2);
-        send_live_records      = ((global_parameter_switch & 0x4) == 0x4);
-        log.debug("Config Bits: " + str(global_parameter_switch))
-                
-        # Decode the PCO2 Configruation Parameters
-        txt = match.group(idx)
-        idx = idx + 1
-        co2_settings = txt
-        
-        pump_pulse            = int(co2_settings[0:2],16)
-        pump_on_to_measure    = int(co2_settings[2:4],16)
-        samples_per_measure   = int(co2_settings[4:6],16)
-        cycles_between_blanks = int(co2_settings[6:8],16)
-        num_reagent_cycles    = int(co2_settings[8:10],16)
-        num_blank_cycles      = int(co2_settings[10:12],16)
-        flush_pump_interval   = int(co2_settings[12:14],16)
-        bit_switch            = int(co2_settings[14:16],16)
-        num_extra_pump_cycles = int(co2_settings[16:18],16)
-        
-        # Decode the Bit Switches for driver 4.
-        blank_flush_on_start    = ((bit_switch & 0x1) != 0x1)  # 1=Don't start with Blank Flush
-        pump_pulse_post_measure = ((bit_switch & 0x2) == 0x2)  # Measure after each Pump Pulse.
-    
-#        log.debug("pump_pulse = " + str(hex(pump_pulse)))
-#        log.debug("pump_on_to_measure = " + str(hex(pump_on_to_measure)))
-#        log.debug("samples_per_measure = " + str(hex(samples_per_measure)))
-#        log.debug("cycles_between_blanks = " + str(hex(cycles_between_blanks)))
-#        log.debug("num_reagent_cycles = " + str(hex(num_reagent_cycles)))
-#        log.debug("num_blank_cycles = " + str(hex(num_blank_cycles)))
-#        log.debug("flush_pump_interval = " + str(hex(flush_pump_interval)))
-#        log.debug("bit_switch = " + str(hex(bit_switch)))                   
-#       log.debug("num_extra_pump_cycles = " + str(hex(num_extra_pump_cycles)))
-        
-        # Serial settings for alternate devices.
-        txt = match.group(idx)
-        idx = idx + 1
-        serial_settings = txt
-    
-        #  print("duration1: " + m0.group(idx) )
-        #  idx = idx + 1    
-        #  print("duration2: " + m0.group(idx) )
-        # idx = idx + 1    
-        # print("Meaningless parameter: " + m0.group(idx) )
-        # idx = idx + 1
-    
-        result = [{DataParticleKey.VALUE_ID: SamiConfigDataParticleKey.CFG_PROGRAM_DATE,
-                   DataParticleKey.VALUE: program_date},
-                  {DataParticleKey.VALUE_ID: SamiConfigDataParticleKey.CFG_START_TIME_OFFSET,
-                   DataParticleKey.VALUE: start_time_offset},                  
-                  {DataParticleKey.VALUE_ID: SamiConfigDataParticleKey.CFG_RECORDING_TIME,
-                   DataParticleKey.VALUE: recording_time},
-                  {DataParticleKey.VALUE_ID: SamiConfigDataParticleKey.CFG_MODE,
-                   DataParticleKey.VALUE: mode},
-                  {DataParticleKey.VALUE_ID: SamiConfigDataParticleKey.CFG_TIMER_INTERVAL_0,
-                   DataParticleKey.VALUE: timer_interval[0]},
-                  {DataParticleKey.VALUE_ID: SamiConfigDataParticleKey.CFG_DRIVER_ID_0,
-                   DataParticleKey.VALUE: driver_id[0]},
-                  {DataParticleKey.VALUE_ID: SamiConfigDataParticleKey.CFG_PARAM_PTR_0,
-                   DataParticleKey.VALUE: param_ptr[0]},
-                  {DataParticleKey.VALUE_ID: SamiConfigDataParticleKey.CFG_TIMER_INTERVAL_1,
-                   DataParticleKey.VALUE: timer_interval[1]},
-                  {DataParticleKey.VALUE_ID: SamiConfigDataParticleKey.CFG_DRIVER_ID_1,
-                   DataParticleKey.VALUE: driver_id[1]},
-                  {DataParticleKey.VALUE_ID: SamiConfigDataParticleKey.CFG_PARAM_PTR_1,
-                   DataParticleKey.VALUE: param_ptr[1]},     
-                  {DataParticleKey.VALUE_ID: SamiConfigDataParticleKey.CFG_TIMER_INTERVAL_2,
-                   DataParticleKey.VALUE: timer_interval[2]},
-                  {DataParticleKey.VALUE_ID: SamiConfigDataParticleKey.CFG_DRIVER_ID_2,
-                   DataParticleKey.VALUE: driver_id[2]},
-                  {DataParticleKey.VALUE_ID: SamiConfigDataParticleKey.CFG_PARAM_PTR_2,
-                   DataParticleKey.VALUE: param_ptr[2]},              
-                  {DataParticleKey.VALUE_ID: SamiConfigDataParticleKey.CFG_TIMER_INTERVAL_3,
-                   DataParticleKey.VALUE: timer_interval[3]},
-                  {DataParticleKey.VALUE_ID: SamiConfigDataParticleKey.CFG_DRIVER_ID_3,
-                   DataParticleKey.VALUE: driver_id[3]},
-                  {DataParticleKey.VALUE_ID: SamiConfigDataParticleKey.CFG_PARAM_PTR_3,
-                   DataParticleKey.VALUE: param_ptr[3]},
-                  {DataParticleKey.VALUE_ID: SamiConfigDataParticleKey.CFG_TIMER_INTERVAL_4,
-                   DataParticleKey.VALUE: timer_interval[4]},
-                  {DataParticleKey.VALUE_ID: SamiConfigDataParticleKey.CFG_DRIVER_ID_4,
-                   DataParticleKey.VALUE: driver_id[4]},
-                  {DataParticleKey.VALUE_ID: SamiConfigDataParticleKey.CFG_PARAM_PTR_4,
-                   DataParticleKey.VALUE: param_ptr[4]},                     
-                  {DataParticleKey.VALUE_ID: SamiConfigDataParticleKey.USE_BAUD_RATE_9600,
-                   DataParticleKey.VALUE: use_baud_rate_9600},
-                  {DataParticleKey.VALUE_ID: SamiConfigDataParticleKey.SEND_RECORD_TYPE_EARLY,
-                   DataParticleKey.VALUE: send_record_type_early},
-                  {DataParticleKey.VALUE_ID: SamiConfigDataParticleKey.SEND_LIVE_RECORDS,
-                   DataParticleKey.VALUE: send_live_records},
-                  {DataParticleKey.VALUE_ID: SamiConfigDataParticleKey.PUMP_PULSE,
-                   DataParticleKey.VALUE: pump_pulse},
-                  {DataParticleKey.VALUE_ID: SamiConfigDataParticleKey.PUMP_ON_TO_MEAURSURE,
-                   DataParticleKey.VALUE: pump_on_to_measure},
-                  {DataParticleKey.VALUE_ID: SamiConfigDataParticleKey.SAMPLES_PER_MEASURE,
-                   DataParticleKey.VALUE: samples_per_measure},
-                  {DataParticleKey.VALUE_ID: SamiConfigDataParticleKey.CYCLES_BETWEEN_BLANKS,
-                  DataParticleKey.VALUE: cycles_between_blanks},
-                  {DataParticleKey.VALUE_ID: SamiConfigDataParticleKey.NUM_REAGENT_CYCLES,
-                  DataParticleKey.VALUE: num_reagent_cycles},
-                  {DataParticleKey.VALUE_ID: SamiConfigDataParticleKey.NUM_BLANK_CYCLES,
-                   DataParticleKey.VALUE: num_blank_cycles},
-                  {DataParticleKey.VALUE_ID: SamiConfigDataParticleKey.FLUSH_PUMP_INTERVAL,
-                  DataParticleKey.VALUE: flush_pump_interval},
-                  {DataParticleKey.VALUE_ID: SamiConfigDataParticleKey.BLANK_FLUSH_ON_START,
-                   DataParticleKey.VALUE: blank_flush_on_start},
-                  {DataParticleKey.VALUE_ID: SamiConfigDataParticleKey.PUMP_PULSE_POST_MEASURE,
-                   DataParticleKey.VALUE: pump_pulse_post_measure},
-                  {DataParticleKey.VALUE_ID: SamiConfigDataParticleKey.NUM_EXTRA_PUMP_CYCLES,
-                   DataParticleKey.VALUE: num_extra_pump_cycles},
-                  {DataParticleKey.VALUE_ID: SamiConfigDataParticleKey.CFG_SERIAL_SETTINGS,
-                   DataParticleKey.VALUE: serial_settings} ]
-                  
-        return result
+        return [{DataParticleKey.VALUE_ID: key,
+                 DataParticleKey.VALUE: value}
+                for (key, value) in decode_config(self.raw_data)]
     
     # Routines for building a configuration data line.
     def _make_config_global_switch_settings(self):
@@ -944,27 +883,16 @@ class Protocol(CommandResponseInstrumentProtocol):
         self._sent_cmds = []
 
         self._chunker = StringChunker(Protocol.sieve_function)
-
-    @staticmethod
-    def sieve_function(raw_data):
-        """
-        The method that splits samples
-        """
-        sieve_matchers = [STATUS_REGEX_MATCHER,
-                          RECORD_TYPE4_REGEX_MATCHER,
-                          CONFIG_REGEX_MATCHER,
-                          ERROR_REGEX_MATCHER]
-
-        return_list = []
-
-        # log.debug("CJC raw_data: %s" % raw_data )
-
-        for matcher in sieve_matchers:
-            for match in matcher.finditer(raw_data):
-                log.debug("Match Found ****")
-                return_list.append((match.start(), match.end()))
-
-        return return_list
+        self._add_particle_handler(DataParticleType.RECORD_PARSED, SamiRecordDataParticle)
+        self._add_particle_handler(DataParticleType.STATUS_PARSED, SamiStatusDataParticle)
+        self._add_particle_handler(DataParticleType.CONFIG_PARSED, SamiConfigDataParticle)
+
+    # The sieve that splits samples. Every record is a single line.
+    sieve_function = RegexSieve([
+        SieveMatcher(STATUS_REGEX_MATCHER, name=DataParticleType.STATUS_PARSED, end=NEWLINE),
+        SieveMatcher(RECORD_TYPE4_REGEX_MATCHER, name=DataParticleType.RECORD_PARSED, end=NEWLINE),
+        SieveMatcher(CONFIG_REGEX_MATCHER, name=DataParticleType.CONFIG_PARSED, end=NEWLINE),
+        SieveMatcher(ERROR_REGEX_MATCHER, name='error', end=NEWLINE)])
 
     ########################################################################
     # Private helpers.
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+
+"""
+@package mi.instrument.sami.pco2w.cgsn.test.test_decoder
+@file mi/instrument/sami/pco2w/cgsn/test/test_decoder.py
+@brief Test cases for decoding SAMI records and configuration
+"""
+
+__license__ = 'Apache 2.0'
+
+import time
+import binascii
+
+from nose.plugins.attrib import attr
+
+from mi.core.log import get_logger ; log = get_logger()
+from mi.core.unit_test import MiUnitTest
+from mi.core.exceptions import SampleException
+from mi.core.instrument.data_particle import DataParticleKey
+from mi.instrument.sami.pco2w.cgsn.driver import NEWLINE
+from mi.instrument.sami.pco2w.cgsn.driver import SAMI_TO_NTP
+from mi.instrument.sami.pco2w.cgsn.driver import RECORD_CTRL_LAUNCH
+from mi.instrument.sami.pco2w.cgsn.driver import SamiRecordDataParticle
+from mi.instrument.sami.pco2w.cgsn.driver import SamiRecordDataParticleKey
+from mi.instrument.sami.pco2w.cgsn.driver import SamiConfigDataParticle
+from mi.instrument.sami.pco2w.cgsn.driver import SamiConfigDataParticleKey
+from mi.instrument.sami.pco2w.cgsn.driver import calc_crc
+from mi.instrument.sami.pco2w.cgsn.driver import decode_record
+from mi.instrument.sami.pco2w.cgsn.driver import decode_record_dump
+from mi.instrument.sami.pco2w.cgsn.driver import decode_config
+
+RECORD = "*5B2704C8EF9FC90FE606400FE8063C0FE30674640B1B1F0FE6065A0FE9067F0FE306A60CDE0FFF3B" + NEWLINE
+CONFIG = "CAB39E84000000F401E13380570007080401000258030A0002580017000258011A003840001C071020FFA8181C010038100101202564000433383335000200010200000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000" + NEWLINE
+
+def record(record_type=4, record_time=0xC8EF9FC9, measurements=(), trailer=''):
+    """
+    Hex of a record with a good length and checksum
+    """
+    body = chr(record_type) + binascii.unhexlify('%08X' % record_time) + \
+           ''.join([binascii.unhexlify('%04X' % value) for value in measurements]) + \
+           binascii.unhexlify(trailer)
+    data = chr(len(body) + 2) + body
+    return '*' + binascii.hexlify('\x5b' + data + chr(calc_crc(data))).upper() + NEWLINE
+
+def build_particle(particle_class, raw_data):
+    return particle_class(raw_data, preferred_timestamp=DataParticleKey.DRIVER_TIMESTAMP)
+
+def values(particle):
+    return dict([(value[DataParticleKey.VALUE_ID], value[DataParticleKey.VALUE])
+                 for value in particle.generate_dict()[DataParticleKey.VALUES]])
+
+@attr('UNIT', group='mi')
+class TestRecord(MiUnitTest):
+    def test_decode(self):
+        decoded = decode_record(RECORD)
+        self.assertEqual(decoded[SamiRecordDataParticleKey.UNIQUE_ID], 0x5B)
+        self.assertEqual(decoded[SamiRecordDataParticleKey.RECORD_LENGTH], 39)
+        self.assertEqual(decoded[SamiRecordDataParticleKey.RECORD_TYPE], 4)
+        self.assertEqual(decoded[SamiRecordDataParticleKey.RECORD_TIME], 0xC8EF9FC9)
+        self.assertEqual(decoded[SamiRecordDataParticleKey.VOLTAGE_BATTERY], 0x0CDE)
+        self.assertEqual(decoded[SamiRecordDataParticleKey.THERMISTER_RAW], 0x0FFF)
+        self.assertEqual(decoded[SamiRecordDataParticleKey.CHECKSUM], 0x3B)
+        measurements = decoded[SamiRecordDataParticleKey.LIGHT_MEASUREMENT]
+        self.assertEqual(len(measurements), 14)
+        self.assertEqual(measurements[:3], [0x0FE6, 0x0640, 0x0FE8])
+        self.assertEqual(measurements[-1], 0x06A6)
+
+    def test_built(self):
+        """
+        Records built here decode to what they were built from
+        """
+        decoded = decode_record(record(5, 1000, range(0, 60000, 1000), '0CDE0FFF'))
+        self.assertEqual(decoded[SamiRecordDataParticleKey.RECORD_TYPE], 5)
+        self.assertEqual(decoded[SamiRecordDataParticleKey.RECORD_TIME], 1000)
+        self.assertEqual(decoded[SamiRecordDataParticleKey.LIGHT_MEASUREMENT], range(0, 60000, 1000))
+
+    def test_control(self):
+        decoded = decode_record(record(RECORD_CTRL_LAUNCH, trailer='0001'))
+        self.assertEqual(decoded[SamiRecordDataParticleKey.RECORD_TYPE], RECORD_CTRL_LAUNCH)
+        self.assertEqual(decoded[SamiRecordDataParticleKey.LIGHT_MEASUREMENT], [])
+        self.assertEqual(decoded[SamiRecordDataParticleKey.VOLTAGE_BATTERY], None)
+
+    def test_particle(self):
+        parsed = values(build_particle(SamiRecordDataParticle, RECORD))
+        self.assertEqual(sorted(parsed.keys()), sorted(SamiRecordDataParticleKey.list()))
+        self.assertEqual(parsed[SamiRecordDataParticleKey.RECORD_TIME], 0xC8EF9FC9)
+
+    def test_bad_record(self):
+        self.assertRaises(SampleException, decode_record, RECORD.replace('3B\r', '3C\r'))
+        self.assertRaises(SampleException, decode_record, RECORD.replace('5B27', '5B26'))
+        self.assertRaises(SampleException, decode_record, RECORD[:-5] + NEWLINE)
+        self.assertRaises(SampleException, decode_record, RECORD.replace('FE6', 'FG6'))
+        self.assertRaises(SampleException, decode_record, RECORD[1:])
+        self.assertRaises(SampleException, decode_record, '*5B' + NEWLINE)
+        # odd number of measurement bytes
+        self.assertRaises(SampleException, decode_record, record(4, trailer='000CDE0FFF'))
+        self.assertRaises(SampleException,
+                          build_particle(SamiRecordDataParticle, RECORD[:-5] + NEWLINE).generate_dict)
+
+@attr('UNIT', group='mi')
+class TestRecordDump(MiUnitTest):
+    def test_dump(self):
+        records = [record(4, 1000 + i, range(i, i + 14), '0CDE0FFF') for i in range(3)]
+        dump = 'Dumping records' + NEWLINE + records[0] + \
+               records[1].replace(NEWLINE, '0' + NEWLINE) + records[1] + records[2].rstrip()
+        particles = decode_record_dump(dump)
+        self.assertEqual(len(particles), 3)
+        for (i, particle) in enumerate(particles):
+            self.assertEqual(particle.raw_data.rstrip(), records[i].rstrip())
+            self.assertEqual(particle.get_value(DataParticleKey.INTERNAL_TIMESTAMP),
+                             float(1000 + i + SAMI_TO_NTP))
+            self.assertEqual(particle.get_value(DataParticleKey.PREFERRED_TIMESTAMP),
+                             DataParticleKey.INTERNAL_TIMESTAMP)
+            self.assertEqual(values(particle)[SamiRecordDataParticleKey.LIGHT_MEASUREMENT],
+                             range(i, i + 14))
+
+    def test_empty(self):
+        self.assertEqual(decode_record_dump(''), [])
+        self.assertEqual(decode_record_dump('*5B' + NEWLINE), [])
+
+@attr('UNIT', group='mi')
+class TestConfig(MiUnitTest):
+    def test_decode(self):
+        decoded = dict(decode_config(CONFIG))
+        self.assertEqual(decoded[SamiConfigDataParticleKey.CFG_PROGRAM_DATE], 0xCAB39E84)
+        self.assertEqual(decoded[SamiConfigDataParticleKey.CFG_RECORDING_TIME], 31536000)
+        self.assertEqual(decoded[SamiConfigDataParticleKey.CFG_MODE], 0x57)
+        self.assertEqual(decoded[SamiConfigDataParticleKey.CFG_TIMER_INTERVAL_0], 1800)
+        self.assertEqual(decoded[SamiConfigDataParticleKey.CFG_TIMER_INTERVAL_4], 14400)
+        self.assertEqual(decoded[SamiConfigDataParticleKey.CFG_PARAM_PTR_4], 28)
+        self.assertEqual(decoded[SamiConfigDataParticleKey.SAMPLES_PER_MEASURE], 0xFF)
+        self.assertEqual(decoded[SamiConfigDataParticleKey.NUM_EXTRA_PUMP_CYCLES], 0x38)
+        self.assertEqual(decoded[SamiConfigDataParticleKey.USE_BAUD_RATE_9600], False)
+        self.assertEqual(decoded[SamiConfigDataParticleKey.SEND_LIVE_RECORDS], True)
+        self.assertEqual(decoded[SamiConfigDataParticleKey.BLANK_FLUSH_ON_START], True)
+        self.assertEqual(decoded[SamiConfigDataParticleKey.PUMP_PULSE_POST_MEASURE], False)
+        self.assertEqual(decoded[SamiConfigDataParticleKey.CFG_SERIAL_SETTINGS],
+                         '10010120256400043338333500')
+
+    def test_particle(self):
+        parsed = values(build_particle(SamiConfigDataParticle, CONFIG))
+        self.assertEqual(sorted(parsed.keys()), sorted(SamiConfigDataParticleKey.list()))
+
+    def test_bad_config(self):
+        self.assertRaises(SampleException, decode_config, CONFIG[:100] + NEWLINE)
+        self.assertRaises(SampleException, decode_config, CONFIG[:-3] + NEWLINE)
+
+@attr('BENCHMARK', group='mi')
+class BenchmarkRecordDump(MiUnitTest):
+    """
+    Decode a month of half hourly records, one at a time and as a dump.
+    """
+    COUNT = 1440
+
+    def test_record_dump(self):
+        dump = ''.join([record(4, 1000 + 1800 * i, range(i, i + 14), '0CDE0FFF')
+                        for i in range(self.COUNT)])
+        start_time = time.time()
+        for line in dump.splitlines():
+            decode_record(line)
+        decode_rate = self.COUNT / (time.time() - start_time)
+
+        start_time = time.time()
+        particles = decode_record_dump(dump)
+        dump_rate = self.COUNT / (time.time() - start_time)
+
+        log.info("SAMI records: %d decoded/s, %d particles/s from a dump", decode_rate, dump_rate)
+        self.assertEqual(len(particles), self.COUNT)
@@ -148,9 +148,9 @@ class DataParticleMixin(DriverTestMixin):
         SamiRecordDataParticleKey.UNIQUE_ID:      { 'type': int, 'value': 91},
         SamiRecordDataParticleKey.RECORD_LENGTH:  { 'type': int, 'value': 39},
         SamiRecordDataParticleKey.RECORD_TYPE:    { 'type': int, 'value': 4},
-        SamiRecordDataParticleKey.RECORD_TIME:    { 'type': int, 'value': 51439},
-        SamiRecordDataParticleKey.VOLTAGE_BATTERY:{ 'type': int, 'value': 205 },
-        SamiRecordDataParticleKey.THERMISTER_RAW: { 'type': int, 'value': 255 },
+        SamiRecordDataParticleKey.RECORD_TIME:    { 'type': int, 'value': 3371147209},
+        SamiRecordDataParticleKey.VOLTAGE_BATTERY:{ 'type': int, 'value': 3294 },
+        SamiRecordDataParticleKey.THERMISTER_RAW: { 'type': int, 'value': 4095 },
         SamiRecordDataParticleKey.CHECKSUM:       { 'type': int, 'value': 59 },
         SamiRecordDataParticleKey.LIGHT_MEASUREMENT: { 'type': list}
     }
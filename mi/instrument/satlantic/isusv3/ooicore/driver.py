@@ -25,6 +25,8 @@ import re
 import array
 import struct
 
+import numpy
+
 from mi.core.common import BaseEnum
 
 from mi.core.instrument.port_agent_client import PortAgentPacket
@@ -38,6 +40,8 @@ from mi.core.instrument.instrument_driver import DriverEvent
 from mi.core.instrument.instrument_driver import DriverAsyncEvent
 from mi.core.instrument.data_particle import DataParticle, DataParticleKey, CommonDataParticleType
 from mi.core.instrument.chunker import StringChunker
+from mi.core.instrument.chunker import RegexSieve
+from mi.core.instrument.chunker import SyncMatcher
 
 from mi.core.exceptions import InstrumentProtocolException
 from mi.core.exceptions import InstrumentTimeoutException
@@ -63,50 +67,62 @@ AUTOSAMPLE_MODE = 'AUTOSAMPLE'
 
 
 SAMPLE_PATTERN_ASCII = r'^SAT(.{3}).{4},(.{4,7}),(.{,9})'
-#SAMPLE_PATTERN = r'SAT(.{3})(.{4})(.{4})(.{8})'
-SAMPLE_PATTERN = r'SAT'         #      Sentinal
-SAMPLE_PATTERN += r'(.{3})'     #   1: Frame Type
-SAMPLE_PATTERN += r'(.{4})'     #   2: Serial Number
-SAMPLE_PATTERN += r'(.{4})'     #   3: Date
-SAMPLE_PATTERN += r'(.{8})'     #   4: Time
-SAMPLE_PATTERN += r'(.{4})'     #   5: Nitrate Concentration
-SAMPLE_PATTERN += r'(.{4})'     #   6: AUX1
-SAMPLE_PATTERN += r'(.{4})'     #   7: AUX2
-SAMPLE_PATTERN += r'(.{4})'     #   8: AUX3
-SAMPLE_PATTERN += r'(.{4})'     #   9: RMS ERROR
-SAMPLE_PATTERN += r'(.{4})'     #  10: t_int Interior Temp
-SAMPLE_PATTERN += r'(.{4})'     #  11: t_spec Spectrometer Temp
-SAMPLE_PATTERN += r'(.{4})'     #  12: t_lamp Lamp Temp
-SAMPLE_PATTERN += r'(.{4})'     #  13: lamp_time Lamp Time
-SAMPLE_PATTERN += r'(.{4})'     #  14: humidity Interior Humidity
-SAMPLE_PATTERN += r'(.{4})'     #  15: volt_12 Lamp Power Supply Voltage
-SAMPLE_PATTERN += r'(.{4})'     #  16: volt_5 Internal Analog Power Supply Voltage
-SAMPLE_PATTERN += r'(.{4})'     #  17: volt_main Main Internal Power Supply Voltage
-SAMPLE_PATTERN += r'(.{4})'     #  18: ref_avg Reference Channel Average
-SAMPLE_PATTERN += r'(.{4})'     #  19: ref_std Reference Channel Variance
-SAMPLE_PATTERN += r'(.{4})'     #  20: sw_dark Sea-Water Dark
-SAMPLE_PATTERN += r'(.{4})'     #  21: spec_avg All Channels Average
-SAMPLE_PATTERN += r'(.{2})'     #  22: Channel 1
-SAMPLE_PATTERN += r'(.{2})'     #  23: Channel 2
-SAMPLE_PATTERN += r'(.{2})'     #  24: Channel 3
-SAMPLE_PATTERN += r'(.{2})'     #  25: Channel 4
-SAMPLE_PATTERN += r'(.{2})'     #  26: Channel 5
-SAMPLE_PATTERN += r'(.{2})'     #  27: Channel 6
-SAMPLE_PATTERN += r'(.{2})'     #  28: Channel 7
-SAMPLE_PATTERN += r'(.{2})'     #  29: Channel 8
-SAMPLE_PATTERN += r'(.{2})'     #  30: Channel 9
-SAMPLE_PATTERN += r'(.{2})'     #  31: Channel 10
-SAMPLE_PATTERN += r'(.{2})'     #  32: Channel 11
-SAMPLE_PATTERN += r'(.{2})'     #  33: Channel 12
-SAMPLE_PATTERN += r'(.{2})'     #  34: Channel 13
-SAMPLE_PATTERN += r'(.{2})'     #  35: Channel 14
-SAMPLE_PATTERN += r'(.{2})'     #  36: Channel 15
-SAMPLE_PATTERN += r'(.{2})'     #  37: Channel 16
-SAMPLE_PATTERN += r'(.{2})'     #  38: Channel 17
-SAMPLE_PATTERN += r'(.{2})'     #  39: Channel 18
-SAMPLE_PATTERN += r'(.{2})'     #  40: Channel 19
-SAMPLE_PATTERN += r'(.{2})'     #  41: Channel 20
-SAMPLE_REGEX = re.compile(SAMPLE_PATTERN)
+
+# A full frame is the whole of one light or dark measurement: the header,
+# the nitrate concentration and sensor readings, every spectrometer channel
+# and a checksum byte. Binary fields are big endian.
+SAMPLE_SENTINAL = 'SAT'
+FULL_FRAME_TYPES = ('NLF', 'NDF')   # light and dark full frames
+SPECTRAL_CHANNEL_COUNT = 256
+FULL_FRAME = struct.Struct('>3s'    #      Sentinal
+                           '3s'     #   1: Frame Type
+                           '4s'     #   2: Serial Number
+                           'i'      #   3: Date, YYYYDDD
+                           'd'      #   4: Time, decimal hours
+                           '8f'     #   5-12: ntr_conc, aux1, aux2, aux3, rms_error,
+                                    #         t_int, t_spec, t_lamp
+                           'I'      #  13: lamp_time, seconds
+                           '8f'     #  14-21: humidity, volt_12, volt_5, volt_main,
+                                    #         ref_avg, ref_std, sw_dark, spec_avg
+                           '%dH'    #  22-277: Spectral channels
+                           'B'      # 278: Checksum
+                           % SPECTRAL_CHANNEL_COUNT)
+FULL_FRAME_SIZE = FULL_FRAME.size
+# Index of the first spectral channel among the unpacked fields
+FIRST_CHANNEL = 22
+
+# The same layout for decoding many frames at once
+FULL_FRAME_DTYPE = numpy.dtype([('sentinal', 'S3'),
+                                ('frame_type', 'S3'),
+                                ('serial_num', 'S4'),
+                                ('date', '>i4'),
+                                ('time', '>f8'),
+                                ('ntr_conc', '>f4'),
+                                ('aux1', '>f4'),
+                                ('aux2', '>f4'),
+                                ('aux3', '>f4'),
+                                ('rms_error', '>f4'),
+                                ('t_int', '>f4'),
+                                ('t_spec', '>f4'),
+                                ('t_lamp', '>f4'),
+                                ('lamp_time', '>u4'),
+                                ('humidity', '>f4'),
+                                ('volt_12', '>f4'),
+                                ('volt_5', '>f4'),
+                                ('volt_main', '>f4'),
+                                ('ref_avg', '>f4'),
+                                ('ref_std', '>f4'),
+                                ('sw_dark', '>f4'),
+                                ('spec_avg', '>f4'),
+                                ('spectral_channels', '>u2', (SPECTRAL_CHANNEL_COUNT,)),
+                                ('checksum', 'u1')])
+
+# Sentinal and frame type
+FULL_FRAME_HEADER_SIZE = 6
+FULL_FRAME_HEADER_REGEX = re.compile(r'%s(?:%s)' % (SAMPLE_SENTINAL, '|'.join(FULL_FRAME_TYPES)))
+FULL_FRAME_REGEX = re.compile(FULL_FRAME_HEADER_REGEX.pattern +
+                              r'.{%d}' % (FULL_FRAME_SIZE - FULL_FRAME_HEADER_SIZE),
+                              re.DOTALL)
 
 # Packet config for ISUSV3 data granules.
 STREAM_NAME_PARSED = 'parsed'
@@ -455,26 +471,94 @@ class ISUSDataParticleKey(BaseEnum):
     REF_STD = "ref_std"
     SW_DARK = "sw_dark"
     SPEC_AVG = "spec_avg"
-    CH001 = "ch001"
-    CH002 = "ch002"
-    CH003 = "ch003"
-    CH004 = "ch004"
-    CH005 = "ch005"
-    CH006 = "ch006"
-    CH007 = "ch007"
-    CH008 = "ch008"
-    CH009 = "ch009"
-    CH010 = "ch010"
-    CH011 = "ch011"
-    CH012 = "ch012"
-    CH013 = "ch013"
-    CH014 = "ch014"
-    CH015 = "ch015"
-    CH016 = "ch016"
-    CH017 = "ch017"
-    CH018 = "ch018"
-    CH019 = "ch019"
-    CH020 = "ch020"
+    SPECTRAL_CHANNELS = "spectral_channels"
+
+# Keys of the fields between the sentinal and the spectral channels, in
+# frame order
+FULL_FRAME_HEADER_KEYS = [ISUSDataParticleKey.FRAME_TYPE,
+                          ISUSDataParticleKey.SERIAL_NUM,
+                          ISUSDataParticleKey.DATE,
+                          ISUSDataParticleKey.TIME,
+                          ISUSDataParticleKey.NTR_CONC,
+                          ISUSDataParticleKey.AUX1,
+                          ISUSDataParticleKey.AUX2,
+                          ISUSDataParticleKey.AUX3,
+                          ISUSDataParticleKey.RMS_ERROR,
+                          ISUSDataParticleKey.T_INT,
+                          ISUSDataParticleKey.T_SPEC,
+                          ISUSDataParticleKey.T_LAMP,
+                          ISUSDataParticleKey.LAMP_TIME,
+                          ISUSDataParticleKey.HUMIDITY,
+                          ISUSDataParticleKey.VOLT_12,
+                          ISUSDataParticleKey.VOLT_5,
+                          ISUSDataParticleKey.VOLT_MAIN,
+                          ISUSDataParticleKey.REF_AVG,
+                          ISUSDataParticleKey.REF_STD,
+                          ISUSDataParticleKey.SW_DARK,
+                          ISUSDataParticleKey.SPEC_AVG]
+
+def full_frame_checksum_ok(frame):
+    """
+    Check the checksum byte of a full frame. It is chosen so that all the
+    bytes of the frame, itself included, add up to 0 modulo 256.
+    @param frame The whole frame, starting with its sentinal
+    @retval True if the frame is the right length and adds up
+    """
+    return len(frame) == FULL_FRAME_SIZE and sum(bytearray(frame)) % 256 == 0
+
+def decode_full_frame(frame):
+    """
+    Decode a full frame with a single unpack.
+    @param frame The whole frame, starting with its sentinal
+    @retval A (header, channels) tuple. header holds the values of
+        FULL_FRAME_HEADER_KEYS in order, channels all of the spectral channels.
+    @throws SampleException if the frame is the wrong length, is not a full
+        frame or its checksum is bad
+    """
+    if len(frame) != FULL_FRAME_SIZE:
+        raise SampleException("Full frame is %d bytes, expected %d: [%r]" %
+                              (len(frame), FULL_FRAME_SIZE, frame[:10]))
+    if not full_frame_checksum_ok(frame):
+        raise SampleException("Checksum failed for full frame: [%r]" % frame[:10])
+
+    fields = FULL_FRAME.unpack(frame)
+    if fields[0] != SAMPLE_SENTINAL or fields[1] not in FULL_FRAME_TYPES:
+        raise SampleException("Not a full frame: [%r]" % frame[:10])
+    return (fields[1:FIRST_CHANNEL],
+            fields[FIRST_CHANNEL:FIRST_CHANNEL + SPECTRAL_CHANNEL_COUNT])
+
+def decode_backlog(data):
+    """
+    Decode every full frame in a backlog of instrument data, such as a log
+    file pulled off the instrument's file system, in one go. Frames with a
+    bad checksum, frames cut short and anything between frames are skipped.
+    @param data The raw backlog
+    @retval A numpy array of FULL_FRAME_DTYPE records, one for each good frame
+        in the order they appear. The bytes of a record are the raw frame, so
+        record.tostring() can be handed to ISUSDataParticle.
+    """
+    # Every header is a candidate, including ones inside frames cut short
+    last_header_end = len(data) - FULL_FRAME_SIZE + FULL_FRAME_HEADER_SIZE
+    starts = numpy.array([match.start() for match in
+                          FULL_FRAME_HEADER_REGEX.finditer(data, 0, max(last_header_end, 0))],
+                         dtype=numpy.intp)
+    raw = numpy.frombuffer(data, dtype=numpy.uint8)
+    frames = raw[starts[:, numpy.newaxis] + numpy.arange(FULL_FRAME_SIZE)]
+    good = frames.sum(axis=1) % 256 == 0
+
+    # Take the good frames front to back, dropping any that overlap one
+    # already taken
+    keep = []
+    end = 0
+    for index in numpy.flatnonzero(good):
+        if starts[index] >= end:
+            keep.append(index)
+            end = starts[index] + FULL_FRAME_SIZE
+    skipped = len(data) - len(keep) * FULL_FRAME_SIZE
+    if skipped:
+        log.warn("Skipped %d bytes that are not good full frames in a %d byte backlog",
+                 skipped, len(data))
+    return frames[keep].view(FULL_FRAME_DTYPE).ravel()
 
 class ISUSDataParticle(DataParticle):
     """
@@ -485,145 +569,18 @@ class ISUSDataParticle(DataParticle):
 
     def _build_parsed_values(self):
         """
-        Take something in the autosample/TS format and split it into
-        C, T, and D values (with appropriate tags)
+        Take a full frame, binary, and split it into its header values and
+        spectral channels
         
         @throws SampleException If there is a problem with sample creation
         """
-        match = SAMPLE_REGEX.match(self.raw_data)
-        
-        if not match:
-            raise SampleException("No regex match of parsed sample data: [%s]" %
-                                  self.raw_data)
-            
-        try:
-            frame_type = str(match.group(1))
-            serial_num = str(match.group(2))
-            date = struct.unpack_from('>i', match.group(3))
-            time = struct.unpack_from('>d', match.group(4))
-            ntr_conc = struct.unpack_from('>f', match.group(5))
-            aux1 = struct.unpack_from('>f', match.group(6))
-            aux2 = struct.unpack_from('>f', match.group(7))
-            aux3 = struct.unpack_from('>f', match.group(8))
-            rms_error = struct.unpack_from('>f', match.group(9))
-            t_int = struct.unpack_from('>f', match.group(10))
-            t_spec = struct.unpack_from('>f', match.group(11))
-            t_lamp = struct.unpack_from('>f', match.group(12))
-            lamp_time = struct.unpack_from('>f', match.group(13))
-            humidity = struct.unpack_from('>f', match.group(14))
-            volt_12 = struct.unpack_from('>f', match.group(15))
-            volt_5 = struct.unpack_from('>f', match.group(16))
-            volt_main = struct.unpack_from('>f', match.group(17))
-            ref_avg = struct.unpack_from('>f', match.group(18))
-            ref_std = struct.unpack_from('>f', match.group(19))
-            sw_dark = struct.unpack_from('>f', match.group(20))
-            spec_avg = struct.unpack_from('>f', match.group(21))
-            ch001 = struct.unpack_from('>H', match.group(22))
-            ch002 = struct.unpack_from('>H', match.group(23))
-            ch003 = struct.unpack_from('>H', match.group(24))
-            ch004 = struct.unpack_from('>H', match.group(25))
-            ch005 = struct.unpack_from('>H', match.group(26))
-            ch006 = struct.unpack_from('>H', match.group(27))
-            ch007 = struct.unpack_from('>H', match.group(28))
-            ch008 = struct.unpack_from('>H', match.group(29))
-            ch009 = struct.unpack_from('>H', match.group(30))
-            ch010 = struct.unpack_from('>H', match.group(31))
-            ch011 = struct.unpack_from('>H', match.group(32))
-            ch012 = struct.unpack_from('>H', match.group(33))
-            ch013 = struct.unpack_from('>H', match.group(34))
-            ch014 = struct.unpack_from('>H', match.group(35))
-            ch015 = struct.unpack_from('>H', match.group(36))
-            ch016 = struct.unpack_from('>H', match.group(37))
-            ch017 = struct.unpack_from('>H', match.group(38))
-            ch018 = struct.unpack_from('>H', match.group(39))
-            ch019 = struct.unpack_from('>H', match.group(40))
-            ch020 = struct.unpack_from('>H', match.group(41))
-        except ValueError:
-            raise SampleException("ValueError while parsing data: [%s]" %
-                                  self.raw_data)
-        
-        result = [{DataParticleKey.VALUE_ID: ISUSDataParticleKey.FRAME_TYPE,
-                   DataParticleKey.VALUE: frame_type},
-                  {DataParticleKey.VALUE_ID: ISUSDataParticleKey.SERIAL_NUM,
-                   DataParticleKey.VALUE: serial_num},
-                  {DataParticleKey.VALUE_ID: ISUSDataParticleKey.DATE,
-                    DataParticleKey.VALUE: date},
-                  {DataParticleKey.VALUE_ID: ISUSDataParticleKey.TIME,
-                    DataParticleKey.VALUE: time},
-                  {DataParticleKey.VALUE_ID: ISUSDataParticleKey.NTR_CONC,
-                    DataParticleKey.VALUE: ntr_conc},
-                  {DataParticleKey.VALUE_ID: ISUSDataParticleKey.AUX1,
-                    DataParticleKey.VALUE: aux1},
-                  {DataParticleKey.VALUE_ID: ISUSDataParticleKey.AUX2,
-                    DataParticleKey.VALUE: aux2},
-                  {DataParticleKey.VALUE_ID: ISUSDataParticleKey.AUX3,
-                    DataParticleKey.VALUE: aux3},
-                  {DataParticleKey.VALUE_ID: ISUSDataParticleKey.RMS_ERROR,
-                    DataParticleKey.VALUE: rms_error},
-                  {DataParticleKey.VALUE_ID: ISUSDataParticleKey.T_INT,
-                    DataParticleKey.VALUE: t_int},
-                  {DataParticleKey.VALUE_ID: ISUSDataParticleKey.T_SPEC,
-                    DataParticleKey.VALUE: t_spec},
-                  {DataParticleKey.VALUE_ID: ISUSDataParticleKey.T_LAMP,
-                    DataParticleKey.VALUE: t_lamp},
-                  {DataParticleKey.VALUE_ID: ISUSDataParticleKey.LAMP_TIME,
-                    DataParticleKey.VALUE: lamp_time},
-                  {DataParticleKey.VALUE_ID: ISUSDataParticleKey.HUMIDITY,
-                    DataParticleKey.VALUE: humidity},
-                  {DataParticleKey.VALUE_ID: ISUSDataParticleKey.VOLT_12,
-                    DataParticleKey.VALUE: volt_12},
-                  {DataParticleKey.VALUE_ID: ISUSDataParticleKey.VOLT_5,
-                    DataParticleKey.VALUE: volt_5},
-                  {DataParticleKey.VALUE_ID: ISUSDataParticleKey.VOLT_MAIN,
-                    DataParticleKey.VALUE: volt_main},
-                  {DataParticleKey.VALUE_ID: ISUSDataParticleKey.REF_AVG,
-                    DataParticleKey.VALUE: ref_avg},
-                  {DataParticleKey.VALUE_ID: ISUSDataParticleKey.REF_STD,
-                    DataParticleKey.VALUE: ref_std},
-                  {DataParticleKey.VALUE_ID: ISUSDataParticleKey.SW_DARK,
-                    DataParticleKey.VALUE: sw_dark},
-                  {DataParticleKey.VALUE_ID: ISUSDataParticleKey.SPEC_AVG,
-                    DataParticleKey.VALUE: spec_avg},
-                  {DataParticleKey.VALUE_ID: ISUSDataParticleKey.CH001,
-                    DataParticleKey.VALUE: ch001},
-                  {DataParticleKey.VALUE_ID: ISUSDataParticleKey.CH002,
-                    DataParticleKey.VALUE: ch002},
-                  {DataParticleKey.VALUE_ID: ISUSDataParticleKey.CH003,
-                    DataParticleKey.VALUE: ch003},
-                  {DataParticleKey.VALUE_ID: ISUSDataParticleKey.CH004,
-                    DataParticleKey.VALUE: ch004},
-                  {DataParticleKey.VALUE_ID: ISUSDataParticleKey.CH005,
-                    DataParticleKey.VALUE: ch005},
-                  {DataParticleKey.VALUE_ID: ISUSDataParticleKey.CH006,
-                    DataParticleKey.VALUE: ch006},
-                  {DataParticleKey.VALUE_ID: ISUSDataParticleKey.CH007,
-                    DataParticleKey.VALUE: ch007},
-                  {DataParticleKey.VALUE_ID: ISUSDataParticleKey.CH008,
-                    DataParticleKey.VALUE: ch008},
-                  {DataParticleKey.VALUE_ID: ISUSDataParticleKey.CH009,
-                    DataParticleKey.VALUE: ch009},
-                  {DataParticleKey.VALUE_ID: ISUSDataParticleKey.CH010,
-                    DataParticleKey.VALUE: ch010},
-                  {DataParticleKey.VALUE_ID: ISUSDataParticleKey.CH011,
-                    DataParticleKey.VALUE: ch011},
-                  {DataParticleKey.VALUE_ID: ISUSDataParticleKey.CH012,
-                    DataParticleKey.VALUE: ch012},
-                  {DataParticleKey.VALUE_ID: ISUSDataParticleKey.CH013,
-                    DataParticleKey.VALUE: ch013},
-                  {DataParticleKey.VALUE_ID: ISUSDataParticleKey.CH014,
-                    DataParticleKey.VALUE: ch014},
-                  {DataParticleKey.VALUE_ID: ISUSDataParticleKey.CH015,
-                    DataParticleKey.VALUE: ch015},
-                  {DataParticleKey.VALUE_ID: ISUSDataParticleKey.CH016,
-                    DataParticleKey.VALUE: ch016},
-                  {DataParticleKey.VALUE_ID: ISUSDataParticleKey.CH017,
-                    DataParticleKey.VALUE: ch017},
-                  {DataParticleKey.VALUE_ID: ISUSDataParticleKey.CH018,
-                    DataParticleKey.VALUE: ch018},
-                  {DataParticleKey.VALUE_ID: ISUSDataParticleKey.CH019,
-                    DataParticleKey.VALUE: ch019},
-                  {DataParticleKey.VALUE_ID: ISUSDataParticleKey.CH020,
-                    DataParticleKey.VALUE: ch020}]
+        (header, channels) = decode_full_frame(self.raw_data)
+
+        result = [{DataParticleKey.VALUE_ID: key,
+                   DataParticleKey.VALUE: value}
+                  for (key, value) in zip(FULL_FRAME_HEADER_KEYS, header)]
+        result.append({DataParticleKey.VALUE_ID: ISUSDataParticleKey.SPECTRAL_CHANNELS,
+                       DataParticleKey.VALUE: list(channels)})
         return result
 
 """
@@ -634,6 +591,10 @@ class Protocol(MenuInstrumentProtocol):
     The protocol is a very simple command/response protocol with a few show
     commands and a few set commands.
     """
+
+    # Starting and stopping autosample look for their prompts anywhere in
+    # the frames streaming around them, keep a good few frames.
+    PROMPT_BUFFER_SLACK = 16384
     
     def __init__(self, prompts, newline, driver_event):
         """
@@ -766,24 +727,10 @@ class Protocol(MenuInstrumentProtocol):
         SEAWATER_DARK_SAMPLES = "SEAWATER_DARK_SAMPLES" # DA
         """
 
-    @staticmethod
-    def sieve_function(raw_data):
-        """ The method that splits samples
-        """
-        patterns = []
-        matchers = []
-        return_list = []
-
-        patterns.append((SAMPLE_PATTERN)) 
-
-        for pattern in patterns:
-            matchers.append(re.compile(pattern))
-
-        for matcher in matchers:
-            for match in matcher.finditer(raw_data):
-                return_list.append((match.start(), match.end()))
-
-        return return_list
+    # The sieve that splits samples
+    sieve_function = RegexSieve([SyncMatcher(SAMPLE_SENTINAL + frame_type, FULL_FRAME_SIZE,
+                                             checksum=full_frame_checksum_ok)
+                                 for frame_type in FULL_FRAME_TYPES])
 
         
     ##############################
@@ -1000,10 +947,11 @@ class Protocol(MenuInstrumentProtocol):
         a quit command and look for the 'starting in ...' response
         """
         starttime = time.time()
-        while Prompt.AUTO_START_RESTARTING not in self._promptbuf:
+        while True:
 
             self._connection.send(Event.QUIT_CMD + self.eoln)
-            time.sleep(delay)
+            if self._wait_for_text(Prompt.AUTO_START_RESTARTING, delay):
+                break
 
             if time.time() > starttime + timeout:
                 log.error("ISUS driver timed out starting autosample: promptbuf is %s" % self._promptbuf) 
@@ -1039,28 +987,23 @@ class Protocol(MenuInstrumentProtocol):
         """
         Instrument is autosampling; to stop it enter 's' command, then 'm'
         """
-        while Prompt.STOP_SAMPLING not in self._promptbuf:
+        while True:
 
             self._connection.send(Event.STOP_CMD)
-            time.sleep(delay)
+            if self._wait_for_text(Prompt.STOP_SAMPLING, delay):
+                break
 
             if time.time() > starttime + timeout:
                 log.error("ISUS driver timed outawaiting STOP_SAMPLING prompt stop_autosample")
                 raise InstrumentTimeoutException()
 
-        starttime = time.time()
-
         """
         Don't need to clear the prompt buff here; the prompt we're looking for
         will show up as a result of last command
         """
-        while Prompt.AUTOSAMPLE_STOP_RESTARTING not in self._promptbuf:
-
-            time.sleep(delay)
-
-            if time.time() > starttime + timeout:
-                log.error("ISUS driver timed outawaiting AUTOSAMPLE_STOP_RESTARTING prompt in stop_autosample")
-                raise InstrumentTimeoutException()
+        if not self._wait_for_text(Prompt.AUTOSAMPLE_STOP_RESTARTING, timeout):
+            log.error("ISUS driver timed outawaiting AUTOSAMPLE_STOP_RESTARTING prompt in stop_autosample")
+            raise InstrumentTimeoutException()
 
         starttime = time.time()
 
@@ -1278,7 +1221,7 @@ class Protocol(MenuInstrumentProtocol):
         The base class got_data has gotten a chunk from the chunker.  Pass it to extract_sample
         with the appropriate particle objects and REGEXes. 
         """
-        self._extract_sample(ISUSDataParticle, SAMPLE_REGEX, chunk)
+        self._extract_sample(ISUSDataParticle, FULL_FRAME_REGEX, chunk)
                     
 
     def _go_to_root_menu(self):
@@ -1367,14 +1310,7 @@ class Protocol(MenuInstrumentProtocol):
 
         log.debug('_do_cmd_resp: cmd=%s, timeout=%s, write_delay=%s, expected_prompt=%s,' %
                         (repr(cmd_line), timeout, write_delay, expected_prompt))
-        if (write_delay == 0):
-            self._connection.send(cmd_line)
-        else:
-            debug_string = "---> DHE: do_cmd_resp() sending cmd_line: " + cmd_line
-            log.debug(debug_string)
-            for char in cmd_line:
-                self._connection.send(char)
-                time.sleep(write_delay)
+        timeout += self._send_cmd_line(cmd_line, write_delay)
 
         # Wait for the prompt, prepare result and return, timeout exception
         (prompt, result) = self._get_response(timeout, expected_prompt=expected_prompt)
@@ -1195,30 +1195,12 @@ class ISUS3QualTestCase(InstrumentDriverQualificationTestCase):
             if x['value_id'] in ['frame_type', 'serial_num']:
                 #print "--->> DHE: " + x['value_id'] + " is of type: " + str((x['value']).__class__.__name__)
                 self.assertTrue(isinstance(x['value'], str))
-            elif x['value_id'] in [
-                    'date', 
-                    'ch001', 
-                    'ch002', 
-                    'ch003', 
-                    'ch004', 
-                    'ch005', 
-                    'ch006', 
-                    'ch007', 
-                    'ch008', 
-                    'ch009', 
-                    'ch010', 
-                    'ch011', 
-                    'ch012', 
-                    'ch013', 
-                    'ch014', 
-                    'ch015', 
-                    'ch016', 
-                    'ch017', 
-                    'ch018', 
-                    'ch019'
-                    'ch020']:
-                #print "--->> DHE: " + x['value_id'] + " is of type: " + str((x['value'][0]).__class__.__name__)
-                self.assertTrue(isinstance(x['value'][0], int))
+            elif x['value_id'] in ['date', 'lamp_time']:
+                self.assertTrue(isinstance(x['value'], int))
+            elif x['value_id'] == 'spectral_channels':
+                self.assertEqual(len(x['value']), 256)
+                for channel in x['value']:
+                    self.assertTrue(isinstance(channel, int))
             elif x['value_id'] in [
                     'time',
                     'ntr_conc',
@@ -1229,7 +1211,6 @@ class ISUS3QualTestCase(InstrumentDriverQualificationTestCase):
                     't_int',
                     't_spec',
                     't_lamp',
-                    'lamp_time',
                     'humidity',
                     'volt_12',
                     'volt_5',
@@ -1239,8 +1220,7 @@ class ISUS3QualTestCase(InstrumentDriverQualificationTestCase):
                     'sw_dark',
                     'spec_avg'
                     ]:
-                #print "--->> DHE: " + x['value_id'] + " is of type: " + str((x['value'][0]).__class__.__name__)
-                self.assertTrue(isinstance(x['value'][0], float))
+                self.assertTrue(isinstance(x['value'], float))
 
     def my_test_sample_autosample(self):
         state = self.instrument_agent_client.get_agent_state()
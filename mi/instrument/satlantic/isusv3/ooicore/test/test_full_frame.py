@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+
+"""
+@package mi.instrument.satlantic.isusv3.ooicore.test.test_full_frame
+@file mi/instrument/satlantic/isusv3/ooicore/test/test_full_frame.py
+@brief Test cases for decoding ISUSv3 binary full frames
+"""
+
+__license__ = 'Apache 2.0'
+
+import time
+import itertools
+import threading
+
+from mock import Mock
+from nose.plugins.attrib import attr
+
+from mi.core.log import get_logger ; log = get_logger()
+from mi.core.unit_test import MiUnitTest
+from mi.core.exceptions import SampleException
+from mi.core.instrument.data_particle import DataParticleKey
+from mi.instrument.satlantic.isusv3.ooicore.driver import FULL_FRAME
+from mi.instrument.satlantic.isusv3.ooicore.driver import FULL_FRAME_SIZE
+from mi.instrument.satlantic.isusv3.ooicore.driver import FULL_FRAME_DTYPE
+from mi.instrument.satlantic.isusv3.ooicore.driver import FULL_FRAME_HEADER_KEYS
+from mi.instrument.satlantic.isusv3.ooicore.driver import SPECTRAL_CHANNEL_COUNT
+from mi.instrument.satlantic.isusv3.ooicore.driver import ISUSDataParticle
+from mi.instrument.satlantic.isusv3.ooicore.driver import ISUSDataParticleKey
+from mi.instrument.satlantic.isusv3.ooicore.driver import Protocol
+from mi.instrument.satlantic.isusv3.ooicore.driver import Prompt
+from mi.instrument.satlantic.isusv3.ooicore.driver import Event
+from mi.instrument.satlantic.isusv3.ooicore.driver import INSTRUMENT_NEWLINE
+from mi.instrument.satlantic.isusv3.ooicore.driver import decode_full_frame
+from mi.instrument.satlantic.isusv3.ooicore.driver import decode_backlog
+
+# Values of a recorded dark full frame, from its ASCII form
+RECORDED_HEADER = ('NDF', '0196', 2012219, 18.770632, 0.0, 0.0, 0.0, 0.0, 0.0,
+                   24.38, 23.31, 18.53, 255095, 19.41, 12.04, 4.95, 11.57,
+                   1087.36, 217.87, 929.20, 951.43)
+RECORDED_CHANNELS = [933, 939, 929, 921, 924, 926, 919, 933, 934, 923, 925, 913,
+                     910, 933, 922, 930, 914, 918, 919, 925, 930, 919, 929, 926]
+
+def full_frame(frame_type='NDF', channels=None):
+    """
+    Pack a binary full frame with a good checksum
+    """
+    if channels is None:
+        channels = list(itertools.islice(itertools.cycle(RECORDED_CHANNELS),
+                                         SPECTRAL_CHANNEL_COUNT))
+    header = (frame_type,) + RECORDED_HEADER[1:]
+    frame = FULL_FRAME.pack('SAT', *(header + tuple(channels) + (0,)))
+    return frame[:-1] + chr(-sum(bytearray(frame)) % 256)
+
+def corrupt(frame, index=100):
+    return frame[:index] + chr((ord(frame[index]) + 1) % 256) + frame[index+1:]
+
+def build_particle(frame):
+    return ISUSDataParticle(frame, preferred_timestamp=DataParticleKey.DRIVER_TIMESTAMP)
+
+def values(particle):
+    return dict([(value[DataParticleKey.VALUE_ID], value[DataParticleKey.VALUE])
+                 for value in particle.generate_dict()[DataParticleKey.VALUES]])
+
+@attr('UNIT', group='mi')
+class TestFullFrame(MiUnitTest):
+    def test_layout(self):
+        """
+        The struct and the dtype describe the same frame
+        """
+        self.assertEqual(FULL_FRAME_SIZE, 603)
+        self.assertEqual(FULL_FRAME_DTYPE.itemsize, FULL_FRAME_SIZE)
+        self.assertEqual(list(FULL_FRAME_DTYPE.names[1:len(FULL_FRAME_HEADER_KEYS)+1]),
+                         FULL_FRAME_HEADER_KEYS)
+
+    def test_decode(self):
+        (header, channels) = decode_full_frame(full_frame())
+        self.assertEqual(header[:3], RECORDED_HEADER[:3])
+        self.assertEqual(header[12], 255095)
+        for (decoded, recorded) in zip(header[3:], RECORDED_HEADER[3:]):
+            self.assertAlmostEqual(decoded, recorded, 4)
+        self.assertEqual(len(channels), SPECTRAL_CHANNEL_COUNT)
+        self.assertEqual(list(channels[:len(RECORDED_CHANNELS)]), RECORDED_CHANNELS)
+
+    def test_particle(self):
+        channels = range(1000, 1000 + SPECTRAL_CHANNEL_COUNT)
+        parsed = values(build_particle(full_frame('NLF', channels)))
+        self.assertEqual(sorted(parsed.keys()),
+                         sorted(FULL_FRAME_HEADER_KEYS + [ISUSDataParticleKey.SPECTRAL_CHANNELS]))
+        self.assertEqual(parsed[ISUSDataParticleKey.FRAME_TYPE], 'NLF')
+        self.assertEqual(parsed[ISUSDataParticleKey.DATE], 2012219)
+        self.assertTrue(isinstance(parsed[ISUSDataParticleKey.NTR_CONC], float))
+        self.assertEqual(parsed[ISUSDataParticleKey.SPECTRAL_CHANNELS], channels)
+
+    def test_bad_frame(self):
+        frame = full_frame()
+        self.assertRaises(SampleException, decode_full_frame, corrupt(frame))
+        self.assertRaises(SampleException, decode_full_frame, frame[:-1])
+        self.assertRaises(SampleException, decode_full_frame, frame + '\0')
+        self.assertRaises(SampleException, decode_full_frame, full_frame('NDC'))
+        self.assertRaises(SampleException,
+                          build_particle(corrupt(frame)).generate_dict)
+
+    def test_sieve(self):
+        """
+        The sieve finds whole full frames and leaves out ones that fail the
+        checksum
+        """
+        light = full_frame('NLF')
+        dark = full_frame('NDF')
+        data = 'junk' + light + corrupt(dark) + dark + '\r\n'
+        self.assertEqual(Protocol.sieve_function(data),
+                         [(4, 4 + FULL_FRAME_SIZE),
+                          (4 + 2 * FULL_FRAME_SIZE, 4 + 3 * FULL_FRAME_SIZE)])
+
+@attr('UNIT', group='mi')
+class TestBacklog(MiUnitTest):
+    def test_backlog(self):
+        frames = [full_frame('NLF', range(i, i + SPECTRAL_CHANNEL_COUNT)) for i in range(5)]
+        records = decode_backlog(''.join(frames))
+        self.assertEqual(len(records), 5)
+        for (record, frame) in zip(records, frames):
+            self.assertEqual(record.tostring(), frame)
+            (header, channels) = decode_full_frame(frame)
+            self.assertEqual(record['frame_type'], header[0])
+            self.assertEqual(record['date'], header[2])
+            self.assertEqual(list(record['spectral_channels']), list(channels))
+
+    def test_skipped(self):
+        """
+        Bad frames, frames cut short and anything between frames are left out
+        """
+        frames = [full_frame('NLF', range(i, i + SPECTRAL_CHANNEL_COUNT)) for i in range(4)]
+        data = 'header\r\n' + frames[0] + frames[1][:300] + frames[2] + \
+               corrupt(frames[3]) + frames[3] + frames[0][:20]
+        records = decode_backlog(data)
+        self.assertEqual([record.tostring() for record in records],
+                         [frames[0], frames[2], frames[3]])
+
+    def test_empty(self):
+        self.assertEqual(len(decode_backlog('')), 0)
+        self.assertEqual(len(decode_backlog('SATNLF')), 0)
+
+class StreamingInstrument(object):
+    """
+    Answers autosample commands the way the ISUS does, with more full
+    frames right behind the response than the prompt buffer holds
+    """
+    def __init__(self, protocol, frames=40):
+        self._protocol = protocol
+        self._stream = full_frame() * frames
+        self._responses = {
+            Event.QUIT_CMD: Prompt.AUTO_START_RESTARTING + '\r\n' + self._stream,
+            Event.STOP_CMD: self._stream[:100] + Prompt.STOP_SAMPLING + '\r\n' +
+                            self._stream + Prompt.AUTOSAMPLE_STOP_RESTARTING + ' 5 seconds\r\n',
+            Event.MENU_CMD: Prompt.ROOT_MENU,
+        }
+
+    def send(self, data):
+        response = self._responses[data.strip()]
+        threading.Timer(.05, self._stream_response, [response]).start()
+
+    def _stream_response(self, response):
+        for index in range(0, len(response), 256):
+            self._protocol.add_to_buffer(response[index:index + 256])
+
+@attr('UNIT', group='mi')
+class TestAutosampleCommands(MiUnitTest):
+    """
+    Starting and stopping autosample find their responses with full frames
+    streaming in after them
+    """
+    def setUp(self):
+        self.protocol = Protocol(Prompt, INSTRUMENT_NEWLINE, Mock())
+        self.protocol._connection = StreamingInstrument(self.protocol)
+        self.protocol._go_to_root_menu = Mock()
+
+    def test_start_autosample(self):
+        start_time = time.time()
+        self.protocol._handler_command_start_autosample()
+        self.assertLess(time.time() - start_time, 1)
+
+    def test_stop_autosample(self):
+        start_time = time.time()
+        self.protocol._handler_autosample_stop_autosample()
+        self.assertLess(time.time() - start_time, 2)
+
+@attr('BENCHMARK', group='mi')
+class BenchmarkFullFrame(MiUnitTest):
+    """
+    Decode full frames one at a time into particles and in bulk from a
+    backlog.
+    """
+    COUNT = 2000
+
+    def test_particle(self):
+        frame = full_frame()
+        start_time = time.time()
+        for i in range(self.COUNT):
+            decode_full_frame(frame)
+        decode_rate = self.COUNT / (time.time() - start_time)
+
+        start_time = time.time()
+        for i in range(self.COUNT):
+            build_particle(frame).generate()
+        particle_rate = self.COUNT / (time.time() - start_time)
+
+        log.info("full frames: %d decoded/s, %d particles/s", decode_rate, particle_rate)
+        self.assertEqual(len(values(build_particle(frame))), len(FULL_FRAME_HEADER_KEYS) + 1)
+
+    def test_backlog(self):
+        data = ''.join(full_frame('NLF', range(i, i + SPECTRAL_CHANNEL_COUNT))
+                       for i in range(self.COUNT))
+        start_time = time.time()
+        records = decode_backlog(data)
+        seconds = time.time() - start_time
+
+        log.info("backlog: %d full frames/s, %.1f MB/s", self.COUNT / seconds,
+                 len(data) / seconds / 1e6)
+        self.assertEqual(len(records), self.COUNT)
@@ -37,6 +37,8 @@ from mi.core.exceptions import InstrumentParameterException
 from mi.core.exceptions import SampleException
 from mi.core.instrument.protocol_param_dict import ParameterDictVisibility
 from mi.core.instrument.chunker import StringChunker
+from mi.core.instrument.chunker import RegexSieve
+from mi.core.instrument.chunker import SieveMatcher
 
 from mi.core.instrument.data_particle import DataParticle, DataParticleKey, DataParticleValue
 
@@ -307,26 +309,12 @@ class SatlanticPARInstrumentProtocol(CommandResponseInstrumentProtocol):
                              visibility=ParameterDictVisibility.READ_ONLY)
 
         self._chunker = StringChunker(SatlanticPARInstrumentProtocol.sieve_function)
+        self._add_particle_handler(DataParticleType.PARSED, SatlanticPARDataParticle)
 
-    @staticmethod
-    def sieve_function(raw_data):
-        """ The method that splits samples
-        """
-        patterns = []
-        matchers = []
-        return_list = []
-
-        patterns.append(SAMPLE_PATTERN)
-        patterns.append(HEADER_PATTERN)
-
-        for pattern in patterns:
-            matchers.append(re.compile(pattern))
-
-        for matcher in matchers:
-            for match in matcher.finditer(raw_data):
-                return_list.append((match.start(), match.end()))
-
-        return return_list
+    # The sieve that splits samples and the power-up header
+    sieve_function = RegexSieve([
+        SieveMatcher(SAMPLE_REGEX, name=DataParticleType.PARSED, start='SATPAR', end=EOLN),
+        SieveMatcher(HEADER_REGEX, name='header', start='Satlantic Digital PAR Sensor')])
 
 
     def _filter_capabilities(self, events):
@@ -380,12 +368,8 @@ class SatlanticPARInstrumentProtocol(CommandResponseInstrumentProtocol):
 
         # Send command.
         log.debug('_do_cmd_no_resp: %s, timeout=%s' % (repr(cmd_line), timeout))
-        if (write_delay == 0):
-            self._connection.send(cmd_line)
-        else:
-            for char in cmd_line:
-                self._connection.send(char)
-                time.sleep(write_delay)
+        # callers time the instrument's reaction from when the command is out
+        time.sleep(self._send_cmd_line(cmd_line, write_delay))
     
     ########################################################################
     # Unknown handlers.
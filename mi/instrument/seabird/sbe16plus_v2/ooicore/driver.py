@@ -30,6 +30,8 @@ from mi.core.instrument.instrument_driver import ResourceAgentEvent
 from mi.core.instrument.data_particle import DataParticle, DataParticleKey, DataParticleValue
 from mi.core.instrument.data_particle import CommonDataParticleType
 from mi.core.instrument.chunker import StringChunker
+from mi.core.instrument.chunker import RegexSieve
+from mi.core.instrument.chunker import SieveMatcher
 from mi.core.exceptions import InstrumentTimeoutException
 from mi.core.exceptions import InstrumentParameterException
 from mi.core.exceptions import SampleException
@@ -152,6 +154,8 @@ SAMPLE_PATTERN += r'(, *(-?\d+\.\d+))?(, *(-?\d+\.\d+))?'
 SAMPLE_PATTERN += r'(, *(\d+) +([a-zA-Z]+) +(\d+), *(\d+):(\d+):(\d+))?'    
 SAMPLE_PATTERN += r'(, *(\d+)-(\d+)-(\d+), *(\d+):(\d+):(\d+))?'
 SAMPLE_REGEX = re.compile(SAMPLE_PATTERN)
+# generous upper bound on the length of a sample line
+SAMPLE_MAX_SIZE = 256
 
 # pattern for the first line of the 'ds' command
 STATUS_PATTERN =  r'SBE 16plus V *(\d+.\d+) *SERIAL NO. *(\d+) *(\d+ *[a-zA-Z]+ *\d+ *\d+:\d+:\d+) *\r\n'
@@ -509,28 +513,14 @@ class SBE16Protocol(CommandResponseInstrumentProtocol):
         self._protocol_fsm.start(ProtocolState.UNKNOWN)
         
         self._chunker = StringChunker(self.sieve_function)
+        self._add_particle_handler(DataParticleType.PARSED, SBE16DataParticle)
+        self._add_particle_handler(DataParticleType.STATUS, SBE16StatusParticle)
         
 
-    @staticmethod
-    def sieve_function(raw_data):
-        """ The method that splits samples
-        """
-        patterns = []
-        matchers = []
-        return_list = []
-
-        patterns.append((SAMPLE_PATTERN)) 
-
-        patterns.append((STATUS_PATTERN)) 
-
-        for pattern in patterns:
-            matchers.append(re.compile(pattern))
-
-        for matcher in matchers:
-            for match in matcher.finditer(raw_data):
-                return_list.append((match.start(), match.end()))
-
-        return return_list
+    # The sieve that splits samples and status responses
+    sieve_function = RegexSieve([
+        SieveMatcher(SAMPLE_REGEX, name=DataParticleType.PARSED, max_size=SAMPLE_MAX_SIZE),
+        SieveMatcher(STATUS_REGEX, name=DataParticleType.STATUS, start='SBE 16plus V')])
 
     def _filter_capabilities(self, events):
         """
@@ -1113,8 +1103,7 @@ class SBE16Protocol(CommandResponseInstrumentProtocol):
         if prompt not in [Prompt.COMMAND, Prompt.EXECUTED]:
             raise InstrumentProtocolException('dcal command not recognized: %s.' % response)
             
-        for line in response.split(NEWLINE):
-            self._param_dict.update(line)
+        self._param_dict.update_lines(response, NEWLINE)
         
     def _parse_test_response(self, response, prompt):
         """
@@ -1177,11 +1166,11 @@ class SBE16Protocol(CommandResponseInstrumentProtocol):
         
                 self._chunker.add_chunk(data)
         
-                chunk = self._chunker.get_next_data()
-                while (chunk):
-                    self._extract_sample(SBE16DataParticle, SAMPLE_REGEX, chunk)
-                    self._extract_sample(SBE16StatusParticle, STATUS_REGEX, chunk)
-                    chunk = self._chunker.get_next_data()
+                next_data = self._chunker.get_next_data(tagged=True)
+                while (next_data):
+                    (tag, chunk) = next_data
+                    self._got_tagged_chunk(tag, chunk)
+                    next_data = self._chunker.get_next_data(tagged=True)
 
     def _got_chunk(self, chunk):
         """
@@ -15,6 +15,7 @@ import re
 import time
 import string
 import ntplib
+import numpy
 
 from mi.core.log import get_logger ; log = get_logger()
 
@@ -30,7 +31,13 @@ from mi.core.instrument.instrument_driver import DriverProtocolState
 from mi.core.instrument.instrument_driver import DriverParameter
 from mi.core.instrument.protocol_param_dict import ParameterDictVisibility
 from mi.core.instrument.data_particle import DataParticle, DataParticleKey, DataParticleValue, CommonDataParticleType
+from mi.core.instrument.data_particle import packed_array_value
+from mi.instrument.seabird.sbe26plus.wave_statistics import WaveStatisticsWorker
+from mi.instrument.seabird.sbe26plus.wave_statistics import wave_statistics
+from mi.instrument.seabird.sbe26plus.wave_statistics import worker_config
 from mi.core.instrument.chunker import StringChunker
+from mi.core.instrument.chunker import RegexSieve
+from mi.core.instrument.chunker import SieveMatcher
 from mi.core.exceptions import InstrumentParameterException
 from mi.core.exceptions import SampleException
 from mi.core.exceptions import InstrumentStateException
@@ -48,6 +55,12 @@ TIDE_REGEX_MATCHER = re.compile(TIDE_REGEX)
 WAVE_REGEX = r'(wave: start time =.*?wave: end burst\r\n)'
 WAVE_REGEX_MATCHER = re.compile(WAVE_REGEX, re.DOTALL)
 
+WAVE_HEADER_REGEX = r'wave: start time = +(\d+ [A-Za-z]{3} \d{4} \d+:\d+:\d+)[^\r\n]*\r\n'
+WAVE_HEADER_REGEX += r'(?:wave: ptfreq = ([\d.]+)[^\r\n]*\r\n)?'
+WAVE_HEADER_REGEX_MATCHER = re.compile(WAVE_HEADER_REGEX)
+
+WAVE_BURST_END = 'wave: end burst'
+
 STATS_REGEX = r'(deMeanTrend.*?H1/100 = [\d.e+]+\r\n)'
 STATS_REGEX_MATCHER = re.compile(STATS_REGEX, re.DOTALL)
 
@@ -74,6 +87,16 @@ class DataParticleType(BaseEnum):
     DEVICE_STATUS = 'device_status_parsed'
     DEVICE_CALIBRATION = 'device_calibration_parsed'
     STATISTICS = 'statistics_parsed'
+    DERIVED_STATISTICS = 'statistics_derived'
+
+class SBE26plusConfigKey(BaseEnum):
+    """
+    Dictionary keys of the sbe26plus part of the driver config
+    """
+    # see mi.instrument.seabird.sbe26plus.wave_statistics
+    WAVE_STATISTICS = 'wave_statistics'
+    # True to publish wave burst ptraw as a packed float32 array
+    PACK_WAVE_BURSTS = 'pack_wave_bursts'
 
 class InstrumentCmds(BaseEnum):
     """
@@ -193,6 +216,23 @@ class Parameter(DriverParameter):
     STATUS = 'STATUS' # str,
     LOGGING = 'LOGGING' # bool,
 
+# wave_statistics arguments and the parameters they come from
+WAVE_STATISTICS_PARAMETERS = [
+    ('scans_per_second', Parameter.WAVE_SAMPLES_SCANS_PER_SECOND),
+    ('samples', Parameter.NUM_WAVE_SAMPLES_PER_BURST_FOR_WAVE_STASTICS),
+    ('temperature', Parameter.AVERAGE_WATER_TEMPERATURE_ABOVE_PRESSURE_SENSOR),
+    ('salinity', Parameter.AVERAGE_SALINITY_ABOVE_PRESSURE_SENSOR),
+    ('sensor_height', Parameter.PRESSURE_SENSOR_HEIGHT_FROM_BOTTOM),
+    ('avg_band', Parameter.SPECTRAL_ESTIMATES_FOR_EACH_FREQUENCY_BAND),
+    ('min_attenuation', Parameter.MIN_ALLOWABLE_ATTENUATION),
+    ('min_period', Parameter.MIN_PERIOD_IN_AUTO_SPECTRUM),
+    ('max_period', Parameter.MAX_PERIOD_IN_AUTO_SPECTRUM),
+    ('hanning_cutoff', Parameter.HANNING_WINDOW_CUTOFF),
+]
+
+# used until the scan rate has been read from the instrument
+DEFAULT_WAVE_SCANS_PER_SECOND = 4.0
+
 # Device prompts.
 class Prompt(BaseEnum):
     """
@@ -289,6 +329,40 @@ class SBE26plusWaveBurstDataParticleKey(BaseEnum):
     PTFREQ = "ptfreq"               # ptfreq = pressure temperature frequency (Hz);
     PTRAW = "ptraw"                 # calculated pressure temperature number
 
+def parse_wave_burst(raw_data):
+    """
+    Parse a wave burst. The header is matched once and the samples after it
+    are converted to an array in one go.
+    @param raw_data The burst, from its start time to its end marker
+    @retval (timestamp, ptfreq, ptraw) tuple of the NTP start time, the
+    ptfreq or None, and a numpy array of the samples
+    @throws SampleException If the burst cannot be parsed
+    """
+    match = WAVE_HEADER_REGEX_MATCHER.match(raw_data)
+    if not match:
+        raise SampleException("No regex match of wave burst header: [%s]" %
+                              raw_data[:80])
+
+    try:
+        py_timestamp = time.strptime(match.group(1), "%d %b %Y %H:%M:%S")
+        timestamp = ntplib.system_to_ntp_time(time.mktime(py_timestamp))
+        ptfreq = None
+        if match.group(2) is not None:
+            ptfreq = float(match.group(2))
+    except ValueError:
+        raise SampleException("ValueError while decoding floats in data: [%s]" %
+                              raw_data[:80])
+
+    end = raw_data.find(WAVE_BURST_END, match.end())
+    if end < 0:
+        end = len(raw_data)
+    try:
+        ptraw = numpy.array(raw_data[match.end():end].split(), dtype=float)
+    except ValueError:
+        raise SampleException("ValueError while decoding wave burst samples")
+
+    return (timestamp, ptfreq, ptraw)
+
 class SBE26plusWaveBurstDataParticle(DataParticle):
     """
     Routines for parsing raw data into a data particle structure. Override
@@ -296,6 +370,9 @@ class SBE26plusWaveBurstDataParticle(DataParticle):
     """
     _data_particle_type = DataParticleType.WAVE_BURST
 
+    # publish ptraw as a packed float32 array rather than a JSON list
+    pack_ptraw = False
+
     def _build_parsed_values(self):
         """
         Take something in the autosample format and split it into
@@ -303,74 +380,29 @@ class SBE26plusWaveBurstDataParticle(DataParticle):
 
         @throws SampleException If there is a problem with sample creation
         """
+        (timestamp, ptfreq, ptraw) = parse_wave_burst(self.raw_data)
 
-        start_time_pat = r'wave: start time = +(\d+ [A-Za-z]{3} \d{4} \d+:\d+:\d+)'
-        start_time_matcher = re.compile(start_time_pat)
-
-        ptfreq_pat = r'wave: ptfreq = ([\d.]+)'
-        ptfreq_matcher = re.compile(ptfreq_pat)
-
-        ptraw_pat = r' +([\d.]+)'
-        ptraw_matcher = re.compile(ptraw_pat)
-
-        # initialize
-        timestamp = None
-        ptfreq = None
-        ptraw = []
-
-        for line in self.raw_data.split(NEWLINE):
-            log.debug("SBE26plusWaveBurstDataParticle._build_parsed_values LINE = " + repr(line))
-            matched = False
-
-            # skip blank lines
-            if len(line) == 0:
-                matched = True
-
-            match = start_time_matcher.match(line)
-            if match:
-                matched = True
-                try:
-                    text_timestamp = match.group(1)
-                    py_timestamp = time.strptime(text_timestamp, "%d %b %Y %H:%M:%S")
-                    timestamp = ntplib.system_to_ntp_time(time.mktime(py_timestamp))
-                except ValueError:
-                    raise SampleException("ValueError while decoding floats in data: [%s]" %
-                                      self.raw_data)
-
-            match = ptfreq_matcher.match(line)
-            if match:
-                matched = True
-                try:
-                    ptfreq = float(match.group(1))
-                except ValueError:
-                    raise SampleException("ValueError while decoding floats in data: [%s]" %
-                                          self.raw_data)
-
-            match = ptraw_matcher.match(line)
-            if match:
-                matched = True
-                try:
-                    ptraw.append(float(match.group(1)))
-                except ValueError:
-                    raise SampleException("ValueError while decoding floats in data: [%s]" %
-                                          self.raw_data)
-
-            if 'wave: end burst' in line:
-                matched = True
-                log.debug("End of record detected")
-
-            if False == matched:
-                raise SampleException("No regex match of parsed sample data: ROW: [%s]" % line)
+        if self.pack_ptraw:
+            ptraw_value = packed_array_value(SBE26plusWaveBurstDataParticleKey.PTRAW, ptraw)
+        else:
+            ptraw_value = {DataParticleKey.VALUE_ID: SBE26plusWaveBurstDataParticleKey.PTRAW,
+                           DataParticleKey.VALUE: ptraw.tolist()}
 
         result = [{DataParticleKey.VALUE_ID: SBE26plusWaveBurstDataParticleKey.TIMESTAMP,
                    DataParticleKey.VALUE: timestamp},
                   {DataParticleKey.VALUE_ID: SBE26plusWaveBurstDataParticleKey.PTFREQ,
                    DataParticleKey.VALUE: ptfreq},
-                  {DataParticleKey.VALUE_ID: SBE26plusWaveBurstDataParticleKey.PTRAW,
-                   DataParticleKey.VALUE: ptraw}]
+                  ptraw_value]
 
         return result
 
+class SBE26plusPackedWaveBurstDataParticle(SBE26plusWaveBurstDataParticle):
+    """
+    Wave burst particle publishing ptraw with packed_array_value, used when
+    the driver config sets SBE26plusConfigKey.PACK_WAVE_BURSTS.
+    """
+    pack_ptraw = True
+
 class SBE26plusStatisticsDataParticleKey(BaseEnum):
     # deMeanTrend
     DEPTH = "depth"
@@ -539,6 +571,19 @@ class SBE26plusStatisticsDataParticle(DataParticle):
 
         return result
 
+class SBE26plusDerivedStatisticsDataParticle(DataParticle):
+    """
+    Wave statistics the driver computed from a wave burst. The raw data is
+    the dict returned by wave_statistics, keyed like the statistics the
+    instrument sends.
+    """
+    _data_particle_type = DataParticleType.DERIVED_STATISTICS
+
+    def _build_parsed_values(self):
+        return [{DataParticleKey.VALUE_ID: key,
+                 DataParticleKey.VALUE: self.raw_data[key]}
+                for key in sorted(self.raw_data.keys())]
+
 class SBE26plusDeviceCalibrationDataParticleKey(BaseEnum):
     PCALDATE = 'pcaldate' # tuple,
     PU0 = 'pu0' # float,
@@ -1146,26 +1191,121 @@ class Protocol(SeaBirdProtocol):
         self._sent_cmds = []
 
         self._chunker = StringChunker(Protocol.sieve_function)
+        self._add_particle_handler(DataParticleType.TIDE_PARSED, SBE26plusTideSampleDataParticle)
+        self._add_particle_handler(DataParticleType.WAVE_BURST, SBE26plusWaveBurstDataParticle)
+        self._add_particle_handler(DataParticleType.STATISTICS, SBE26plusStatisticsDataParticle)
+        self._add_particle_handler(DataParticleType.DEVICE_STATUS, SBE26plusDeviceStatusDataParticle)
+        self._add_particle_handler(DataParticleType.DEVICE_CALIBRATION, SBE26plusDeviceCalibrationDataParticle)
 
-    @staticmethod
-    def sieve_function(raw_data):
+        # computes wave statistics from the bursts when configured
+        self._wave_statistics_worker = None
+
+    def set_wave_burst_packing(self, packed):
         """
-        Chunker sieve method to help the chunker identify chunks.
-        @returns a list of chunks identified, if any.  The chunks are all the same type.
+        Choose how wave burst samples are published.
+        @param packed True to publish ptraw as a base64 packed float32
+        array with its shape, False for a JSON list of floats
         """
-        sieve_matchers = [TIDE_REGEX_MATCHER,
-                          WAVE_REGEX_MATCHER,
-                          STATS_REGEX_MATCHER,
-                          DS_REGEX_MATCHER,
-                          DC_REGEX_MATCHER]
-
-        return_list = []
-
-        for matcher in sieve_matchers:
-            for match in matcher.finditer(raw_data):
-                return_list.append((match.start(), match.end()))
-
-        return return_list
+        if packed:
+            particle_class = SBE26plusPackedWaveBurstDataParticle
+        else:
+            particle_class = SBE26plusWaveBurstDataParticle
+        self._add_particle_handler(DataParticleType.WAVE_BURST, particle_class)
+
+    def set_init_params(self, config):
+        """
+        Set the init params and the wave burst packing and wave statistics
+        parts of the driver config.
+        @raise InstrumentParameterException If the config cannot be set
+        """
+        SeaBirdProtocol.set_init_params(self, config)
+        self.set_wave_burst_packing(bool(config.get(SBE26plusConfigKey.PACK_WAVE_BURSTS)))
+        self._configure_wave_statistics(config.get(SBE26plusConfigKey.WAVE_STATISTICS))
+
+    def _configure_wave_statistics(self, config):
+        """
+        Start or stop computing wave statistics from the wave bursts.
+        @param config dict keyed by WaveStatisticsKey, None for off
+        @raise InstrumentParameterException If the config is invalid
+        """
+        (enabled, max_queued) = worker_config(config)
+        if self._wave_statistics_worker is not None:
+            self._wave_statistics_worker.done()
+            self._wave_statistics_worker = None
+        if enabled:
+            self._wave_statistics_worker = WaveStatisticsWorker(self._publish_wave_statistics,
+                                                                max_queued)
+            self._wave_statistics_worker.start()
+
+    def shutdown(self):
+        """
+        Stop the wave statistics worker along with the protocol.
+        """
+        SeaBirdProtocol.shutdown(self)
+        self._configure_wave_statistics(None)
+
+    def get_wave_statistics_metrics(self):
+        """
+        @retval dict of WaveStatisticsMetric -> value, None if wave
+        statistics are off
+        """
+        worker = self._wave_statistics_worker
+        if worker is None:
+            return None
+        return worker.get_metrics()
+
+    def _got_tagged_chunk(self, tag, chunk):
+        """
+        Hand wave bursts to the wave statistics worker as well, with the
+        settings in effect when they arrived.
+        """
+        SeaBirdProtocol._got_tagged_chunk(self, tag, chunk)
+        worker = self._wave_statistics_worker
+        if worker is not None and tag == DataParticleType.WAVE_BURST:
+            worker.submit((chunk, self._wave_statistics_settings()))
+
+    def _wave_statistics_settings(self):
+        """
+        @retval dict of wave_statistics keyword arguments for the parameters
+        read from the instrument so far
+        """
+        settings = {}
+        for (name, parameter) in WAVE_STATISTICS_PARAMETERS:
+            value = self._param_dict.get(parameter)
+            if value is not None:
+                settings[name] = value
+        return settings
+
+    def _publish_wave_statistics(self, burst):
+        """
+        Compute and publish the wave statistics of a burst, called in the
+        wave statistics worker thread.
+        @param burst (chunk, settings) tuple
+        """
+        (chunk, settings) = burst
+        (timestamp, ptfreq, ptraw) = parse_wave_burst(chunk)
+        settings.setdefault('scans_per_second', DEFAULT_WAVE_SCANS_PER_SECOND)
+        statistics = wave_statistics(ptraw, **settings)
+        particle = SBE26plusDerivedStatisticsDataParticle(statistics,
+            internal_timestamp=timestamp,
+            preferred_timestamp=DataParticleKey.DRIVER_TIMESTAMP)
+        if self._driver_event:
+            self._driver_event(DriverAsyncEvent.SAMPLE, particle.generate())
+
+    # Chunker sieve to help the chunker identify chunks. A wave burst is
+    # only scanned once its end marker has arrived.
+    sieve_function = RegexSieve([
+        SieveMatcher(TIDE_REGEX_MATCHER, name=DataParticleType.TIDE_PARSED,
+                     start='tide: start time', end=NEWLINE),
+        SieveMatcher(WAVE_REGEX_MATCHER, name=DataParticleType.WAVE_BURST,
+                     start='wave: start time',
+                     end='wave: end burst' + NEWLINE),
+        SieveMatcher(STATS_REGEX_MATCHER, name=DataParticleType.STATISTICS,
+                     start='deMeanTrend'),
+        SieveMatcher(DS_REGEX_MATCHER, name=DataParticleType.DEVICE_STATUS,
+                     start='SBE 26plus V'),
+        SieveMatcher(DC_REGEX_MATCHER, name=DataParticleType.DEVICE_CALIBRATION,
+                     start='Pressure coefficients')])
 
     def _filter_capabilities(self, events):
         """
@@ -2409,8 +2549,7 @@ class Protocol(SeaBirdProtocol):
         if prompt != Prompt.COMMAND:
             raise InstrumentProtocolException('ds command not recognized: %s.' % response)
 
-        for line in response.split(NEWLINE):
-            hit_count = self._param_dict.multi_match_update(line)
+        self._param_dict.update_lines(response, NEWLINE, multi_match=True)
 
         # return the Ds as text
         match = DS_REGEX_MATCHER.search(response)
@@ -24,6 +24,7 @@ from mock import Mock
 
 from mi.core.common import BaseEnum
 from mi.core.log import get_logger ; log = get_logger()
+from mi.core.unit_test import MiUnitTest
 from nose.plugins.attrib import attr
 from mi.idk.unit_test import DriverTestMixin
 from mi.idk.unit_test import ParameterTestConfigKey
@@ -738,6 +739,68 @@ class SeaBird26PlusUnitTest(SeaBirdUnitTest, SeaBird26PlusMixin):
         driver = InstrumentDriver(self._got_data_event_callback)
         self.assert_capabilities(driver, capabilities)
 
+    def test_parse_ds_response(self):
+        """
+        Verify the ds response updates the same parameters in one pass as
+        it does a line at a time
+        """
+        protocol = Protocol(Prompt, NEWLINE, Mock())
+        protocol._parse_ds_response(SAMPLE_DS, Prompt.COMMAND)
+
+        expected = Protocol(Prompt, NEWLINE, Mock())._param_dict
+        for line in SAMPLE_DS.split(NEWLINE):
+            expected.multi_match_update(line)
+
+        self.assertEqual(protocol._param_dict.get_config(), expected.get_config())
+        self.assertEqual(protocol._param_dict.get(Parameter.CONDUCTIVITY), False)
+        self.assertEqual(protocol._param_dict.get(Parameter.VLITH_V), 9.0)
+
+
+@attr('BENCHMARK', group='mi')
+class SeaBird26PlusParamDictBenchmark(MiUnitTest):
+    """
+    ds responses parsed per second by the parameter dictionary: trying
+    every parameter regex on every line, a line at a time through the
+    index, and the whole response in one pass.
+    """
+    DURATION = 2
+
+    def _rate(self, parse):
+        param_dict = Protocol(Prompt, NEWLINE, Mock())._param_dict
+        count = 0
+        start_time = time.time()
+        while time.time() - start_time < self.DURATION:
+            parse(param_dict)
+            count += 1
+        rate = count / (time.time() - start_time)
+        self.assertEqual(param_dict.get(Parameter.VLITH_V), 9.0)
+        return rate
+
+    def _every_regex(self, param_dict):
+        for line in SAMPLE_DS.split(NEWLINE):
+            multi_mode = False
+            for (name, val) in param_dict._param_dict.iteritems():
+                if multi_mode and not val.multi_match:
+                    continue
+                if val.update(line):
+                    if not val.multi_match:
+                        break
+                    multi_mode = True
+
+    def _indexed_lines(self, param_dict):
+        for line in SAMPLE_DS.split(NEWLINE):
+            param_dict.multi_match_update(line)
+
+    def _one_pass(self, param_dict):
+        param_dict.update_lines(SAMPLE_DS, NEWLINE, multi_match=True)
+
+    def test_parse_rate(self):
+        rates = [('every regex', self._rate(self._every_regex)),
+                 ('indexed lines', self._rate(self._indexed_lines)),
+                 ('one pass', self._rate(self._one_pass))]
+        for (name, rate) in rates:
+            log.info("ds response, %s: %d responses/s", name, rate)
+
 
 ###############################################################################
 #                            INTEGRATION TESTS                                #
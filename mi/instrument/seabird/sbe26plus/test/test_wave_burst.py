@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+
+"""
+@package mi.instrument.seabird.sbe26plus.test.test_wave_burst
+@file mi/instrument/seabird/sbe26plus/test/test_wave_burst.py
+@brief Test cases for parsing SBE26plus wave bursts
+"""
+
+__license__ = 'Apache 2.0'
+
+import json
+import time
+import base64
+import itertools
+
+import numpy
+from nose.plugins.attrib import attr
+
+from mi.core.log import get_logger ; log = get_logger()
+from mi.core.unit_test import MiUnitTest
+from mi.core.exceptions import SampleException
+from mi.core.instrument.data_particle import DataParticleKey
+from mi.core.instrument.data_particle import DataParticleValue
+from mi.core.instrument.data_particle import packed_array_value
+from mi.core.instrument.instrument_driver import DriverAsyncEvent
+from mi.instrument.seabird.sbe26plus.driver import NEWLINE
+from mi.instrument.seabird.sbe26plus.driver import Prompt
+from mi.instrument.seabird.sbe26plus.driver import Protocol
+from mi.instrument.seabird.sbe26plus.driver import DataParticleType
+from mi.instrument.seabird.sbe26plus.driver import SBE26plusConfigKey
+from mi.instrument.seabird.sbe26plus.driver import SBE26plusWaveBurstDataParticle
+from mi.instrument.seabird.sbe26plus.driver import SBE26plusPackedWaveBurstDataParticle
+from mi.instrument.seabird.sbe26plus.driver import SBE26plusWaveBurstDataParticleKey
+
+HEADER = "wave: start time = 05 Oct 2012 01:10:54" + NEWLINE + \
+         "wave: ptfreq = 171791.359" + NEWLINE
+END = "wave: end burst" + NEWLINE
+
+# samples from a recorded burst, in the order they came
+RECORDED_PTRAW = [14.5102, 14.5064, 14.5165, 14.5064, 14.5165, 14.5064, 14.5165,
+                  14.5064, 14.5165, 14.5064, 14.5165, 14.5064, 14.5165, 14.5134,
+                  14.5078, 14.5134, 14.5064, 14.5165, 14.5036, 14.5165, 14.5064,
+                  14.5134, 14.5064, 14.5165, 14.5064, 14.5165, 14.5064, 14.5165]
+
+def wave_burst(ptraw):
+    return HEADER + ''.join(["%9.4f" % value + NEWLINE for value in ptraw]) + END
+
+def build_particle(particle_class, burst):
+    return particle_class(burst, preferred_timestamp=DataParticleKey.DRIVER_TIMESTAMP)
+
+def values(particle):
+    return dict([(value[DataParticleKey.VALUE_ID], value)
+                 for value in particle.generate_dict()[DataParticleKey.VALUES]])
+
+@attr('UNIT', group='mi')
+class TestWaveBurst(MiUnitTest):
+    def test_parse(self):
+        parsed = values(build_particle(SBE26plusWaveBurstDataParticle, wave_burst(RECORDED_PTRAW)))
+        self.assertEqual(parsed[SBE26plusWaveBurstDataParticleKey.PTFREQ][DataParticleKey.VALUE],
+                         171791.359)
+        self.assertTrue(isinstance(parsed[SBE26plusWaveBurstDataParticleKey.TIMESTAMP][DataParticleKey.VALUE],
+                                   float))
+        ptraw = parsed[SBE26plusWaveBurstDataParticleKey.PTRAW]
+        self.assertEqual(ptraw[DataParticleKey.VALUE], RECORDED_PTRAW)
+        self.assertTrue(type(ptraw[DataParticleKey.VALUE][0]) is float)
+
+    def test_packed(self):
+        parsed = values(build_particle(SBE26plusPackedWaveBurstDataParticle, wave_burst(RECORDED_PTRAW)))
+        ptraw = parsed[SBE26plusWaveBurstDataParticleKey.PTRAW]
+        self.assertTrue(ptraw[DataParticleKey.BINARY])
+        self.assertEqual(ptraw[DataParticleKey.SHAPE], [len(RECORDED_PTRAW)])
+        self.assertEqual(ptraw[DataParticleKey.ENCODING], DataParticleValue.FLOAT32)
+        unpacked = numpy.frombuffer(base64.b64decode(ptraw[DataParticleKey.VALUE]),
+                                    dtype=ptraw[DataParticleKey.ENCODING])
+        numpy.testing.assert_array_almost_equal(unpacked, RECORDED_PTRAW, 4)
+
+    def test_packing_config(self):
+        """
+        The driver config chooses how the protocol publishes wave bursts
+        """
+        events = []
+        protocol = Protocol(Prompt, NEWLINE, lambda *args: events.append(args))
+
+        def published_ptraw():
+            [particle] = [json.loads(args[1]) for args in events
+                          if args[0] == DriverAsyncEvent.SAMPLE]
+            del events[:]
+            return dict([(value[DataParticleKey.VALUE_ID], value)
+                         for value in particle[DataParticleKey.VALUES]])[SBE26plusWaveBurstDataParticleKey.PTRAW]
+
+        protocol.set_init_params({SBE26plusConfigKey.PACK_WAVE_BURSTS: True})
+        protocol._got_tagged_chunk(DataParticleType.WAVE_BURST, wave_burst(RECORDED_PTRAW))
+        self.assertTrue(published_ptraw()[DataParticleKey.BINARY])
+
+        protocol.set_init_params({})
+        protocol._got_tagged_chunk(DataParticleType.WAVE_BURST, wave_burst(RECORDED_PTRAW))
+        self.assertEqual(published_ptraw()[DataParticleKey.VALUE], RECORDED_PTRAW)
+
+    def test_packed_array_value(self):
+        """
+        Sequences and numpy arrays pack the same
+        """
+        self.assertEqual(packed_array_value('x', RECORDED_PTRAW),
+                         packed_array_value('x', numpy.array(RECORDED_PTRAW)))
+        value = packed_array_value('x', numpy.zeros((2, 3)))
+        self.assertEqual(value[DataParticleKey.SHAPE], [2, 3])
+        self.assertEqual(base64.b64decode(value[DataParticleKey.VALUE]), '\0' * 24)
+
+    def test_bad_burst(self):
+        self.assertRaises(SampleException,
+                          build_particle(SBE26plusWaveBurstDataParticle,
+                                   "wave: ptfreq = 1" + NEWLINE).generate_dict)
+        self.assertRaises(SampleException,
+                          build_particle(SBE26plusWaveBurstDataParticle,
+                                   HEADER + "  14.5102" + NEWLINE + "bogus" + NEWLINE + END).generate_dict)
+
+    def test_empty_burst(self):
+        parsed = values(build_particle(SBE26plusWaveBurstDataParticle, HEADER + END))
+        self.assertEqual(parsed[SBE26plusWaveBurstDataParticleKey.PTRAW][DataParticleKey.VALUE], [])
+
+@attr('BENCHMARK', group='mi')
+class BenchmarkWaveBurst(MiUnitTest):
+    """
+    Parse a 4 Hz burst of 1024 samples made of recorded samples into JSON
+    particles, with ptraw as a list and packed.
+    """
+    COUNT = 200
+
+    def _run(self, particle_class, burst):
+        start_time = time.time()
+        for i in range(self.COUNT):
+            generated = build_particle(particle_class, burst).generate()
+        return ((time.time() - start_time) / self.COUNT, len(generated))
+
+    def test_wave_burst(self):
+        burst = wave_burst(itertools.islice(itertools.cycle(RECORDED_PTRAW), 1024))
+        for particle_class in (SBE26plusWaveBurstDataParticle,
+                               SBE26plusPackedWaveBurstDataParticle):
+            (seconds, size) = self._run(particle_class, burst)
+            log.info("%s: %.2f ms per 1024 sample burst, %d byte particle",
+                     particle_class.__name__, 1000 * seconds, size)
+            self.assertEqual(len(values(build_particle(particle_class, burst))), 3)
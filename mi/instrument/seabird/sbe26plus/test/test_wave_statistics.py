@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+
+"""
+@package mi.instrument.seabird.sbe26plus.test.test_wave_statistics
+@file mi/instrument/seabird/sbe26plus/test/test_wave_statistics.py
+@brief Test cases for the wave statistics computed in the driver
+"""
+
+__license__ = 'Apache 2.0'
+
+import json
+import math
+import time
+import threading
+
+import numpy
+from mock import Mock
+from nose.plugins.attrib import attr
+
+from mi.core.log import get_logger ; log = get_logger()
+from mi.core.unit_test import MiUnitTest
+from mi.core.exceptions import InstrumentParameterException
+from mi.core.instrument.data_particle import DataParticleKey
+from mi.core.instrument.instrument_driver import DriverAsyncEvent
+from mi.instrument.seabird.sbe26plus.driver import NEWLINE
+from mi.instrument.seabird.sbe26plus.driver import Prompt
+from mi.instrument.seabird.sbe26plus.driver import Protocol
+from mi.instrument.seabird.sbe26plus.driver import DataParticleType
+from mi.instrument.seabird.sbe26plus.driver import SBE26plusConfigKey
+from mi.instrument.seabird.sbe26plus.driver import SBE26plusStatisticsDataParticleKey
+from mi.instrument.seabird.sbe26plus.wave_statistics import GRAVITY
+from mi.instrument.seabird.sbe26plus.wave_statistics import PASCALS_PER_PSI
+from mi.instrument.seabird.sbe26plus.wave_statistics import ATMOSPHERIC_PRESSURE
+from mi.instrument.seabird.sbe26plus.wave_statistics import Statistic
+from mi.instrument.seabird.sbe26plus.wave_statistics import WaveStatisticsKey
+from mi.instrument.seabird.sbe26plus.wave_statistics import WaveStatisticsMetric
+from mi.instrument.seabird.sbe26plus.wave_statistics import WaveStatisticsWorker
+from mi.instrument.seabird.sbe26plus.wave_statistics import attenuation
+from mi.instrument.seabird.sbe26plus.wave_statistics import seawater_density
+from mi.instrument.seabird.sbe26plus.wave_statistics import wave_numbers
+from mi.instrument.seabird.sbe26plus.wave_statistics import wave_statistics
+
+RATE = 4.0
+DEPTH = 10.0
+SENSOR_HEIGHT = 1.0
+
+def swell(amplitude, period, count=1024):
+    """
+    Pressures a sensor SENSOR_HEIGHT above the bottom in DEPTH of water sees
+    under a swell, psia
+    """
+    meters_per_psi = PASCALS_PER_PSI / (seawater_density(15, 35) * GRAVITY)
+    gain = attenuation(numpy.array([1.0 / period]), DEPTH, SENSOR_HEIGHT)[0]
+    elevation = amplitude * gain * numpy.cos(2 * math.pi * numpy.arange(count) / RATE / period)
+    return ATMOSPHERIC_PRESSURE + (DEPTH - SENSOR_HEIGHT + elevation) / meters_per_psi
+
+def wave_burst(ptraw):
+    return ("wave: start time = 05 Oct 2012 01:10:54" + NEWLINE +
+            "wave: ptfreq = 171791.359" + NEWLINE +
+            ''.join(["%9.4f" % value + NEWLINE for value in ptraw]) +
+            "wave: end burst" + NEWLINE)
+
+@attr('UNIT', group='mi')
+class TestWaveStatistics(MiUnitTest):
+    def test_keys(self):
+        """
+        The derived statistics are named like the instrument's own
+        """
+        self.assertEqual(sorted(Statistic.list()),
+                         sorted(SBE26plusStatisticsDataParticleKey.list()))
+
+    def test_density(self):
+        # as the instrument reports it for 23.84 deg C and 35 PSU
+        self.assertAlmostEqual(seawater_density(23.84, 35), 1023.690, 3)
+
+    def test_wave_numbers(self):
+        frequencies = numpy.array([0, .02, .5])
+        k = wave_numbers(frequencies, 100)
+        self.assertEqual(k[0], 0)
+        omega = 2 * math.pi * frequencies
+        numpy.testing.assert_allclose(GRAVITY * k * numpy.tanh(k * 100), omega**2)
+        # deep water
+        self.assertAlmostEqual(k[2], omega[2]**2 / GRAVITY, 6)
+
+    def test_swell(self):
+        """
+        A 0.5 m, 8 s swell in 10 m of water
+        """
+        statistics = wave_statistics(swell(.5, 8), RATE, sensor_height=SENSOR_HEIGHT)
+        self.assertAlmostEqual(statistics[Statistic.DEPTH], DEPTH - SENSOR_HEIGHT, 3)
+        self.assertAlmostEqual(statistics[Statistic.SIGNIFICANT_WAVE_HEIGHT], 4 * math.sqrt(.125), 2)
+        self.assertAlmostEqual(statistics[Statistic.SIGNIFICANT_PERIOD], 8, 1)
+        self.assertAlmostEqual(statistics[Statistic.TOTAL_ENERGY],
+                               statistics[Statistic.DENSITY] * GRAVITY * statistics[Statistic.TOTAL_VARIANCE])
+        self.assertAlmostEqual(statistics[Statistic.TSS_AVERAGE_WAVE_HEIGHT], 1, 2)
+        self.assertAlmostEqual(statistics[Statistic.TSS_AVERAGE_WAVE_PERIOD], 8, 1)
+        self.assertAlmostEqual(statistics[Statistic.TSS_SIGNIFICANT_WAVE_HEIGHT], 1, 2)
+        self.assertAlmostEqual(statistics[Statistic.TSS_TOTAL_VARIANCE], .125, 2)
+        self.assertEqual(statistics[Statistic.TSS_WAVE_INTEGRATION_TIME], 256)
+        self.assertTrue(20 <= statistics[Statistic.TSS_NUMBER_OF_WAVES] <= 32)
+        json.dumps(statistics)
+
+    def test_old_numpy(self):
+        """
+        numpy 1.6, which we build against, has no numpy.fft.rfftfreq
+        """
+        expected = wave_statistics(swell(.5, 8), RATE, sensor_height=SENSOR_HEIGHT)
+        rfftfreq = numpy.fft.__dict__.pop('rfftfreq', None)
+        try:
+            statistics = wave_statistics(swell(.5, 8), RATE, sensor_height=SENSOR_HEIGHT)
+        finally:
+            if rfftfreq is not None:
+                numpy.fft.rfftfreq = rfftfreq
+        self.assertEqual(statistics, expected)
+        self.assertAlmostEqual(statistics[Statistic.SIGNIFICANT_PERIOD], 8, 1)
+
+    def test_samples(self):
+        statistics = wave_statistics(swell(.5, 8), RATE, samples=512)
+        self.assertEqual(statistics[Statistic.TSS_WAVE_INTEGRATION_TIME], 128)
+
+    def test_periods(self):
+        """
+        Periods outside the auto-spectrum limits are left out
+        """
+        statistics = wave_statistics(swell(.5, 8), RATE, sensor_height=SENSOR_HEIGHT,
+                                     max_period=5)
+        self.assertAlmostEqual(statistics[Statistic.TOTAL_VARIANCE], 0, 4)
+
+    def test_calm(self):
+        statistics = wave_statistics(numpy.ones(512) * 20, RATE)
+        self.assertEqual(statistics[Statistic.TSS_NUMBER_OF_WAVES], 0)
+        self.assertEqual(statistics[Statistic.SIGNIFICANT_PERIOD], 0)
+        self.assertEqual(statistics[Statistic.TSS_H1_10], 0)
+
+    def test_too_short(self):
+        self.assertRaises(ValueError, wave_statistics, numpy.ones(4), RATE)
+
+@attr('UNIT', group='mi')
+class TestWaveStatisticsWorker(MiUnitTest):
+    def test_drop_oldest(self):
+        """
+        Submitting never blocks, the oldest waiting burst makes room
+        """
+        processed = []
+        release = threading.Event()
+        def process(burst):
+            release.wait()
+            processed.append(burst)
+
+        worker = WaveStatisticsWorker(process, max_queued=2)
+        worker.start()
+        self.addCleanup(worker.done)
+        worker.submit(1)
+        time.sleep(.1)
+        for burst in range(2, 6):
+            worker.submit(burst)
+        release.set()
+        end_time = time.time() + 5
+        while len(processed) < 3 and time.time() < end_time:
+            time.sleep(.01)
+
+        self.assertEqual(processed, [1, 4, 5])
+        metrics = worker.get_metrics()
+        self.assertEqual(metrics[WaveStatisticsMetric.DROPPED], 2)
+        self.assertEqual(metrics[WaveStatisticsMetric.PROCESSED], 3)
+        self.assertEqual(metrics[WaveStatisticsMetric.QUEUED], 0)
+        self.assertTrue(metrics[WaveStatisticsMetric.MAX_LAG] >= .1)
+
+    def test_failure(self):
+        def process(burst):
+            raise ValueError(burst)
+        worker = WaveStatisticsWorker(process)
+        worker.start()
+        self.addCleanup(worker.done)
+        worker.submit(1)
+        end_time = time.time() + 5
+        while not worker.get_metrics()[WaveStatisticsMetric.FAILED] and time.time() < end_time:
+            time.sleep(.01)
+        self.assertEqual(worker.get_metrics()[WaveStatisticsMetric.FAILED], 1)
+
+@attr('UNIT', group='mi')
+class TestProtocolWaveStatistics(MiUnitTest):
+    def setUp(self):
+        self.events = []
+        self.protocol = Protocol(Prompt, NEWLINE, lambda *args: self.events.append(args))
+        self.addCleanup(self.protocol._configure_wave_statistics, None)
+
+    def derived(self):
+        particles = [json.loads(args[1]) for args in self.events
+                     if args[0] == DriverAsyncEvent.SAMPLE]
+        return [particle for particle in particles
+                if particle[DataParticleKey.STREAM_NAME] == DataParticleType.DERIVED_STATISTICS]
+
+    def test_off(self):
+        self.protocol._got_tagged_chunk(DataParticleType.WAVE_BURST, wave_burst(swell(.5, 8)))
+        time.sleep(.1)
+        self.assertEqual(self.derived(), [])
+        self.assertEqual(self.protocol.get_wave_statistics_metrics(), None)
+
+    def test_derived_particle(self):
+        self.protocol.set_init_params({SBE26plusConfigKey.WAVE_STATISTICS:
+                                       {WaveStatisticsKey.ENABLED: True}})
+        self.protocol._got_tagged_chunk(DataParticleType.WAVE_BURST, wave_burst(swell(.5, 8)))
+        end_time = time.time() + 5
+        while not self.derived() and time.time() < end_time:
+            time.sleep(.01)
+
+        [particle] = self.derived()
+        self.assertTrue(particle[DataParticleKey.INTERNAL_TIMESTAMP])
+        values = dict([(value[DataParticleKey.VALUE_ID], value[DataParticleKey.VALUE])
+                       for value in particle[DataParticleKey.VALUES]])
+        self.assertEqual(sorted(values.keys()), sorted(Statistic.list()))
+        self.assertAlmostEqual(values[Statistic.SIGNIFICANT_PERIOD], 8, 1)
+        self.assertEqual(self.protocol.get_wave_statistics_metrics()[WaveStatisticsMetric.PROCESSED], 1)
+
+    def test_shutdown(self):
+        """
+        The worker stops with the protocol, so reconnecting doesn't leave
+        threads behind holding old protocols
+        """
+        self.protocol.set_init_params({SBE26plusConfigKey.WAVE_STATISTICS:
+                                       {WaveStatisticsKey.ENABLED: True}})
+        worker = self.protocol._wave_statistics_worker
+        self.assertTrue(worker.is_alive())
+
+        self.protocol.shutdown()
+        worker.join(5)
+        self.assertFalse(worker.is_alive())
+        self.assertEqual(self.protocol.get_wave_statistics_metrics(), None)
+
+    def test_config(self):
+        for config in ('on', {WaveStatisticsKey.MAX_QUEUED: 0},
+                       {WaveStatisticsKey.MAX_QUEUED: 'many'}):
+            self.assertRaises(InstrumentParameterException, self.protocol.set_init_params,
+                              {SBE26plusConfigKey.WAVE_STATISTICS: config})
+
+@attr('BENCHMARK', group='mi')
+class BenchmarkWaveStatistics(MiUnitTest):
+    """
+    Bursts of 1024 samples at 4 Hz through the protocol with wave
+    statistics on, arriving back to back and paced. Reports bursts
+    processed per second and how far the statistics lag behind the bursts.
+    """
+    COUNT = 500
+
+    def _run(self, interval):
+        protocol = Protocol(Prompt, NEWLINE, Mock())
+        protocol.set_init_params({SBE26plusConfigKey.WAVE_STATISTICS:
+                                  {WaveStatisticsKey.ENABLED: True}})
+        burst = wave_burst(swell(.5, 8))
+        start_time = time.time()
+        for i in range(self.COUNT):
+            protocol._got_tagged_chunk(DataParticleType.WAVE_BURST, burst)
+            if interval:
+                time.sleep(interval)
+        ingested = time.time() - start_time
+
+        metrics = protocol.get_wave_statistics_metrics()
+        while metrics[WaveStatisticsMetric.QUEUED] or \
+              metrics[WaveStatisticsMetric.PROCESSED] + metrics[WaveStatisticsMetric.DROPPED] < self.COUNT:
+            time.sleep(.001)
+            metrics = protocol.get_wave_statistics_metrics()
+        elapsed = time.time() - start_time
+        protocol._configure_wave_statistics(None)
+        self.assertEqual(metrics[WaveStatisticsMetric.FAILED], 0)
+        return (metrics, self.COUNT / ingested, metrics[WaveStatisticsMetric.PROCESSED] / elapsed)
+
+    def test_back_to_back(self):
+        (metrics, ingested, processed) = self._run(0)
+        log.info("back to back: %d bursts/s ingested, %d bursts/s processed, %d dropped, max lag %.1f ms",
+                 ingested, processed, metrics[WaveStatisticsMetric.DROPPED],
+                 1000 * metrics[WaveStatisticsMetric.MAX_LAG])
+
+    def test_paced(self):
+        (metrics, ingested, processed) = self._run(.01)
+        log.info("paced: %d bursts/s ingested, %d bursts/s processed, %d dropped, max lag %.1f ms",
+                 ingested, processed, metrics[WaveStatisticsMetric.DROPPED],
+                 1000 * metrics[WaveStatisticsMetric.MAX_LAG])
+        self.assertEqual(metrics[WaveStatisticsMetric.DROPPED], 0)
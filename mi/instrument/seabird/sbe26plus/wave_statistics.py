@@ -0,0 +1,357 @@
+#!/usr/bin/env python
+
+"""
+@package mi.instrument.seabird.sbe26plus.wave_statistics
+@file mi/instrument/seabird/sbe26plus/wave_statistics.py
+@brief Wave statistics computed in the driver from SBE26plus wave bursts.
+
+The SBE26plus only sends its own wave statistics when TXWAVESTATS is on.
+This computes the same auto-spectrum and time series statistics from the
+wave bursts it sends, following the steps the instrument reports while
+computing them: remove the mean and trend, hanning window, FFT, correct
+for the attenuation of pressure with depth, band average, then inverse
+FFT, remove the window and count the waves between zero up-crossings.
+Every step works on whole numpy arrays.
+
+Bursts are processed by a WaveStatisticsWorker thread, so a burst arriving
+never waits for the one before it to be processed. Turn it on through the
+driver config:
+
+    {SBE26plusConfigKey.WAVE_STATISTICS: {
+        WaveStatisticsKey.ENABLED: True,
+        WaveStatisticsKey.MAX_QUEUED: 4}}
+"""
+
+__license__ = 'Apache 2.0'
+
+import math
+import time
+import threading
+from collections import deque
+
+import numpy
+
+from mi.core.common import BaseEnum
+from mi.core.exceptions import InstrumentParameterException
+from mi.core.log import get_logger ; log = get_logger()
+
+GRAVITY = 9.80665
+PASCALS_PER_PSI = 6894.757
+ATMOSPHERIC_PRESSURE = 14.7 # psia
+
+# meters, far below what the pressure sensor resolves. Smaller
+# fluctuations are rounding left by the FFTs, not waves.
+RESOLUTION = 1e-6
+
+# bursts waiting to be processed, the oldest are dropped beyond this
+DEFAULT_MAX_QUEUED = 4
+
+class WaveStatisticsKey(BaseEnum):
+    """
+    Dictionary keys for the wave statistics config.
+    """
+    ENABLED = 'enabled'
+    MAX_QUEUED = 'max_queued'
+
+class WaveStatisticsMetric(BaseEnum):
+    """
+    Keys of the WaveStatisticsWorker metrics.
+    """
+    PROCESSED = 'processed'
+    DROPPED = 'dropped'
+    FAILED = 'failed'
+    QUEUED = 'queued'
+    # seconds from a burst being submitted to its statistics being published
+    LAST_LAG = 'last_lag'
+    MAX_LAG = 'max_lag'
+
+class Statistic(BaseEnum):
+    """
+    Keys of the computed statistics, named like the values of the
+    statistics the instrument sends.
+    """
+    DEPTH = "depth"
+    TEMPERATURE = "temperature"
+    SALINITY = "salinity"
+    DENSITY = "density"
+
+    N_AGV_BAND = "nAvgBand"
+    TOTAL_VARIANCE = "total_variance"
+    TOTAL_ENERGY = "total_energy"
+    SIGNIFICANT_PERIOD = "significant_period"
+    SIGNIFICANT_WAVE_HEIGHT = "significant_wave_height"
+
+    TSS_WAVE_INTEGRATION_TIME = "tss_wave_integration_time"
+    TSS_NUMBER_OF_WAVES = "tss_number_of_waves"
+    TSS_TOTAL_VARIANCE = "tss_total_variance"
+    TSS_TOTAL_ENERGY = "tss_total_energy"
+    TSS_AVERAGE_WAVE_HEIGHT = "tss_average_wave_height"
+    TSS_AVERAGE_WAVE_PERIOD = "tss_average_wave_period"
+    TSS_MAXIMUM_WAVE_HEIGHT = "tss_maximum_wave_height"
+    TSS_SIGNIFICANT_WAVE_HEIGHT = "tss_significant_wave_height"
+    TSS_SIGNIFICANT_WAVE_PERIOD = "tss_significant_wave_period"
+    TSS_H1_10 = "tss_height_highest_10_percent_waves"
+    TSS_H1_100 = "tss_height_highest_1_percent_waves"
+
+def seawater_density(temperature, salinity):
+    """
+    Density of sea water at the surface, UNESCO 1981.
+    @param temperature deg C
+    @param salinity PSU
+    @retval kg/m^3
+    """
+    t = temperature
+    s = salinity
+    pure = (999.842594 + 6.793952e-2 * t - 9.095290e-3 * t**2 + 1.001685e-4 * t**3
+            - 1.120083e-6 * t**4 + 6.536332e-9 * t**5)
+    return (pure
+            + s * (0.824493 - 4.0899e-3 * t + 7.6438e-5 * t**2 - 8.2467e-7 * t**3 + 5.3875e-9 * t**4)
+            + s**1.5 * (-5.72466e-3 + 1.0227e-4 * t - 1.6546e-6 * t**2)
+            + 4.8314e-4 * s**2)
+
+def wave_numbers(frequencies, depth):
+    """
+    Solve the linear dispersion relation w^2 = g k tanh(k h) for every
+    frequency at once, from an explicit approximation refined by Newton
+    iterations.
+    @param frequencies numpy array, Hz
+    @param depth Water depth, meters
+    @retval numpy array of wave numbers, 1/meters
+    """
+    omega = 2 * math.pi * frequencies
+    x = omega * math.sqrt(depth / GRAVITY)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        kh = x**2 * (1 - numpy.exp(-x**2.5)) ** -0.4
+        kh[x == 0] = 0
+        for i in range(3):
+            tanh = numpy.tanh(kh)
+            f = kh * tanh - x**2
+            kh = numpy.where(kh > 0, kh - f / (tanh + kh * (1 - tanh**2)), 0)
+    return kh / depth
+
+def attenuation(frequencies, depth, sensor_height):
+    """
+    How much of the surface pressure fluctuation at each frequency reaches
+    the sensor, cosh(k z) / cosh(k h) written so it cannot overflow.
+    @param frequencies numpy array, Hz
+    @param depth Water depth, meters
+    @param sensor_height Height of the sensor above the bottom, meters
+    @retval numpy array between 0 and 1
+    """
+    if depth <= 0:
+        return numpy.ones(len(frequencies))
+    k = wave_numbers(frequencies, depth)
+    z = min(sensor_height, depth)
+    return numpy.exp(k * (z - depth)) * (1 + numpy.exp(-2 * k * z)) / (1 + numpy.exp(-2 * k * depth))
+
+def _highest(heights, periods, fraction):
+    """
+    @retval (mean height, mean period) of the highest fraction of the waves,
+    zeros if there are too few waves for that
+    """
+    count = int(len(heights) * fraction)
+    if count == 0:
+        return (0.0, 0.0)
+    return (float(heights[:count].mean()), float(periods[:count].mean()))
+
+def wave_statistics(ptraw, scans_per_second, samples=None, temperature=15.0,
+                    salinity=35.0, sensor_height=0.0, avg_band=5,
+                    min_attenuation=.0025, min_period=0.0, max_period=1e6,
+                    hanning_cutoff=.1):
+    """
+    Compute the auto-spectrum and time series statistics of a wave burst,
+    taking the same settings the instrument uses for its own.
+    @param ptraw numpy array of the burst pressures, psia
+    @param scans_per_second Sample rate of the burst
+    @param samples Number of samples to use, None for all of them
+    @param temperature Average water temperature above the sensor, deg C
+    @param salinity Average salinity above the sensor, PSU
+    @param sensor_height Height of the sensor above the bottom, meters
+    @param avg_band Number of spectral estimates in each frequency band
+    @param min_attenuation Frequencies attenuated more than this at the
+    sensor are left out
+    @param min_period Shortest period in the auto-spectrum, seconds
+    @param max_period Longest period in the auto-spectrum, seconds
+    @param hanning_cutoff Samples where the window is below this are left
+    out of the time series once the window is removed
+    @retval dict of Statistic -> value
+    @throws ValueError if the burst is too short
+    """
+    pressure = numpy.asarray(ptraw, dtype=float)[:samples]
+    count = len(pressure)
+    if count < 2 * avg_band:
+        raise ValueError('%d samples are too few for wave statistics' % count)
+
+    density = seawater_density(temperature, salinity)
+    meters_per_psi = PASCALS_PER_PSI / (density * GRAVITY)
+
+    # deMeanTrend
+    index = numpy.arange(count)
+    (slope, intercept) = numpy.polyfit(index, pressure, 1)
+    fluctuation = (pressure - slope * index - intercept) * meters_per_psi
+    depth = max(0.0, (pressure.mean() - ATMOSPHERIC_PRESSURE) * meters_per_psi)
+    water_depth = depth + sensor_height
+
+    # hanning, FFT, correct for the attenuation at the sensor
+    window = numpy.hanning(count)
+    # rfft bin frequencies, numpy.fft.rfftfreq is newer than our numpy 1.6
+    frequencies = numpy.arange(count // 2 + 1) * (float(scans_per_second) / count)
+    gain = attenuation(frequencies, water_depth, sensor_height)
+    usable = (frequencies > 0) & (gain >= min_attenuation) & (frequencies >= 1.0 / max_period)
+    if min_period > 0:
+        usable &= frequencies <= 1.0 / min_period
+    surface = numpy.where(usable, numpy.fft.rfft(fluctuation * window) / numpy.where(usable, gain, 1), 0)
+
+    # normalize to a one sided spectral density, band average
+    resolution = float(scans_per_second) / count
+    density_spectrum = 2 * abs(surface)**2 / (scans_per_second * (window**2).sum())
+    bands = len(density_spectrum) // avg_band
+    band_spectrum = density_spectrum[:bands * avg_band].reshape(bands, avg_band).mean(axis=1)
+    band_frequencies = frequencies[:bands * avg_band].reshape(bands, avg_band).mean(axis=1)
+    variance = float(band_spectrum.sum() * resolution * avg_band)
+    significant_period = 0.0
+    if variance < RESOLUTION**2:
+        variance = 0.0
+    else:
+        significant_period = float(1 / band_frequencies[band_spectrum.argmax()])
+
+    # IFFT, deHanning, zero crossing analysis
+    series = numpy.fft.irfft(surface, count)
+    kept = window > hanning_cutoff
+    series = series[kept] / window[kept]
+    series[abs(series) < RESOLUTION] = 0
+    up = numpy.nonzero((series[:-1] < 0) & (series[1:] >= 0))[0]
+    waves = max(0, len(up) - 1)
+    heights = periods = numpy.zeros(0)
+    if waves:
+        crossings = (up + series[up] / (series[up] - series[up + 1])) / scans_per_second
+        periods = numpy.diff(crossings)
+        heights = (numpy.maximum.reduceat(series, up) - numpy.minimum.reduceat(series, up))[:-1]
+        order = heights.argsort()[::-1]
+        heights = heights[order]
+        periods = periods[order]
+    (significant_height, significant_wave_period) = _highest(heights, periods, 1 / 3.0)
+    series_variance = float(series.var())
+
+    return {
+        Statistic.DEPTH: depth,
+        Statistic.TEMPERATURE: float(temperature),
+        Statistic.SALINITY: float(salinity),
+        Statistic.DENSITY: density,
+        Statistic.N_AGV_BAND: avg_band,
+        Statistic.TOTAL_VARIANCE: variance,
+        Statistic.TOTAL_ENERGY: density * GRAVITY * variance,
+        Statistic.SIGNIFICANT_PERIOD: significant_period,
+        Statistic.SIGNIFICANT_WAVE_HEIGHT: 4 * math.sqrt(variance),
+        Statistic.TSS_WAVE_INTEGRATION_TIME: int(round(count / float(scans_per_second))),
+        Statistic.TSS_NUMBER_OF_WAVES: waves,
+        Statistic.TSS_TOTAL_VARIANCE: series_variance,
+        Statistic.TSS_TOTAL_ENERGY: density * GRAVITY * series_variance,
+        Statistic.TSS_AVERAGE_WAVE_HEIGHT: waves and float(heights.mean()) or 0.0,
+        Statistic.TSS_AVERAGE_WAVE_PERIOD: waves and float(periods.mean()) or 0.0,
+        Statistic.TSS_MAXIMUM_WAVE_HEIGHT: waves and float(heights[0]) or 0.0,
+        Statistic.TSS_SIGNIFICANT_WAVE_HEIGHT: significant_height,
+        Statistic.TSS_SIGNIFICANT_WAVE_PERIOD: significant_wave_period,
+        Statistic.TSS_H1_10: _highest(heights, periods, .1)[0],
+        Statistic.TSS_H1_100: _highest(heights, periods, .01)[0],
+    }
+
+class WaveStatisticsWorker(threading.Thread):
+    """
+    Processes wave bursts one at a time in its own thread. Submitting never
+    blocks: when more than max_queued bursts are waiting, the oldest is
+    dropped, so a slow computer falls behind by a bounded amount and
+    reports the newest waves.
+    """
+    def __init__(self, process, max_queued=DEFAULT_MAX_QUEUED):
+        """
+        @param process Called in the worker thread with each submitted burst
+        @param max_queued Most bursts waiting to be processed
+        """
+        threading.Thread.__init__(self)
+        # the protocol stops it from shutdown, don't hold up exit if it can't
+        self.daemon = True
+        self._process = process
+        self._queue = deque()
+        self._max_queued = max_queued
+        self._condition = threading.Condition()
+        self._done = False
+        self._metrics = {}
+        for metric in WaveStatisticsMetric.list():
+            self._metrics[metric] = 0
+
+    def submit(self, burst):
+        """
+        Queue a burst for processing.
+        @param burst Passed to process
+        """
+        with self._condition:
+            if len(self._queue) >= self._max_queued:
+                self._queue.popleft()
+                self._metrics[WaveStatisticsMetric.DROPPED] += 1
+            self._queue.append((time.time(), burst))
+            self._condition.notify()
+
+    def done(self):
+        """
+        Stop once the burst being processed is finished. Queued bursts are
+        dropped.
+        """
+        with self._condition:
+            self._done = True
+            self._condition.notify()
+
+    def get_metrics(self):
+        """
+        @retval dict of WaveStatisticsMetric -> value
+        """
+        with self._condition:
+            metrics = dict(self._metrics)
+            metrics[WaveStatisticsMetric.QUEUED] = len(self._queue)
+        return metrics
+
+    def run(self):
+        log.info('Wave statistics worker started.')
+        while True:
+            with self._condition:
+                while not self._queue and not self._done:
+                    self._condition.wait()
+                if self._done:
+                    break
+                (submitted, burst) = self._queue.popleft()
+
+            try:
+                self._process(burst)
+                failed = 0
+            except Exception as e:
+                log.error('Wave statistics failed: %s', e)
+                failed = 1
+
+            lag = time.time() - submitted
+            with self._condition:
+                if failed:
+                    self._metrics[WaveStatisticsMetric.FAILED] += 1
+                else:
+                    self._metrics[WaveStatisticsMetric.PROCESSED] += 1
+                self._metrics[WaveStatisticsMetric.LAST_LAG] = lag
+                self._metrics[WaveStatisticsMetric.MAX_LAG] = max(lag, self._metrics[WaveStatisticsMetric.MAX_LAG])
+        log.info('Wave statistics worker done.')
+
+def worker_config(config):
+    """
+    Check a wave statistics config.
+    @param config dict keyed by WaveStatisticsKey, None for off
+    @retval (enabled, max_queued) tuple
+    @raise InstrumentParameterException if the config is invalid
+    """
+    if config is None:
+        config = {}
+    if not isinstance(config, dict):
+        raise InstrumentParameterException('Invalid wave statistics config: %s' % config)
+    try:
+        max_queued = int(config.get(WaveStatisticsKey.MAX_QUEUED, DEFAULT_MAX_QUEUED))
+    except (TypeError, ValueError):
+        raise InstrumentParameterException('Invalid wave statistics config: %s' % config)
+    if max_queued < 1:
+        raise InstrumentParameterException('Invalid wave statistics config: %s' % config)
+    return (bool(config.get(WaveStatisticsKey.ENABLED, False)), max_queued)
@@ -32,6 +32,8 @@ from mi.core.instrument.instrument_driver import ResourceAgentState
 from mi.core.instrument.instrument_driver import ResourceAgentEvent
 from mi.core.instrument.data_particle import DataParticle, DataParticleKey, CommonDataParticleType
 from mi.core.instrument.chunker import StringChunker
+from mi.core.instrument.chunker import RegexSieve
+from mi.core.instrument.chunker import SieveMatcher
 from mi.core.exceptions import InstrumentTimeoutException
 from mi.core.exceptions import InstrumentParameterException
 from mi.core.exceptions import SampleException
@@ -152,6 +154,8 @@ SAMPLE_PATTERN += r'(, *(-?\d+\.\d+))?(, *(-?\d+\.\d+))?'
 SAMPLE_PATTERN += r'(, *(\d+) +([a-zA-Z]+) +(\d+), *(\d+):(\d+):(\d+))?'
 SAMPLE_PATTERN += r'(, *(\d+)-(\d+)-(\d+), *(\d+):(\d+):(\d+))?'
 SAMPLE_REGEX = re.compile(SAMPLE_PATTERN)
+# generous upper bound on the length of a sample line
+SAMPLE_MAX_SIZE = 256
         
 ###############################################################################
 # Seabird Electronics 37-SMP MicroCAT Driver.
@@ -313,23 +317,8 @@ class SBE37Protocol(CommandResponseInstrumentProtocol):
         self._chunker = StringChunker(self.sieve_function)
 
 
-    @staticmethod
-    def sieve_function(raw_data):
-        """ The method that splits samples
-        """
-        patterns = []
-        matchers = []
-        return_list = []
-        
-        patterns.append((SAMPLE_PATTERN)) 
-        
-        for pattern in patterns:
-            matchers.append(re.compile(pattern))
-
-        for matcher in matchers:
-            for match in matcher.finditer(raw_data):
-                return_list.append((match.start(), match.end()))
-        return return_list
+    # The sieve that splits samples
+    sieve_function = RegexSieve([SieveMatcher(SAMPLE_REGEX, max_size=SAMPLE_MAX_SIZE)])
         
     def _filter_capabilities(self, events):
         """
@@ -805,8 +794,7 @@ class SBE37Protocol(CommandResponseInstrumentProtocol):
         if prompt.strip() != SBE37Prompt.COMMAND:
             raise InstrumentProtocolException('dsdc command not recognized: %s.' % response)
 
-        for line in response.split(SBE37_NEWLINE):
-            self._param_dict.update(line)
+        self._param_dict.update_lines(response, SBE37_NEWLINE)
 
     def _parse_ts_response(self, response, prompt):
         """
@@ -38,6 +38,8 @@ from mi.core.exceptions import InstrumentProtocolException
 
 from mi.core.instrument.data_particle import DataParticle, DataParticleKey, DataParticleValue
 from mi.core.instrument.chunker import StringChunker
+from mi.core.instrument.chunker import RegexSieve
+from mi.core.instrument.chunker import SieveMatcher
 from pyon.agent.agent import ResourceAgentState
 # newline.
 NEWLINE = '\r\n'
@@ -63,6 +65,14 @@ SAMPLE_DATA_REGEX_MATCHER = re.compile(SAMPLE_DATA_REGEX, re.DOTALL)
 SAMPLE_REF_OSC_REGEX = r"<SetTimeout>.*?</Sample>"
 SAMPLE_REF_OSC_MATCHER = re.compile(SAMPLE_REF_OSC_REGEX, re.DOTALL)
 
+# Tags the sieve gives each kind of chunk
+class ChunkTag(BaseEnum):
+    STATUS = 'status'
+    CONFIGURATION = 'configuration'
+    EVENT_COUNTER = 'event_counter'
+    HARDWARE = 'hardware'
+    SAMPLE = 'sample'
+    SAMPLE_REF_OSC = 'sample_ref_osc'
 
 # Packet config
 STREAM_NAME_PARSED = 'parsed'
@@ -1384,31 +1394,30 @@ class Protocol(CommandResponseInstrumentProtocol):
         self._sent_cmds = []
 
         self._chunker = StringChunker(Protocol.sieve_function)
-
-
-
-    @staticmethod
-    def sieve_function(raw_data):
-        """
-        The method that splits samples
-        """
-
-        return_list = []
-
-        sieve_matchers = [STATUS_DATA_REGEX_MATCHER,
-                          CONFIGURATION_DATA_REGEX_MATCHER,
-                          EVENT_COUNTER_DATA_REGEX_MATCHER,
-                          HARDWARE_DATA_REGEX_MATCHER,
-                          SAMPLE_DATA_REGEX_MATCHER,
-                          SAMPLE_REF_OSC_MATCHER]
-
-
-
-        for matcher in sieve_matchers:
-            for match in matcher.finditer(raw_data):
-                return_list.append((match.start(), match.end()))
-
-        return return_list
+        self._add_particle_handler(ChunkTag.STATUS, SBE54tpsStatusDataParticle)
+        self._add_particle_handler(ChunkTag.CONFIGURATION, SBE54tpsConfigurationDataParticle)
+        self._add_particle_handler(ChunkTag.EVENT_COUNTER, SBE54tpsEventCounterDataParticle)
+        self._add_particle_handler(ChunkTag.HARDWARE, SBE54tpsHardwareDataParticle)
+        self._add_particle_handler(ChunkTag.SAMPLE, SBE54tpsSampleDataParticle)
+        self._add_particle_handler(ChunkTag.SAMPLE_REF_OSC, SBE54tpsSampleRefOscDataParticle)
+
+
+
+    # The sieve that splits samples. Every record is an XML element
+    # with a known opening and closing tag.
+    sieve_function = RegexSieve([
+        SieveMatcher(STATUS_DATA_REGEX_MATCHER, name=ChunkTag.STATUS,
+                     start="<StatusData DeviceType='", end="</StatusData>"),
+        SieveMatcher(CONFIGURATION_DATA_REGEX_MATCHER, name=ChunkTag.CONFIGURATION,
+                     start="<ConfigurationData DeviceType=", end="</ConfigurationData>"),
+        SieveMatcher(EVENT_COUNTER_DATA_REGEX_MATCHER, name=ChunkTag.EVENT_COUNTER,
+                     start="<EventSummary numEvents='", end="</EventList>"),
+        SieveMatcher(HARDWARE_DATA_REGEX_MATCHER, name=ChunkTag.HARDWARE,
+                     start="<HardwareData DeviceType='", end="</HardwareData>"),
+        SieveMatcher(SAMPLE_DATA_REGEX_MATCHER, name=ChunkTag.SAMPLE,
+                     start="<Sample Num='", end="</Sample>"),
+        SieveMatcher(SAMPLE_REF_OSC_MATCHER, name=ChunkTag.SAMPLE_REF_OSC,
+                     start="<SetTimeout>", end="</Sample>")])
 
     def _filter_capabilities(self, events):
         """
@@ -2545,26 +2554,22 @@ class Protocol(CommandResponseInstrumentProtocol):
 
 
         response = self._do_cmd_resp(InstrumentCmds.GET_CONFIGURATION_DATA, timeout=timeout)
-        for line in response.split(NEWLINE):
-            self._param_dict.update(line)
+        self._param_dict.update_lines(response, NEWLINE)
 
         log.debug("GET_CONFIGURATION_DATA response = " + repr(response))
 
         response = self._do_cmd_resp(InstrumentCmds.GET_STATUS_DATA, timeout=timeout)
-        for line in response.split(NEWLINE):
-            self._param_dict.update(line)
+        self._param_dict.update_lines(response, NEWLINE)
 
         log.debug("GET_STATUS_DATA response = " + repr(response))
 
         response = self._do_cmd_resp(InstrumentCmds.GET_EVENT_COUNTER_DATA, timeout=timeout)
-        for line in response.split(NEWLINE):
-            self._param_dict.update(line)
+        self._param_dict.update_lines(response, NEWLINE)
 
         log.debug("GET_EVENT_COUNTER_DATA response = " + repr(response))
 
         response = self._do_cmd_resp(InstrumentCmds.GET_HARDWARE_DATA, timeout=timeout)
-        for line in response.split(NEWLINE):
-            self._param_dict.update(line)
+        self._param_dict.update_lines(response, NEWLINE)
 
         log.debug("GET_HARDWARE_DATA response = " + repr(response))
 
@@ -14,6 +14,8 @@ __license__ = 'Apache 2.0'
 import datetime
 from struct import pack, unpack
 
+import numpy
+
 ID_HEADER = 0x7F
 ID_DATA_SOURCE = 0x7F
 ID_FIXED_LEADER = 0x0000
@@ -25,6 +27,17 @@ ID_VARIABLE_LEADER = 0x0080
 DATATYPE_FIXED_LEADER = 1
 DATATYPE_VARIABLE_LEADER = 2
 
+# numpy dtype of the values in each per cell and beam data type
+DATA_DTYPES = {
+    ID_VELOCITY: numpy.dtype('<i2'),
+    ID_CORRELATION_MAGNITUDE: numpy.dtype('u1'),
+    ID_ECHO_INTENSITY: numpy.dtype('u1'),
+    ID_PERCENT_GOOD: numpy.dtype('u1'),
+}
+
+# dB per echo intensity count
+ECHO_INTENSITY_SCALE = 0.45
+
 
 #################
 # some utilities
@@ -92,6 +105,9 @@ class PD0DataStructure(object):
         else:
             raise ValueError("Not a valid workhorse data ensemble")
 
+        # (cells, beams) arrays by data type ID, see _decodeDataTypes
+        self._arrays = None
+
     def __str__(self):
         s = []
         s.append("NumberOfBytesInEnsemble = %d" % \
@@ -274,46 +290,88 @@ class PD0DataStructure(object):
     # Data Info
     #######################
 
+    def _decodeDataTypes(self):
+        """
+        Parses the data type offset table once and views each of the per
+        cell and beam data types in place as a (cells, beams) array.
+        @retval dict of data type ID -> read only numpy array
+        """
+        if self._arrays is not None:
+            return self._arrays
+
+        nBeams = self.getNumberOfBeams()
+        nCells = self.getNumberOfCells()
+        arrays = {}
+        for i in range(3, self.getNumberOfDataTypes() + 1):
+            idx = self.getOffsetForDataType(i)
+            type_id = self.getShort(idx) & 0xffff
+            dtype = DATA_DTYPES.get(type_id)
+            if dtype is None or type_id in arrays:
+                continue
+            count = nCells * nBeams
+            if idx + 2 + count * dtype.itemsize > len(self.data):
+                raise InvalidEnsemble("data type %d at %d runs past the "
+                                      "end of the ensemble" % (i, idx))
+            values = numpy.frombuffer(self.data, dtype=dtype, count=count,
+                                      offset=idx + 2)
+            values = values.reshape(nCells, nBeams)
+            values.flags.writeable = False
+            arrays[type_id] = values
+
+        self._arrays = arrays
+        return arrays
+
+    def getDataArray(self, type):
+        """
+        @param type The data type ID, one of ID_VELOCITY,
+               ID_CORRELATION_MAGNITUDE, ID_ECHO_INTENSITY or ID_PERCENT_GOOD
+        @return read only (cells, beams) numpy array of the raw values, a
+                view on the ensemble data. None if the data type is not in
+                the ensemble
+        """
+        return self._decodeDataTypes().get(type)
+
+    def getVelocityArray(self):
+        """
+        @return (cells, beams) array of velocities (mm/s along beam axis),
+                None if no velocity data was found
+        """
+        return self.getDataArray(ID_VELOCITY)
+
+    def getCorrelationMagnitudeArray(self):
+        """
+        @return (cells, beams) array of correlation magnitudes, None if not
+                found
+        """
+        return self.getDataArray(ID_CORRELATION_MAGNITUDE)
+
+    def getEchoIntensityArray(self):
+        """
+        @return (cells, beams) array of echo intensities in dB, None if not
+                found
+        """
+        counts = self.getDataArray(ID_ECHO_INTENSITY)
+        if counts is None:
+            return None
+        return counts * ECHO_INTENSITY_SCALE
+
+    def getPercentGoodArray(self):
+        """
+        @return (cells, beams) array of percent good, None if not found
+        """
+        return self.getDataArray(ID_PERCENT_GOOD)
+
     def getVelocity(self, beam):
         """
-         @param beam The beam number to return (values are 1-4)
+         @param beam The beam number to return (1 to the number of beams)
          @return An array of velocities for the beam. (mm/s along beam axis).
                   None is returned if no velocity data was found
         """
-        if beam < 1 or beam > 4:
-            raise ValueError(
-                    "Beam number must be between 1 and 4. You specified %s" %
-                    beam)
-
-        #
-        # Find the index into the data for the start of the velocity record
-        #
-        idx = -1
-        nTypes = self.getNumberOfDataTypes()
-        for i in range(3, nTypes + 1):
-            idxTest = self.getOffsetForDataType(i)
-            id = self.getShort(idxTest)
-            if id == ID_VELOCITY:
-                idx = idxTest
-                break
-
-        velocities = None
-        if idx > 0:
-            nBeams = self.getNumberOfBeams()
-            idx += 2 + ((beam - 1) * 2)  # Skip to start of velocity data
-            velocities = []
-            for i in range(self.getNumberOfCells()):
-                a = self.data[idx]
-                b = self.data[idx + 1]
-                s = toSignedShort(a, b)
-                velocities.append(s)
-                idx += (nBeams * 2)
-
-        return velocities
+        return self.getValues(beam, ID_VELOCITY)
 
     def getCorrelationMagnitude(self, beam):
         """
-        @param beam The beam number to return (values are 1-4)
+        @param beam The beam number to return (1 to the number of beams)
         @return Magnitude of normalized echo autocorrelation at the lag used
                 for estimating Doppler phase change.
                 0 = bad; 255 = perfect (linear scale)
@@ -322,19 +380,19 @@ class PD0DataStructure(object):
 
     def getEchoIntensity(self, beam):
         """
-        @param beam The beam number to return (values are 1-4)
+        @param beam The beam number to return (1 to the number of beams)
         @return echo intensity in dB
         """
         ei = self.getValues(beam, ID_ECHO_INTENSITY)
         out = None
         if ei is not None:
-            out = [intens * 0.45 for intens in ei]
+            out = [intens * ECHO_INTENSITY_SCALE for intens in ei]
 
         return out
 
     def getPercentGood(self, beam):
         """
-        @param beam The beam number to return (values are 1-4)
+        @param beam The beam number to return (1 to the number of beams)
         @return Data-quality indicator that reports percentage (0 - 100) of
                 good data collected for each depth cell of the velocity
                 profile. The settings of the EX command determines how the
@@ -345,41 +403,20 @@ class PD0DataStructure(object):
 
     def getValues(self, beam, type):
         """
-        @param beam THe beam number to return (values are 1-4)
+        @param beam THe beam number to return (1 to the number of beams)
         @return An array of values for the beam.
                  None is returned if nodata was found
         """
-        if beam < 1 or beam > 4:
+        nBeams = self.getNumberOfBeams()
+        if beam < 1 or beam > nBeams:
             raise ValueError(
-                    "Beam number must be between 1 and 4. You specified %s" %
-                    beam)
-
-        #
-        # Find the index into the data for the start of the record type you
-        # want
-        #
-        idx = -1
-        nTypes = self.getNumberOfDataTypes()
-        for i in range(3, nTypes + 1):
-            idxTest = self.getOffsetForDataType(i)
-            id = self.getShort(idxTest)
-            if id == type:
-                idx = idxTest
-                break
-
-        values = None
-        if idx > 0:
-            nBeams = self.getNumberOfBeams()
-            idx += 2 + (beam - 1)  # Skip to start of data record
-            values = []
-            for i in range(self.getNumberOfCells()):
-#                values[i] = NumberUtil.toUnsignedInt(data[idx]);
-                s = self.data[idx] & 0xff
-                values.append(s)
-                idx += nBeams
-
-        return values
+                    "Beam number must be between 1 and %d. You specified %s" %
+                    (nBeams, beam))
 
+        values = self.getDataArray(type)
+        if values is None:
+            return None
+        return values[:, beam - 1].tolist()
 
 if __name__ == '__main__':
     import sys
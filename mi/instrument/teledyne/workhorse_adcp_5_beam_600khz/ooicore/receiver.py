@@ -18,6 +18,7 @@ from mi.instrument.teledyne.workhorse_adcp_5_beam_600khz.ooicore.util.coroutine
 from mi.instrument.teledyne.workhorse_adcp_5_beam_600khz.ooicore.util.ts_filter import timestamp_filter
 from mi.instrument.teledyne.workhorse_adcp_5_beam_600khz.ooicore.util.pd0_filter import pd0_filter
 
+from mi.core.line_assembler import LineAssembler
 from mi.core.mi_logger import mi_logger as log
 
 
@@ -120,15 +121,14 @@ class _Receiver(object):
         self._latest_ts = None
         self._latest_pd0 = None
 
+        self._assembler = LineAssembler(self.MAX_NUM_LINES)
         self.reset_internal_info()
 
     def start(self):
         self._thr.start()
 
     def reset_internal_info(self):
-        self._last_line = ''
-        self._new_line = ''
-        self._lines = []
+        self._assembler.reset()
         self._recv_time = 0  # time of last received buffer
         self._set_state(State.TBD)
 
@@ -142,7 +142,7 @@ class _Receiver(object):
 
     @property
     def lines(self):
-        return self._lines
+        return list(self._assembler.lines)
 
     @property
     def latest_pd0(self):
@@ -179,10 +179,11 @@ class _Receiver(object):
 
     def _set_state(self, state):
         if self._state != state:
+            last_line = self._assembler.last_line
             log.info("{{TRANSITION: %s => %s %r}}" % (self._state, state,
-                                                   self._last_line))
-            if self._last_line:
-                log.debug("LINES=\n\t|%s" % "\n\t|".join(self._lines))
+                                                   last_line))
+            if last_line:
+                log.debug("LINES=\n\t|%s" % "\n\t|".join(self._assembler.lines))
             self._state = state
 
     def end(self):
@@ -241,32 +242,12 @@ class _Receiver(object):
     def _buffer_received(self, buffer):
 #        sys.stdout.write(buffer)
 #        sys.stdout.flush()
-        numl = self._update_lines(buffer)
-        if self._last_line.rstrip() == PROMPT:
+        numl = len(self._assembler.add(buffer))
+        if self._assembler.last_line.rstrip() == PROMPT:
             self._set_state(State.PROMPT)
         elif numl:
             self._state = None
 
-    def _update_lines(self, buffer):
-        """
-        Updates the internal info about received lines.
-        @param buffer buffer that has just been received
-        """
-        numl = 0
-        for c in buffer:
-            if c == '\n':
-                numl += 1
-                self._last_line = self._new_line
-                self._new_line = ''
-                self._lines.append(self._last_line)
-                if len(self._lines) > self.MAX_NUM_LINES:
-                    self._lines = self._lines[1 - self.MAX_NUM_LINES:]
-#            elif c != '\r' and not isascii(c):
-#                print "NOT_ASCII=%r" % c
-            else:
-                self._new_line += c
-        return numl
-
     def run(self):
         """
         Runs the receiver.
@@ -7,10 +7,23 @@ __license__ = 'Apache 2.0'
 """
 
 
+import time
+from struct import pack
+
 from mi.instrument.teledyne.workhorse_adcp_5_beam_600khz.ooicore.pd0 import PD0DataStructure
+from mi.instrument.teledyne.workhorse_adcp_5_beam_600khz.ooicore.pd0 import ID_VELOCITY
+from mi.instrument.teledyne.workhorse_adcp_5_beam_600khz.ooicore.pd0 import ID_PERCENT_GOOD
+from mi.instrument.teledyne.workhorse_adcp_5_beam_600khz.ooicore.util.pd0_filter import pd0_filter
+from mi.instrument.teledyne.workhorse_adcp_5_beam_600khz.ooicore.util.coroutine import coroutine
 
 from mi.core.unit_test import MiUnitTest
 from nose.plugins.attrib import attr
+from mi.core.mi_logger import mi_logger as log
+
+# The sample holds 20 whole 954 byte ensembles (checksum included) and the
+# first 920 bytes of another.
+ENSEMBLE_SIZE = 954
+NO_ENSEMBLES = 20
 
 
 def _read_sample(filename='mi/instrument/teledyne'
@@ -45,3 +58,167 @@ class Test(MiUnitTest):
         header_len = pd0.getHeaderLength()
         self.assertEqual(header_len, 6 + 2*no_data_types)
 
+    def test_data_arrays(self):
+        pd0 = PD0DataStructure(_read_sample())
+
+        velocities = pd0.getVelocityArray()
+        self.assertEqual(velocities.shape, (40, 4))
+        self.assertEqual(velocities[:5, 0].tolist(), [-57, 119, -16, -32768, -32768])
+        self.assertEqual(pd0.getCorrelationMagnitudeArray()[:5, 1].tolist(), [105, 98, 99, 98, 26])
+        self.assertEqual(pd0.getEchoIntensityArray()[:3, 2].tolist(), [77.4, 64.8, 47.25])
+        self.assertEqual(pd0.getPercentGoodArray()[:5, 0].tolist(), [100, 100, 100, 0, 0])
+        self.assertRaises(ValueError, velocities.fill, 0)
+
+        # the per beam getters read the same arrays
+        for beam in range(1, 5):
+            self.assertEqual(pd0.getVelocity(beam), velocities[:, beam - 1].tolist())
+        self.assertEqual(pd0.getEchoIntensity(3)[:3], [77.4, 64.8, 47.25])
+        self.assertRaises(ValueError, pd0.getVelocity, 0)
+        self.assertRaises(ValueError, pd0.getVelocity, 5)
+
+    def test_fifth_beam_unit(self):
+        pd0 = PD0DataStructure(_make_ensemble(_read_sample(), 1))
+        self.assertEqual(pd0.getNumberOfBeams(), 1)
+        self.assertEqual(pd0.getVelocityArray().shape, (40, 1))
+        self.assertEqual(pd0.getVelocity(1)[:5], [-57, 119, -16, -32768, -32768])
+        self.assertEqual(pd0.getPercentGood(1)[:5], [100, 100, 100, 0, 0])
+        self.assertRaises(ValueError, pd0.getVelocity, 2)
+
+
+def _make_ensemble(data, beams):
+    """
+    Builds an ensemble like the one at the start of data, but with only the
+    first few beams, as the 5th beam unit of a VADCP sends.
+    """
+    pd0 = PD0DataStructure(data)
+    no_data_types = pd0.getNumberOfDataTypes()
+    offsets = [pd0.getOffsetForDataType(i + 1) for i in range(no_data_types)]
+    bounds = offsets + [pd0.getNumberOfBytesInEnsemble()]
+    records = [str(pd0.data[bounds[i]:bounds[i + 1]]) for i in range(no_data_types)]
+
+    fixed_leader = records[0]
+    records[0] = fixed_leader[:8] + chr(beams) + fixed_leader[9:]
+    for i in range(2, no_data_types):
+        values = pd0.getDataArray(pd0.getShort(offsets[i]))[:, :beams]
+        records[i] = records[i][:2] + values.tostring()
+
+    header_len = pd0.getHeaderLength()
+    offsets = []
+    for record in records:
+        offsets.append(header_len + sum([len(r) for r in records[:len(offsets)]]))
+    ensemble_len = header_len + sum([len(r) for r in records])
+    header = '\x7f\x7f' + pack('<HBB', ensemble_len, 0, no_data_types) + \
+             pack('<%dH' % no_data_types, *offsets)
+    return header + ''.join(records)
+
+
+@coroutine
+def _collect(pd0s, unhandled):
+    while True:
+        xelems, buffer = (yield)
+        if xelems['pd0']:
+            pd0s.append(xelems['pd0'])
+        if buffer:
+            unhandled.append(buffer)
+
+
+def _replay(data, chunk_size):
+    """
+    Sends data through a pd0_filter in chunks of chunk_size bytes.
+    @retval (list of PD0DataStructure, unhandled bytes)
+    """
+    pd0s = []
+    unhandled = []
+    pipeline = pd0_filter(_collect(pd0s, unhandled))
+    for i in range(0, len(data), chunk_size):
+        pipeline.send(({}, data[i:i + chunk_size]))
+    return pd0s, ''.join(unhandled)
+
+
+@attr('UNIT', group='mi')
+class TestPd0Filter(MiUnitTest):
+    """
+    Unit tests for the pd0_filter ensemble framer
+    """
+
+    def test_replay(self):
+        data = _read_sample()
+        for chunk_size in (1, 7, 500, ENSEMBLE_SIZE, len(data)):
+            pd0s, unhandled = _replay(data, chunk_size)
+            self.assertEqual(len(pd0s), NO_ENSEMBLES)
+            self.assertEqual(unhandled, '')
+            for pd0 in pd0s:
+                self.assertEqual(pd0.getNumberOfBytesInEnsemble(), 952)
+                self.assertEqual(len(pd0.data), 952)
+
+    def test_unhandled_bytes(self):
+        """
+        Bytes between ensembles are passed on, including a 0x7f or a
+        whole ensemble whose checksum does not match
+        """
+        data = _read_sample()
+        first = data[:ENSEMBLE_SIZE]
+        second = data[ENSEMBLE_SIZE:2 * ENSEMBLE_SIZE]
+        corrupt = first[:100] + chr(ord(first[100]) ^ 1) + first[101:]
+        stream = 'hello\x7f' + first + '\r\n>' + corrupt + second + '\x7f\x7f'
+
+        for chunk_size in (1, 13, len(stream)):
+            pd0s, unhandled = _replay(stream, chunk_size)
+            self.assertEqual(len(pd0s), 2)
+            self.assertEqual(str(pd0s[0].data), first[:952])
+            self.assertEqual(str(pd0s[1].data), second[:952])
+            self.assertEqual(unhandled, 'hello\x7f' + '\r\n>' + corrupt)
+
+
+@attr('BENCHMARK', group='mi')
+class BenchmarkPd0Filter(MiUnitTest):
+    """
+    Ensembles per second framed from the recorded sample, sent as the
+    port agent would in packets of a few hundred bytes.
+    """
+    REPEAT = 50
+
+    def test_replay_rate(self):
+        data = _read_sample()[:NO_ENSEMBLES * ENSEMBLE_SIZE] * self.REPEAT
+        start_time = time.time()
+        pd0s, unhandled = _replay(data, 512)
+        elapsed = time.time() - start_time
+        self.assertEqual(len(pd0s), NO_ENSEMBLES * self.REPEAT)
+        log.info("pd0_filter: %d ensembles/s, %.1f MB/s",
+                 len(pd0s) / elapsed, len(data) / elapsed / 1e6)
+
+
+@attr('BENCHMARK', group='mi')
+class BenchmarkPd0Decode(MiUnitTest):
+    """
+    Ensembles per second decoded into all their velocity, correlation, echo
+    intensity and percent good values, for the 4 beam unit and the 5th beam
+    unit of a VADCP.
+    """
+    COUNT = 2000
+
+    def _rate(self, ensemble, decode):
+        start_time = time.time()
+        for i in range(self.COUNT):
+            decode(PD0DataStructure(ensemble))
+        return self.COUNT / (time.time() - start_time)
+
+    def _arrays(self, pd0):
+        pd0.getVelocityArray()
+        pd0.getCorrelationMagnitudeArray()
+        pd0.getEchoIntensityArray()
+        pd0.getPercentGoodArray()
+
+    def _beams(self, pd0):
+        for beam in range(1, pd0.getNumberOfBeams() + 1):
+            pd0.getVelocity(beam)
+            pd0.getCorrelationMagnitude(beam)
+            pd0.getEchoIntensity(beam)
+            pd0.getPercentGood(beam)
+
+    def test_decode_rate(self):
+        sample = _read_sample()[:952]
+        for (name, ensemble) in (('4 beam', sample),
+                                 ('5th beam', _make_ensemble(sample, 1))):
+            log.info("PD0 %s arrays: %d ensembles/s", name, self._rate(ensemble, self._arrays))
+            log.info("PD0 %s per beam getters: %d ensembles/s", name, self._rate(ensemble, self._beams))
@@ -11,17 +11,59 @@ See mi/instrument/teledyne/workhorse_adcp_5_beam_600khz/ooicore/test/direct.py f
 __author__ = 'Carlos Rueda'
 __license__ = 'Apache 2.0'
 
+import struct
+
 from mi.instrument.teledyne.workhorse_adcp_5_beam_600khz.ooicore.pd0 import PD0DataStructure
+from mi.instrument.teledyne.workhorse_adcp_5_beam_600khz.ooicore.pd0 import ID_FIXED_LEADER
 from mi.instrument.teledyne.workhorse_adcp_5_beam_600khz.ooicore.util.coroutine import coroutine
 
 from mi.core.mi_logger import mi_logger as log
 
 
-# Some min data size to try to construct a structure and extract
-# the actual length of the ensemble. The number 30 seems enough
-# according to various runs.
+# Header ID and data source ID that start every ensemble
+ENSEMBLE_START = '\x7f\x7f'
+
+# Some min data size to check the header of a candidate ensemble before
+# waiting for all of it. Enough for the header with the offsets of the
+# usual data types and the ID of the fixed leader.
 MIN_LENGTH_TRY_ENSEMBLE = 30
 
+# The ensemble length in the header excludes the 2 byte checksum after it
+CHECKSUM_LENGTH = 2
+
+
+def _check_header(data, start, available):
+    """
+    Checks the header of a candidate ensemble starting at data[start].
+    @param data bytearray
+    @param start index of the ENSEMBLE_START in data
+    @param available number of bytes from start on, at least
+           MIN_LENGTH_TRY_ENSEMBLE
+    @retval the ensemble length, or None if this is not an ensemble
+    """
+    (ensemble_len, _, no_data_types) = struct.unpack_from('<HBB', data, start + 2)
+    header_len = 6 + 2 * no_data_types
+    if no_data_types == 0 or ensemble_len <= header_len + 2:
+        return None
+    if header_len + 2 <= available:
+        # the fixed leader comes right after the header
+        (offset,) = struct.unpack_from('<H', data, start + 6)
+        if offset != header_len:
+            return None
+        (leader_id,) = struct.unpack_from('<H', data, start + header_len)
+        if leader_id != ID_FIXED_LEADER:
+            return None
+    return ensemble_len
+
+
+def _checksum_ok(data, start, ensemble_len):
+    """
+    @retval True if the checksum after the ensemble at data[start] is the
+            sum of the ensemble bytes modulo 65536
+    """
+    (checksum,) = struct.unpack_from('<H', data, start + ensemble_len)
+    return sum(data[start:start + ensemble_len]) & 0xffff == checksum
+
 
 @coroutine
 def pd0_filter(receiver):
@@ -42,76 +84,53 @@ def pd0_filter(receiver):
     For any unhandled bytes in the stream, this filter calls
         receiver.sends( (xelems.update({'pd0', None}), send_buffer) )
     where send_buffer is a buffer of unrecognized bytes.
+
+    Received bytes are appended to a bytearray that is searched for the
+    start of an ensemble; an ensemble is only taken once all of it and its
+    checksum have arrived and the checksum matches.
     """
 
-    data = ''  # never None
+    data = bytearray()
 
-    # the length of the current ensemble. Initialized with a
-    # small number (but enough to extract the actual len):
-    ensemble_len = MIN_LENGTH_TRY_ENSEMBLE
+    def send_unhandled(xelems, end):
+        xelems['pd0'] = None
+        receiver.send((xelems, str(data[:end])))
+        del data[:end]
 
     while True:
         xelems, buffer = (yield)
-
-#        for rcv in buffer:
-        while buffer:
-            idx = buffer.find('\x7f')
-            if idx < 0:
-                if len(data) == 0:
-                    xelems['pd0'] = None
-                    receiver.send((xelems, buffer))
+        if not buffer:
+            continue
+
+        data.extend(buffer)
+
+        while data:
+            start = data.find(ENSEMBLE_START)
+            if start < 0:
+                # a last 0x7f may be the first half of the next start
+                end = len(data) - 1 if data[-1] == 0x7f else len(data)
+                if end:
+                    send_unhandled(xelems, end)
+                break
+
+            if start > 0:
+                send_unhandled(xelems, start)
+
+            available = len(data)
+            if available < MIN_LENGTH_TRY_ENSEMBLE:
+                break  # ie., go receive more.
+
+            ensemble_len = _check_header(data, 0, available)
+            if ensemble_len is not None:
+                if available < ensemble_len + CHECKSUM_LENGTH:
                     break  # ie., go receive more.
-
-            elif idx > 0:
-                if len(data) == 0:
-                    xelems['pd0'] = None
-                    receiver.send((xelems, buffer[0:idx]))
-                    buffer = buffer[idx:]
-
-            rcv = buffer[0]
-            buffer = buffer[1:]
-            if rcv == '\x7f':
-                if len(data) == 0:
-                    log.debug("RECEIVING DATA **")
-
-            elif len(data) == 0:
-                xelems['pd0'] = None
-                receiver.send((xelems, rcv))
-                continue
-
-            data += rcv
-
-            if len(data) < ensemble_len:
-                continue
-
-            # if ensemble_len is our small number, it will still allow us
-            # to "try" a structure and retrieve the actual ensemble length:
-            #
-            try:
-                pd0 = PD0DataStructure(data)
-                ensemble_len = pd0.getNumberOfBytesInEnsemble()
-            except Exception:
-                #
-                # ok, we are not yet seeing the beginning of a structure, just
-                # shift the data array a position and continue
-                # receiving:
-                #
-                data = data[1:]
-                continue
-
-            if len(data) < ensemble_len:
-                #
-                # we don't yet have enough of the ensemble, just continue
-                # receiving:
-                #
-                continue
-
-            # we have our complete ensemble:
-            ensemble = data[:ensemble_len]
-            pd0 = PD0DataStructure(ensemble)
-            xelems['pd0'] = pd0
-            receiver.send((xelems, None))
-
-            data = data[ensemble_len:]
-
-            ensemble_len = MIN_LENGTH_TRY_ENSEMBLE
+                if _checksum_ok(data, 0, ensemble_len):
+                    log.debug("RECEIVED ENSEMBLE len=%d" % ensemble_len)
+                    pd0 = PD0DataStructure(data[:ensemble_len])
+                    del data[:ensemble_len + CHECKSUM_LENGTH]
+                    xelems['pd0'] = pd0
+                    receiver.send((xelems, None))
+                    continue
+
+            # not an ensemble after all; the first byte is just data
+            send_unhandled(xelems, 1)
@@ -22,6 +22,8 @@ from mi.core.exceptions import InstrumentTimeoutException
 
 from mi.core.instrument.data_particle import DataParticle, DataParticleKey, CommonDataParticleType
 from mi.core.instrument.chunker import StringChunker
+from mi.core.instrument.chunker import RegexSieve
+from mi.core.instrument.chunker import SieveMatcher
 from mi.core.instrument.protocol_param_dict import ProtocolParameterDict, ParameterDictVisibility
 
 from mi.core.instrument.instrument_fsm import InstrumentFSM
@@ -471,16 +473,8 @@ class Protocol(MenuInstrumentProtocol):
 
         self._chunker = StringChunker(self.sieve_function)
 
-    @staticmethod
-    def sieve_function(raw_data):
-        """ The method that splits samples
-        """
-        return_list = []
-        
-        for match in SAMPLE_REGEX.finditer(raw_data):
-            return_list.append((match.start(), match.end()))
-
-        return return_list
+    # The sieve that splits samples. Samples are single lines.
+    sieve_function = RegexSieve([SieveMatcher(SAMPLE_REGEX, end='\r\n')])
 
     def _go_to_root_menu(self):
         """ Get back to the root menu, assuming we are in COMMAND mode.
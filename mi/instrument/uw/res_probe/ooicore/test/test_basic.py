@@ -9,6 +9,8 @@ Unit tests for the basic trhph module.
 
 
 import mi.instrument.uw.res_probe.ooicore.trhph as trhph
+from mi.instrument.uw.res_probe.ooicore.trhph_client import _Recv
+from mi.instrument.uw.res_probe.ooicore.trhph_client import State
 
 from mi.core.unit_test import MiUnitTest
 from nose.plugins.attrib import attr
@@ -37,3 +39,39 @@ class BasicTrhphTest(MiUnitTest):
         self.assertEqual(so, "Consortium for Ocean Leadership")
         self.assertEqual(ci, "Giora Proskurowski, 206-685-3507")
         self.assertEqual(ss, "001")
+
+
+@attr('UNIT', group='mi')
+class RecvTest(MiUnitTest):
+    """
+    Unit tests for the state and values kept by the TrhphClient receiver.
+    """
+
+    DATA_LINE = ' '.join(['%d.%03d' % (i, i) for i in range(12)]) + \
+                trhph.NEWLINE
+
+    def _receive(self, recv, data, size):
+        for i in range(0, len(data), size):
+            recv._buffer_received(data[i:i + size])
+
+    def test_states_and_samples(self):
+        for size in (1, 7, 4096):
+            samples = []
+            recv = _Recv(None, samples.append)
+            self._receive(recv, trhph.MAIN_MENU, size)
+            self.assertEqual(recv._state, State.MAIN_MENU)
+            self._receive(recv, trhph.NEWLINE + self.DATA_LINE * 3, size)
+            self.assertEqual(recv._state, State.COLLECTING_DATA)
+            self.assertEqual(len(samples), 3)
+            self.assertEqual(samples[0][trhph.CHANNEL_NAMES[1]], 1.001)
+
+    def test_prompt_without_newline(self):
+        """
+        The state follows the line being received, as prompts are not
+        terminated
+        """
+        recv = _Recv(None, None)
+        self._receive(recv, trhph.SYSTEM_PARAMETER_MENU, 4096)
+        self.assertEqual(recv._state, State.SYSTEM_PARAM_MENU)
+        self.assertTrue(recv.new_line.endswith('--> '))
+        self.assertEqual(len(recv.lines), len(trhph.SYSTEM_PARAMETER_MENU.split('\n')) - 1)
@@ -42,6 +42,7 @@ import os
 import re
 
 import logging
+from mi.core.line_assembler import LineAssembler
 from mi.core.mi_logger import mi_logger
 log = mi_logger
 
@@ -94,6 +95,9 @@ GENERIC_PROMPT_PATTERN = re.compile(r'.*--> ')
 # keep this max number of received lines
 MAX_NUM_LINES = 30
 
+# max number of bytes read from the socket at a time
+RECV_BUFSIZE = 4096
+
 # default value for the generic timeout. By default, 30 secs
 DEFAULT_GENERIC_TIMEOUT = 30
 
@@ -177,9 +181,7 @@ class _Recv(Greenlet):
         Greenlet.__init__(self)
         self._sock = sock
         self._data_listener = data_listener
-        self._last_line = ''
-        self._new_line = ''
-        self._lines = []
+        self._assembler = LineAssembler(MAX_NUM_LINES)
         self._active = True
         self._outfile = outfile
         self._prefix_state = prefix_state
@@ -193,33 +195,44 @@ class _Recv(Greenlet):
 
         log.debug("_Recv created.")
 
-    def _update_lines(self, c):
+    @property
+    def new_line(self):
         """
-        Updates the internal buffers.
-        @param c Character that has just been received
+        The line being received, possibly a prompt.
         """
-        if c == '\n':
-            self._last_line = self._new_line
-            self._new_line = ''
-            self._lines.append(self._last_line)
-            if len(self._lines) > MAX_NUM_LINES:
-                self._lines = self._lines[1 - MAX_NUM_LINES:]
-        else:
-            self._new_line += c
+        return self._assembler.new_line
 
-    def _update_state(self):
+    @property
+    def lines(self):
         """
-        Updates the state according to the last received information.
+        The last MAX_NUM_LINES completed lines.
         """
-        # use the last non-empty line:
-        line = self._last_line if self._new_line == '' else self._new_line
-        if line is None:
-            return
+        return list(self._assembler.lines)
+
+    def _buffer_received(self, buffer):
+        """
+        Updates the state and values once per line completed by the
+        received buffer, and the state for the incomplete line after it, if
+        any.
+        @param buffer The buffer that has just been received
+        """
+        for line in self._assembler.add(buffer):
+            self._update_state(line, True)
+            self._update_values(line)
+        if self._assembler.new_line:
+            self._update_state(self._assembler.new_line, False)
+        self._update_outfile(buffer)
 
+    def _update_state(self, line, complete):
+        """
+        Updates the state according to the last received information.
+        @param line The last completed line or the line being received
+        @param complete True if line has been completed
+        """
         prev_state = self._state
 
         if DATA_LINE_PATTERN.match(line):
-            if self._new_line == '':
+            if complete:
                 # this condition is to make sure we have received a complete
                 # line to proceed with the (potential) state transition. In
                 # particular, _update_values will have a complete data line
@@ -272,20 +285,12 @@ class _Recv(Greenlet):
                 index += 1
             self._data_listener(sample)
 
-    def _update_values(self, c):
+    def _update_values(self, line):
         """
-        Updates internal values according to the current state and the last
-        received information. It only tries any update if a line has just
-        been completed.
+        Updates internal values according to the current state and a line
+        that has just been completed.
+        @param line The completed line
         """
-        if c != '\n':
-            return
-
-        # use the last non-empty line:
-        line = self._last_line if self._new_line == '' else self._new_line
-        if line is None:
-            return
-
         if self._state == State.COLLECTING_DATA:
             mo = DATA_LINE_PATTERN.search(line)
             if mo:
@@ -324,15 +329,16 @@ class _Recv(Greenlet):
     def end(self):
         self._active = False
 
-    def _update_outfile(self, c):
+    def _update_outfile(self, buffer):
         """
         Updates the outfile if any.
-        @param c Character that has just been received
+        @param buffer The buffer that has just been received
         """
         if self._outfile:
-            os.write(self._outfile.fileno(), c)
-            if c == '\n' and self._prefix_state:
-                os.write(self._outfile.fileno(), "%20s| " % self._state)
+            if self._prefix_state:
+                prefix = "\n%20s| " % self._state
+                buffer = buffer.replace('\n', prefix)
+            os.write(self._outfile.fileno(), buffer)
             self._outfile.flush()
 
     def _end_outfile(self):
@@ -362,16 +368,13 @@ class _Recv(Greenlet):
 
         log.debug("_Recv running.")
         while self._active:
-            # Note that we read one character at a time.
             try:
-                c = self._sock.recv(1)
+                buffer = self._sock.recv(RECV_BUFSIZE)
             except socket.timeout, e:
                 # ok, just reattempt reading
                 continue
-            self._update_lines(c)
-            self._update_state()
-            self._update_values(c)
-            self._update_outfile(c)
+            if buffer:
+                self._buffer_received(buffer)
             _yield()
         log.debug("_Recv.run done.")
         self._end_outfile()
@@ -586,7 +589,7 @@ class TrhphClient(object):
             log.debug("sending ^S")
             self._send_control('s', 'to break streaming')
             sleep(2)
-            string = self._bt._new_line
+            string = self._bt.new_line
             log.info(":::::: string=[%s]" % string)
             got_prompt = GENERIC_PROMPT_PATTERN.match(string) is not None
 
@@ -1016,7 +1019,7 @@ class TrhphClient(object):
                     curr_state=self._bt._state)
 
     def get_last_buffer(self):
-        return '\n'.join(self._bt._lines)
+        return '\n'.join(self._bt.lines)
 
     def send_enter(self, info=None):
         """
@@ -1059,7 +1062,7 @@ class TrhphClient(object):
         got_it = False
         while not got_it and time.time() <= time_limit:
             sleep(0.5)
-            string = self._bt._new_line
+            string = self._bt.new_line
             got_it = re.match(pattern, string) is not None
 
         if not got_it: